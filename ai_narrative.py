@@ -6,18 +6,55 @@ Usage:
     python ai_narrative.py                    # Generate for all metros
     python ai_narrative.py --metro charlotte  # Generate for specific metro
     python ai_narrative.py --preview          # Preview prompt without API call
+    python ai_narrative.py --batch            # Submit all metros as one batch job and exit
+    python ai_narrative.py --collect          # Save results of finished batches (--wait to poll)
 
 Environment Variables:
     ANTHROPIC_API_KEY - Your Anthropic API key (or configure in notifications_config.json)
+
+All metros' requests are issued concurrently (up to `max_concurrency` in
+flight) under the `requests_per_minute` / `tokens_per_minute` budget, and each
+narrative is saved as soon as its response arrives. Rate-limit, overload and
+connection errors are retried with jittered backoff (see rate_limits.py).
+`base_url` points the client at another endpoint, e.g. a local mock API.
+
+Narratives are cached in {slug}_narrative_cache.json, keyed by a hash of the
+prompt, model and max_tokens. A metro whose prompt is unchanged since the last
+run (e.g. the scheduler rerunning after a later step failed) reuses its
+narrative with no API call; the tokens the cached narrative cost are reported
+as saved.
+
+With `stream` enabled (the default) responses are streamed: text is appended
+to {slug}_narrative.<request hash>.partial as it arrives and the .txt/.json
+are only written, atomically, once the message is complete. A stream that is
+cut off is retried from the text received so far (sent as the start of the
+assistant's reply), within the same run or by the next one.
+
+--batch submits the prompts as one Message Batch instead (see
+narrative_batch.py); results are collected later by --collect or by the next
+scheduled run.
 """
 
+import asyncio
+import hashlib
 import os
 import sys
 import json
 import re
+import time
 from datetime import datetime
 from pathlib import Path
 
+from atomic_io import write_json_atomic, write_text_atomic
+from data_artifact import find_data_file, load_metro_data
+from rate_limits import (
+    DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_RETRY_BASE_DELAY, DEFAULT_RETRY_MAX_DELAY,
+    DEFAULT_TOKENS_PER_MINUTE, estimate_tokens, get_budget, is_retryable, retry_delay
+)
+
+NARRATIVE_CACHE_ENTRIES = 5
+DEFAULT_PROMPT_TOKEN_BUDGET = 1200
+
 # Try to import anthropic, handle gracefully if not installed
 try:
     import anthropic
@@ -25,6 +62,17 @@ try:
 except ImportError:
     ANTHROPIC_AVAILABLE = False
 
+if ANTHROPIC_AVAILABLE:
+    # A read that fails mid-stream surfaces as the SDK's HTTP client error
+    # (httpx2 from anthropic 1.x, httpx before), not as APIConnectionError
+    try:
+        import httpx2 as httpx
+    except ImportError:
+        import httpx  # type: ignore[no-redef]
+    STREAM_ERRORS: tuple = (httpx.TransportError,)
+else:
+    STREAM_ERRORS = ()
+
 
 def load_config():
     """Load AI narrative configuration."""
@@ -36,7 +84,17 @@ def load_config():
         'api_key': '',
         'model': 'claude-opus-4-5-20251101',
         'max_tokens': 2000,
-        'generate_for_all_metros': True
+        'generate_for_all_metros': True,
+        'base_url': '',
+        'max_concurrency': 8,
+        'requests_per_minute': DEFAULT_REQUESTS_PER_MINUTE,
+        'tokens_per_minute': DEFAULT_TOKENS_PER_MINUTE,
+        'max_retries': DEFAULT_MAX_RETRIES,
+        'retry_base_delay': DEFAULT_RETRY_BASE_DELAY,
+        'retry_max_delay': DEFAULT_RETRY_MAX_DELAY,
+        'batch_mode': False,
+        'prompt_token_budget': DEFAULT_PROMPT_TOKEN_BUDGET,
+        'stream': True
     }
 
     # Load from config file if exists
@@ -58,141 +116,335 @@ def load_config():
     return config
 
 
-def format_trend_data(trends, metric_name, num_periods=6):
-    """Format trend data for the prompt."""
-    if not trends:
-        return "No data available"
+# Shared by every metro, so it goes first (as the system prompt) and can be
+# cached by the API across a run's requests; only the data block varies.
+NARRATIVE_INSTRUCTIONS = """You are a senior real estate market analyst. Using the metro data block, write a 3-4 paragraph monthly market narrative (about 400-500 words) for real estate investors and agents.
 
-    metric_aliases = {
-        'median_sale_price': ('median_sale_price', 'median_price'),
-        'median_price': ('median_price', 'median_sale_price'),
-        'median_dom': ('median_dom', 'avg_dom'),
-        'avg_dom': ('avg_dom', 'median_dom'),
-        'inventory': ('inventory', 'total_inventory'),
-        'total_inventory': ('total_inventory', 'inventory')
-    }
+Data format: pipe-separated tables after a header row; prices rounded ($612k, $1.25M); YoY as signed percents.
+
+Structure:
+1. Executive summary of current conditions (1 paragraph)
+2. Key trends and what they mean for the next 3-6 months (1 paragraph)
+3. Guidance for sellers (pricing, timeline), buyers (negotiation, opportunity areas) and investors (flip vs hold, target areas)
+4. 2-3 specific actionable insights, introduced by a sentence-case lead-in such as "Actionable insights:"; these may be numbered or bulleted
+
+Rules:
+- Professional but accessible; flowing prose, plain text (no Markdown, headings, all-caps labels or emojis); start directly with the narrative.
+- Support points with specific numbers from the data; never invent data or make unsupported causal claims.
+- Name only cities in the TOP CITIES table, each with at least one metric (price, DOM, health or YoY); describe hot, buyer or attention submarkets generically.
+- No speculative language ("below-replacement-cost", "guaranteed", "certain to") and no vague adjectives ("strong", "weak", "robust") without a concrete metric."""
+
+# Progressively smaller prompts, tried in order until one fits the token budget:
+# tier lists go first, then extra alert and city rows, then older trend months.
+PROMPT_LEVELS = [
+    {'months': 6, 'cities': 5, 'alerts': 3, 'tiers': True},
+    {'months': 6, 'cities': 5, 'alerts': 3, 'tiers': False},
+    {'months': 6, 'cities': 5, 'alerts': 1, 'tiers': False},
+    {'months': 6, 'cities': 3, 'alerts': 1, 'tiers': False},
+    {'months': 3, 'cities': 3, 'alerts': 1, 'tiers': False},
+    {'months': 3, 'cities': 3, 'alerts': 0, 'tiers': False},
+]
 
-    recent = trends[-num_periods:]
-    formatted = []
-
-    for t in recent:
-        period = t.get('period', 'Unknown')
-        value = None
-        for key in metric_aliases.get(metric_name, (metric_name,)):
-            value = t.get(key)
-            if value is not None:
-                break
-
-        if value is not None:
-            if metric_name in ('median_price', 'median_sale_price'):
-                formatted.append(f"{period}: ${value:,.0f}")
-            elif metric_name in ('avg_dom', 'median_dom'):
-                formatted.append(f"{period}: {value:,.0f} days")
-            elif metric_name.endswith(('_mom', '_yoy')):
-                formatted.append(f"{period}: {value*100:+.1f}%")
-            else:
-                formatted.append(f"{period}: {value:,.0f}")
 
-    return ' -> '.join(formatted) if formatted else "No data available"
+def compact_price(value):
+    """$612k / $1.25M: enough precision for a narrative, a fraction of the tokens."""
+    if value is None:
+        return '-'
+    if abs(value) >= 1_000_000:
+        return f"${value / 1_000_000:.2f}M"
+    return f"${value / 1000:.0f}k"
 
 
-def build_narrative_prompt(summary, metro_trends):
-    """Build the prompt for Claude to generate market narrative."""
+def compact_number(value):
+    return '-' if value is None else f"{value:,.0f}"
 
+
+def compact_percent(value):
+    return '-' if value is None else f"{value * 100:+.1f}%"
+
+
+def format_trend_table(trends, num_periods=6):
+    """Recent metro trends as a month|price|DOM|inventory table."""
+    rows = []
+    for t in trends[-num_periods:]:
+        price = t.get('median_sale_price', t.get('median_price'))
+        dom = t.get('median_dom', t.get('avg_dom'))
+        inventory = t.get('inventory', t.get('total_inventory'))
+        if price is None and dom is None and inventory is None:
+            continue
+        rows.append(f"{t.get('period', '?')}|{compact_price(price)}|{compact_number(dom)}|{compact_number(inventory)}")
+
+    if not rows:
+        return "TRENDS: no data"
+    return "TRENDS (month|median price|DOM|inventory):\n" + '\n'.join(rows)
+
+
+def _data_block(summary, metro_trends, months, cities, alerts, tiers):
     metro = summary.get('metro_name', 'Unknown Metro')
     period = summary.get('report_period', 'Unknown')
-    health = summary.get('metro_health_score', 0)
-    status = summary.get('market_status', 'UNKNOWN')
-    description = summary.get('market_description', '')
-
     metrics = summary.get('key_metrics', {})
-    city_tiers = summary.get('city_tiers', {})
-    alerts = summary.get('alert_cities', [])
-    top_cities = summary.get('top_cities', [])[:5]
-
-    # Format trend strings
-    price_trend = format_trend_data(metro_trends, 'median_sale_price')
-    dom_trend = format_trend_data(metro_trends, 'median_dom')
-    inventory_trend = format_trend_data(metro_trends, 'inventory')
-
-    # Format city data
-    city_summaries = []
-    for city in top_cities:
-        city_summaries.append(
-            f"  - {city.get('name', 'Unknown')}: ${city.get('price', 0):,.0f} median, "
-            f"{city.get('dom', 0)} DOM, {city.get('health', 0)} health score, "
-            f"{city.get('price_yoy', 0)*100:+.1f}% YoY"
-        )
 
-    # Format alerts
-    alert_summaries = []
-    for alert in alerts[:3]:
-        alert_summaries.append(
-            f"  - {alert.get('name', 'Unknown')} ({alert.get('severity', 'LOW')}): "
-            f"{', '.join(alert.get('alerts', []))}"
+    lines = [
+        f"MARKET: {metro} | PERIOD: {period}",
+        f"STATUS: health {summary.get('metro_health_score', 0)}/100 | "
+        f"{summary.get('market_status', 'UNKNOWN')} - {summary.get('market_description', '')}",
+        f"TOTALS: sales {compact_number(metrics.get('total_sales', 0))} | "
+        f"inventory {compact_number(metrics.get('total_inventory', 0))} | "
+        f"avg median price {compact_price(metrics.get('weighted_avg_price', 0))} | "
+        f"avg DOM {metrics.get('weighted_avg_dom', 0)}",
+        format_trend_table(metro_trends, months),
+    ]
+
+    top_cities = summary.get('top_cities', [])[:cities]
+    if top_cities:
+        lines.append("TOP CITIES (city|median price|DOM|health|YoY):")
+        lines.extend(
+            f"{c.get('name', 'Unknown')}|{compact_price(c.get('price', 0))}|{c.get('dom', 0)}|"
+            f"{c.get('health', 0)}|{compact_percent(c.get('price_yoy', 0))}"
+            for c in top_cities
         )
+    else:
+        lines.append("TOP CITIES: no data")
+
+    if tiers:
+        city_tiers = summary.get('city_tiers', {})
+        lines.append(f"HOT MARKETS (seller conditions): {'; '.join(city_tiers.get('hot_markets', [])[:5]) or 'none'}")
+        lines.append(f"BUYER MARKETS (excess inventory): {'; '.join(city_tiers.get('buyer_markets', [])[:5]) or 'none'}")
+
+    attention = summary.get('alert_cities', [])[:alerts]
+    if attention:
+        lines.append("ATTENTION (city|severity|alerts):")
+        lines.extend(
+            f"{a.get('name', 'Unknown')}|{a.get('severity', 'LOW')}|{'; '.join(a.get('alerts', []))}"
+            for a in attention
+        )
+    elif alerts:
+        lines.append("ATTENTION: none flagged")
 
-    # Hot markets
-    hot_markets = city_tiers.get('hot_markets', [])[:5]
-    buyer_markets = city_tiers.get('buyer_markets', [])[:5]
-
-    prompt = f"""You are a senior real estate market analyst providing a monthly market briefing for {metro}.
-Based on the data below, write a compelling 3-4 paragraph market narrative suitable for real estate investors and agents.
-
-MARKET DATA FOR {metro.upper()} - {period}:
-
-Current Status:
-- Market Health Score: {health}/100
-- Classification: {status} - {description}
-- Total Sales: {metrics.get('total_sales', 0):,}
-- Active Inventory: {metrics.get('total_inventory', 0):,}
-- Average Median Price: ${metrics.get('weighted_avg_price', 0):,.0f}
-- Average Days on Market: {metrics.get('weighted_avg_dom', 0)} days
-
-6-Month Trends:
-- Price Trend: {price_trend}
-- DOM Trend: {dom_trend}
-- Inventory Trend: {inventory_trend}
-
-Top Cities by Volume:
-{chr(10).join(city_summaries) if city_summaries else '  No data available'}
-
-Hot Markets (Strong Seller Conditions):
-{', '.join(hot_markets) if hot_markets else 'None identified'}
-
-Buyer Markets (Excess Inventory):
-{', '.join(buyer_markets) if buyer_markets else 'None identified'}
-
-Cities Requiring Attention:
-{chr(10).join(alert_summaries) if alert_summaries else '  None flagged'}
-
-INSTRUCTIONS:
-1. Start with an executive summary of current market conditions (1 paragraph)
-2. Analyze key trends and what they mean for the next 3-6 months (1 paragraph)
-3. Provide specific guidance for different stakeholders:
-   - For Sellers: pricing strategy and timeline expectations
-   - For Buyers: negotiation approach and opportunity areas
-   - For Investors: strategy recommendations (flip vs hold, target areas)
-4. End with 2-3 specific actionable insights
-
-Keep the tone professional but accessible. Use specific numbers from the data to support your analysis.
-Write in plain text (no Markdown headings, no hash marks, no emojis).
-Do not use bullet points for the main narrative paragraphs - write in flowing prose.
-The actionable insights at the end can be numbered or bulleted.
-Do not invent data or make claims that are not supported by the provided numbers.
-Only name cities that appear in the "Top Cities by Volume" list, and include at least one metric (price, DOM, health score, or YoY) when you name them.
-If you want to reference other submarkets (hot markets, buyer markets, or alerts), describe them generically without naming a city.
-Avoid speculative language (e.g., "below-replacement-cost," "guaranteed," "certain to") and avoid causal claims that are not directly supported by the data.
-Avoid vague adjectives (e.g., "strong," "weak," "robust") unless you cite a concrete metric alongside it.
-Do not include standalone headings or all-caps labels; start immediately with the narrative.
-Introduce the final insights with a short lead-in sentence like "Actionable insights:" in sentence case.
-Total length should be approximately 400-500 words.
-"""
+    return '\n'.join(lines)
+
+
+def build_narrative_prompt(summary, metro_trends, config=None):
+    """
+    Build the per-metro part of the prompt (the data block sent after
+    NARRATIVE_INSTRUCTIONS).
 
+    The largest prompt whose estimated input tokens, instructions included,
+    fit `prompt_token_budget` is used; lower-priority sections are dropped
+    first (see PROMPT_LEVELS). If even the smallest doesn't fit, it is used
+    anyway.
+    """
+    budget = int((config or {}).get('prompt_token_budget', DEFAULT_PROMPT_TOKEN_BUDGET))
+    instruction_tokens = estimate_tokens(NARRATIVE_INSTRUCTIONS)
+
+    for level in PROMPT_LEVELS:
+        prompt = _data_block(summary, metro_trends, **level)
+        if instruction_tokens + estimate_tokens(prompt) <= budget:
+            break
     return prompt
 
 
-def generate_narrative(summary, metro_trends, config=None, preview_only=False):
+def client_options(config):
+    """Client arguments shared by the sync and async clients; retries are handled here, not by the SDK."""
+    options = {'api_key': config['api_key'], 'max_retries': 0}
+    if config.get('base_url'):
+        options['base_url'] = config['base_url']
+    return options
+
+
+def message_request(config, prompt, prefix=''):
+    """
+    Messages API parameters for one narrative prompt (shared instructions as a
+    cacheable system block). A non-empty `prefix` is sent as the start of the
+    assistant's reply, so the model continues a truncated narrative.
+    """
+    request = {
+        'model': config['model'],
+        'max_tokens': config.get('max_tokens', 2000),
+        'system': [
+            {
+                "type": "text",
+                "text": NARRATIVE_INSTRUCTIONS,
+                "cache_control": {"type": "ephemeral"}
+            }
+        ],
+        'messages': [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+    if prefix:
+        request['messages'].append({"role": "assistant", "content": prefix})
+    return request
+
+
+def new_result(config):
+    """An empty (failed) narrative result dict."""
+    return {
+        'success': False,
+        'narrative': '',
+        'model': config.get('model', 'unknown'),
+        'tokens_used': 0,
+        'error': None
+    }
+
+
+def _check_setup(result, config):
+    """Record why the API can't be called, if it can't; returns True when it can."""
+    if not ANTHROPIC_AVAILABLE:
+        result['error'] = "anthropic package not installed. Run: pip install anthropic"
+        return False
+
+    if not config.get('api_key'):
+        result['error'] = "No API key configured. Set ANTHROPIC_API_KEY or configure in notifications_config.json"
+        return False
+
+    return True
+
+
+def usage_tokens(message):
+    """Input plus output tokens the API reported for a message."""
+    return message.usage.input_tokens + message.usage.output_tokens
+
+
+def apply_response(result, message):
+    """Extract narrative from response; its tokens add to any earlier attempts'. Returns its tokens."""
+    tokens = usage_tokens(message)
+    result['success'] = True
+    result['narrative'] = message.content[0].text if message.content else ''
+    result['tokens_used'] += tokens
+    return tokens
+
+
+def _describe_error(e):
+    if isinstance(e, StreamInterrupted):
+        return str(e)
+    if isinstance(e, anthropic.APIConnectionError):
+        return "Failed to connect to Anthropic API"
+    if isinstance(e, anthropic.RateLimitError):
+        return "API rate limit exceeded. Please try again later."
+    if isinstance(e, anthropic.APIStatusError):
+        return f"API error: {e.message}"
+    return f"Unexpected error: {str(e)}"
+
+
+def _request_tokens(config, prompt):
+    """Tokens to reserve from the budget: estimated input plus the full output allowance."""
+    return estimate_tokens(NARRATIVE_INSTRUCTIONS) + estimate_tokens(prompt) + int(config.get('max_tokens', 2000))
+
+
+def partial_path(output_folder, metro_name, prompt, config):
+    """Where a streamed narrative accumulates; named by request hash so only the same request resumes it."""
+    return Path(output_folder) / f"{metro_name}_narrative.{narrative_cache_key(prompt, config)[:12]}.partial"
+
+
+class PartialNarrative:
+    """Narrative text received so far, mirrored to a .partial file as it streams in."""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        # Text an earlier, interrupted run left behind is continued, not discarded
+        self.text = self.path.read_text(encoding='utf-8') if self.path and self.path.exists() else ''
+
+    def resume_point(self):
+        """The text to continue from, trimmed (a prefill can't end in whitespace) with the file cut to match."""
+        self.text = self.text.rstrip()
+        if self.path is not None:
+            with open(self.path, 'a', encoding='utf-8'):
+                pass
+            os.truncate(self.path, len(self.text.encode('utf-8')))
+        return self.text
+
+    def append(self, chunk):
+        self.text += chunk
+        if self.path is not None:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(chunk)
+
+
+class StreamInterrupted(Exception):
+    """The response stream ended before the message was complete."""
+
+    def __init__(self, reason, message=None):
+        super().__init__(reason)
+        # The message as far as it arrived (None before its first event), for its usage
+        self.message = message
+
+
+def _complete(message):
+    if message.stop_reason is None:
+        raise StreamInterrupted("Response stream ended early", message)
+    return message
+
+
+def _dropped(stream, error):
+    try:
+        snapshot = stream.current_message_snapshot
+    except AssertionError:
+        snapshot = None
+    return StreamInterrupted(f"Response stream dropped ({type(error).__name__})", snapshot)
+
+
+def _start_stream(result, partial):
+    prefix = partial.resume_point()
+    if prefix:
+        result['resumed_chars'] = len(prefix)
+    return prefix, time.perf_counter()
+
+
+def _stream_chunk(result, partial, chunk, started):
+    result.setdefault('first_byte_seconds', round(time.perf_counter() - started, 3))
+    partial.append(chunk)
+
+
+def _stream_message(client, config, prompt, partial, result):
+    """Stream one request into `partial`, continuing from whatever it already holds."""
+    prefix, started = _start_stream(result, partial)
+    with client.messages.stream(**message_request(config, prompt, prefix)) as stream:
+        try:
+            for chunk in stream.text_stream:
+                _stream_chunk(result, partial, chunk, started)
+        except STREAM_ERRORS as e:
+            raise _dropped(stream, e) from e
+        return _complete(stream.get_final_message())
+
+
+async def _stream_message_async(client, config, prompt, partial, result):
+    prefix, started = _start_stream(result, partial)
+    async with client.messages.stream(**message_request(config, prompt, prefix)) as stream:
+        try:
+            async for chunk in stream.text_stream:
+                _stream_chunk(result, partial, chunk, started)
+        except STREAM_ERRORS as e:
+            raise _dropped(stream, e) from e
+        return _complete(await stream.get_final_message())
+
+
+def _finish(result, message, partial, budget, reservation):
+    budget.settle(reservation, apply_response(result, message))
+    if partial is not None:
+        # The response holds only the continuation; the partial has it all
+        result['narrative'] = partial.text
+        result['streamed'] = True
+
+
+def _failed(result, error, budget, reservation):
+    """Record a failed attempt; True when it's worth retrying."""
+    result['error'] = _describe_error(error)
+    if isinstance(error, StreamInterrupted) and error.message is not None:
+        # The cut-off attempt was still billed for what it sent and received
+        tokens = usage_tokens(error.message)
+        result['tokens_used'] += tokens
+        budget.settle(reservation, tokens)
+    # A stream cut off mid-response (an early end or a dropped read) is continued
+    # from the partial text; an API error status is only retried when rate_limits
+    # says so. Anything else (a bug, a local IO error) fails the narrative.
+    return is_retryable(error) or isinstance(error, StreamInterrupted)
+
+
+def generate_narrative(summary, metro_trends, config=None, preview_only=False, prompt=None, partial_file=None):
     """
     Generate AI-powered market narrative.
 
@@ -201,80 +453,200 @@ def generate_narrative(summary, metro_trends, config=None, preview_only=False):
         metro_trends: List of trend data points
         config: Configuration dict (optional)
         preview_only: If True, return prompt without making API call
+        prompt: Already-built prompt (default: build_narrative_prompt)
+        partial_file: With `stream` enabled, where text is written as it
+            arrives (see partial_path); an existing file is continued
 
     Returns:
-        dict with 'success', 'narrative', 'model', 'tokens_used'
+        dict with 'success', 'narrative', 'model', 'tokens_used' (and, when
+        streamed, 'first_byte_seconds' and 'resumed_chars')
     """
     if config is None:
         config = load_config()
 
-    result = {
-        'success': False,
-        'narrative': '',
-        'model': config.get('model', 'unknown'),
-        'tokens_used': 0,
-        'error': None
-    }
-
-    prompt = build_narrative_prompt(summary, metro_trends)
+    result = new_result(config)
+    if prompt is None:
+        prompt = build_narrative_prompt(summary, metro_trends, config)
 
     if preview_only:
         result['success'] = True
-        result['narrative'] = f"[PREVIEW - Prompt would be sent to {config['model']}]\n\n{prompt}"
+        result['narrative'] = (f"[PREVIEW - Prompt would be sent to {config['model']}]\n\n"
+                               f"{NARRATIVE_INSTRUCTIONS}\n\n{prompt}")
         return result
 
-    if not ANTHROPIC_AVAILABLE:
-        result['error'] = "anthropic package not installed. Run: pip install anthropic"
+    if not _check_setup(result, config):
         return result
 
-    if not config.get('api_key'):
-        result['error'] = "No API key configured. Set ANTHROPIC_API_KEY or configure in notifications_config.json"
-        return result
+    client = anthropic.Anthropic(**client_options(config))
+    budget = get_budget(config)
+    max_retries = int(config.get('max_retries', DEFAULT_MAX_RETRIES))
+    partial = PartialNarrative(partial_file) if config.get('stream', True) else None
 
-    try:
-        client = anthropic.Anthropic(api_key=config['api_key'])
-
-        message = client.messages.create(
-            model=config['model'],
-            max_tokens=config.get('max_tokens', 2000),
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        )
+    for attempt in range(max_retries + 1):
+        reservation, wait = budget.reserve(_request_tokens(config, prompt))
+        while reservation is None:
+            time.sleep(wait)
+            reservation, wait = budget.reserve(_request_tokens(config, prompt))
 
-        # Extract narrative from response
-        narrative = message.content[0].text if message.content else ''
+        try:
+            if partial is not None:
+                message = _stream_message(client, config, prompt, partial, result)
+            else:
+                message = client.messages.create(**message_request(config, prompt))
+            _finish(result, message, partial, budget, reservation)
+            return result
+        except Exception as e:
+            if not _failed(result, e, budget, reservation) or attempt == max_retries:
+                return result
+            delay = retry_delay(attempt, config, e)
+            print(f"  [WARN] {result['error']} - retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
 
-        result['success'] = True
-        result['narrative'] = narrative
-        result['tokens_used'] = message.usage.input_tokens + message.usage.output_tokens
-
-    except anthropic.APIConnectionError:
-        result['error'] = "Failed to connect to Anthropic API"
-    except anthropic.RateLimitError:
-        result['error'] = "API rate limit exceeded. Please try again later."
-    except anthropic.APIStatusError as e:
-        result['error'] = f"API error: {e.message}"
-    except Exception as e:
-        result['error'] = f"Unexpected error: {str(e)}"
+    return result
+
+
+async def generate_narrative_async(client, summary, metro_trends, config, budget=None, prompt=None,
+                                   partial_file=None):
+    """
+    Async generate_narrative for a shared AsyncAnthropic client.
+
+    Waits for the request/token budget before each attempt and retries
+    rate-limit, overload and connection errors with jittered backoff. A
+    streamed response cut off part-way is retried from the text received.
+    """
+    result = new_result(config)
+    if prompt is None:
+        prompt = build_narrative_prompt(summary, metro_trends, config)
+    budget = budget or get_budget(config)
+    max_retries = int(config.get('max_retries', DEFAULT_MAX_RETRIES))
+    partial = PartialNarrative(partial_file) if config.get('stream', True) else None
+
+    for attempt in range(max_retries + 1):
+        reservation, wait = budget.reserve(_request_tokens(config, prompt))
+        while reservation is None:
+            await asyncio.sleep(wait)
+            reservation, wait = budget.reserve(_request_tokens(config, prompt))
+
+        try:
+            if partial is not None:
+                message = await _stream_message_async(client, config, prompt, partial, result)
+            else:
+                message = await client.messages.create(**message_request(config, prompt))
+            _finish(result, message, partial, budget, reservation)
+            return result
+        except Exception as e:
+            if not _failed(result, e, budget, reservation) or attempt == max_retries:
+                return result
+            delay = retry_delay(attempt, config, e)
+            print(f"  [WARN] {result['error']} - retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
     return result
 
 
+def narrative_cache_key(prompt, config):
+    """Content hash of everything that determines a narrative: prompt, model and max_tokens."""
+    material = json.dumps([NARRATIVE_INSTRUCTIONS, prompt, config.get('model'), int(config.get('max_tokens', 2000))])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _cache_file(output_folder, metro_name):
+    return Path(output_folder) / f"{metro_name}_narrative_cache.json"
+
+
+def load_cached_narrative(output_folder, metro_name, prompt, config):
+    """
+    Return a cached result for this exact prompt, model and max_tokens, or None.
+
+    Hits cost no tokens; 'tokens_saved' is what the original request used.
+    """
+    cache_file = _cache_file(output_folder, metro_name)
+    if not cache_file.exists():
+        return None
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            entry = json.load(f).get(narrative_cache_key(prompt, config))
+    except (OSError, ValueError):
+        return None
+    if not entry:
+        return None
+
+    result = new_result(config)
+    result.update(success=True, narrative=entry['narrative'], cached=True, tokens_saved=entry['tokens_used'])
+    return result
+
+
+def store_cached_narrative(output_folder, metro_name, prompt, config, result):
+    """Record a fresh narrative under its cache key, keeping the most recent entries."""
+    cache_file = _cache_file(output_folder, metro_name)
+    entries = {}
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+
+    entries[narrative_cache_key(prompt, config)] = {
+        'model': result['model'],
+        'max_tokens': int(config.get('max_tokens', 2000)),
+        'created_at': datetime.now().isoformat(),
+        'tokens_used': result['tokens_used'],
+        'narrative': result['narrative'],
+    }
+    # Keep a handful of entries (e.g. one per model tried), newest last
+    recent = sorted(entries.items(), key=lambda item: item[1]['created_at'])[-NARRATIVE_CACHE_ENTRIES:]
+
+    write_json_atomic(cache_file, dict(recent))
+
+
 def save_narrative(narrative, output_path):
-    """Save narrative to file."""
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(narrative)
+    """Save narrative to file (atomically: readers never see half a narrative)."""
+    write_text_atomic(output_path, narrative)
     return output_path
 
 
-def process_metro(metro_name, metro_dir, config, preview_only=False):
-    """Process a single metro and generate narrative."""
-    print(f"\n[PROCESS] {metro_name}")
+def save_narrative_result(metro_name, output_folder, summary, result):
+    """
+    Write a successful result's {slug}_narrative.txt and .json (with metadata),
+    then drop the metro's .partial stream files.
+    """
+    latest_folder = Path(output_folder)
+
+    output_path = latest_folder / f"{metro_name}_narrative.txt"
+    save_narrative(result['narrative'], output_path)
+    print(f"  [OK] Narrative saved: {output_path}")
+    if result.get('cached'):
+        print(f"       Reused from cache ({result['tokens_saved']} tokens saved)")
+    else:
+        print(f"       Tokens used: {result['tokens_used']}")
+    if result.get('first_byte_seconds') is not None:
+        print(f"       First token after {result['first_byte_seconds']:.2f}s"
+              + (f" (continued from {result['resumed_chars']} saved chars)" if result.get('resumed_chars') else ''))
+
+    # Also save as JSON with metadata
+    narrative_json = {
+        'metro': summary.get('metro_name'),
+        'period': summary.get('report_period'),
+        'generated_at': datetime.now().isoformat(),
+        'model': result['model'],
+        'tokens_used': result['tokens_used'],
+        'cached': result.get('cached', False),
+        'tokens_saved': result.get('tokens_saved', 0),
+        'streamed': result.get('streamed', False),
+        'first_byte_seconds': result.get('first_byte_seconds'),
+        'resumed_chars': result.get('resumed_chars', 0),
+        'narrative': result['narrative']
+    }
+    json_path = latest_folder / f"{metro_name}_narrative.json"
+    write_json_atomic(json_path, narrative_json)
+
+    for partial_file in latest_folder.glob(f"{metro_name}_narrative.*.partial"):
+        partial_file.unlink()
+
 
+def load_metro_inputs(metro_name, metro_dir):
+    """Find a metro's latest period; returns (folder, summary, metro_trends) or None."""
     # Find latest period
     period_pattern = re.compile(r'^\d{4}-\d{2}$')
     period_folders = sorted([
@@ -283,12 +655,12 @@ def process_metro(metro_name, metro_dir, config, preview_only=False):
     ], reverse=True)
 
     if not period_folders:
-        print(f"  [SKIP] No data folders found")
+        print(f"  [SKIP] {metro_name}: no data folders found")
         return None
 
     latest_folder = period_folders[0]
     summary_file = latest_folder / f"{metro_name}_summary.json"
-    data_file = latest_folder / f"{metro_name}_data.json"
+    data_file = find_data_file(latest_folder, metro_name)
 
     if not summary_file.exists():
         print(f"  [SKIP] Summary file not found: {summary_file}")
@@ -300,42 +672,85 @@ def process_metro(metro_name, metro_dir, config, preview_only=False):
 
     # Load trends from data file
     metro_trends = []
-    if data_file.exists():
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-            metro_trends = data.get('metro_trends', [])
+    if data_file is not None:
+        metro_trends = load_metro_data(data_file).get('metro_trends', [])
+
+    return latest_folder, summary, metro_trends
+
+
+def process_metro(metro_name, metro_dir, config, preview_only=False):
+    """Process a single metro and generate narrative."""
+    print(f"\n[PROCESS] {metro_name}")
+
+    inputs = load_metro_inputs(metro_name, metro_dir)
+    if inputs is None:
+        return None
+
+    return narrate_metro(metro_name, *inputs, config, preview_only)
 
-    # Generate narrative
-    result = generate_narrative(summary, metro_trends, config, preview_only)
+
+def narrate_metro(metro_name, output_folder, summary, metro_trends, config, preview_only=False):
+    """Generate and save a narrative from an already-loaded summary and trends."""
+    prompt = build_narrative_prompt(summary, metro_trends, config)
+
+    result = None if preview_only else load_cached_narrative(output_folder, metro_name, prompt, config)
+    if result is None:
+        result = generate_narrative(summary, metro_trends, config, preview_only, prompt=prompt,
+                                    partial_file=partial_path(output_folder, metro_name, prompt, config))
+        if result['success'] and not preview_only:
+            store_cached_narrative(output_folder, metro_name, prompt, config, result)
 
     if result['success']:
         if preview_only:
-            print(f"  [PREVIEW] Prompt generated ({len(result['narrative'])} chars)")
+            print(f"  [PREVIEW] Prompt generated ({len(result['narrative'])} chars, "
+                  f"~{estimate_tokens(NARRATIVE_INSTRUCTIONS) + estimate_tokens(prompt)} input tokens)")
         else:
-            # Save narrative
-            output_path = latest_folder / f"{metro_name}_narrative.txt"
-            save_narrative(result['narrative'], output_path)
-            print(f"  [OK] Narrative saved: {output_path}")
-            print(f"       Tokens used: {result['tokens_used']}")
-
-            # Also save as JSON with metadata
-            narrative_json = {
-                'metro': summary.get('metro_name'),
-                'period': summary.get('report_period'),
-                'generated_at': datetime.now().isoformat(),
-                'model': result['model'],
-                'tokens_used': result['tokens_used'],
-                'narrative': result['narrative']
-            }
-            json_path = latest_folder / f"{metro_name}_narrative.json"
-            with open(json_path, 'w') as f:
-                json.dump(narrative_json, f, indent=2)
+            save_narrative_result(metro_name, output_folder, summary, result)
     else:
         print(f"  [ERROR] {result['error']}")
 
     return result
 
 
+async def narrate_metros_async(jobs, config):
+    """
+    Generate narratives for many metros concurrently, saving each as it completes.
+
+    Args:
+        jobs: List of (metro_name, output_folder, summary, metro_trends)
+        config: Configuration dict
+
+    Returns:
+        List of (metro_name, result) in job order
+    """
+    semaphore = asyncio.Semaphore(max(1, int(config.get('max_concurrency', 8))))
+    budget = get_budget(config)
+
+    async with anthropic.AsyncAnthropic(**client_options(config)) as client:
+        async def _narrate(job):
+            metro_name, output_folder, summary, metro_trends = job
+            prompt = build_narrative_prompt(summary, metro_trends, config)
+
+            result = load_cached_narrative(output_folder, metro_name, prompt, config)
+            if result is None:
+                async with semaphore:
+                    result = await generate_narrative_async(
+                        client, summary, metro_trends, config, budget, prompt,
+                        partial_path(output_folder, metro_name, prompt, config)
+                    )
+                if result['success']:
+                    store_cached_narrative(output_folder, metro_name, prompt, config, result)
+
+            print(f"\n[PROCESS] {metro_name}")
+            if result['success']:
+                save_narrative_result(metro_name, output_folder, summary, result)
+            else:
+                print(f"  [ERROR] {result['error']}")
+            return metro_name, result
+
+        return await asyncio.gather(*(_narrate(job) for job in jobs))
+
+
 def main():
     """Command-line entry point."""
     base_dir = Path(__file__).parent
@@ -372,6 +787,17 @@ def main():
 
         print(f"\n[CONFIG] Model: {config['model']}")
         print(f"         Max tokens: {config['max_tokens']}")
+        print(f"         Concurrency: {config['max_concurrency']} "
+              f"({config['requests_per_minute']} requests / {config['tokens_per_minute']:,} tokens per minute)")
+
+    # Batch mode: save whatever finished since the batch was submitted
+    if '--collect' in sys.argv and not preview_only:
+        from narrative_batch import collect_narrative_batches
+        totals = collect_narrative_batches(config, base_dir, wait='--wait' in sys.argv)
+        print(f"\n[BATCH] Saved {totals['saved']} narrative(s), {totals['pending']} batch(es) still processing")
+        for failure in totals['failed']:
+            print(f"  [FAILED] {failure}")
+        return 1 if totals['failed'] else 0
 
     # Load metro config
     metro_config_file = base_dir / 'metro_config.json'
@@ -390,9 +816,8 @@ def main():
             print(f"[ERROR] Metro '{metro_filter}' not found or not enabled")
             return 1
 
-    # Process each metro
-    results = []
-    total_tokens = 0
+    # Load each metro's latest summary and trends
+    jobs = []
 
     for metro in metros:
         metro_name = metro['name']
@@ -402,10 +827,28 @@ def main():
             print(f"\n[SKIP] {metro_name} - directory not found")
             continue
 
-        result = process_metro(metro_name, metro_dir, config, preview_only)
-        if result:
-            results.append((metro_name, result))
-            total_tokens += result.get('tokens_used', 0)
+        inputs = load_metro_inputs(metro_name, metro_dir)
+        if inputs is not None:
+            jobs.append((metro_name, *inputs))
+
+    if '--batch' in sys.argv and not preview_only:
+        from narrative_batch import collect_narrative_batches, submit_narrative_batch
+        batch_id = submit_narrative_batch(jobs, config, base_dir)
+        if batch_id and '--wait' in sys.argv:
+            totals = collect_narrative_batches(config, base_dir, wait=True)
+            return 1 if totals['failed'] or totals['pending'] else 0
+        if batch_id:
+            print("        Collect results with: python ai_narrative.py --collect")
+        return 0
+
+    if preview_only:
+        results = [(job[0], narrate_metro(*job, config, preview_only=True)) for job in jobs]
+    else:
+        results = asyncio.run(narrate_metros_async(jobs, config))
+
+    total_tokens = sum(result.get('tokens_used', 0) for _, result in results)
+    saved_tokens = sum(result.get('tokens_saved', 0) for _, result in results)
+    cached = sum(1 for _, result in results if result.get('cached'))
 
     # Summary
     print("\n" + "="*60)
@@ -417,7 +860,7 @@ def main():
         status = "[OK]" if result['success'] else "[FAILED]"
         if result['success']:
             successful += 1
-        print(f"  {status} {metro_name}")
+        print(f"  {status} {metro_name}{' (cached)' if result.get('cached') else ''}")
         if result.get('error'):
             print(f"         Error: {result['error']}")
 
@@ -427,6 +870,9 @@ def main():
         estimated_cost = (total_tokens / 1000) * 0.003
         print(f"Estimated cost: ${estimated_cost:.4f}")
 
+    if cached:
+        print(f"\nReused {cached} cached narrative(s), saving {saved_tokens:,} API tokens")
+
     return 0 if successful == len(results) else 1
 
 
@@ -0,0 +1,315 @@
+"""
+Alert Rules
+Declarative city alerts, evaluated over whole tables at once.
+
+alert_rules.yaml lists the rules (a metric, thresholds, a severity and a
+message) and the severity levels. Each rule compiles to a vectorized column
+test, so evaluate_alerts screens every row of a city table in one pass,
+whether that is one metro's current month (extract_summary.py) or every month
+of every city in the Redfin source file. The result is a ranked alert table:
+latest period first, then severity, then sales volume.
+
+Usage:
+    python alert_rules.py                 # Latest month, every region in every enabled metro
+    python alert_rules.py --history       # Every month of history
+    python alert_rules.py --national      # Every city in the Redfin source file
+    python alert_rules.py --rules FILE    # Use another rules file
+    python alert_rules.py --output FILE   # Where to write the table (default alerts_ranked.csv)
+    python alert_rules.py --limit N       # Rows to print (default 20)
+"""
+
+import json
+import operator
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from market_radar.simple_yaml import load_simple_yaml
+
+DEFAULT_RULES_FILE = Path(__file__).parent / 'alert_rules.yaml'
+DEFAULT_OUTPUT_FILE = 'alerts_ranked.csv'
+DEFAULT_PRINT_LIMIT = 20
+
+# Source rows read per chunk by --national
+NATIONAL_CHUNK_ROWS = 100000
+
+METRICS = ['sales', 'price', 'price_yoy', 'dom', 'inventory', 'pending', 'new_listings',
+           'price_drops', 'months_supply', 'health']
+
+TESTS = {'above': operator.gt, 'below': operator.lt, 'at_least': operator.ge, 'at_most': operator.le}
+
+# Used when alert_rules.yaml is missing; same rules as the shipped file
+DEFAULT_ALERT_RULES = {
+    'severities': {
+        'HIGH': {'level': 3, 'recommendation': "Aggressive pricing needed. Consider incentives. Extended timeline expected."},
+        'MEDIUM': {'level': 2, 'recommendation': "Monitor closely. Price competitively. May need adjustment if no activity in 30 days."},
+        'LOW': {'level': 1, 'recommendation': "Minor concerns. Standard marketing approach should suffice."},
+    },
+    'rules': {
+        'price_decline': {'metric': 'price_yoy', 'below': -0.05, 'severity': 'MEDIUM', 'scale': -100,
+                          'message': "Price down {value:.1f}% YoY"},
+        'high_dom': {'metric': 'dom', 'above': 70, 'severity': 'MEDIUM',
+                     'message': "High days on market: {value:.0f} days"},
+        'excess_inventory': {'metric': 'months_supply', 'above': 6, 'severity': 'HIGH',
+                             'message': "Excess inventory: {value:.1f} months supply"},
+        'low_health': {'metric': 'health', 'below': 40, 'severity': 'MEDIUM',
+                       'message': "Low health score: {value:.0f}/100"},
+    },
+}
+
+
+@dataclass
+class AlertRule:
+    name: str
+    metric: str
+    tests: List[tuple]      # (operator, threshold), all of which must hold
+    severity: str
+    message: str
+    scale: float = 1.0
+
+    def mask(self, frame: pd.DataFrame) -> np.ndarray:
+        """Which rows trip this rule; missing values never do."""
+        if self.metric not in frame:
+            return np.zeros(len(frame), dtype=bool)
+        values = pd.to_numeric(frame[self.metric], errors='coerce')
+        tripped = np.ones(len(frame), dtype=bool)
+        for test, threshold in self.tests:
+            tripped &= test(values, threshold).to_numpy()
+        return tripped
+
+
+@dataclass
+class AlertRules:
+    rules: List[AlertRule]
+    severities: Dict[str, dict] = field(default_factory=dict)   # name -> {'level', 'recommendation'}
+
+    def level(self, severity: str) -> int:
+        return int(self.severities[severity]['level'])
+
+    def recommendation(self, severity: str) -> str:
+        return self.severities.get(severity, {}).get('recommendation', '')
+
+
+def compile_rules(config: dict) -> AlertRules:
+    """Validate a rules mapping (as in alert_rules.yaml) and build its AlertRules."""
+    severities = config.get('severities') or DEFAULT_ALERT_RULES['severities']
+    rules = []
+    for name, spec in (config.get('rules') or {}).items():
+        metric = spec.get('metric')
+        if metric not in METRICS:
+            raise ValueError(f"Alert rule '{name}': unknown metric '{metric}' (expected one of {', '.join(METRICS)})")
+        tests = [(TESTS[key], float(spec[key])) for key in TESTS if spec.get(key) is not None]
+        if not tests:
+            raise ValueError(f"Alert rule '{name}': needs at least one of {', '.join(TESTS)}")
+        severity = spec.get('severity', 'LOW')
+        if severity not in severities:
+            raise ValueError(f"Alert rule '{name}': unknown severity '{severity}'")
+        rules.append(AlertRule(name, metric, tests, severity, spec.get('message', name), float(spec.get('scale', 1))))
+
+    return AlertRules(rules, severities)
+
+
+def load_alert_rules(path: Optional[Path] = None) -> AlertRules:
+    """Load and compile alert_rules.yaml (or `path`), falling back to the built-in rules."""
+    path = Path(path) if path is not None else DEFAULT_RULES_FILE
+    if not path.exists():
+        return compile_rules(DEFAULT_ALERT_RULES)
+    return compile_rules(load_simple_yaml(path))
+
+
+def evaluate_alerts(frame: pd.DataFrame, rules: AlertRules) -> pd.DataFrame:
+    """
+    Screen every row of a city table against the rules.
+
+    Args:
+        frame: One row per city (or city and month) with METRICS columns;
+            an optional 'period' column ranks later months first
+
+    Returns:
+        The rows that tripped at least one rule, ranked, with 'severity',
+        'severity_level', 'alert_count' and an 'alert_{rule}' flag per rule
+    """
+    masks = [rule.mask(frame) for rule in rules.rules]
+    levels = np.zeros(len(frame), dtype=int)
+    for rule, mask in zip(rules.rules, masks):
+        levels = np.where(mask, np.maximum(levels, rules.level(rule.severity)), levels)
+
+    # Rank just the tripped rows in numpy and take them from the frame once
+    tripped = np.flatnonzero(levels)
+    rank_keys = []   # np.lexsort: last key is the primary one
+    if 'sales' in frame:
+        rank_keys.append(-pd.to_numeric(frame['sales'], errors='coerce').to_numpy()[tripped])
+    rank_keys.append(-levels[tripped])
+    if 'period' in frame:
+        rank_keys.append(-pd.factorize(frame['period'].to_numpy()[tripped], sort=True)[0])
+    order = tripped[np.lexsort(rank_keys)]
+
+    table = frame.iloc[order].reset_index(drop=True)
+    for rule, mask in zip(rules.rules, masks):
+        table[f'alert_{rule.name}'] = mask[order]
+    table['alert_count'] = np.sum([mask[order] for mask in masks], axis=0, dtype=int) if masks else 0
+    table['severity_level'] = levels[order]
+    names = {rules.level(name): name for name in rules.severities}
+    table['severity'] = table['severity_level'].map(names)
+    return table
+
+
+def alert_messages(table: pd.DataFrame, rules: AlertRules) -> List[List[str]]:
+    """Each alert row's messages, in rule order."""
+    per_rule = []
+    for rule in rules.rules:
+        flags = table[f'alert_{rule.name}'].to_numpy()
+        values = pd.to_numeric(table[rule.metric], errors='coerce').to_numpy() * rule.scale
+        per_rule.append([rule.message.format(value=v) if f else None for f, v in zip(flags, values)])
+    return [[m for m in messages if m is not None] for messages in zip(*per_rule)] if per_rule else []
+
+
+def _number(value, default=None, as_int=False):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return default
+    return int(value) if as_int else float(value)
+
+
+def alert_city_records(table: pd.DataFrame, rules: AlertRules) -> List[dict]:
+    """An alert table as the summary's alert_cities entries."""
+    records = []
+    for row, alerts in zip(table.to_dict('records'), alert_messages(table, rules)):
+        records.append({
+            'name': row.get('name', row.get('CITY', '')),
+            'sales': _number(row.get('sales'), 0, as_int=True),
+            'price': _number(row.get('price'), 0, as_int=True),
+            'price_yoy': _number(row.get('price_yoy'), 0),
+            'dom': _number(row.get('dom'), 0, as_int=True),
+            'inventory': _number(row.get('inventory'), 0, as_int=True),
+            'months_supply': _number(row.get('months_supply'), 0),
+            'health': _number(row.get('health'), 50, as_int=True),
+            'severity': row['severity'],
+            'alerts': alerts,
+            'recommendation': rules.recommendation(row['severity'])
+        })
+    return records
+
+
+# ========== COMMAND LINE ==========
+
+def read_national_rows(source: Path, keys: Tuple[str, ...], history: bool = False) -> pd.DataFrame:
+    """
+    The source file's "All Residential" rows, latest month only unless `history`.
+
+    Read NATIONAL_CHUNK_ROWS at a time with only the columns city_metric_frame
+    needs, so the national tracker is never loaded whole.
+    """
+    from process_market_data import CITY_METRIC_COLUMNS
+
+    usecols = list(dict.fromkeys(['PERIOD_BEGIN', 'PROPERTY_TYPE', *keys, *CITY_METRIC_COLUMNS]))
+    kept: List[pd.DataFrame] = []
+    latest = None
+    for chunk in pd.read_csv(source, sep='\t', usecols=usecols, chunksize=NATIONAL_CHUNK_ROWS):
+        chunk = chunk[chunk['PROPERTY_TYPE'] == 'All Residential']
+        chunk = chunk.assign(PERIOD_BEGIN=pd.to_datetime(chunk['PERIOD_BEGIN']))
+        if not history:
+            chunk_latest = chunk['PERIOD_BEGIN'].max()
+            if pd.isna(chunk_latest) or (latest is not None and chunk_latest < latest):
+                continue
+            if latest is None or chunk_latest > latest:
+                kept.clear()
+                latest = chunk_latest
+            chunk = chunk[chunk['PERIOD_BEGIN'] == latest]
+        kept.append(chunk)
+
+    if not kept:
+        return pd.DataFrame(columns=usecols)
+    return pd.concat(kept, ignore_index=True)
+
+
+def load_city_frame(base_dir: Path, national: bool = False, history: bool = False) -> pd.DataFrame:
+    """
+    City-month metrics for every enabled metro's extracted rows, or the whole source file.
+
+    Each metro is screened at its region granularity, as its summary is (see
+    region_granularity.py): for zip-code and neighborhood metros, CITY holds
+    the region's name and GRANULARITY says which kind it is.
+    """
+    from frame_partition import partition_path, read_extracted
+    from process_market_data import city_metric_frame
+    from region_granularity import extracted_file_name, metro_granularity
+
+    with open(base_dir / 'metro_config.json', 'r') as f:
+        metro_config = json.load(f)
+    data_settings = metro_config.get('data_settings', {})
+
+    if national:
+        source = base_dir / data_settings.get('source_file', 'city_market_tracker.tsv000.gz')
+        print(f"[LOAD] {source.name}")
+        keys: Tuple[str, ...] = ('STATE_CODE', 'CITY')
+        df = read_national_rows(source, keys, history)
+    else:
+        frames = []
+        for metro in metro_config.get('metros', []):
+            if not metro.get('enabled', True):
+                continue
+            granularity = metro_granularity(data_settings, metro)
+            tsv_file = base_dir / extracted_file_name(data_settings, metro, granularity)
+            if not partition_path(tsv_file).exists() and not tsv_file.exists():
+                print(f"[SKIP] {metro['name']}: {partition_path(tsv_file).name} not found (run extract_metros.py)")
+                continue
+            rows = read_extracted(tsv_file)
+            if granularity.region_column != 'CITY':
+                rows = rows.drop(columns='CITY', errors='ignore').rename(columns={granularity.region_column: 'CITY'})
+            frames.append(rows.assign(METRO=metro.get('display_name', metro['name']), GRANULARITY=granularity.name))
+        if not frames:
+            raise FileNotFoundError("No extracted metro files found")
+        df = pd.concat(frames, ignore_index=True)
+        keys = ('METRO', 'GRANULARITY', 'CITY')
+
+    df = df[df['PROPERTY_TYPE'] == 'All Residential']
+    df = df.assign(PERIOD_BEGIN=pd.to_datetime(df['PERIOD_BEGIN']))
+    if not history:
+        # Each metro's own latest month (metros can lag each other)
+        latest = df['PERIOD_BEGIN'].max() if national else df.groupby('METRO')['PERIOD_BEGIN'].transform('max')
+        df = df[df['PERIOD_BEGIN'] == latest]
+
+    return city_metric_frame(df, keys)
+
+
+def main():
+    base_dir = Path(__file__).parent
+    args = sys.argv[1:]
+
+    def option(name, default):
+        return args[args.index(name) + 1] if name in args and args.index(name) + 1 < len(args) else default
+
+    rules = load_alert_rules(option('--rules', None))
+    frame = load_city_frame(base_dir, national='--national' in args, history='--history' in args)
+
+    started = time.perf_counter()
+    table = evaluate_alerts(frame, rules)
+    elapsed = time.perf_counter() - started
+
+    counts = table['severity'].value_counts()
+    print(f"[OK] Screened {len(frame):,} city-month(s) against {len(rules.rules)} rule(s) in {elapsed:.3f}s: "
+          + ', '.join(f"{counts.get(name, 0):,} {name.lower()}" for name in rules.severities))
+
+    key_columns = [c for c in ('METRO', 'GRANULARITY', 'STATE_CODE', 'CITY', 'period') if c in table]
+    output = table[key_columns + ['severity', 'alert_count'] + METRICS].assign(
+        alerts=['; '.join(messages) for messages in alert_messages(table, rules)]
+    )
+    output_file = Path(option('--output', DEFAULT_OUTPUT_FILE))
+    output.to_csv(output_file, index=False)
+    print(f"[OK] Ranked alert table: {output_file} ({len(output):,} rows)")
+
+    limit = int(option('--limit', DEFAULT_PRINT_LIMIT))
+    for row in output.head(limit).itertuples(index=False):
+        where = ' / '.join(str(getattr(row, c)) for c in key_columns)
+        print(f"  [{row.severity}] {where}: {row.alerts}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
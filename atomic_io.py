@@ -0,0 +1,53 @@
+"""
+Atomic IO
+Write files via a temp file + rename, so readers see either the previous
+file or the complete new one, never half of it.
+
+The temp file is `<name>.tmp` next to the target (same filesystem, so the
+rename is atomic). A write that fails or is interrupted removes its temp file
+and leaves any existing target untouched.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+
+def temp_path(path) -> Path:
+    """The temp file a write to `path` goes through."""
+    path = Path(path)
+    return path.with_name(path.name + '.tmp')
+
+
+@contextmanager
+def atomic_write(path, mode: str = 'w', encoding: str = 'utf-8') -> Iterator[IO[Any]]:
+    """Open a temp file for writing; it replaces `path` when the block exits cleanly."""
+    temp_file = temp_path(path)
+    try:
+        with open(temp_file, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+        os.replace(temp_file, path)
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        raise
+
+
+def write_bytes_atomic(path, data: bytes):
+    """Write bytes to `path` atomically."""
+    with atomic_write(path, 'wb') as f:
+        f.write(data)
+
+
+def write_text_atomic(path, text: str, encoding: str = 'utf-8'):
+    """Write text to `path` atomically."""
+    with atomic_write(path, 'w', encoding) as f:
+        f.write(text)
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Write `data` as JSON (indent=2 unless given) to `path` atomically."""
+    dump_kwargs.setdefault('indent', 2)
+    with atomic_write(path, 'w') as f:
+        json.dump(data, f, **dump_kwargs)
@@ -0,0 +1,121 @@
+"""
+Chart Downsampling
+Largest-Triangle-Three-Buckets (LTTB) point selection for long dashboard series.
+
+The dashboard plots full history for the metro and every city. Rather than
+shipping thousands of points to Chart.js, we precompute which periods to keep
+for each series so long views draw a fixed number of points per line.
+"""
+
+import math
+
+# Default number of points kept per series in long (full-history) views
+DEFAULT_POINT_BUDGET = 120
+
+# Metrics plotted on the city chart and the multi-city comparison chart
+CITY_CHART_METRICS = [
+    'inventory', 'new_listings', 'pending_sales', 'homes_sold',
+    'median_dom', 'median_sale_price'
+]
+
+# Metrics plotted as lines on the metro date-range charts
+METRO_CHART_METRICS = CITY_CHART_METRICS + ['pending_ratio']
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def lttb_indices(values, threshold):
+    """
+    Select indices of `values` to keep using Largest-Triangle-Three-Buckets.
+
+    Missing values are ignored. The first and last non-missing points are
+    always kept. Returns all non-missing indices when there are no more than
+    `threshold` of them.
+    """
+    points = [(i, float(v)) for i, v in enumerate(values) if not _is_missing(v)]
+    n = len(points)
+
+    if n <= threshold or n <= 2:
+        return [i for i, _ in points]
+    if threshold < 3:
+        return [points[0][0], points[-1][0]][:max(threshold, 0)]
+
+    sampled = [points[0][0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for bucket in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        avg_start = int((bucket + 1) * bucket_size) + 1
+        avg_end = min(int((bucket + 2) * bucket_size) + 1, n)
+        next_bucket = points[avg_start:avg_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        range_start = int(bucket * bucket_size) + 1
+        range_end = int((bucket + 1) * bucket_size) + 1
+
+        ax, ay = points[a]
+        max_area = -1.0
+        selected = range_start
+        for j in range(range_start, range_end):
+            bx, by = points[j]
+            area = abs((ax - avg_x) * (by - ay) - (ax - bx) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                selected = j
+
+        sampled.append(points[selected][0])
+        a = selected
+
+    sampled.append(points[-1][0])
+    return sampled
+
+
+def downsample_periods(trend_rows, metrics, budget=DEFAULT_POINT_BUDGET):
+    """
+    Return the sorted periods to keep for a trend series in long views.
+
+    The budget is shared across metrics and the per-metric LTTB selections are
+    unioned, so every plotted metric keeps its most significant points while the
+    whole series stays within `budget` periods (plus the first and last).
+    """
+    periods = [row.get('period') for row in trend_rows]
+    if len(periods) <= budget:
+        return periods
+
+    columns = [[row.get(metric) for row in trend_rows] for metric in metrics]
+
+    def select(per_metric):
+        keep = {0, len(periods) - 1}
+        for values in columns:
+            keep.update(lttb_indices(values, per_metric))
+        return keep
+
+    # Selections overlap across metrics, so grow the per-metric share until
+    # the union would exceed the budget.
+    per_metric = max(3, budget // max(len(metrics), 1))
+    keep = select(per_metric)
+    while per_metric < budget:
+        candidate = select(per_metric + max(1, per_metric // 4))
+        if len(candidate) > budget:
+            break
+        keep = candidate
+        per_metric += max(1, per_metric // 4)
+
+    return [periods[i] for i in sorted(keep)]
+
+
+def build_chart_downsample(metro_data, budget=DEFAULT_POINT_BUDGET):
+    """Precompute kept periods for the metro series and every city series."""
+    full_city_trends = metro_data.get('full_city_trends', {})
+    return {
+        'budget': budget,
+        'metro': downsample_periods(metro_data.get('full_metro_trends', []), METRO_CHART_METRICS, budget),
+        'cities': {
+            city: downsample_periods(series, CITY_CHART_METRICS, budget)
+            for city, series in full_city_trends.items()
+        }
+    }
@@ -0,0 +1,264 @@
+"""
+Data Artifact
+Compact columnar storage for the processed metro data ({slug}_data).
+
+The processed data is mostly long lists of same-shaped monthly records (metro
+and city trends). Written as pretty-printed JSON that is a multi-MB document
+every consumer has to parse in full. The binary artifact, {slug}_data.npz,
+stores each record list column by column instead:
+
+- `numbers`: one float64 array holding every column back to back. Integer and
+  float columns are stored as-is (None as NaN). String columns are stored as
+  codes into a shared vocabulary, so repeated periods and city names cost 8
+  bytes each.
+- `meta`: UTF-8 JSON with the rest of the structure. Each encoded list is
+  replaced by a placeholder giving its columns and where they start in
+  `numbers`.
+
+load_metro_data() returns the same Python structure as json.load() on the
+JSON artifact. A mapping whose values are all record lists (full_city_trends,
+city_trends) comes back as a LazyTables that decodes each city's rows the
+first time that city is looked up.
+
+Values the layout can't hold exactly (mixed int/float columns, bools, NaN,
+ints beyond 2**53) stay inline in `meta` as plain JSON.
+"""
+
+import io
+import json
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# data_settings.data_format values
+DATA_FORMATS = ('binary', 'json')
+DEFAULT_DATA_FORMAT = 'binary'
+
+# Suffix appended to {slug}_data for each format, preferred first when reading
+DATA_SUFFIXES = {'binary': '.npz', 'json': '.json'}
+
+# Lists of plain values shorter than this stay inline in `meta`
+MIN_COLUMN_LENGTH = 8
+
+_MAX_EXACT_INT = 2 ** 53
+
+
+def data_file_name(metro_slug: str, data_format: str = DEFAULT_DATA_FORMAT) -> str:
+    """File name of a metro's data artifact in the given format."""
+    if data_format not in DATA_SUFFIXES:
+        raise ValueError(f"Unknown data_format: {data_format} (choose from {', '.join(DATA_FORMATS)})")
+    return f"{metro_slug}_data{DATA_SUFFIXES[data_format]}"
+
+
+def find_data_file(folder: Path, metro_slug: str) -> Optional[Path]:
+    """A metro's data artifact in `folder`, preferring the binary one; None if neither exists."""
+    for data_format in DATA_FORMATS:
+        candidate = Path(folder) / data_file_name(metro_slug, data_format)
+        if candidate.exists():
+            return candidate
+    return None
+
+
+# ========== ENCODING ==========
+
+def _column_kind(values: list) -> Optional[str]:
+    """'i', 'f' or 's' when every non-None value has that one type, else None."""
+    types = set(map(type, values))
+    types.discard(type(None))
+    if not types:
+        return 'f'
+    if len(types) > 1:
+        return None
+    return {int: 'i', float: 'f', str: 's'}.get(types.pop())
+
+
+def _is_table(value) -> bool:
+    """A non-empty list of dicts that all have the same keys, in the same order."""
+    if not isinstance(value, list) or not value or not isinstance(value[0], dict):
+        return False
+    keys = list(value[0])
+    return all(isinstance(row, dict) and list(row) == keys for row in value)
+
+
+class _Encoder:
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.vocabulary = {}
+
+    def column(self, values: list) -> Optional[dict]:
+        kind = _column_kind(values)
+        if kind is None:
+            return None
+        if kind == 's':
+            codes = [None if v is None else self.vocabulary.setdefault(v, len(self.vocabulary)) for v in values]
+            array = np.array(codes, dtype=np.float64)
+        else:
+            array = np.array(values, dtype=np.float64)
+            # NaN is reserved for None; out-of-range ints would not round-trip
+            if np.count_nonzero(np.isnan(array)) != values.count(None):
+                return None
+            if kind == 'i' and len(array) and np.nanmax(np.abs(array)) > _MAX_EXACT_INT:
+                return None
+        start = self.size
+        self.chunks.append(array)
+        self.size += len(array)
+        return {'kind': kind, 'start': start}
+
+    def table(self, rows: list) -> dict:
+        columns = []
+        for name in rows[0]:
+            values = [row[name] for row in rows]
+            column = self.column(values) or {'kind': 'j', 'values': values}
+            columns.append(dict(name=name, **column))
+        return {'__table__': len(rows), 'columns': columns}
+
+    def encode(self, value):
+        if isinstance(value, dict):
+            if value and all(_is_table(v) or v == [] for v in value.values()) and any(value.values()):
+                return {'__tables__': {k: self.table(v) if v else {'__table__': 0, 'columns': []}
+                                       for k, v in value.items()}}
+            return {k: self.encode(v) for k, v in value.items()}
+        if _is_table(value):
+            return self.table(value)
+        if isinstance(value, list):
+            if len(value) >= MIN_COLUMN_LENGTH:
+                column = self.column(value)
+                if column is not None:
+                    return {'__column__': len(value), **column}
+            return [self.encode(v) for v in value]
+        return value
+
+
+def encode_metro_data(metro_data: dict) -> bytes:
+    """Serialize processed metro data to the binary artifact format."""
+    encoder = _Encoder()
+    skeleton = encoder.encode(metro_data)
+    meta = {
+        'version': FORMAT_VERSION,
+        'strings': list(encoder.vocabulary),
+        'data': skeleton,
+    }
+    numbers = np.concatenate(encoder.chunks) if encoder.chunks else np.zeros(0, dtype=np.float64)
+
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        meta=np.frombuffer(json.dumps(meta, separators=(',', ':')).encode('utf-8'), dtype=np.uint8),
+        numbers=numbers,
+    )
+    return buffer.getvalue()
+
+
+# ========== DECODING ==========
+
+class _Decoder:
+    def __init__(self, numbers: np.ndarray, strings: list):
+        self.numbers = numbers
+        self.strings = strings
+
+    def column(self, spec: dict, length: int) -> list:
+        kind = spec['kind']
+        if kind == 'j':
+            return spec['values']
+        array = self.numbers[spec['start']:spec['start'] + length]
+        missing = np.isnan(array)
+        if kind == 'f':
+            values = array.tolist()
+        else:
+            values = np.where(missing, 0, array).astype(np.int64).tolist()
+            if kind == 's':
+                strings = self.strings
+                values = [strings[code] for code in values]
+        if missing.any():
+            for i in np.flatnonzero(missing).tolist():
+                values[i] = None
+        return values
+
+    def table(self, spec: dict) -> list:
+        length = spec['__table__']
+        names = [column['name'] for column in spec['columns']]
+        if not names:
+            return [{} for _ in range(length)]
+        columns = [self.column(column, length) for column in spec['columns']]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def decode(self, value):
+        if isinstance(value, dict):
+            if '__tables__' in value:
+                return LazyTables(value['__tables__'], self)
+            if '__table__' in value:
+                return self.table(value)
+            if '__column__' in value:
+                return self.column(value, value['__column__'])
+            return {k: self.decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.decode(v) for v in value]
+        return value
+
+
+class LazyTables(Mapping):
+    """Read-only mapping of name -> record list, decoding each list on first access."""
+
+    def __init__(self, specs: dict, decoder: _Decoder):
+        self._specs = specs
+        self._decoder = decoder
+        self._decoded: Dict[str, List[dict]] = {}
+
+    def __getitem__(self, key):
+        if key not in self._decoded:
+            self._decoded[key] = self._decoder.table(self._specs[key])
+        return self._decoded[key]
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
+    def __repr__(self):
+        return f"LazyTables({len(self._specs)} tables, {len(self._decoded)} decoded)"
+
+
+def decode_metro_data(payload: bytes) -> dict:
+    """Deserialize the binary artifact format; record-list mappings decode lazily."""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as archive:
+        meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+        numbers = archive['numbers']
+
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported data artifact version: {meta.get('version')}")
+    return _Decoder(numbers, meta['strings']).decode(meta['data'])
+
+
+def materialize(value):
+    """A copy with every LazyTables in nested dicts decoded into a plain dict."""
+    if isinstance(value, LazyTables):
+        return dict(value.items())
+    if isinstance(value, dict):
+        return {k: materialize(v) for k, v in value.items()}
+    return value
+
+
+# ========== FILES ==========
+
+def load_metro_data(data_file: Union[str, Path]) -> dict:
+    """Load a metro data artifact, binary or JSON, by its suffix."""
+    data_file = Path(data_file)
+    if data_file.suffix == DATA_SUFFIXES['binary']:
+        return decode_metro_data(data_file.read_bytes())
+    with open(data_file, 'r') as f:
+        return json.load(f)
+
+
+def encode_data_file(metro_data: dict, data_format: str = DEFAULT_DATA_FORMAT) -> bytes:
+    """The bytes of a data artifact in the given format (JSON is written minified)."""
+    if data_format == 'binary':
+        return encode_metro_data(metro_data)
+    if data_format == 'json':
+        return json.dumps(materialize(metro_data), separators=(',', ':')).encode('utf-8')
+    raise ValueError(f"Unknown data_format: {data_format} (choose from {', '.join(DATA_FORMATS)})")
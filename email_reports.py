@@ -9,19 +9,33 @@ Usage:
 
 Environment Variables (or use notifications_config.json):
     SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, EMAIL_FROM, EMAIL_RECIPIENTS
+
+Messages go out through shared, pooled SMTP sessions with per-message retry
+(see mail_delivery.py). This CLI sends directly; scheduled runs queue reports
+and status notifications in the outbox and deliver them in the background
+(see outbox.py).
 """
 
 import os
 import sys
 import json
 import smtplib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from pathlib import Path
 
+from data_artifact import find_data_file
+from mail_delivery import (
+    DEFAULT_MAX_RECIPIENTS, DEFAULT_MAX_RETRIES, DEFAULT_MAX_SESSIONS, DEFAULT_RETRY_BACKOFF,
+    DeliveryError, get_pool
+)
+from outbox import DEFAULT_FLUSH_TIMEOUT, DEFAULT_MAX_ATTEMPTS, DEFAULT_OUTBOX_BACKOFF, idempotency_key
+from region_granularity import get_granularity
+from report_attachments import (
+    DEFAULT_DASHBOARD_MONTHS, build_message, dashboard_link, encode_attachment,
+    message_size_limit, plan_report_message
+)
+
 try:
     from dotenv import load_dotenv
     DOTENV_AVAILABLE = True
@@ -52,7 +66,18 @@ def load_config():
         'send_on_success': True,
         'send_on_failure': True,
         'include_summary_attachment': False,
-        'include_dashboard_attachment': True
+        'include_dashboard_attachment': True,
+        'smtp_starttls': True,
+        'smtp_max_sessions': DEFAULT_MAX_SESSIONS,
+        'smtp_max_retries': DEFAULT_MAX_RETRIES,
+        'smtp_retry_backoff': DEFAULT_RETRY_BACKOFF,
+        'smtp_max_recipients': DEFAULT_MAX_RECIPIENTS,
+        'smtp_max_message_bytes': None,   # None: use the server's advertised SIZE
+        'email_dashboard_months': DEFAULT_DASHBOARD_MONTHS,
+        'dashboard_base_url': '',
+        'outbox_max_attempts': DEFAULT_MAX_ATTEMPTS,
+        'outbox_retry_backoff': DEFAULT_OUTBOX_BACKOFF,
+        'outbox_flush_timeout': DEFAULT_FLUSH_TIMEOUT
     }
 
     # Load from config file if exists
@@ -95,8 +120,14 @@ def load_config():
     return config
 
 
-def generate_email_html(summary, include_ai_narrative=None, dashboard_attached=False):
-    """Generate HTML email body from summary JSON."""
+def generate_email_html(summary, include_ai_narrative=None, dashboard_attached=False, dashboard_note='',
+                        dashboard_link=None):
+    """Generate HTML email body from summary JSON.
+
+    `dashboard_note` adds a line to the attachment notice (e.g. that it is
+    zipped); `dashboard_link` replaces the notice with a link when the
+    dashboard is not attached.
+    """
     metro = summary.get('metro_name', 'Unknown Metro')
     period = summary.get('report_period', 'Unknown')
     health = summary.get('metro_health_score', 0)
@@ -140,9 +171,10 @@ def generate_email_html(summary, include_ai_narrative=None, dashboard_attached=F
     medium_alerts = [a for a in alerts if a.get('severity') == 'MEDIUM']
 
     if high_alerts or medium_alerts:
-        alerts_html = '<h3 style="color: #dc3545; margin-top: 20px;">Cities Requiring Attention</h3>'
+        region = get_granularity(summary.get('region_granularity'))
+        alerts_html = f'<h3 style="color: #dc3545; margin-top: 20px;">{region.plural} Requiring Attention</h3>'
         alerts_html += '<table style="width: 100%; border-collapse: collapse; margin-top: 10px;">'
-        alerts_html += '<tr style="background: #f8f9fa;"><th style="padding: 8px; text-align: left; border: 1px solid #ddd;">City</th>'
+        alerts_html += f'<tr style="background: #f8f9fa;"><th style="padding: 8px; text-align: left; border: 1px solid #ddd;">{region.label}</th>'
         alerts_html += '<th style="padding: 8px; text-align: left; border: 1px solid #ddd;">Severity</th>'
         alerts_html += '<th style="padding: 8px; text-align: left; border: 1px solid #ddd;">Issues</th></tr>'
 
@@ -256,6 +288,9 @@ def generate_email_html(summary, include_ai_narrative=None, dashboard_attached=F
 
     # Add dashboard attachment notice right after header if attached
     if dashboard_attached:
+        note_html = ''
+        if dashboard_note:
+            note_html = f'<p style="color: white; margin: 10px 0 0 0; font-size: 13px;">{dashboard_note}</p>'
         dashboard_notice = '''
         <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; border-radius: 10px; margin-bottom: 20px; text-align: center;">
             <div style="font-size: 28px; margin-bottom: 10px;">📊</div>
@@ -267,8 +302,22 @@ def generate_email_html(summary, include_ai_narrative=None, dashboard_attached=F
             <p style="color: rgba(255,255,255,0.7); margin: 10px 0 0 0; font-size: 12px;">
                 (Requires internet connection to load charting libraries)
             </p>
+        ''' + note_html + '''
         </div>
         '''
+    elif dashboard_link:
+        dashboard_notice = f'''
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; border-radius: 10px; margin-bottom: 20px; text-align: center;">
+            <h3 style="color: white; margin: 0 0 10px 0; font-size: 18px;">Interactive Dashboard</h3>
+            <p style="color: rgba(255,255,255,0.9); margin: 0; font-size: 14px;">
+                The dashboard is too large to attach. <a href="{dashboard_link}" style="color: white; font-weight: bold;">Open it here</a>.
+            </p>
+        </div>
+        '''
+    else:
+        dashboard_notice = ''
+
+    if dashboard_notice:
         # Insert after the header div
         header_end = html.find('</div>', html.find('Period:'))
         if header_end != -1:
@@ -278,7 +327,7 @@ def generate_email_html(summary, include_ai_narrative=None, dashboard_attached=F
     return html
 
 
-def generate_plain_text(summary, dashboard_attached=False):
+def generate_plain_text(summary, dashboard_attached=False, dashboard_note='', dashboard_link=None):
     """Generate plain text version of email."""
     metro = summary.get('metro_name', 'Unknown Metro')
     period = summary.get('report_period', 'Unknown')
@@ -297,6 +346,15 @@ Download the attached HTML file and open in your browser for:
 - Trend analysis with moving averages
 - Flipper intelligence signals
 (Requires internet connection for charting libraries)
+"""
+        if dashboard_note:
+            dashboard_section += f"{dashboard_note}\n"
+        dashboard_section += "\n"
+    elif dashboard_link:
+        dashboard_section = f"""
+*** INTERACTIVE DASHBOARD ***
+The dashboard is too large to attach. Open it here:
+{dashboard_link}
 
 """
 
@@ -332,8 +390,8 @@ Data Source: Redfin Data Center
     return text
 
 
-def send_email(config, subject, html_body, text_body, attachments=None):
-    """Send email with HTML body and optional attachments."""
+def _email_ready(config):
+    """Check that email is enabled and has recipients, printing why not."""
     if not config.get('enabled'):
         print("[SKIP] Email not configured (missing credentials or recipients)")
         return False
@@ -342,59 +400,94 @@ def send_email(config, subject, html_body, text_body, attachments=None):
         print("[SKIP] No email recipients configured")
         return False
 
+    return True
+
+
+def send_batched(config, message):
+    """
+    Send a built message (or its flattened bytes) to every configured recipient
+    over the shared pool; long recipient lists go out in parallel batches.
+
+    Returns:
+        smtplib's dict of refused recipients
+
+    Raises:
+        DeliveryError: the message could not be delivered
+    """
+    recipients = config['recipients']
+    batch_size = max(1, int(config.get('smtp_max_recipients', DEFAULT_MAX_RECIPIENTS)))
+    batches = [recipients[i:i + batch_size] for i in range(0, len(recipients), batch_size)]
+    from_addr = config['from_address'] or config['smtp_user']
+    return get_pool(config).send_batches(message, batches, from_addr=from_addr)
+
+
+def outbox_sender(config):
+    """Delivery callable for outbox.py: sends flattened bytes, raising DeliveryError on failure."""
+    def _send(message):
+        refused = send_batched(config, message)
+        if refused:
+            print(f"[WARN] {len(refused)} recipient(s) refused: {', '.join(refused)}")
+    return _send
+
+
+def deliver_message(config, message):
+    """Send a built message (or its flattened bytes) to the configured recipients."""
+    if not _email_ready(config):
+        return False
+
     try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = config['from_address'] or config['smtp_user']
-        msg['To'] = ', '.join(config['recipients'])
-
-        # Attach plain text and HTML versions
-        msg.attach(MIMEText(text_body, 'plain'))
-        msg.attach(MIMEText(html_body, 'html'))
-
-        # Add attachments if any
-        if attachments:
-            for filepath in attachments:
-                if os.path.exists(filepath):
-                    with open(filepath, 'rb') as f:
-                        part = MIMEBase('application', 'octet-stream')
-                        part.set_payload(f.read())
-                        encoders.encode_base64(part)
-                        filename = os.path.basename(filepath)
-                        part.add_header('Content-Disposition', f'attachment; filename="{filename}"')
-                        msg.attach(part)
-
-        # Connect and send
-        print(f"[EMAIL] Connecting to {config['smtp_host']}:{config['smtp_port']}...")
-
-        with smtplib.SMTP(config['smtp_host'], config['smtp_port']) as server:
-            server.starttls()
-            server.login(config['smtp_user'], config['smtp_password'])
-            server.send_message(msg)
-
-        print(f"[OK] Email sent to {len(config['recipients'])} recipient(s)")
+        print(f"[EMAIL] Sending via {config['smtp_host']}:{config['smtp_port']}...")
+        refused = send_batched(config, message)
+
+        if refused:
+            print(f"[WARN] {len(refused)} recipient(s) refused: {', '.join(refused)}")
+        print(f"[OK] Email sent to {len(config['recipients']) - len(refused)} recipient(s)")
         return True
 
-    except smtplib.SMTPAuthenticationError:
-        print("[ERROR] Email authentication failed. Check username/password.")
-        return False
-    except smtplib.SMTPException as e:
-        print(f"[ERROR] SMTP error: {str(e)}")
+    except DeliveryError as e:
+        if isinstance(e.__cause__, smtplib.SMTPAuthenticationError):
+            print("[ERROR] Email authentication failed. Check username/password.")
+        else:
+            print(f"[ERROR] SMTP error: {str(e)}")
         return False
     except Exception as e:
         print(f"[ERROR] Failed to send email: {str(e)}")
         return False
 
 
-def send_market_report(
+def send_email(config, subject, html_body, text_body, attachments=None):
+    """Send email with HTML body and optional attachments."""
+    if not _email_ready(config):
+        return False
+
+    try:
+        parts = []
+        for filepath in attachments or []:
+            if os.path.exists(filepath):
+                with open(filepath, 'rb') as f:
+                    parts.append(encode_attachment(os.path.basename(filepath), f.read()))
+        msg = build_message(config, subject, html_body, text_body, parts)
+    except Exception as e:
+        print(f"[ERROR] Failed to build email: {str(e)}")
+        return False
+
+    return deliver_message(config, msg)
+
+
+def report_key(metro_slug, period):
+    """Outbox idempotency key: one market report per metro and period."""
+    return idempotency_key('report', metro_slug, period)
+
+
+def build_market_report(
     metro_name,
     summary,
-    config=None,
+    config,
     ai_narrative=None,
     output_directory=None,
     metro_slug=None,
 ):
-    """Send market report email for a specific metro.
+    """Plan a metro's market report email against the size limit.
 
     Args:
         metro_name: Display name for the metro (e.g., "Charlotte, NC")
@@ -403,18 +496,19 @@ def send_market_report(
         ai_narrative: Optional AI-generated narrative text
         output_directory: Folder name where files are stored (e.g., "charlotte")
         metro_slug: Config slug used for generated filenames (e.g., "charlotte")
-    """
-    if config is None:
-        config = load_config()
 
+    Returns:
+        (plan, fallback): the chosen MessagePlan, and the body-only message as
+        bytes to send if the plan is rejected (None when the plan is body-only)
+    """
     period = summary.get('report_period', 'Unknown')
     status = summary.get('market_status', 'UNKNOWN').replace('_', ' ')
 
     subject = f"[Market Report] {metro_name} - {period} ({status})"
 
     # Prepare attachments
-    attachments = []
-    dashboard_attachment = None
+    extra_files = []
+    dashboard_file = None
     base_dir = Path(__file__).parent
 
     # Use output_directory if provided, otherwise derive from metro_name
@@ -429,45 +523,124 @@ def send_market_report(
     if config.get('include_summary_attachment'):
         summary_file = report_folder / f"{attachment_slug}_summary.json"
         if summary_file.exists():
-            attachments.append(str(summary_file))
+            extra_files.append(summary_file)
 
     # Add interactive dashboard HTML attachment
     if config.get('include_dashboard_attachment'):
-        dashboard_file = report_folder / f"dashboard_enhanced_{attachment_slug}_{period}.html"
-        if dashboard_file.exists():
-            dashboard_attachment = str(dashboard_file)
-            attachments.append(dashboard_attachment)
-            print(f"    [+] Dashboard attached: {dashboard_file.name} ({dashboard_file.stat().st_size / 1024 / 1024:.1f} MB)")
-
-    def _send_with_attachments(current_attachments):
-        has_dashboard = bool(dashboard_attachment and dashboard_attachment in current_attachments)
-        html_body = generate_email_html(summary, include_ai_narrative=ai_narrative, dashboard_attached=has_dashboard)
-        text_body = generate_plain_text(summary, dashboard_attached=has_dashboard)
-        return send_email(config, subject, html_body, text_body, current_attachments)
-
-    # First try with requested attachments.
-    success = _send_with_attachments(attachments)
-
-    # If dashboard attachment caused rejection (size/policy), retry without dashboard.
-    if not success and dashboard_attachment and dashboard_attachment in attachments:
-        retry_without_dashboard = [a for a in attachments if a != dashboard_attachment]
-        print("    [WARN] Retrying email without dashboard attachment...")
-        success = _send_with_attachments(retry_without_dashboard)
-        attachments = retry_without_dashboard
-
-    # Final fallback: deliver report body without attachments.
-    if not success and attachments:
+        candidate = report_folder / f"dashboard_enhanced_{attachment_slug}_{period}.html"
+        if candidate.exists():
+            dashboard_file = candidate
+            print(f"    [+] Dashboard: {dashboard_file.name} ({dashboard_file.stat().st_size / 1024 / 1024:.1f} MB)")
+
+    def _render_bodies(variant):
+        html_body = generate_email_html(
+            summary, include_ai_narrative=ai_narrative, dashboard_attached=variant.dashboard_attached,
+            dashboard_note=variant.dashboard_note, dashboard_link=variant.dashboard_link
+        )
+        text_body = generate_plain_text(
+            summary, dashboard_attached=variant.dashboard_attached,
+            dashboard_note=variant.dashboard_note, dashboard_link=variant.dashboard_link
+        )
+        return html_body, text_body
+
+    # Pick the largest variant that fits the server's size limit before sending anything
+    plan = plan_report_message(
+        config, subject, _render_bodies,
+        dashboard_file=dashboard_file,
+        data_file=find_data_file(report_folder, attachment_slug),
+        extra_files=extra_files,
+        dashboard_url=dashboard_link(config, base_dir, dashboard_file) if dashboard_file else None,
+        limit=message_size_limit(config, get_pool(config)),
+    )
+
+    # Policy rejections the size check can't predict: deliver the report body on its own
+    fallback = None
+    if plan.variant != 'body_only':
+        html_body, text_body = generate_email_html(summary, include_ai_narrative=ai_narrative), generate_plain_text(summary)
+        fallback = build_message(config, subject, html_body, text_body).as_bytes()
+
+    return plan, fallback
+
+
+def send_market_report(
+    metro_name,
+    summary,
+    config=None,
+    ai_narrative=None,
+    output_directory=None,
+    metro_slug=None,
+):
+    """Send market report email for a specific metro right away (see build_market_report for args)."""
+    if config is None:
+        config = load_config()
+
+    if not _email_ready(config):
+        return False
+
+    try:
+        plan, fallback = build_market_report(metro_name, summary, config, ai_narrative, output_directory, metro_slug)
+    except Exception as e:
+        print(f"[ERROR] Failed to build email: {str(e)}")
+        return False
+    print(f"    [PLAN] Sending '{plan.variant}' variant ({plan.size / 1024 / 1024:.1f} MB, limit {plan.limit / 1024 / 1024:.1f} MB)")
+
+    success = deliver_message(config, plan.message)
+
+    if not success and fallback is not None:
         print("    [WARN] Retrying email without attachments...")
-        success = _send_with_attachments([])
+        success = deliver_message(config, fallback)
 
     return success
 
 
-def send_pipeline_notification(success, message, metros_processed=None, config=None):
-    """Send notification about pipeline execution status."""
+def queue_market_report(
+    outbox,
+    metro_name,
+    summary,
+    config=None,
+    ai_narrative=None,
+    output_directory=None,
+    metro_slug=None,
+):
+    """
+    Queue a metro's market report in the outbox for background delivery.
+
+    Reports already sent (or still queued) for the same metro and period are
+    not queued again.
+
+    Returns:
+        'queued', 'duplicate', or None when email is not configured or the
+        message could not be built
+    """
     if config is None:
         config = load_config()
 
+    if not _email_ready(config):
+        return None
+
+    period = summary.get('report_period', 'Unknown')
+    key = report_key(metro_slug or metro_name, period)
+    state = outbox.state(key)
+    if state in ('sent', 'pending'):
+        print(f"    [SKIP] Report for {period} already {state} ({key})")
+        return 'duplicate'
+
+    try:
+        plan, fallback = build_market_report(metro_name, summary, config, ai_narrative, output_directory, metro_slug)
+    except Exception as e:
+        print(f"[ERROR] Failed to build email: {str(e)}")
+        return None
+    print(f"    [PLAN] Queued '{plan.variant}' variant ({plan.size / 1024 / 1024:.1f} MB, limit {plan.limit / 1024 / 1024:.1f} MB)")
+
+    queued = outbox.enqueue(
+        key, plan.message, fallback=fallback,
+        kind='report', metro=metro_slug or metro_name, period=period, variant=plan.variant
+    )
+    return 'queued' if queued else 'duplicate'
+
+
+def build_pipeline_notification(success, message, metros_processed=None):
+    """Build the pipeline status email; returns (subject, html_body, text_body)."""
     status_emoji = "Success" if success else "FAILED"
     subject = f"[Pipeline {status_emoji}] Real Estate Market Analysis - {datetime.now().strftime('%Y-%m-%d')}"
 
@@ -496,19 +669,53 @@ Metros Processed: {metros_list}
 
 {'All dashboards and reports have been generated successfully.' if success else 'Please check the logs for details.'}
 """
+    return subject, html_body, text_body
+
 
-    # Decide whether to send based on config
+def _notification_wanted(success, config):
+    """Decide whether to send based on config."""
     if success and not config.get('send_on_success', True):
         print("[SKIP] Success notification disabled in config")
-        return True
+        return False
 
     if not success and not config.get('send_on_failure', True):
         print("[SKIP] Failure notification disabled in config")
+        return False
+
+    return True
+
+
+def send_pipeline_notification(success, message, metros_processed=None, config=None):
+    """Send notification about pipeline execution status."""
+    if config is None:
+        config = load_config()
+
+    if not _notification_wanted(success, config):
         return True
 
+    subject, html_body, text_body = build_pipeline_notification(success, message, metros_processed)
     return send_email(config, subject, html_body, text_body)
 
 
+def queue_pipeline_notification(outbox, run_id, success, message, metros_processed=None, config=None):
+    """Queue the pipeline status notification for a run (one per run_id) in the outbox."""
+    if config is None:
+        config = load_config()
+
+    if not _notification_wanted(success, config):
+        return True
+
+    if not _email_ready(config):
+        return False
+
+    subject, html_body, text_body = build_pipeline_notification(success, message, metros_processed)
+    outbox.enqueue(
+        idempotency_key('status', run_id), build_message(config, subject, html_body, text_body).as_bytes(),
+        kind='status', run_id=run_id, success=success
+    )
+    return True
+
+
 def send_test_email(config=None):
     """Send a test email to verify configuration."""
     if config is None:
@@ -582,8 +789,8 @@ def main():
             print(f"[ERROR] Metro '{metro_filter}' not found or not enabled")
             return 1
 
-    # Send reports for each metro
-    results = []
+    # Collect each metro's latest report
+    reports = []
     for metro in metros:
         metro_name = metro['name']
         metro_dir = base_dir / metro.get('output_directory', metro_name)
@@ -616,17 +823,23 @@ def main():
             with open(narrative_file, 'r') as f:
                 ai_narrative = f.read()
 
+        reports.append((metro, summary, ai_narrative))
+
+    def _send(report):
+        metro, summary, ai_narrative = report
         print(f"\n[SEND] Sending report for {metro['display_name']}...")
-        output_dir = metro.get('output_directory', metro_name)
-        success = send_market_report(
+        return metro['name'], send_market_report(
             metro['display_name'],
             summary,
             config=config,
             ai_narrative=ai_narrative,
-            output_directory=output_dir,
-            metro_slug=metro_name,
+            output_directory=metro.get('output_directory', metro['name']),
+            metro_slug=metro['name'],
         )
-        results.append((metro_name, success))
+
+    # Send concurrently, one report per pooled SMTP session
+    with ThreadPoolExecutor(max_workers=max(1, int(config.get('smtp_max_sessions', DEFAULT_MAX_SESSIONS)))) as executor:
+        results = list(executor.map(_send, reports))
 
     # Summary
     print("\n" + "="*60)
@@ -1,92 +1,465 @@
 """
 Metro Extraction Script
-Extracts metro-specific data from raw Redfin city_market_tracker TSV file.
+Extracts metro-specific data from raw Redfin city_market_tracker TSV file
+(or the zip-code / neighborhood tracker, per region_granularity.py).
 Reads configuration from metro_config.json to support multiple metros.
+
+Each metro is written as a typed binary partition ({name}_cities_filtered.npz,
+see frame_partition.py) that processing reads back without re-parsing. Set
+data_settings.tsv_export to also write the TSV.
+
+By default a metro's matching rows are collected in memory, sorted and
+written. With data_settings.extract_memory_mb set, extraction streams instead
+(stream_and_write_metro): matching rows are spilled to spool partitions on
+disk as they are found, each sorted by period. The spool runs are then merged
+period by period into the output, one column and one block of rows at a time,
+so peak memory stays under the cap however large the metro or its history.
+Zip-code and neighborhood metros stream by default.
 """
 
+import numpy as np
 import pandas as pd
 import gzip
 import json
+import shutil
+import tempfile
+from contextlib import ExitStack
 from pathlib import Path
+from typing import List, Optional, Tuple
 import sys
 
+from frame_partition import (
+    PartitionReader, PartitionWriter, iter_partition_blocks, partition_path, write_partition
+)
+from region_granularity import extract_memory_mb, extracted_file_name, granularity_source_file, metro_granularity
+
+# Date columns parsed once here so downstream stages get datetimes
+DATE_COLUMNS = ('PERIOD_BEGIN', 'PERIOD_END')
+
+# Source rows read per chunk (the most a streaming chunk may grow to)
+CHUNK_ROWS = 50000
+
+# Streaming extraction: rows in the first chunk, used to size later chunks
+PROBE_ROWS = 2000
+
+# Streaming extraction: shares of extract_memory_mb for one source chunk and
+# for the matching rows buffered before they are spilled to disk. The rest is
+# headroom for the CSV parser and for the column being written out.
+CHUNK_SHARE = 0.2
+SPOOL_SHARE = 0.2
+
+# Streaming extraction: generous size of one decoded value (a short string
+# object), used to size merge blocks from CHUNK_SHARE
+VALUE_BYTES = 100
+
+# Streaming extraction: rough cost of one open spool run (file handle, zip
+# directory and read buffers), used to size the merge fan-in from CHUNK_SHARE
+RUN_BYTES = 64 * 1024
+
+# int64 view of NaT
+NAT_TICK = np.iinfo(np.int64).min
+
 def load_config(config_path: str = 'metro_config.json') -> dict:
     """Load metro configuration from JSON file."""
     with open(config_path, 'r') as f:
         return json.load(f)
 
-def extract_metro(source_file: str, metro_code: str, output_file: str, property_type: str = 'All Residential'):
-    """
-    Extract a single metro's data from the source TSV file.
+def _matching_rows(chunk: pd.DataFrame, metro_code: str, property_type: str) -> pd.DataFrame:
+    """A source chunk's rows for one metro and property type."""
+    # Normalize headers (strip quotes/whitespace) while preserving case expected downstream
+    chunk.columns = [col.strip().strip('"') for col in chunk.columns]
+    return chunk[
+        (chunk['PARENT_METRO_REGION_METRO_CODE'].astype(str) == str(metro_code)) &
+        (chunk['PROPERTY_TYPE'] == property_type)
+    ]
 
-    Args:
-        source_file: Path to city_market_tracker.tsv000.gz
-        metro_code: Metro code to filter (e.g., '16740' for Charlotte)
-        output_file: Path to output filtered TSV file
-        property_type: Property type to filter (default: 'All Residential')
+
+def extract_metro_frame(source_file: str, metro_code: str, property_type: str = 'All Residential') -> Optional[pd.DataFrame]:
     """
-    print(f"\n[EXTRACTING] Metro Code: {metro_code}")
-    print(f"  Source: {source_file}")
-    print(f"  Output: {output_file}")
+    Read a single metro's rows from the source TSV file.
 
+    Returns the filtered rows sorted by period (most recent first, source
+    order within a period), with DATE_COLUMNS parsed to datetimes, or None
+    when the metro has no rows. The number of source rows scanned is kept in
+    `attrs['rows_scanned']`.
+    """
     # Open gzipped file and read in chunks to manage memory
-    chunk_size = 50000
     filtered_chunks = []
     total_rows = 0
     filtered_rows = 0
 
-    try:
-        with gzip.open(source_file, 'rt', encoding='utf-8') as f:
-            # Read in chunks
-            for chunk_num, chunk in enumerate(pd.read_csv(f, sep='\t', chunksize=chunk_size, low_memory=False)):
-                # Normalize headers (strip quotes/whitespace) while preserving case expected downstream
-                chunk.columns = [col.strip().strip('"') for col in chunk.columns]
-                total_rows += len(chunk)
-
-                # Filter by metro code and property type
-                filtered = chunk[
-                    (chunk['PARENT_METRO_REGION_METRO_CODE'].astype(str) == str(metro_code)) &
-                    (chunk['PROPERTY_TYPE'] == property_type)
-                ]
-
-                if len(filtered) > 0:
-                    filtered_chunks.append(filtered)
-                    filtered_rows += len(filtered)
-
-                # Progress indicator
-                if (chunk_num + 1) % 10 == 0:
-                    print(f"  Processed {total_rows:,} rows, found {filtered_rows:,} matches...")
-
-        if not filtered_chunks:
-            print(f"  [WARNING] No data found for metro code {metro_code}")
-            return False
+    with gzip.open(source_file, 'rt', encoding='utf-8') as f:
+        # Read in chunks
+        for chunk_num, chunk in enumerate(pd.read_csv(f, sep='\t', chunksize=CHUNK_ROWS, low_memory=False)):
+            total_rows += len(chunk)
+
+            # Filter by metro code and property type
+            filtered = _matching_rows(chunk, metro_code, property_type)
+
+            if len(filtered) > 0:
+                filtered_chunks.append(filtered)
+                filtered_rows += len(filtered)
+
+            # Progress indicator
+            if (chunk_num + 1) % 10 == 0:
+                print(f"  Processed {total_rows:,} rows, found {filtered_rows:,} matches...")
+
+    if not filtered_chunks:
+        return None
+
+    # Combine all filtered chunks
+    result_df = pd.concat(filtered_chunks, ignore_index=True)
+
+    # Sort by period (most recent first); stable, so streaming extraction matches
+    result_df = result_df.sort_values('PERIOD_BEGIN', ascending=False, kind='stable')
+    for column in DATE_COLUMNS:
+        if column in result_df.columns:
+            result_df[column] = pd.to_datetime(result_df[column])
+    result_df.attrs['rows_scanned'] = total_rows
+    return result_df
 
-        # Combine all filtered chunks
-        result_df = pd.concat(filtered_chunks, ignore_index=True)
 
-        # Sort by period (most recent first)
-        result_df = result_df.sort_values('PERIOD_BEGIN', ascending=False)
+def extract_and_write_metro(
+    source_file: str,
+    metro_code: str,
+    output_file: str,
+    property_type: str = 'All Residential',
+    tsv_export: bool = False
+) -> Optional[pd.DataFrame]:
+    """
+    Extract a single metro's data, write its partition and return the rows.
+
+    output_file is the metro's TSV path; the partition goes next to it with a
+    .npz suffix. The TSV itself is written only with tsv_export, and a stale
+    one from an earlier run is removed otherwise.
+
+    Returns None when extraction fails or finds no rows.
+    """
+    partition_file = partition_path(output_file)
+    print(f"\n[EXTRACTING] Metro Code: {metro_code}")
+    print(f"  Source: {source_file}")
+    print(f"  Output: {partition_file}" + (f" + {output_file}" if tsv_export else ""))
+
+    try:
+        result_df = extract_metro_frame(source_file, metro_code, property_type)
+
+        if result_df is None:
+            print(f"  [WARNING] No data found for metro code {metro_code}")
+            return None
 
-        # Write to output file
-        result_df.to_csv(output_file, sep='\t', index=False)
+        # Write the partition (and the TSV export, if enabled)
+        write_partition(result_df, partition_file)
+        if tsv_export:
+            result_df.to_csv(output_file, sep='\t', index=False, date_format='%Y-%m-%d')
+        else:
+            Path(output_file).unlink(missing_ok=True)
 
         # Summary statistics
         unique_cities = result_df['REGION'].nunique()
-        date_range = f"{result_df['PERIOD_BEGIN'].min()} to {result_df['PERIOD_BEGIN'].max()}"
+        date_range = (f"{result_df['PERIOD_BEGIN'].min():%Y-%m-%d} to "
+                      f"{result_df['PERIOD_BEGIN'].max():%Y-%m-%d}")
 
         print(f"  [OK] Extraction complete:")
         print(f"       Total rows: {len(result_df):,}")
-        print(f"       Unique cities: {unique_cities}")
+        print(f"       Unique regions: {unique_cities}")
         print(f"       Date range: {date_range}")
 
-        return True
+        return result_df
+
+    except FileNotFoundError:
+        print(f"  [ERROR] Source file not found: {source_file}")
+        return None
+    except Exception as e:
+        print(f"  [ERROR] Extraction failed: {str(e)}")
+        return None
+
+
+def _spool_matching_rows(source_file: str, metro_code: str, property_type: str, budget: float,
+                         spool_dir: Path) -> tuple:
+    """
+    Scan the source in chunks sized to the memory budget, spilling matching
+    rows to numbered spool partitions whenever the buffered rows outgrow their
+    share of it. Each run is sorted like extract_metro_frame (stable, most
+    recent period first) and has its DATE_COLUMNS parsed.
+
+    Returns (spool files, source rows scanned).
+    """
+    runs: List[Path] = []
+    buffered: List[pd.DataFrame] = []
+    buffered_bytes = 0
+    total_rows = 0
+    filtered_rows = 0
+
+    def spill():
+        run = pd.concat(buffered, ignore_index=True)
+        buffered.clear()
+        run = run.sort_values('PERIOD_BEGIN', ascending=False, kind='stable', ignore_index=True)
+        for column in DATE_COLUMNS:
+            if column in run.columns:
+                run[column] = pd.to_datetime(run[column])
+        run_file = spool_dir / f'run{len(runs):04d}.npz'
+        write_partition(run, run_file)
+        runs.append(run_file)
+
+    with gzip.open(source_file, 'rt', encoding='utf-8') as f:
+        reader = pd.read_csv(f, sep='\t', chunksize=PROBE_ROWS, low_memory=False)
+        chunk_rows = PROBE_ROWS
+        next_progress = CHUNK_ROWS * 10
+        while True:
+            try:
+                chunk = reader.get_chunk(chunk_rows)
+            except StopIteration:
+                break
+            total_rows += len(chunk)
+
+            # Size the next chunk from what this one cost per row
+            row_bytes = chunk.memory_usage(deep=True).sum() / max(len(chunk), 1)
+            chunk_rows = int(min(max(budget * CHUNK_SHARE / row_bytes, PROBE_ROWS), CHUNK_ROWS))
+
+            filtered = _matching_rows(chunk, metro_code, property_type)
+            del chunk
+            if len(filtered) > 0:
+                buffered.append(filtered)
+                buffered_bytes += filtered.memory_usage(deep=True).sum()
+                filtered_rows += len(filtered)
+                if buffered_bytes > budget * SPOOL_SHARE:
+                    spill()
+                    buffered_bytes = 0
+
+            # Progress indicator
+            if total_rows >= next_progress:
+                print(f"  Processed {total_rows:,} rows, found {filtered_rows:,} matches...")
+                next_progress += CHUNK_ROWS * 10
+
+    if buffered:
+        spill()
+    return runs, total_rows
+
+
+def _merged_dtype(dtypes: List[str]) -> str:
+    """The dtype pd.concat gives a column stored with these dtypes across runs."""
+    if len(set(dtypes)) == 1:
+        return dtypes[0]
+    parsed = [pd.api.types.pandas_dtype(d) for d in set(dtypes)]
+    if all(isinstance(d, np.dtype) for d in parsed) and (
+            all(d.kind in 'iuf' for d in parsed) or all(d.kind == 'M' for d in parsed)):
+        return str(np.result_type(*parsed))
+    return 'object'
+
+
+def _period_counts(run: Path, block_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """A run's distinct PERIOD_BEGIN ticks (ascending) and their row counts, read a block at a time."""
+    counts: dict = {}
+    with PartitionReader(run) as partition, partition.column('PERIOD_BEGIN') as column:
+        for start in range(0, partition.rows, block_rows):
+            block = column.read_array(min(block_rows, partition.rows - start))
+            ticks, block_counts = np.unique(block.astype('datetime64[ns]').view(np.int64), return_counts=True)
+            for tick, count in zip(ticks.tolist(), block_counts.tolist()):
+                counts[tick] = counts.get(tick, 0) + count
+    ticks = np.array(sorted(counts), dtype=np.int64)
+    return ticks, np.array([counts[tick] for tick in ticks.tolist()], dtype=np.int64)
+
+
+def _merge_segments(runs: List[Path], block_rows: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The output order as segments (parallel arrays of run index and rows),
+    plus the period ticks found, most recent first.
+
+    Each run is sorted by period, so a period's rows are one slice of every
+    run. Taking periods most recent first and, within a period, runs in order
+    is the stable sort of the whole metro that extract_metro_frame does.
+    """
+    run_ticks, run_counts = [], []
+    for run in runs:
+        ticks, counts = _period_counts(run, block_rows)
+        run_ticks.append(ticks)
+        run_counts.append(counts)
+
+    # NaT is the smallest tick, so missing periods come last, as with sort_values
+    periods = np.unique(np.concatenate(run_ticks))
+    rank = np.concatenate([np.searchsorted(periods, ticks) for ticks in run_ticks])
+    run_index = np.concatenate([np.full(len(ticks), i) for i, ticks in enumerate(run_ticks)])
+    by_period = np.lexsort((run_index, -rank))
+    return run_index[by_period], np.concatenate(run_counts)[by_period], periods[::-1]
+
+
+def _merged_blocks(sources, segments: Tuple[np.ndarray, np.ndarray], block_rows: int):
+    """
+    One column's values in merged order, as Series of at most block_rows rows.
+
+    Segments are gathered as plain numpy arrays (np.concatenate widens mixed
+    numeric runs as pd.concat would); pandas only sees whole blocks.
+    """
+    pending: List[np.ndarray] = []
+    pending_rows = 0
+    for run, rows in zip(*segments):
+        rows = int(rows)
+        while rows:
+            take = min(rows, block_rows - pending_rows)
+            pending.append(sources[run].read_array(take))
+            pending_rows += take
+            rows -= take
+            if pending_rows == block_rows:
+                block = np.concatenate(pending)
+                yield pd.Series(block, dtype=block.dtype, copy=False)
+                pending, pending_rows = [], 0
+    if pending:
+        block = np.concatenate(pending)
+        yield pd.Series(block, dtype=block.dtype, copy=False)
+
+
+def _tally_regions(blocks, regions: set):
+    for block in blocks:
+        regions.update(block.dropna().unique())
+        yield block
+
+
+def _merge_runs(runs: List[Path], partition_file: Path, block_rows: int, attrs: dict) -> Tuple[int, np.ndarray, set]:
+    """
+    Merge period-sorted runs into one partition, itself sorted the same way.
+
+    Columns are written one at a time, each streamed from every run in blocks
+    of at most block_rows rows, so memory holds one block, the segments and
+    the column's distinct strings (shared across runs), never a whole column.
+
+    Returns (rows, period ticks most recent first, distinct REGION values).
+    """
+    run_index, run_rows, ticks = _merge_segments(runs, block_rows)
+    rows = int(run_rows.sum())
+    regions: set = set()
+    with ExitStack() as stack:
+        readers = [stack.enter_context(PartitionReader(run)) for run in runs]
+        with PartitionWriter(partition_file, rows) as writer:
+            for name in readers[0].dtypes:
+                interned: dict = {}
+                with ExitStack() as columns:
+                    sources = [columns.enter_context(reader.column(name, interned)) for reader in readers]
+                    blocks = _merged_blocks(sources, (run_index, run_rows), block_rows)
+                    if name == 'REGION':
+                        blocks = _tally_regions(blocks, regions)
+                    writer.add_column_blocks(name, _merged_dtype([r.dtypes[name] for r in readers]), blocks)
+            writer.close(attrs)
+    return rows, ticks, regions
+
+
+def _write_merged_runs(runs: List[Path], partition_file: Path, rows_scanned: int,
+                       block_rows: int = CHUNK_ROWS, fan_in: int = 64) -> dict:
+    """
+    Merge the spool runs into the output partition, in extract_metro_frame's
+    order (see _merge_runs).
+
+    Every open run costs a file handle and buffers, so at most fan_in runs
+    are merged at once: beyond that, consecutive groups are first merged into
+    larger runs next to the spool files. Merging neighbours keeps the order
+    stable.
+    """
+    passes = 0
+    while len(runs) > fan_in:
+        passes += 1
+        merged = []
+        for start in range(0, len(runs), fan_in):
+            group = runs[start:start + fan_in]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            merged_file = group[0].with_name(f'pass{passes}-{len(merged):04d}.npz')
+            _merge_runs(group, merged_file, block_rows, {})
+            for run in group:
+                run.unlink()
+            merged.append(merged_file)
+        runs = merged
+
+    rows, ticks, regions = _merge_runs(runs, partition_file, block_rows, {'rows_scanned': rows_scanned})
+    periods = [pd.Timestamp(tick) for tick in ticks if tick != NAT_TICK]
+    return {
+        'rows': rows,
+        'rows_scanned': rows_scanned,
+        'unique_cities': len(regions),
+        'date_range': f"{periods[-1]:%Y-%m-%d} to {periods[0]:%Y-%m-%d}" if periods else 'n/a',
+    }
+
+
+def stream_and_write_metro(
+    source_file: str,
+    metro_code: str,
+    output_file: str,
+    memory_mb: float,
+    property_type: str = 'All Residential',
+    tsv_export: bool = False
+) -> Optional[dict]:
+    """
+    Extract a single metro's data under a memory cap and write its partition.
+
+    Writes the same partition (and TSV export) as extract_and_write_metro, but
+    never holds the metro's rows as one DataFrame: matching rows are spooled
+    to disk next to the output and merged column by column (see the module
+    docstring). Nothing is returned in memory; processing reads the partition.
+
+    Returns {'rows', 'rows_scanned', 'unique_cities', 'date_range'}, or None
+    when extraction fails or finds no rows.
+    """
+    partition_file = partition_path(output_file)
+    print(f"\n[EXTRACTING] Metro Code: {metro_code} (streaming, {memory_mb:g} MB cap)")
+    print(f"  Source: {source_file}")
+    print(f"  Output: {partition_file}" + (f" + {output_file}" if tsv_export else ""))
+
+    spool_dir = None
+    try:
+        if memory_mb <= 0:
+            raise ValueError(f"extract_memory_mb must be positive (got {memory_mb})")
+        spool_dir = Path(tempfile.mkdtemp(prefix=f'.{partition_file.stem}.spool-', dir=partition_file.parent))
+        runs, rows_scanned = _spool_matching_rows(
+            source_file, metro_code, property_type, memory_mb * 1024 * 1024, spool_dir
+        )
+        if not runs:
+            print(f"  [WARNING] No data found for metro code {metro_code}")
+            return None
+
+        budget = memory_mb * 1024 * 1024
+        block_rows = int(min(max(budget * CHUNK_SHARE / VALUE_BYTES, PROBE_ROWS), CHUNK_ROWS))
+        fan_in = max(int(budget * CHUNK_SHARE / RUN_BYTES), 2)
+        stats = _write_merged_runs(runs, partition_file, rows_scanned, block_rows, fan_in)
+        if tsv_export:
+            with open(output_file, 'w', encoding='utf-8', newline='') as f:
+                for i, block in enumerate(iter_partition_blocks(partition_file, block_rows)):
+                    block.to_csv(f, sep='\t', index=False, header=(i == 0), date_format='%Y-%m-%d')
+        else:
+            Path(output_file).unlink(missing_ok=True)
+
+        print(f"  [OK] Extraction complete:")
+        print(f"       Total rows: {stats['rows']:,} (from {len(runs)} spool run(s))")
+        print(f"       Unique regions: {stats['unique_cities']}")
+        print(f"       Date range: {stats['date_range']}")
+        return stats
 
     except FileNotFoundError:
         print(f"  [ERROR] Source file not found: {source_file}")
-        return False
+        return None
     except Exception as e:
         print(f"  [ERROR] Extraction failed: {str(e)}")
-        return False
+        return None
+    finally:
+        if spool_dir is not None:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def extract_metro(source_file: str, metro_code: str, output_file: str, property_type: str = 'All Residential',
+                  tsv_export: bool = False, memory_mb: Optional[float] = None):
+    """
+    Extract a single metro's data from the source TSV file.
+
+    Args:
+        source_file: Path to city_market_tracker.tsv000.gz
+        metro_code: Metro code to filter (e.g., '16740' for Charlotte)
+        output_file: Path to the filtered TSV (the partition is written next to it)
+        property_type: Property type to filter (default: 'All Residential')
+        tsv_export: Also write the filtered TSV
+        memory_mb: Stream extraction under this memory cap (default: in memory)
+    """
+    if memory_mb:
+        return stream_and_write_metro(source_file, metro_code, output_file, memory_mb, property_type,
+                                      tsv_export) is not None
+    return extract_and_write_metro(source_file, metro_code, output_file, property_type, tsv_export) is not None
 
 def main():
     """Main extraction workflow."""
@@ -108,15 +481,23 @@ def main():
 
     # Get data settings
     data_settings = config.get('data_settings', {})
-    source_file = data_settings.get('source_file', 'city_market_tracker.tsv000.gz')
     property_type = data_settings.get('property_type_filter', 'All Residential')
-    output_pattern = data_settings.get('output_file_pattern', '{name}_cities_filtered.tsv')
+    tsv_export = data_settings.get('tsv_export', False)
+    enabled = [metro for metro in config['metros'] if metro.get('enabled', True)]
 
-    # Check if source file exists
-    if not Path(source_file).exists():
-        print(f"\n[ERROR] Source file not found: {source_file}")
-        print("Please download the latest city_market_tracker.tsv000.gz from Redfin")
+    # Check that every source file exists (one tracker per region granularity in use)
+    try:
+        granularities = {metro['name']: metro_granularity(data_settings, metro) for metro in enabled}
+    except ValueError as e:
+        print(f"\n[ERROR] {e}")
         sys.exit(1)
+    for granularity in sorted(set(granularities.values()), key=lambda g: g.name):
+        source_file = granularity_source_file(data_settings, granularity)
+        if not Path(source_file).exists():
+            print(f"\n[ERROR] Source file not found: {source_file}")
+            print(f"Please download the latest {source_file} from Redfin "
+                  f"(python fetch_redfin_data.py --tracker {granularity.name})")
+            sys.exit(1)
 
     # Extract each enabled metro
     success_count = 0
@@ -128,14 +509,17 @@ def main():
             continue
 
         # Build output file path
-        output_file = output_pattern.format(name=metro['name'])
+        granularity = granularities[metro['name']]
+        output_file = extracted_file_name(data_settings, metro, granularity)
 
         # Extract metro data
         success = extract_metro(
-            source_file=source_file,
+            source_file=granularity_source_file(data_settings, granularity),
             metro_code=metro['metro_code'],
             output_file=output_file,
-            property_type=property_type
+            property_type=property_type,
+            tsv_export=tsv_export,
+            memory_mb=extract_memory_mb(data_settings, granularity)
         )
 
         if success:
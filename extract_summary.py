@@ -1,10 +1,21 @@
 """
 Extract summary data from JSON files with strategic analysis
 Replaces AI agent analysis with Python-generated insights
+
+Summaries are normally written during processing (process_market_data.py and
+the pipeline's process stage call write_metro_summary on the in-memory data).
+Run this script to rebuild them from saved {slug}_data files, e.g. to
+backfill after editing alert_rules.yaml.
 """
 import json
 import re
 from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from alert_rules import AlertRules, alert_city_records, evaluate_alerts, load_alert_rules
+from data_artifact import data_file_name, find_data_file, load_metro_data
 
 
 def load_metro_config(config_path: Path) -> dict:
@@ -14,7 +25,7 @@ def load_metro_config(config_path: Path) -> dict:
 
 
 def find_latest_data_file(metro_dir: str, metro_name: str) -> tuple:
-    """Find the latest data JSON file for a metro and return (data_file, period)"""
+    """Find the latest data file (binary or JSON) for a metro and return (data_file, period)"""
     metro_path = Path(metro_dir)
     period_pattern = re.compile(r'^\d{4}-\d{2}$')
 
@@ -27,10 +38,10 @@ def find_latest_data_file(metro_dir: str, metro_name: str) -> tuple:
         raise FileNotFoundError(f"No period folders found in {metro_dir}")
 
     latest_folder = sorted(period_folders, key=lambda x: x.name)[-1]
-    data_file = latest_folder / f'{metro_name}_data.json'
+    data_file = find_data_file(latest_folder, metro_name)
 
-    if not data_file.exists():
-        raise FileNotFoundError(f"Data file not found: {data_file}")
+    if data_file is None:
+        raise FileNotFoundError(f"Data file not found: {latest_folder / data_file_name(metro_name)}")
 
     return str(data_file), latest_folder.name
 
@@ -82,11 +93,13 @@ def generate_recommendations(status: str, avg_dom: int, avg_health: int) -> dict
     return recommendations
 
 
-def extract_metro_summary(json_path: str) -> dict:
+def extract_metro_summary(data_path: str) -> dict:
     """Extract key metrics with strategic analysis"""
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+    return build_metro_summary(load_metro_data(data_path))
 
+
+def build_metro_summary(data: dict, rules: Optional[AlertRules] = None) -> dict:
+    """Build the strategic summary from processed metro data (see process_market_data.py)"""
     top_cities = data.get('top_cities', [])
 
     # Calculate metro-level metrics
@@ -112,7 +125,7 @@ def extract_metro_summary(json_path: str) -> dict:
     market_status, market_description = classify_market_status(avg_health, avg_dom)
 
     # City tier classification
-    city_tiers = {"HOT": [], "BALANCED": [], "BUYER": []}
+    city_tiers: Dict[str, List[str]] = {"HOT": [], "BALANCED": [], "BUYER": []}
     for city in top_cities:
         tier = classify_city_tier(city)
         city_tiers[tier].append(city.get('name', ''))
@@ -120,70 +133,18 @@ def extract_metro_summary(json_path: str) -> dict:
     # Generate recommendations
     recommendations = generate_recommendations(market_status, avg_dom, avg_health)
 
-    # Identify alert cities
-    alert_cities = []
-    for city in top_cities:
-        alerts = []
-        severity = 'LOW'
-
-        price_yoy = city.get('price_yoy') or 0
-        dom = city.get('dom') or 0
-        months_supply = city.get('months_supply') or 0
-        health = city.get('health') or 50
-
-        # Price decline alert
-        if price_yoy < -0.05:
-            alerts.append(f"Price down {abs(price_yoy)*100:.1f}% YoY")
-            severity = 'MEDIUM'
-
-        # High DOM alert
-        if dom > 70:
-            alerts.append(f"High days on market: {dom} days")
-            if severity == 'LOW':
-                severity = 'MEDIUM'
-
-        # Excess inventory alert
-        if months_supply and months_supply > 6:
-            alerts.append(f"Excess inventory: {months_supply:.1f} months supply")
-            severity = 'HIGH'
-
-        # Low health score alert
-        if health < 40:
-            alerts.append(f"Low health score: {health}/100")
-            if severity == 'LOW':
-                severity = 'MEDIUM'
-
-        if alerts:
-            # Generate city-specific recommendation
-            if severity == 'HIGH':
-                city_rec = "Aggressive pricing needed. Consider incentives. Extended timeline expected."
-            elif severity == 'MEDIUM':
-                city_rec = "Monitor closely. Price competitively. May need adjustment if no activity in 30 days."
-            else:
-                city_rec = "Minor concerns. Standard marketing approach should suffice."
-
-            alert_cities.append({
-                'name': city.get('name', ''),
-                'sales': city.get('sales', 0),
-                'price': city.get('price', 0),
-                'price_yoy': price_yoy,
-                'dom': dom,
-                'inventory': city.get('inventory', 0),
-                'months_supply': months_supply,
-                'health': health,
-                'severity': severity,
-                'alerts': alerts,
-                'recommendation': city_rec
-            })
-
-    # Sort alerts by severity
-    severity_order = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
-    alert_cities.sort(key=lambda x: severity_order.get(x['severity'], 3))
+    # Screen every city (not just the top 10) against the alert rules; these
+    # are the metro's regions at its granularity (zip codes for a zip metro).
+    # Data files from before city_metrics existed fall back to top_cities
+    cities = data.get('city_metrics') or top_cities
+    rules = rules or load_alert_rules()
+    alert_cities = alert_city_records(evaluate_alerts(pd.DataFrame(cities), rules), rules) if cities else []
 
     # Build summary
     summary = {
         'metro_name': data.get('metro', ''),
         'report_period': data.get('period', ''),
+        'region_granularity': data.get('region_granularity', 'city'),
         'metro_health_score': avg_health,
         'market_status': market_status,
         'market_description': market_description,
@@ -193,7 +154,8 @@ def extract_metro_summary(json_path: str) -> dict:
             'total_inventory': total_inventory,
             'weighted_avg_price': avg_price,
             'weighted_avg_dom': avg_dom,
-            'cities_analyzed': len(top_cities)
+            'cities_analyzed': len(top_cities),
+            'cities_screened': len(cities)
         },
 
         'city_tiers': {
@@ -218,6 +180,25 @@ def extract_metro_summary(json_path: str) -> dict:
     return summary
 
 
+def save_metro_summary(summary: dict, output_file: Path):
+    """Write a metro summary JSON file."""
+    with open(output_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+def write_metro_summary(metro_data: dict, folder: Path, metro_slug: str,
+                        rules: Optional[AlertRules] = None) -> tuple:
+    """
+    Build a metro's summary from its in-memory data and save {slug}_summary.json in folder.
+
+    Returns (summary, output_file).
+    """
+    summary = build_metro_summary(metro_data, rules)
+    output_file = Path(folder) / f'{metro_slug}_summary.json'
+    save_metro_summary(summary, output_file)
+    return summary, output_file
+
+
 def main():
     base_dir = Path(__file__).parent
     config_file = base_dir / 'metro_config.json'
@@ -238,12 +219,11 @@ def main():
             raise ValueError("Metro config entry missing required field: name")
 
         metro_output_dir = base_dir / metro.get('output_directory', metro_slug)
-        metro_json, period = find_latest_data_file(str(metro_output_dir), metro_slug)
-        metro_summary = extract_metro_summary(metro_json)
+        metro_data_file, period = find_latest_data_file(str(metro_output_dir), metro_slug)
+        metro_summary = extract_metro_summary(metro_data_file)
 
         summary_output = metro_output_dir / period / f'{metro_slug}_summary.json'
-        with open(summary_output, 'w') as f:
-            json.dump(metro_summary, f, indent=2)
+        save_metro_summary(metro_summary, summary_output)
         print(f"[OK] {metro_display} summary: {summary_output}")
 
         summaries.append((metro_display, metro_summary))
@@ -1,29 +1,41 @@
 """
 Automated Redfin Data Fetcher
-Downloads the latest city market tracker TSV from Redfin's S3 bucket.
+Downloads the latest market tracker TSV from Redfin's S3 bucket.
 
 Usage:
-    python fetch_redfin_data.py [--force]
+    python fetch_redfin_data.py [--force] [--tracker NAME]
 
 Options:
-    --force     Download even if file exists and is recent
+    --force         Download even if file exists and is recent
+    --tracker NAME  Which tracker to fetch: city (default, used by the pipeline),
+                    metro (metro-level medians for the radar and distressed fit),
+                    zip or neighborhood (submarket rows for data_settings.region_granularity)
 """
 
 import os
 import sys
 import shutil
-import hashlib
 from datetime import datetime, timedelta
 from email.utils import parsedate_to_datetime
 from pathlib import Path
 from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
 
-# Redfin Data Center URL for city-level market tracker
-REDFIN_URL = "https://redfin-public-data.s3.us-west-2.amazonaws.com/redfin_market_tracker/city_market_tracker.tsv000.gz"
+# Redfin Data Center folder holding the market trackers
+REDFIN_BASE_URL = "https://redfin-public-data.s3.us-west-2.amazonaws.com/redfin_market_tracker/"
 
-# Output filename
-OUTPUT_FILE = "city_market_tracker.tsv000.gz"
+# Tracker name -> file name in the bucket (saved under the same name)
+TRACKER_FILES = {
+    'city': 'city_market_tracker.tsv000.gz',
+    'metro': 'redfin_metro_market_tracker.tsv000.gz',
+    'zip': 'zip_code_market_tracker.tsv000.gz',
+    'neighborhood': 'neighborhood_market_tracker.tsv000.gz',
+}
+DEFAULT_TRACKER = 'city'
+
+# City-level market tracker URL and output filename
+REDFIN_URL = REDFIN_BASE_URL + TRACKER_FILES[DEFAULT_TRACKER]
+OUTPUT_FILE = TRACKER_FILES[DEFAULT_TRACKER]
 
 # Redfin typically releases data on Friday of the third full week of each month
 # We consider data "stale" if it's older than 35 days
@@ -41,15 +53,6 @@ def get_file_info(filepath):
     return mod_time, size_mb
 
 
-def calculate_file_hash(filepath, block_size=65536):
-    """Calculate MD5 hash of file for comparison."""
-    hasher = hashlib.md5()
-    with open(filepath, 'rb') as f:
-        for block in iter(lambda: f.read(block_size), b''):
-            hasher.update(block)
-    return hasher.hexdigest()
-
-
 def is_file_stale(filepath, stale_days=STALE_DAYS):
     """Check if existing file is older than threshold."""
     mod_time, _ = get_file_info(filepath)
@@ -155,18 +158,23 @@ def download_with_progress(url, output_path, chunk_size=1024*1024):
         return False
 
 
-def fetch_redfin_data(force=False):
+def fetch_redfin_data(force=False, tracker=DEFAULT_TRACKER):
     """
     Main function to fetch Redfin data.
 
     Args:
         force: If True, download even if file exists and is recent
+        tracker: Which market tracker to fetch (a TRACKER_FILES key)
 
     Returns:
         dict with status information
     """
+    if tracker not in TRACKER_FILES:
+        raise ValueError(f"Unknown tracker: {tracker} (choose from {', '.join(TRACKER_FILES)})")
     base_dir = Path(__file__).parent
-    output_path = str(base_dir / OUTPUT_FILE)
+    output_file = TRACKER_FILES[tracker]
+    output_path = str(base_dir / output_file)
+    url = REDFIN_BASE_URL + output_file
 
     result = {
         'success': False,
@@ -177,7 +185,7 @@ def fetch_redfin_data(force=False):
     }
 
     print("\n" + "="*60)
-    print("REDFIN DATA FETCHER")
+    print(f"REDFIN DATA FETCHER ({tracker} tracker)")
     print("="*60)
 
     # Check existing file
@@ -191,7 +199,7 @@ def fetch_redfin_data(force=False):
         if force:
             print("\n[INFO] Force flag set, downloading fresh copy...")
         else:
-            remote_mtime = get_remote_last_modified(REDFIN_URL)
+            remote_mtime = get_remote_last_modified(url)
             if remote_mtime is not None:
                 local_mtime = mod_time.timestamp()
                 if remote_mtime <= local_mtime + 60:
@@ -226,7 +234,7 @@ def fetch_redfin_data(force=False):
     backup_existing_file(output_path)
 
     # Download new file
-    if download_with_progress(REDFIN_URL, output_path):
+    if download_with_progress(url, output_path):
         _, new_size = get_file_info(output_path)
         result['success'] = True
         result['downloaded'] = True
@@ -238,7 +246,7 @@ def fetch_redfin_data(force=False):
         result['message'] = "Download failed"
 
         # Restore from backup if available
-        backup_files = sorted(Path(base_dir).glob(f"{OUTPUT_FILE}.backup_*"), reverse=True)
+        backup_files = sorted(Path(base_dir).glob(f"{output_file}.backup_*"), reverse=True)
         if backup_files:
             print(f"\n[RESTORE] Restoring from latest backup...")
             shutil.copy2(str(backup_files[0]), output_path)
@@ -253,8 +261,16 @@ def fetch_redfin_data(force=False):
 def main():
     """Command-line entry point."""
     force = '--force' in sys.argv or '-f' in sys.argv
-
-    result = fetch_redfin_data(force=force)
+    tracker = DEFAULT_TRACKER
+    if '--tracker' in sys.argv:
+        idx = sys.argv.index('--tracker')
+        if idx + 1 < len(sys.argv):
+            tracker = sys.argv[idx + 1]
+    if tracker not in TRACKER_FILES:
+        print(f"[ERROR] Unknown tracker: {tracker} (choose from {', '.join(TRACKER_FILES)})")
+        return 1
+
+    result = fetch_redfin_data(force=force, tracker=tracker)
 
     print("\n" + "="*60)
     if result['success']:
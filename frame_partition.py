@@ -0,0 +1,369 @@
+"""
+Frame Partition
+Typed binary storage for the per-metro rows handed from extraction to
+processing.
+
+extract_metros.py used to write each metro as a TSV that the next stage (and
+Market Radar) immediately re-parsed with pd.read_csv, re-inferring every dtype
+and re-parsing the dates. A partition is a numpy .npz next to where the TSV
+would go ({name}_cities_filtered.npz) holding one array per column:
+
+- numeric and bool columns as their own dtype (integers in the smallest
+  type that holds them)
+- datetime columns as int64 ticks, restored to the same datetime64 unit
+- string columns dictionary-encoded: int32 codes plus the unique values.
+  Missing values get code -1, or -2 for None in an object column, so None
+  and NaN both round-trip. Other non-string objects are rejected.
+
+A `meta` entry (UTF-8 JSON) records column order, dtypes and the frame's
+attrs, so read_partition() returns a frame equal to the one written.
+The TSV remains available as an opt-in export (data_settings.tsv_export).
+
+PartitionWriter writes the same file one column at a time, and can take a
+column in blocks; PartitionReader reads columns back a block at a time. Both
+keep streaming extraction from holding a whole metro (or a whole column) in
+memory.
+"""
+
+import json
+import os
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from atomic_io import temp_path
+
+FORMAT_VERSION = 1
+
+PARTITION_SUFFIX = '.npz'
+
+# String column codes for missing values
+MISSING_CODE = -1
+NONE_CODE = -2
+
+
+def partition_path(tsv_file: Union[str, Path]) -> Path:
+    """The partition that stands in for an extracted TSV (same name, .npz)."""
+    return Path(tsv_file).with_suffix(PARTITION_SUFFIX)
+
+
+def _column_kind(dtype) -> str:
+    if pd.api.types.is_datetime64_any_dtype(dtype) and getattr(dtype, 'tz', None) is None:
+        return 'datetime'
+    if dtype.kind in 'biuf' and isinstance(dtype, np.dtype):
+        return 'number'
+    return 'string'
+
+
+def _string_codes(series: pd.Series) -> tuple:
+    """Dictionary-encode a string column: (int32 codes, unique values in order of appearance)."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    if not all(isinstance(v, str) for v in uniques):
+        raise TypeError(f"Column {series.name} holds non-string objects; partitions store them only as strings")
+    codes = codes.astype(np.int32)
+    if series.dtype == object:
+        # factorize folds None into the NaN sentinel; keep it apart so it reads back as None
+        missing = np.flatnonzero(codes == MISSING_CODE)
+        codes[missing[np.array([v is None for v in series.to_numpy()[missing]], dtype=bool)]] = NONE_CODE
+    return codes, uniques
+
+
+def _encode_column(series: pd.Series) -> tuple:
+    """Return (kind, {array name suffix: array}) for one column."""
+    kind = _column_kind(series.dtype)
+    if kind == 'datetime':
+        return kind, {'': series.to_numpy().view(np.int64)}
+    if kind == 'number':
+        values = series.to_numpy()
+        if values.dtype.kind in 'iu' and len(values):
+            # Counts fit in far fewer than 8 bytes; read_partition restores the dtype
+            values = values.astype(np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max())))
+        return kind, {'': values}
+
+    codes, uniques = _string_codes(series)
+    return kind, {'': codes, '.values': np.array(list(uniques), dtype=np.str_)}
+
+
+class PartitionWriter:
+    """
+    Write a partition column by column (via a temp file + rename).
+
+    Each column is encoded and streamed into the .npz as it is added; the
+    `meta` entry goes in last, on close(). Leaving the `with` block without
+    calling close() (e.g. on an error) discards the temp file.
+    """
+
+    def __init__(self, output_file: Path, rows: int):
+        self.output_file = Path(output_file)
+        self.rows = rows
+        self.columns: List[dict] = []
+        self._temp_file = temp_path(self.output_file)
+        self._zip: Optional[zipfile.ZipFile] = zipfile.ZipFile(
+            self._temp_file, 'w', compression=zipfile.ZIP_STORED, allowZip64=True
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        # Gone after a successful close(); otherwise the write was cut short
+        self._temp_file.unlink(missing_ok=True)
+
+    def _open_member(self, key: str):
+        assert self._zip is not None, "partition already closed"
+        # Same member layout as np.savez, so np.load reads it
+        return self._zip.open(f'{key}.npy', 'w', force_zip64=True)
+
+    def _write_array(self, key: str, array: np.ndarray):
+        with self._open_member(key) as f:
+            np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+    def add_column(self, name, series: pd.Series):
+        if len(series) != self.rows:
+            raise ValueError(f"Column {name} has {len(series)} rows, expected {self.rows}")
+        i = len(self.columns)
+        kind, parts = _encode_column(series)
+        self.columns.append({'name': str(name), 'kind': kind, 'dtype': str(series.dtype)})
+        for suffix, array in parts.items():
+            self._write_array(f'c{i}{suffix}', array)
+
+    def add_column_blocks(self, name, dtype, blocks: Iterable[pd.Series]):
+        """
+        Add a column from consecutive blocks that together hold every row,
+        encoding and writing each block as it arrives.
+
+        Blocks are cast to `dtype`. String codes are numbered across blocks in
+        order of appearance, as add_column numbers them; integers keep their
+        full width, since their range isn't known up front.
+        """
+        dtype = pd.api.types.pandas_dtype(dtype)
+        kind = _column_kind(dtype)
+        stored = {'datetime': np.dtype(np.int64), 'number': dtype, 'string': np.dtype(np.int32)}[kind]
+        i = len(self.columns)
+        index: Dict[str, int] = {}   # string value -> code
+        written = 0
+        with self._open_member(f'c{i}') as f:
+            np.lib.format.write_array_header_1_0(f, {
+                'descr': np.lib.format.dtype_to_descr(stored), 'fortran_order': False, 'shape': (self.rows,)
+            })
+            for block in blocks:
+                block = block.astype(dtype)
+                if kind == 'string':
+                    codes, uniques = _string_codes(block)
+                    remap = np.array([index.setdefault(value, len(index)) for value in uniques], dtype=np.int32)
+                    array = codes.copy()
+                    present = codes >= 0
+                    array[present] = remap[codes[present]]
+                else:
+                    array = block.to_numpy().view(np.int64) if kind == 'datetime' else block.to_numpy()
+                f.write(np.ascontiguousarray(array, dtype=stored).tobytes())
+                written += len(block)
+        if written != self.rows:
+            raise ValueError(f"Column {name} has {written} rows, expected {self.rows}")
+        if kind == 'string':
+            self._write_array(f'c{i}.values', np.array(list(index), dtype=np.str_))
+        self.columns.append({'name': str(name), 'kind': kind, 'dtype': str(dtype)})
+
+    def close(self, attrs: Optional[dict] = None) -> int:
+        """Finish the file and move it into place. Returns the number of bytes written."""
+        meta = {
+            'version': FORMAT_VERSION,
+            'rows': self.rows,
+            'columns': self.columns,
+            'attrs': {k: v for k, v in (attrs or {}).items() if isinstance(v, (int, float, str, bool))},
+        }
+        self._write_array('meta', np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8))
+        archive, self._zip = self._zip, None
+        if archive is not None:
+            archive.close()
+        os.replace(self._temp_file, self.output_file)
+        return self.output_file.stat().st_size
+
+
+def write_partition(df: pd.DataFrame, output_file: Path) -> int:
+    """
+    Write a frame as a typed partition (via a temp file + rename).
+
+    Returns the number of bytes written.
+    """
+    with PartitionWriter(output_file, len(df)) as writer:
+        for name in df.columns:
+            writer.add_column(name, df[name])
+        return writer.close(df.attrs)
+
+
+def _decode_array(column: dict, array: np.ndarray, values: Optional[np.ndarray] = None) -> np.ndarray:
+    """Stored values as numpy; strings come back as objects, given `values` as an object array."""
+    if column['kind'] == 'datetime':
+        return array.view(column['dtype'])
+    if column['kind'] == 'number':
+        return array.astype(column['dtype'], copy=False)
+    assert values is not None, "string columns need their values"
+    decoded = np.full(len(array), np.nan, dtype=object)
+    present = array >= 0
+    decoded[present] = values[array[present]]
+    decoded[array == NONE_CODE] = None
+    return decoded
+
+
+def _as_series(column: dict, decoded: np.ndarray) -> pd.Series:
+    if column['kind'] == 'string':
+        return pd.Series(decoded, dtype=object, copy=False).astype(column['dtype'])
+    return pd.Series(decoded, copy=False)
+
+
+def _decode_column(column: dict, array: np.ndarray, values: Optional[np.ndarray] = None) -> pd.Series:
+    return _as_series(column, _decode_array(column, array, None if values is None else values.astype(object)))
+
+
+def _load_meta(archive) -> dict:
+    meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported partition version: {meta.get('version')}")
+    return meta
+
+
+def partition_columns(partition_file: Path) -> list:
+    """Column names of a partition, in stored order."""
+    with np.load(partition_file, allow_pickle=False) as archive:
+        return [column['name'] for column in _load_meta(archive)['columns']]
+
+
+def read_partition(partition_file: Path, columns=None) -> pd.DataFrame:
+    """
+    Read a partition back into a DataFrame with its original dtypes and attrs.
+
+    Args:
+        columns: Only decode these columns (default: all, in stored order)
+    """
+    with np.load(partition_file, allow_pickle=False) as archive:
+        meta = _load_meta(archive)
+        wanted = None if columns is None else set(columns)
+        data = {}
+        for i, column in enumerate(meta['columns']):
+            if wanted is not None and column['name'] not in wanted:
+                continue
+            values = archive[f'c{i}.values'] if column['kind'] == 'string' else None
+            data[column['name']] = _decode_column(column, archive[f'c{i}'], values)
+
+    df = pd.DataFrame(data)
+    df.attrs.update(meta.get('attrs', {}))
+    return df
+
+
+class ColumnReader:
+    """
+    Reads one stored column front to back, a given number of rows at a time.
+
+    Readers of several partitions that share an `interned` dict share one
+    object per distinct string instead of holding a copy each.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, index: int, column: dict, interned: Optional[dict] = None):
+        self.column = column
+        self._values = None
+        if column['kind'] == 'string':
+            with archive.open(f'c{index}.values.npy') as f:
+                values = np.lib.format.read_array(f, allow_pickle=False).tolist()
+            if interned is not None:
+                values = [interned.setdefault(value, value) for value in values]
+            self._values = np.empty(len(values), dtype=object)
+            self._values[:] = values
+        self._file = archive.open(f'c{index}.npy')
+        version = np.lib.format.read_magic(self._file)
+        if version == (1, 0):
+            _, _, self._dtype = np.lib.format.read_array_header_1_0(self._file)
+        else:
+            _, _, self._dtype = np.lib.format.read_array_header_2_0(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def read_array(self, rows: int) -> np.ndarray:
+        """Decode the next `rows` values as numpy (strings as objects, without the column's pandas dtype)."""
+        data = self._file.read(rows * self._dtype.itemsize)
+        if len(data) != rows * self._dtype.itemsize:
+            raise ValueError(f"Column {self.column['name']} ended early")
+        return _decode_array(self.column, np.frombuffer(data, dtype=self._dtype), self._values)
+
+    def read(self, rows: int) -> pd.Series:
+        """Decode the next `rows` values."""
+        return _as_series(self.column, self.read_array(rows))
+
+    def close(self):
+        self._file.close()
+
+
+class PartitionReader:
+    """
+    A partition opened for reading columns a block at a time (see ColumnReader).
+
+    Stored members are uncompressed, so a column is read straight from the
+    file without loading the rest of it.
+    """
+
+    def __init__(self, partition_file: Path):
+        self._archive = np.load(partition_file, allow_pickle=False)
+        self.meta = _load_meta(self._archive)
+        self.rows: int = self.meta['rows']
+        self.dtypes: Dict[str, str] = {column['name']: column['dtype'] for column in self.meta['columns']}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def column(self, name, interned: Optional[dict] = None) -> ColumnReader:
+        """A reader positioned at the column's first row."""
+        for i, column in enumerate(self.meta['columns']):
+            if column['name'] == name:
+                return ColumnReader(self._archive.zip, i, column, interned)
+        raise KeyError(name)
+
+    def close(self):
+        self._archive.close()
+
+
+def iter_partition_blocks(partition_file: Path, block_rows: int = 50000):
+    """
+    Yield a partition as DataFrames of at most block_rows rows, in order.
+
+    Each column is read front to back from the file, so only one decoded
+    block is in memory at a time.
+    """
+    with PartitionReader(partition_file) as partition:
+        readers = [partition.column(name) for name in partition.dtypes]
+        try:
+            for start in range(0, partition.rows, block_rows):
+                rows = min(block_rows, partition.rows - start)
+                yield pd.DataFrame({reader.column['name']: reader.read(rows) for reader in readers})
+        finally:
+            for reader in readers:
+                reader.close()
+
+
+def iter_extracted_blocks(extracted_file: Path, block_rows: int = 50000):
+    """A metro's extracted rows as DataFrames: its partition in blocks, else the whole TSV."""
+    partition_file = partition_path(extracted_file)
+    if partition_file.exists():
+        yield from iter_partition_blocks(partition_file, block_rows)
+    else:
+        yield pd.read_csv(extracted_file, sep='\t', low_memory=False)
+
+
+def read_extracted(extracted_file: Path) -> pd.DataFrame:
+    """Read a metro's extracted rows, preferring its partition over the TSV."""
+    partition_file = partition_path(extracted_file)
+    if partition_file.exists():
+        return read_partition(partition_file)
+    return pd.read_csv(extracted_file, sep='\t', low_memory=False)
@@ -1,11 +1,28 @@
 """
 Enhanced Dashboard Generator for Redfin City-Level Data
-Reads charlotte_data.json and roanoke_data.json
+Reads each metro's {slug}_data.npz (or {slug}_data.json; see data_artifact.py)
 Generates interactive HTML dashboards with historical trends and city comparison
 """
 
+import hashlib
 import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import List, Optional
+
+from atomic_io import write_text_atomic
+from chart_downsample import build_chart_downsample
+from data_artifact import data_file_name, find_data_file, load_metro_data
+from region_granularity import get_granularity
+from stage_cache import hash_file
+
+# Bump when the rendered HTML changes in a way the source hashes would not catch
+# (e.g. a CDN library upgrade that should force every dashboard to re-render).
+DASHBOARD_TEMPLATE_VERSION = "2"
+
+FINGERPRINT_META_NAME = "dashboard-fingerprint"
 
 
 def load_metro_config(config_path: Path) -> dict:
@@ -14,24 +31,33 @@ def load_metro_config(config_path: Path) -> dict:
         return json.load(f)
 
 
-def generate_enhanced_dashboard(data_file: str, output_file: str):
-    """Generate enhanced HTML dashboard with metro trends + city comparison"""
+def generate_enhanced_dashboard(data_file: str, output_file: str, fingerprint: Optional[str] = None,
+                                data: Optional[dict] = None):
+    """Generate enhanced HTML dashboard with metro trends + city comparison
+
+    Pass `data` to render from already-loaded metro data instead of reading data_file.
+    """
 
     # Read data
-    with open(data_file, 'r') as f:
-        data = json.load(f)
+    if data is None:
+        data = load_metro_data(data_file)
 
     metro = data['metro']
     period = data['period']
+    # "Cities" are zip codes or neighborhoods in submarket data; older files are city-level
+    region = get_granularity(data.get('region_granularity'))
     metro_trends = data['metro_trends']  # 12-month default
-    top_cities = data['top_cities']
-    city_trends = data['city_trends']  # Top 5 cities, 12 months
+    # Copies: signals are added per city below and must not leak into the caller's data
+    top_cities = [dict(city) for city in data['top_cities']]
+    city_trends = dict(data['city_trends'])  # Top 5 cities, 12 months
     full_metro_trends = data['full_metro_trends']  # ALL historical data
-    full_city_trends = data['full_city_trends']  # ALL cities, ALL history
+    full_city_trends = dict(data['full_city_trends'])  # ALL cities, ALL history (decodes every city)
     available_cities = data['available_cities']  # List of all city names
     period_index_full = data.get('period_index_full', [t['period'] for t in full_metro_trends])
     period_index_12m = data.get('period_index_12m', [t['period'] for t in metro_trends])
     period_index_by_city = data.get('period_index_by_city', {})
+    # Older data files predate precomputed downsampling; build it on the fly
+    chart_downsample = data.get('chart_downsample') or build_chart_downsample(data)
 
     # Current month stats
     current = metro_trends[-1]
@@ -80,9 +106,9 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
         inventory_yoy = 0
 
     # Calculate buy/sell signals for cities
-    buy_cities = []
-    hold_cities = []
-    sell_cities = []
+    buy_cities: List[dict] = []
+    hold_cities: List[dict] = []
+    sell_cities: List[dict] = []
 
     for city in top_cities:
         city_months_supply = round(city['inventory'] / city['sales'], 1) if city['sales'] > 0 else 0
@@ -143,6 +169,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
     period_index_full_json = json.dumps(period_index_full)
     period_index_12m_json = json.dumps(period_index_12m)
     period_index_by_city_json = json.dumps(period_index_by_city)
+    chart_downsample_json = json.dumps(chart_downsample)
 
     # Derived metric arrays for tooltips and fallbacks
     inventory_mom_json = json.dumps([t.get('inventory_mom') for t in metro_trends])
@@ -184,6 +211,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="{FINGERPRINT_META_NAME}" content="{fingerprint or ''}">
     <title>{metro} Market Intelligence Dashboard - {period}</title>
     <script src="https://cdn.tailwindcss.com"></script>
     <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"></script>
@@ -225,7 +253,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
         <!-- Header -->
         <div class="card p-8 text-white">
             <h1 class="text-4xl font-bold mb-2">{metro} Market Intelligence</h1>
-            <p class="text-xl text-gray-300">{period} Analysis - {data['current_stats']['total_cities']} Cities</p>
+            <p class="text-xl text-gray-300">{period} Analysis - {data['current_stats']['total_cities']} {region.plural}</p>
         </div>
 
         <!-- Date Range Selector -->
@@ -402,11 +430,11 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             <div class="flex flex-col gap-4 mb-4">
                 <div class="flex flex-wrap gap-3 items-center justify-between">
                     <div>
-                        <h2 class="text-2xl font-bold">City Historical Trends</h2>
+                        <h2 class="text-2xl font-bold">{region.label} Historical Trends</h2>
                         <p class="text-sm text-gray-400">Ordered by latest monthly sales. Compare inventory, listings, and absorption signals.</p>
                     </div>
                     <div class="flex flex-wrap gap-2 items-center">
-                        <label class="text-sm" for="citySelector">City</label>
+                        <label class="text-sm" for="citySelector">{region.label}</label>
                         <select id="citySelector" class="selector" aria-label="Select city">
                             {city_options}
                         </select>
@@ -460,7 +488,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             <div class="mb-4 flex justify-between items-start">
                 <div>
                     <h2 class="text-2xl font-bold mb-2">Multi-City Comparison Tool</h2>
-                    <p class="text-sm text-gray-400">Select multiple cities to compare side-by-side. All {len(available_cities)} cities available.</p>
+                    <p class="text-sm text-gray-400">Select multiple cities to compare side-by-side. All {len(available_cities)} {region.plural.lower()} available.</p>
                 </div>
                 <div class="flex gap-2">
                     <button onclick="downloadChartImage('multiCityChart', 'multi_city_comparison')" class="px-3 py-2 bg-green-500/20 hover:bg-green-500/40 border border-green-500/50 rounded-lg transition text-sm">
@@ -529,12 +557,12 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
 
         <!-- Top Cities Table -->
         <div class="card p-6 text-white">
-            <h2 class="text-2xl font-bold mb-4">Top 10 Cities by Sales Volume - Flipper Analysis</h2>
+            <h2 class="text-2xl font-bold mb-4">Top 10 {region.plural} by Sales Volume - Flipper Analysis</h2>
             <div class="overflow-x-auto">
                 <table class="w-full text-sm">
                     <thead class="border-b border-gray-600">
                         <tr class="text-left">
-                            <th class="pb-3">City</th>
+                            <th class="pb-3">{region.label}</th>
                             <th class="pb-3">Sales</th>
                             <th class="pb-3">Median Price</th>
                             <th class="pb-3">Price YoY</th>
@@ -755,6 +783,40 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
         const availableCities = ''' + available_cities_json + ''';
         const orderedCityNames = ''' + city_names_json + ''';
 
+        // Precomputed LTTB period selections for long (full-history) views.
+        // Views at or under the point budget always plot at full resolution.
+        const chartDownsample = ''' + chart_downsample_json + ''';
+        const chartPointBudget = chartDownsample.budget || Infinity;
+        const keptMetroPeriods = new Set(chartDownsample.metro || []);
+        const keptCityPeriods = Object.fromEntries(
+            Object.entries(chartDownsample.cities || {}).map(([city, periods]) => [city, new Set(periods)])
+        );
+
+        function keptPeriodsFor(city) {
+            return city ? keptCityPeriods[city] : keptMetroPeriods;
+        }
+
+        // Drop rows outside the precomputed selection when a view exceeds the budget
+        function downsampleRows(rows, city) {
+            const keep = keptPeriodsFor(city);
+            if (!keep || !keep.size || rows.length <= chartPointBudget) return rows;
+            return rows.filter(t => keep.has(t.period));
+        }
+
+        // Null out values outside the selection (for charts sharing a label axis)
+        function downsampleValues(values, periods, city) {
+            const keep = keptPeriodsFor(city);
+            if (!keep || !keep.size || periods.length <= chartPointBudget) return values;
+            return values.map((v, i) => (keep.has(periods[i]) ? v : null));
+        }
+
+        // Re-align values computed on full-resolution rows to the plotted rows
+        function alignToRows(values, rows, plottedRows) {
+            if (rows === plottedRows) return values;
+            const byPeriod = new Map(rows.map((t, i) => [t.period, values[i]]));
+            return plottedRows.map(t => byPeriod.get(t.period) ?? null);
+        }
+
         const urlState = new URLSearchParams(window.location.hash ? window.location.hash.substring(1) : '');
         const getStoredValue = key => { try { return localStorage.getItem(key); } catch (e) { return null; } };
         const setStoredValue = (key, value) => { try { localStorage.setItem(key, value); } catch (e) {} };
@@ -862,11 +924,13 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
 
             const cutoffStr = cutoffDate.toISOString().slice(0, 7);
             const filtered = fullMetroTrends.filter(t => t.period >= cutoffStr);
-            const effective = filtered.length > 0 ? filtered : fullMetroTrends.slice(-12);
+            const fullResolution = filtered.length > 0 ? filtered : fullMetroTrends.slice(-12);
+            const effective = downsampleRows(fullResolution, null);
             const labelText = filtered.length > 0 ? rangeLabel : 'Last 12 Months (Default)';
 
             return {
                 data: effective,
+                fullData: fullResolution,
                 label: labelText,
                 periods: effective.map(t => t.period),
                 labels: formatLabels(effective.map(t => t.period)),
@@ -1158,12 +1222,17 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
                 return;
             }
 
-            // Add moving averages if enabled
+            // Add moving averages if enabled (computed on full-resolution data)
             const primaryData = datasets[0].data;
+            const fullRows = filteredMetroData.fullData;
+            const primaryKey = datasets[0].metaKey;
+            const overlaySeries = fn => (fullRows && fullRows !== filteredMetroData.data)
+                ? alignToRows(fn(fullRows.map(t => t[primaryKey] ?? null)), fullRows, filteredMetroData.data)
+                : fn(primaryData);
             if (document.getElementById('showMA3').checked) {
                 datasets.push({
                     label: '3-Month MA',
-                    data: calculateSMA(primaryData, 3),
+                    data: overlaySeries(d => calculateSMA(d, 3)),
                     borderColor: '#ec4899',
                     borderDash: [5, 5],
                     borderWidth: 2,
@@ -1174,7 +1243,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             if (document.getElementById('showMA6').checked) {
                 datasets.push({
                     label: '6-Month MA',
-                    data: calculateSMA(primaryData, 6),
+                    data: overlaySeries(d => calculateSMA(d, 6)),
                     borderColor: '#a855f7',
                     borderDash: [5, 5],
                     borderWidth: 2,
@@ -1185,7 +1254,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             if (document.getElementById('showMA12').checked) {
                 datasets.push({
                     label: '12-Month MA',
-                    data: calculateSMA(primaryData, 12),
+                    data: overlaySeries(d => calculateSMA(d, 12)),
                     borderColor: '#14b8a6',
                     borderDash: [5, 5],
                     borderWidth: 2,
@@ -1196,7 +1265,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             if (document.getElementById('showTrendLine').checked) {
                 datasets.push({
                     label: 'Trend Line',
-                    data: calculateTrendLine(primaryData),
+                    data: overlaySeries(calculateTrendLine),
                     borderColor: '#fbbf24',
                     borderDash: [2, 2],
                     borderWidth: 2,
@@ -1363,7 +1432,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             return fullCityTrends[city] || cityTrends[city] || [];
         }
 
-        function getCityPeriods(city, range = currentCityRange) {
+        function getCityRangePeriods(city, range = currentCityRange) {
             const series = getCitySeries(city);
             const base = periodIndexByCity[city] || series.map(t => t.period);
             if (!base.length || !series.length) return series.map(t => t.period);
@@ -1377,6 +1446,13 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             return base.slice(startIndex, startIndex + take);
         }
 
+        function getCityPeriods(city, range = currentCityRange) {
+            const periods = getCityRangePeriods(city, range);
+            const keep = keptPeriodsFor(city);
+            if (!keep || !keep.size || periods.length <= chartPointBudget) return periods;
+            return periods.filter(p => keep.has(p));
+        }
+
         let cityPeriods = getCityPeriods(currentCity, currentCityRange);
         let cityLabels = formatLabels(cityPeriods);
 
@@ -1449,8 +1525,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             }
         }
 
-        function getCityTooltipSource(city) {
-            const series = getCitySeries(city);
+        function getCityTooltipSource(series) {
             const base = ['inventory', 'new_listings', 'pending_sales', 'homes_sold', 'median_dom', 'median_sale_price'];
             const result = {};
             base.forEach(key => {
@@ -1464,10 +1539,12 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
 
         function buildCityDatasets() {
             const series = getCitySeries(currentCity);
-            const periods = getCityPeriods(currentCity, currentCityRange);
+            const periods = getCityRangePeriods(currentCity, currentCityRange);
             const take = Math.min(periods.length, series.length);
             const startIndex = Math.max(0, series.length - take);
-            const tooltipSource = getCityTooltipSource(currentCity);
+            const fullRows = series.slice(startIndex);
+            const visibleRows = downsampleRows(fullRows, currentCity);
+            const tooltipSource = getCityTooltipSource(visibleRows);
             const metricKey = resolveMetricKey(currentCityMetricMode);
 
             if (currentCityMetricMode === 'all') {
@@ -1479,7 +1556,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
                 ];
                 return configs.map(cfg => ({
                     label: getMetricLabel(cfg.key),
-                    data: series.slice(startIndex).map(t => t[cfg.key] ?? null),
+                    data: visibleRows.map(t => t[cfg.key] ?? null),
                     borderColor: getMetricColor(cfg.key),
                     backgroundColor: getMetricColor(cfg.key) + '20',
                     fill: true,
@@ -1490,7 +1567,9 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
                 }));
             }
 
-            const baseData = series.slice(startIndex).map(t => t[metricKey] ?? null);
+            const baseData = visibleRows.map(t => t[metricKey] ?? null);
+            const fullData = fullRows.map(t => t[metricKey] ?? null);
+            const overlaySeries = fn => alignToRows(fn(fullData), fullRows, visibleRows);
             const datasets = [{
                 label: getMetricLabel(metricKey),
                 data: baseData,
@@ -1511,7 +1590,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             if (ma3?.checked) {
                 datasets.push({
                     label: getMetricLabel(metricKey) + ' (3-Mo MA)',
-                    data: calculateSMA(baseData, 3),
+                    data: overlaySeries(d => calculateSMA(d, 3)),
                     borderColor: '#ec4899',
                     borderDash: [5, 5],
                     borderWidth: 2,
@@ -1523,7 +1602,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             if (ma6?.checked) {
                 datasets.push({
                     label: getMetricLabel(metricKey) + ' (6-Mo MA)',
-                    data: calculateSMA(baseData, 6),
+                    data: overlaySeries(d => calculateSMA(d, 6)),
                     borderColor: '#a855f7',
                     borderDash: [6, 4],
                     borderWidth: 2,
@@ -1535,7 +1614,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             if (ma12?.checked) {
                 datasets.push({
                     label: getMetricLabel(metricKey) + ' (12-Mo MA)',
-                    data: calculateSMA(baseData, 12),
+                    data: overlaySeries(d => calculateSMA(d, 12)),
                     borderColor: '#14b8a6',
                     borderDash: [8, 4],
                     borderWidth: 2,
@@ -1547,7 +1626,7 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
             if (showTrend?.checked) {
                 datasets.push({
                     label: getMetricLabel(metricKey) + ' (Trend)',
-                    data: calculateTrendLine(baseData),
+                    data: overlaySeries(calculateTrendLine),
                     borderColor: '#fbbf24',
                     borderDash: [2, 2],
                     borderWidth: 2,
@@ -1816,9 +1895,12 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
                     return t[metricKey] ?? null;
                 });
 
+                const plotted = downsampleValues(base, periods, city);
+
                 datasets.push({
                     label: city,
-                    data: base,
+                    data: plotted,
+                    spanGaps: plotted !== base,
                     borderColor: color,
                     backgroundColor: color + '20',
                     tension: 0.4,
@@ -2080,13 +2162,87 @@ def generate_enhanced_dashboard(data_file: str, output_file: str):
 </html>'''
 
     # Write HTML file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html)
+    write_text_atomic(output_file, html)
 
     print(f"[OK] Generated: {output_file}")
 
+
+def truncate_history(data: dict, months: int) -> dict:
+    """Copy of metro data keeping only the last `months` periods of the full-history series.
+
+    Used for email attachments, where the full 20+ year history makes the
+    dashboard too large; the 12-month views are unaffected.
+    """
+    periods = data.get('period_index_full') or [t['period'] for t in data['full_metro_trends']]
+    keep = set(periods[-months:])
+
+    trimmed = dict(data)
+    trimmed['full_metro_trends'] = [t for t in data['full_metro_trends'] if t['period'] in keep]
+    trimmed['full_city_trends'] = {
+        city: [t for t in series if t['period'] in keep]
+        for city, series in data['full_city_trends'].items()
+    }
+    trimmed['period_index_full'] = [p for p in periods if p in keep]
+    trimmed['period_index_by_city'] = {
+        city: [p for p in city_periods if p in keep]
+        for city, city_periods in data.get('period_index_by_city', {}).items()
+    }
+    budget = (data.get('chart_downsample') or {}).get('budget')
+    trimmed['chart_downsample'] = build_chart_downsample(trimmed, budget) if budget else build_chart_downsample(trimmed)
+    return trimmed
+
+
+def dashboard_code_files() -> List[Path]:
+    """This script plus the modules the pipeline's dashboard stage lists as its code."""
+    from pipeline_runner import DASHBOARD_STAGE
+
+    base_dir = Path(__file__).parent
+    return [Path(__file__)] + [base_dir / name for name in DASHBOARD_STAGE.code]
+
+
+def dashboard_fingerprint(data_file: str, metro: dict, data_hash: Optional[str] = None) -> str:
+    """Fingerprint everything a dashboard depends on: data, template, rendering code, metro config.
+
+    Pass `data_hash` (SHA-256 of the data file bytes) when it is already known.
+    """
+    hasher = hashlib.sha256()
+    hasher.update((data_hash or hash_file(Path(data_file))).encode())
+    hasher.update(DASHBOARD_TEMPLATE_VERSION.encode())
+    for code_file in dashboard_code_files():
+        hasher.update(hash_file(code_file).encode())
+    hasher.update(json.dumps(metro, sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def read_dashboard_fingerprint(output_file: str):
+    """Return the fingerprint embedded in an existing dashboard, or None."""
+    if not os.path.exists(output_file):
+        return None
+
+    marker = f'<meta name="{FINGERPRINT_META_NAME}" content="'
+    with open(output_file, 'r', encoding='utf-8', errors='replace') as f:
+        head = f.read(4096)
+
+    start = head.find(marker)
+    if start == -1:
+        return None
+    start += len(marker)
+    end = head.find('"', start)
+    return head[start:end] or None
+
+
+def _render_dashboard_job(job: dict) -> str:
+    """Process-pool entry point; must stay at module level to be picklable."""
+    generate_enhanced_dashboard(
+        data_file=job['data_file'],
+        output_file=job['output_file'],
+        fingerprint=job['fingerprint'],
+        data=job.get('data'),
+    )
+    return job['output_file']
+
 def find_latest_data_file(metro_dir: Path, metro_name: str) -> tuple:
-    """Find the latest data JSON file for a metro and return (data_file, period)"""
+    """Find the latest data file (binary or JSON) for a metro and return (data_file, period)"""
     # Look for folders matching YYYY-MM pattern
     import re
     period_pattern = re.compile(r'^\d{4}-\d{2}$')
@@ -2101,18 +2257,70 @@ def find_latest_data_file(metro_dir: Path, metro_name: str) -> tuple:
 
     # Sort by folder name (YYYY-MM format sorts chronologically)
     latest_folder = sorted(period_folders, key=lambda x: x.name)[-1]
-    data_file = latest_folder / f'{metro_name}_data.json'
+    data_file = find_data_file(latest_folder, metro_name)
 
-    if not data_file.exists():
-        raise FileNotFoundError(f"Data file not found: {data_file}")
+    if data_file is None:
+        raise FileNotFoundError(f"Data file not found: {latest_folder / data_file_name(metro_name)}")
 
     return str(data_file), latest_folder.name
 
 
-def main():
-    """Generate dashboards for enabled metros from metro_config.json."""
+def plan_dashboard_job(base_dir: Path, metro: dict, force: bool = False, in_memory: Optional[dict] = None) -> dict:
+    """
+    Work out one metro's dashboard render job.
 
-    base_dir = Path(__file__).parent
+    `in_memory` is the processing stage's output for this metro, if available.
+    The returned job has current=True when the existing dashboard is up to date.
+    """
+    metro_slug = metro.get('name')
+    if not metro_slug:
+        raise ValueError("Metro config entry missing required field: name")
+
+    metro_output_dir = base_dir / metro.get('output_directory', metro_slug)
+    if in_memory:
+        data_file = str(in_memory['data_file'])
+        period = in_memory['metro_data']['period']
+        data_hash = in_memory.get('data_hash')
+    else:
+        data_file, period = find_latest_data_file(metro_output_dir, metro_slug)
+        data_hash = None
+    dashboard_file = str(metro_output_dir / period / f'dashboard_enhanced_{metro_slug}_{period}.html')
+
+    fingerprint = dashboard_fingerprint(data_file, metro, data_hash)
+    current = not force and read_dashboard_fingerprint(dashboard_file) == fingerprint
+    if current:
+        print(f"[SKIP] Up to date: {dashboard_file}")
+
+    return {
+        'data_file': data_file,
+        'output_file': dashboard_file,
+        'fingerprint': fingerprint,
+        'data': in_memory['metro_data'] if in_memory else None,
+        'current': current,
+    }
+
+
+def generate_all_dashboards(
+    base_dir: Path,
+    force: bool = False,
+    max_workers: Optional[int] = None,
+    processed: Optional[dict] = None,
+) -> dict:
+    """
+    Generate dashboards for enabled metros, skipping ones that are already current.
+
+    A dashboard is current when the fingerprint embedded in its HTML matches the
+    fingerprint of its data file, the template, the rendering code (this script
+    and the modules in dashboard_code_files) and the metro config entry.
+    Stale dashboards are rendered across a process pool.
+
+    `processed` optionally maps metro slug to the in-memory output of the
+    processing stage ({'metro_data', 'data_file', 'data_hash'}); those metros
+    render without re-reading their data file.
+
+    Returns:
+        dict with 'generated' and 'skipped' output paths
+    """
     config_file = base_dir / 'metro_config.json'
     if not config_file.exists():
         raise FileNotFoundError("metro_config.json not found")
@@ -2122,21 +2330,54 @@ def main():
     if not metros:
         raise ValueError("No enabled metros found in metro_config.json")
 
-    for metro in metros:
-        metro_slug = metro.get('name')
-        if not metro_slug:
-            raise ValueError("Metro config entry missing required field: name")
+    if max_workers is None:
+        max_workers = config.get('dashboard_settings', {}).get('max_workers')
 
-        metro_output_dir = base_dir / metro.get('output_directory', metro_slug)
-        data_file, period = find_latest_data_file(metro_output_dir, metro_slug)
-        dashboard_file = metro_output_dir / period / f'dashboard_enhanced_{metro_slug}_{period}.html'
-
-        generate_enhanced_dashboard(
-            data_file=data_file,
-            output_file=str(dashboard_file)
-        )
-
-    print("\n[OK] All enhanced dashboards generated!")
+    jobs = []
+    skipped = []
+    for metro in metros:
+        job = plan_dashboard_job(base_dir, metro, force, (processed or {}).get(metro.get('name')))
+        if job['current']:
+            skipped.append(job['output_file'])
+        else:
+            jobs.append(job)
+
+    generated = []
+    if len(jobs) == 1 or max_workers == 1:
+        # Not worth paying process startup for a single render
+        for job in jobs:
+            generated.append(_render_dashboard_job(job))
+    elif jobs:
+        workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+        print(f"[INFO] Rendering {len(jobs)} dashboards across {workers} worker(s)")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_render_dashboard_job, job) for job in jobs]
+            for future in as_completed(futures):
+                generated.append(future.result())
+
+    return {'generated': generated, 'skipped': skipped}
+
+
+def main(base_dir: Optional[Path] = None):
+    """Generate dashboards for enabled metros from metro_config.json in base_dir (default: this script's folder).
+
+    Options:
+        --force          Re-render even if the dashboard is up to date
+        --workers N      Maximum number of render processes
+    """
+    force = '--force' in sys.argv
+    max_workers = None
+    for i, arg in enumerate(sys.argv):
+        if arg == '--workers' and i + 1 < len(sys.argv):
+            max_workers = int(sys.argv[i + 1])
+
+    base_dir = base_dir or Path(__file__).parent
+    result = generate_all_dashboards(base_dir, force=force, max_workers=max_workers)
+
+    print(
+        f"\n[OK] All enhanced dashboards generated! "
+        f"(rendered={len(result['generated'])}, up-to-date={len(result['skipped'])})"
+    )
 
 if __name__ == '__main__':
     main()
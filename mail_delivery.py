@@ -0,0 +1,268 @@
+"""
+Mail Delivery
+Pooled SMTP sessions shared by every email the pipeline sends.
+
+A pool keeps up to `smtp_max_sessions` authenticated connections open and
+hands them out in turn, so connect, STARTTLS and login happen once per session
+instead of once per message. Connections idle for longer than
+`smtp_idle_timeout` seconds are closed before reuse.
+
+Each message is retried with exponential backoff on transient failures
+(dropped connections, timeouts, 4xx replies). Permanent rejections (5xx
+replies, bad credentials) fail at once so callers can fall back, e.g. to a
+smaller set of attachments.
+
+Recipient lists longer than `smtp_max_recipients` are split into batches that
+go out over parallel sessions.
+"""
+
+import atexit
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_MAX_SESSIONS = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 2.0
+DEFAULT_MAX_RECIPIENTS = 50
+DEFAULT_IDLE_TIMEOUT = 60.0
+DEFAULT_TIMEOUT = 30.0
+
+
+class DeliveryError(Exception):
+    """Raised when a message could not be delivered after all retries."""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    True for failures worth retrying: dropped connections, timeouts and 4xx replies.
+
+    SMTPException subclasses OSError, so other SMTP errors (e.g. a missing
+    extension) and certificate failures are ruled out before the OSError
+    fallback; retrying can't fix them.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, (smtplib.SMTPException, ssl.SSLCertVerificationError)):
+        return False
+    return isinstance(error, OSError)
+
+
+class SMTPPool:
+    """A bounded pool of authenticated SMTP sessions to one server."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str = '',
+        password: str = '',
+        starttls: bool = True,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        timeout: float = DEFAULT_TIMEOUT,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_sessions = max(1, int(max_sessions))
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.sleep = sleep
+        self.connections_opened = 0
+        self._advertised_size: Optional[int] = None
+        self._size_checked = False
+        self._size_lock = threading.Lock()
+
+        self._idle: queue.LifoQueue = queue.LifoQueue()   # (server, last used)
+        self._slots = threading.BoundedSemaphore(self.max_sessions)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'SMTPPool':
+        """Build a pool from an email_reports config dict."""
+        return cls(
+            config['smtp_host'], int(config['smtp_port']),
+            user=config.get('smtp_user', ''),
+            password=config.get('smtp_password', ''),
+            starttls=config.get('smtp_starttls', True),
+            max_sessions=config.get('smtp_max_sessions', DEFAULT_MAX_SESSIONS),
+            max_retries=config.get('smtp_max_retries', DEFAULT_MAX_RETRIES),
+            retry_backoff=config.get('smtp_retry_backoff', DEFAULT_RETRY_BACKOFF),
+            idle_timeout=config.get('smtp_idle_timeout', DEFAULT_IDLE_TIMEOUT),
+        )
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user and self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return server
+
+    def _checkout(self) -> tuple:
+        """Take an idle session (or open one) within the session limit; returns (server, reused)."""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    server, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect(), False
+                if time.monotonic() - last_used <= self.idle_timeout:
+                    return server, True
+                self._quit(server)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, server: smtplib.SMTP, healthy: bool):
+        if healthy:
+            self._idle.put((server, time.monotonic()))
+        else:
+            self._quit(server, polite=False)
+        self._slots.release()
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP, polite: bool = True):
+        try:
+            if polite:
+                server.quit()
+            else:
+                server.close()
+        except Exception:
+            server.close()
+
+    def advertised_size(self) -> Optional[int]:
+        """
+        The server's SIZE limit from EHLO, or None when it doesn't advertise one.
+
+        The server is asked once per pool. A failed probe raises, and later
+        calls return None instead of connecting again.
+        """
+        with self._size_lock:
+            if not self._size_checked:
+                self._size_checked = True
+                server, _ = self._checkout()
+                healthy = False
+                try:
+                    server.ehlo_or_helo_if_needed()
+                    size = server.esmtp_features.get('size', '').strip()
+                    self._advertised_size = int(size) if size.isdigit() and int(size) > 0 else None
+                    healthy = True
+                finally:
+                    self._checkin(server, healthy)
+        return self._advertised_size
+
+    def send(self, msg, to_addrs: Optional[List[str]] = None, from_addr: Optional[str] = None) -> dict:
+        """
+        Send one message over a pooled session, retrying transient failures.
+
+        `msg` is an email Message, or already-flattened bytes (which need
+        `from_addr` and `to_addrs`) so a large message is encoded only once.
+
+        Returns:
+            smtplib's dict of refused recipients (empty when all were accepted)
+
+        Raises:
+            DeliveryError: permanent rejection or retries exhausted
+        """
+        attempt = 0
+        while True:
+            server, reused = None, False
+            try:
+                server, reused = self._checkout()
+                if isinstance(msg, bytes):
+                    refused = server.sendmail(from_addr, to_addrs, msg)
+                else:
+                    refused = server.send_message(msg, from_addr=from_addr, to_addrs=to_addrs)
+                self._checkin(server, healthy=True)
+                return refused
+            except Exception as e:
+                if server is not None:
+                    self._checkin(server, healthy=False)
+
+                # A pooled session the server already closed costs no attempt
+                if reused and isinstance(e, smtplib.SMTPServerDisconnected):
+                    continue
+
+                if not is_transient(e):
+                    raise DeliveryError(str(e), permanent=True) from e
+                if attempt >= self.max_retries:
+                    raise DeliveryError(f"Gave up after {attempt + 1} attempt(s): {e}") from e
+
+                delay = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                print(f"    [WARN] SMTP send failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                self.sleep(delay)
+
+    def send_batches(self, msg, batches: List[List[str]], from_addr: Optional[str] = None) -> dict:
+        """Send one message to several recipient batches over parallel sessions."""
+        if len(batches) == 1:
+            return self.send(msg, to_addrs=batches[0], from_addr=from_addr)
+
+        refused = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_sessions, len(batches))) as executor:
+            sends = executor.map(lambda batch: self.send(msg, to_addrs=batch, from_addr=from_addr), batches)
+            for batch_refused in sends:
+                refused.update(batch_refused)
+        return refused
+
+    def close(self):
+        """Close every idle session."""
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._quit(server)
+
+
+_pools: Dict[tuple, SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(config: dict) -> SMTPPool:
+    """Return the shared pool for the config's server and account, creating it on first use."""
+    key = (config['smtp_host'], int(config['smtp_port']), config.get('smtp_user', ''))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SMTPPool.from_config(config)
+        return _pools[key]
+
+
+def close_pools():
+    """Close all shared pools' idle sessions."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_pools)
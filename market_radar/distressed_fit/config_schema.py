@@ -6,13 +6,17 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, Optional
 
+from ..simple_yaml import load_simple_yaml
+
 
 @dataclass
 class DataPaths:
     master_tsv: str = "city_market_tracker.tsv000.gz"
+    metro_tracker_tsv: str = "redfin_metro_market_tracker.tsv000.gz"
     core_market_root: str = "core_markets"
     competition_csv: str = "market_radar/inputs/competition_proxy.csv"
     housing_age_csv: str = "market_radar/inputs/housing_age_proxy.csv"
+    cube_dir: str = "market_radar/.cube"
 
 
 @dataclass
@@ -38,7 +42,13 @@ class DistressedFitConfig:
     hard_filters: HardFilters
     buy_box: BuyBox
     output_dir: str
+    master_memory_mb: float = 256
+    master_workers: int = 1
+    metro_source: str = "city_tracker"
+
 
+# metro_source values: sum the city tracker by metro, or read Redfin's metro tracker
+METRO_SOURCES = ("city_tracker", "metro_tracker")
 
 DEFAULT_WEIGHTS: Dict[str, float] = {
     "distress_inflow": 0.20,
@@ -50,49 +60,6 @@ DEFAULT_WEIGHTS: Dict[str, float] = {
 }
 
 
-def _parse_scalar(raw: str) -> Any:
-    value = raw.strip().strip('"').strip("'")
-    if value.lower() in {"true", "false"}:
-        return value.lower() == "true"
-    if value.lower() in {"none", "null"}:
-        return None
-    try:
-        if "." in value:
-            return float(value)
-        return int(value)
-    except ValueError:
-        return value
-
-
-def load_simple_yaml(path: Path) -> Dict[str, Any]:
-    """Load a minimal YAML config (nested mappings only)."""
-    config: Dict[str, Any] = {}
-    stack = [(0, config)]
-
-    for raw_line in path.read_text(encoding="utf-8").splitlines():
-        stripped = raw_line.strip()
-        if not stripped or stripped.startswith("#"):
-            continue
-
-        line = raw_line.split("#", 1)[0].rstrip()
-        indent = len(line) - len(line.lstrip(" "))
-        key, _, value = line.lstrip().partition(":")
-        key = key.strip()
-        value = value.strip()
-
-        while stack and indent <= stack[-1][0] and len(stack) > 1:
-            stack.pop()
-
-        parent = stack[-1][1]
-        if value == "":
-            parent[key] = {}
-            stack.append((indent, parent[key]))
-        else:
-            parent[key] = _parse_scalar(value)
-
-    return config
-
-
 def _deep_merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
     merged = dict(base)
     for key, value in override.items():
@@ -106,9 +73,11 @@ def _deep_merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any
 def _as_data_paths(payload: Dict[str, Any]) -> DataPaths:
     return DataPaths(
         master_tsv=str(payload.get("master_tsv", DataPaths.master_tsv)),
+        metro_tracker_tsv=str(payload.get("metro_tracker_tsv", DataPaths.metro_tracker_tsv)),
         core_market_root=str(payload.get("core_market_root", DataPaths.core_market_root)),
         competition_csv=str(payload.get("competition_csv", DataPaths.competition_csv)),
         housing_age_csv=str(payload.get("housing_age_csv", DataPaths.housing_age_csv)),
+        cube_dir=str(payload.get("cube_dir", DataPaths.cube_dir) or ""),
     )
 
 
@@ -138,6 +107,11 @@ def _validate_weights(weights: Dict[str, float]) -> None:
         raise ValueError(f"Weights must sum to ~1.0, got {total:.4f}")
 
 
+def _validate_metro_source(metro_source: str) -> None:
+    if metro_source not in METRO_SOURCES:
+        raise ValueError(f"Unknown metro_source: {metro_source} (choose from {', '.join(METRO_SOURCES)})")
+
+
 def load_config(config_path: Path) -> DistressedFitConfig:
     if not config_path.exists():
         raise FileNotFoundError(f"Config not found: {config_path}")
@@ -147,9 +121,11 @@ def load_config(config_path: Path) -> DistressedFitConfig:
         "markets_seed": "market_radar/seeds_roanoke_4hr.csv",
         "data_paths": {
             "master_tsv": DataPaths.master_tsv,
+            "metro_tracker_tsv": DataPaths.metro_tracker_tsv,
             "core_market_root": DataPaths.core_market_root,
             "competition_csv": DataPaths.competition_csv,
             "housing_age_csv": DataPaths.housing_age_csv,
+            "cube_dir": DataPaths.cube_dir,
         },
         "weights": dict(DEFAULT_WEIGHTS),
         "hard_filters": {
@@ -163,6 +139,9 @@ def load_config(config_path: Path) -> DistressedFitConfig:
             "target_rehab_level": BuyBox.target_rehab_level,
         },
         "output_dir": "market_radar/outputs_distressed_fit",
+        "master_memory_mb": DistressedFitConfig.master_memory_mb,
+        "master_workers": DistressedFitConfig.master_workers,
+        "metro_source": DistressedFitConfig.metro_source,
     }
 
     raw = load_simple_yaml(config_path)
@@ -170,6 +149,8 @@ def load_config(config_path: Path) -> DistressedFitConfig:
 
     weights = {k: float(v) for k, v in merged.get("weights", {}).items()}
     _validate_weights(weights)
+    metro_source = str(merged.get("metro_source", defaults["metro_source"]))
+    _validate_metro_source(metro_source)
 
     return DistressedFitConfig(
         target_month=merged.get("target_month"),
@@ -179,6 +160,9 @@ def load_config(config_path: Path) -> DistressedFitConfig:
         hard_filters=_as_hard_filters(merged.get("hard_filters", {})),
         buy_box=_as_buy_box(merged.get("buy_box", {})),
         output_dir=str(merged.get("output_dir", defaults["output_dir"])),
+        master_memory_mb=float(merged.get("master_memory_mb", defaults["master_memory_mb"])),
+        master_workers=int(merged.get("master_workers", defaults["master_workers"])),
+        metro_source=metro_source,
     )
 
 
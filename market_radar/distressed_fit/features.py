@@ -4,11 +4,14 @@ from __future__ import annotations
 
 import csv
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 
+from ..master_aggregate import DEFAULT_MEMORY_MB, METRO_COLUMN, PERIOD_COLUMN
+from ..metric_cube import load_or_build_cube
 from .competition import lookup_proxy
 
 
@@ -67,6 +70,16 @@ REQUIRED_COLUMNS = [
     "PRICE_DROPS",
 ]
 
+NUMERIC_COLUMNS = [
+    "MEDIAN_SALE_PRICE",
+    "HOMES_SOLD",
+    "PENDING_SALES",
+    "NEW_LISTINGS",
+    "INVENTORY",
+    "MEDIAN_DOM",
+    "PRICE_DROPS",
+]
+
 
 def load_seed_markets(seed_path: Path, limit: Optional[int] = None) -> List[MarketSeed]:
     markets: List[MarketSeed] = []
@@ -106,64 +119,96 @@ def _coerce_numeric(frame: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
     return frame
 
 
+def _market_components(frame: pd.DataFrame) -> pd.DataFrame:
+    """Additive market components of numeric tracker rows (no buy box)."""
+    homes_sold = frame["HOMES_SOLD"]
+    dom_weight = homes_sold.where(frame["MEDIAN_DOM"].notna(), 0).fillna(0)
+    return pd.DataFrame({
+        "inventory": frame["INVENTORY"],
+        "new_listings": frame["NEW_LISTINGS"],
+        "homes_sold": homes_sold,
+        "pending_sales": frame["PENDING_SALES"],
+        "price_drops": frame["PRICE_DROPS"],
+        "weighted_price_component": frame["MEDIAN_SALE_PRICE"] * homes_sold.fillna(0),
+        "weighted_dom_component": frame["MEDIAN_DOM"].fillna(0) * dom_weight,
+        "dom_weight": dom_weight,
+    }, index=frame.index)
+
+
+def _buy_box_homes_sold(frame: pd.DataFrame, buy_box_min: int, buy_box_max: int) -> pd.Series:
+    in_buy_box = frame["MEDIAN_SALE_PRICE"].between(buy_box_min, buy_box_max, inclusive="both")
+    return frame["HOMES_SOLD"].where(in_buy_box, 0).fillna(0)
+
+
+def _monthly_components(frame: pd.DataFrame, buy_box_min: int, buy_box_max: int) -> pd.DataFrame:
+    """Per-row additive components of the monthly metro series (summed by aggregate_master)."""
+    frame = _coerce_numeric(frame.copy(), NUMERIC_COLUMNS)
+    components = _market_components(frame)
+    components["buy_box_homes_sold"] = _buy_box_homes_sold(frame, buy_box_min, buy_box_max)
+    return components
+
+
+def _metro_tracker_components(frame: pd.DataFrame) -> pd.DataFrame:
+    """Components of metro tracker rows: one per metro and month, so the weighted price and DOM are its medians."""
+    return _market_components(_coerce_numeric(frame.copy(), NUMERIC_COLUMNS))
+
+
+def _buy_box_components(frame: pd.DataFrame, buy_box_min: int, buy_box_max: int) -> pd.DataFrame:
+    """City tracker components of the buy-box share, which needs per-city prices."""
+    frame = _coerce_numeric(frame.copy(), ["MEDIAN_SALE_PRICE", "HOMES_SOLD"])
+    return pd.DataFrame({
+        "city_homes_sold": frame["HOMES_SOLD"],
+        "buy_box_homes_sold": _buy_box_homes_sold(frame, buy_box_min, buy_box_max),
+    }, index=frame.index)
+
+
 def load_master_monthly_series(
     tsv_path: Path,
     metro_codes: List[str],
     buy_box_min: int,
     buy_box_max: int,
+    memory_mb: float = DEFAULT_MEMORY_MB,
+    workers: int = 1,
+    cube_dir: Optional[Path] = None,
+    metro_tracker_path: Optional[Path] = None,
 ) -> Tuple[Dict[str, pd.DataFrame], List[str]]:
-    """Load and aggregate master TSV once, then split monthly series by metro code."""
+    """
+    Aggregate the master TSV once, then split monthly series by metro code.
+
+    The file is summed by (metro, month) in chunks under memory_mb (see
+    market_radar/master_aggregate.py) rather than loaded whole, across
+    `workers` processes when more than one. With cube_dir, the sums are
+    saved there as a metric cube and reused until the file, the buy box or
+    the seed metros change (see market_radar/metric_cube.py).
+
+    With metro_tracker_path, market metrics come from Redfin's metro tracker
+    (true metro medians) and only the buy-box share is aggregated from the
+    city-level master TSV.
+    """
     if not tsv_path.exists():
         raise FileNotFoundError(f"Master TSV not found: {tsv_path}")
 
-    metro_set = {str(code) for code in metro_codes}
-
-    frame = pd.read_csv(
-        tsv_path,
-        sep="\t",
-        compression="gzip",
-        low_memory=False,
-        usecols=REQUIRED_COLUMNS,
-    )
-
-    frame = frame[frame["PROPERTY_TYPE"] == "All Residential"].copy()
-    frame["PARENT_METRO_REGION_METRO_CODE"] = frame["PARENT_METRO_REGION_METRO_CODE"].astype(str)
-    frame = frame[frame["PARENT_METRO_REGION_METRO_CODE"].isin(metro_set)].copy()
-
-    numeric_cols = [
-        "MEDIAN_SALE_PRICE",
-        "HOMES_SOLD",
-        "PENDING_SALES",
-        "NEW_LISTINGS",
-        "INVENTORY",
-        "MEDIAN_DOM",
-        "PRICE_DROPS",
-    ]
-    frame = _coerce_numeric(frame, numeric_cols)
-    frame["PERIOD_BEGIN"] = pd.to_datetime(frame["PERIOD_BEGIN"], errors="coerce")
-    frame = frame[frame["PERIOD_BEGIN"].notna()].copy()
-
-    frame["weighted_price_component"] = frame["MEDIAN_SALE_PRICE"] * frame["HOMES_SOLD"].fillna(0)
-    frame["dom_weight"] = frame["HOMES_SOLD"].where(frame["MEDIAN_DOM"].notna(), 0).fillna(0)
-    frame["weighted_dom_component"] = frame["MEDIAN_DOM"].fillna(0) * frame["dom_weight"]
-    in_buy_box = frame["MEDIAN_SALE_PRICE"].between(buy_box_min, buy_box_max, inclusive="both")
-    frame["buy_box_homes_component"] = frame["HOMES_SOLD"].where(in_buy_box, 0).fillna(0)
-
-    grouped = (
-        frame.groupby(["PARENT_METRO_REGION_METRO_CODE", "PERIOD_BEGIN"], as_index=False)
-        .agg(
-            inventory=("INVENTORY", "sum"),
-            new_listings=("NEW_LISTINGS", "sum"),
-            homes_sold=("HOMES_SOLD", "sum"),
-            pending_sales=("PENDING_SALES", "sum"),
-            price_drops=("PRICE_DROPS", "sum"),
-            weighted_price_component=("weighted_price_component", "sum"),
-            weighted_dom_component=("weighted_dom_component", "sum"),
-            dom_weight=("dom_weight", "sum"),
-            buy_box_homes_sold=("buy_box_homes_component", "sum"),
-        )
-        .sort_values(["PARENT_METRO_REGION_METRO_CODE", "PERIOD_BEGIN"])
-    )
+    aggregate = partial(load_or_build_cube, cube_dir=cube_dir, metro_codes=metro_codes,
+                        memory_mb=memory_mb, workers=workers)
+    if metro_tracker_path is None:
+        source_mix = "master_tsv"
+        grouped = aggregate(
+            tsv_path,
+            REQUIRED_COLUMNS,
+            partial(_monthly_components, buy_box_min=buy_box_min, buy_box_max=buy_box_max),
+            name="distressed_fit",
+        ).to_frame()
+    else:
+        source_mix = "metro_tracker"
+        grouped = aggregate(metro_tracker_path, REQUIRED_COLUMNS, _metro_tracker_components,
+                            name="distressed_fit_metro").to_frame()
+        buy_box = aggregate(
+            tsv_path,
+            ["MEDIAN_SALE_PRICE", "HOMES_SOLD"],
+            partial(_buy_box_components, buy_box_min=buy_box_min, buy_box_max=buy_box_max),
+            name="distressed_fit_buy_box",
+        ).to_frame()
+        grouped = grouped.merge(buy_box, on=[METRO_COLUMN, PERIOD_COLUMN], how="left")
 
     grouped["median_sale_price"] = grouped.apply(
         lambda row: row["weighted_price_component"] / row["homes_sold"] if row["homes_sold"] > 0 else None,
@@ -177,17 +222,20 @@ def load_master_monthly_series(
         lambda row: row["inventory"] / row["homes_sold"] if row["homes_sold"] > 0 else None,
         axis=1,
     )
+    # Buy-box sales as a share of the same cities' sales
+    share_base = "homes_sold" if metro_tracker_path is None else "city_homes_sold"
     grouped["buy_box_share"] = grouped.apply(
-        lambda row: row["buy_box_homes_sold"] / row["homes_sold"] if row["homes_sold"] > 0 else None,
+        lambda row: row["buy_box_homes_sold"] / row[share_base] if row[share_base] > 0 else None,
         axis=1,
     )
 
-    grouped = grouped.rename(columns={"PARENT_METRO_REGION_METRO_CODE": "metro_code"})
+    grouped = grouped.rename(columns={METRO_COLUMN: "metro_code"})
 
     monthly_by_metro: Dict[str, pd.DataFrame] = {}
     for metro_code, metro_df in grouped.groupby("metro_code"):
         metro_df = metro_df.sort_values("PERIOD_BEGIN").reset_index(drop=True)
         metro_df["period"] = metro_df["PERIOD_BEGIN"].dt.strftime("%Y-%m")
+        metro_df.attrs["source_mix"] = source_mix
         monthly_by_metro[metro_code] = metro_df
 
     all_periods = sorted(grouped["PERIOD_BEGIN"].dt.strftime("%Y-%m").unique().tolist())
@@ -399,7 +447,7 @@ def build_feature_rows_for_month(
             market=seed.display_name,
             metro_code=seed.metro_code,
             period=selected_period.strftime("%Y-%m"),
-            source_mix="master_tsv",
+            source_mix=monthly.attrs.get("source_mix", "master_tsv"),
             stale_months=max(0, stale_months),
             median_sale_price=median_sale_price,
             median_sale_price_yoy=median_sale_price_yoy,
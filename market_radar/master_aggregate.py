@@ -0,0 +1,243 @@
+"""
+Chunked, memory-capped aggregation of the master city_market_tracker file
+(or any Redfin market tracker with the same columns, such as the metro tracker).
+
+The master TSV holds every city in the country, so reading it into one
+DataFrame (and filtering a copy) needs several GB. aggregate_master() reads it
+in chunks sized to a memory budget instead, map-reduce style:
+
+- map: each chunk is filtered to 'All Residential', unadjusted rows (when
+  the file also has seasonally adjusted ones) and optionally a set of
+  metro codes, and turned into additive per-row components by a
+  caller-supplied function, e.g. HOMES_SOLD and MEDIAN_SALE_PRICE * HOMES_SOLD
+  (the numerator of a sales-weighted price).
+- reduce: the components are summed by (metro code, month). Partial sums are
+  folded into the running totals whenever they outgrow them, so memory holds
+  one chunk plus roughly twice the (metro, month) totals.
+
+Ratios (weighted prices, DOM, months of supply) are computed by the caller
+from the summed numerators and denominators.
+
+Chunks are cut from the decompressed file as blocks of whole lines, at the
+first line end past a fixed byte size worked out from the first PROBE_ROWS
+rows and the budget, so the parent does little beyond decompressing. With
+workers > 1 the blocks are parsed and mapped in a process pool while the
+parent keeps decompressing. The parent folds the partial sums in file order,
+exactly as the serial path does, so both return bit-for-bit identical totals.
+Each worker parses one chunk at a time, so the parallel path needs about
+`workers` times the memory budget.
+"""
+
+import gzip
+import io
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Deque, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+METRO_COLUMN = "PARENT_METRO_REGION_METRO_CODE"
+PERIOD_COLUMN = "PERIOD_BEGIN"
+PROPERTY_TYPE = "All Residential"
+
+# The metro tracker carries seasonally adjusted copies of its rows (the city
+# tracker's are all unadjusted). Only unadjusted rows are aggregated.
+SEASONALLY_ADJUSTED_COLUMN = "IS_SEASONALLY_ADJUSTED"
+
+# Memory cap for one aggregation (radar master_memory_mb / distressed-fit master_memory_mb)
+DEFAULT_MEMORY_MB = 256
+
+# Rows in the first chunk, used to size the rest
+PROBE_ROWS = 2000
+
+# Upper bound on rows per chunk, however large the budget
+MAX_CHUNK_ROWS = 500000
+
+# Share of the budget for one chunk (raw lines plus parsed frame); the rest
+# covers the parser's own buffers, the filtered copy and the running totals
+CHUNK_SHARE = 0.25
+
+# Blocks queued per worker in the parallel path
+BLOCKS_PER_WORKER = 2
+
+
+def _read_lines(stream, lines: int) -> bytes:
+    """The next `lines` lines (fewer at the end of the stream)."""
+    return b"".join(stream.readline() for _ in range(lines))
+
+
+def _read_block(stream, size: int) -> bytes:
+    """The next whole lines spanning at least `size` bytes (b"" at the end)."""
+    block = stream.read(size)
+    if block and not block.endswith(b"\n"):
+        block += stream.readline()
+    return block
+
+
+def _parse_block(names: List[str], block: bytes, usecols: List[str]) -> pd.DataFrame:
+    # Column names come from the header line, so the block is parsed without a copy
+    return pd.read_csv(
+        io.BytesIO(block),
+        sep="\t",
+        header=None,
+        names=names,
+        usecols=usecols,
+        dtype={METRO_COLUMN: str, PERIOD_COLUMN: str, SEASONALLY_ADJUSTED_COLUMN: str},
+    )
+
+
+def _map_chunk(
+    chunk: pd.DataFrame,
+    components: Callable[[pd.DataFrame], pd.DataFrame],
+    metro_set: Optional[set],
+) -> Optional[pd.DataFrame]:
+    """One chunk's component sums by (metro code, month), or None if nothing matched."""
+    chunk = chunk[chunk["PROPERTY_TYPE"] == PROPERTY_TYPE]
+    if SEASONALLY_ADJUSTED_COLUMN in chunk.columns:
+        chunk = chunk[chunk[SEASONALLY_ADJUSTED_COLUMN].str.lower().isin(["false", "f"])]
+    if metro_set is not None:
+        chunk = chunk[chunk[METRO_COLUMN].isin(metro_set)]
+    periods = pd.to_datetime(chunk[PERIOD_COLUMN], errors="coerce")
+    keep = periods.notna()
+    if not keep.any():
+        return None
+
+    chunk = chunk[keep]
+    values = components(chunk).astype("float64")
+    values[METRO_COLUMN] = chunk[METRO_COLUMN]
+    values[PERIOD_COLUMN] = periods[keep]
+    return values.groupby([METRO_COLUMN, PERIOD_COLUMN]).sum()
+
+
+def _map_block(names: List[str], block: bytes, usecols: List[str], components, metro_set) -> tuple:
+    """Parse and map one line block: (rows parsed, partial sums or None)."""
+    chunk = _parse_block(names, block, usecols)
+    return len(chunk), _map_chunk(chunk, components, metro_set)
+
+
+# Set once per pool worker by _init_worker, so each task only ships its block
+_worker_args: Optional[Tuple[List[str], List[str], Any, Any]] = None
+
+
+def _init_worker(names: List[str], usecols: List[str], components, metro_set):
+    global _worker_args
+    _worker_args = (names, usecols, components, metro_set)
+
+
+def _worker_map_block(block: bytes) -> tuple:
+    assert _worker_args is not None, "pool worker was not initialized"
+    names, usecols, components, metro_set = _worker_args
+    return _map_block(names, block, usecols, components, metro_set)
+
+
+class _Totals:
+    """Running (metro, month) sums; partials are folded in the order they are added."""
+
+    def __init__(self):
+        self.totals = None
+        self.partials = []
+        self.partial_rows = 0
+
+    def add(self, partial: Optional[pd.DataFrame]):
+        if partial is None:
+            return
+        self.partials.append(partial)
+        self.partial_rows += len(partial)
+        # Amortized: fold once the partials are as large as the totals
+        if self.partial_rows >= max(len(self.totals) if self.totals is not None else 0, PROBE_ROWS):
+            self.fold()
+
+    def fold(self) -> Optional[pd.DataFrame]:
+        frames = ([self.totals] if self.totals is not None else []) + self.partials
+        if len(frames) > 1:
+            self.totals = pd.concat(frames).groupby(level=[0, 1]).sum()
+        elif frames:
+            self.totals = frames[0]
+        self.partials = []
+        self.partial_rows = 0
+        return self.totals
+
+
+def aggregate_master(
+    tsv_path: Path,
+    columns: Iterable[str],
+    components: Callable[[pd.DataFrame], pd.DataFrame],
+    metro_codes: Optional[Iterable[str]] = None,
+    memory_mb: float = DEFAULT_MEMORY_MB,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Sum per-row components of the master TSV by (metro code, month).
+
+    Args:
+        tsv_path: Gzipped master TSV
+        columns: Source columns `components` needs (only these are parsed)
+        components: Maps a filtered chunk to a frame of additive columns
+            (same index); NaN values are skipped when summing, like groupby sum.
+            Must be picklable (a module-level function or functools.partial)
+            when workers > 1.
+        metro_codes: Only aggregate these metros (default: every metro)
+        memory_mb: Memory budget the chunk size is derived from (per worker)
+        workers: Worker processes that parse and map chunks (1: in-process)
+
+    Returns a frame with PARENT_METRO_REGION_METRO_CODE (str), PERIOD_BEGIN
+    (datetime) and one float64 column per component, sorted by metro and
+    month. `attrs['rows_read']` holds the number of source rows scanned.
+    The result does not depend on `workers`.
+    """
+    if memory_mb <= 0:
+        raise ValueError(f"memory_mb must be positive (got {memory_mb})")
+
+    budget = memory_mb * 1024 * 1024
+    metro_set = None if metro_codes is None else {str(code) for code in metro_codes}
+    totals = _Totals()
+    rows_read = 0
+
+    with gzip.open(tsv_path, "rb") as stream:
+        names = list(pd.read_csv(io.BytesIO(stream.readline()), sep="\t", nrows=0).columns)
+        usecols = sorted(set(columns) | {METRO_COLUMN, PERIOD_COLUMN, "PROPERTY_TYPE"}
+                         | ({SEASONALLY_ADJUSTED_COLUMN} & set(names)))
+
+        # The first rows fix the chunk size (in source bytes) for the rest of the file
+        probe_block = _read_lines(stream, PROBE_ROWS)
+        probe = _parse_block(names, probe_block, usecols)
+        rows_read += len(probe)
+        row_bytes = (probe.memory_usage(deep=True).sum() + len(probe_block)) / max(len(probe), 1)
+        chunk_rows = min(max(budget * CHUNK_SHARE / row_bytes, PROBE_ROWS), MAX_CHUNK_ROWS)
+        chunk_bytes = max(int(chunk_rows * len(probe_block) / max(len(probe), 1)), 1)
+        totals.add(_map_chunk(probe, components, metro_set))
+        del probe, probe_block
+
+        blocks = iter(lambda: _read_block(stream, chunk_bytes), b"")
+        if workers <= 1:
+            for block in blocks:
+                rows, partial = _map_block(names, block, usecols, components, metro_set)
+                rows_read += rows
+                totals.add(partial)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(names, usecols, components, metro_set),
+            ) as pool:
+                pending: Deque[Future] = deque()
+                for block in blocks:
+                    pending.append(pool.submit(_worker_map_block, block))
+                    del block
+                    # Bounded queue; results are folded in file order
+                    while pending and (len(pending) >= workers * BLOCKS_PER_WORKER or pending[0].done()):
+                        rows, partial = pending.popleft().result()
+                        rows_read += rows
+                        totals.add(partial)
+                for future in pending:
+                    rows, partial = future.result()
+                    rows_read += rows
+                    totals.add(partial)
+
+    result = totals.fold()
+    if result is None:
+        result = pd.DataFrame(columns=[METRO_COLUMN, PERIOD_COLUMN])
+    else:
+        result = result.sort_index().reset_index()
+    result.attrs["rows_read"] = rows_read
+    return result
@@ -0,0 +1,237 @@
+"""
+Dense (entity x month x metric) cube of master TSV aggregates, kept on disk.
+
+aggregate_master() returns long (metro, month) rows. A MetricCube holds the
+same numbers as one float64 array of shape (entities, months, metrics), with
+entity and metric index maps, so a metro's series is a slice rather than a
+filtered copy of a DataFrame. Cells with no source rows are NaN; aggregated
+cells never are, since groupby sums skip NaN.
+
+Cubes are saved as a directory holding values.npy (the array) and index.json
+(entity codes, months, metric names, attrs). open_cube() memory-maps the
+array read-only, and load_or_build_cube() names each cube by a key over the
+source file (path, size, mtime), the parsed columns, the components function
+and the metro set, so warm starts reuse the saved cube and skip the master
+scan. A cube opened from disk pickles as its directory.
+
+The components part of the key covers the function's source plus the
+functions and constants it uses from its own module (see
+_components_identity). Bump CUBE_VERSION when a change elsewhere, such as
+in aggregate_master() or a helper imported from another module, alters the
+sums.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import types
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from market_radar.master_aggregate import DEFAULT_MEMORY_MB, METRO_COLUMN, PERIOD_COLUMN, aggregate_master
+
+# Bump when the aggregation or the on-disk layout changes, to retire old cubes
+CUBE_VERSION = 1
+
+VALUES_FILE = "values.npy"
+INDEX_FILE = "index.json"
+
+
+class MetricCube:
+    """(entity, month, metric) float64 array with entity and metric index maps."""
+
+    def __init__(self, values: np.ndarray, entities: List[str], months: np.ndarray,
+                 metrics: List[str], attrs: Optional[dict] = None, path: Optional[Path] = None):
+        self.values = values
+        self.entities = list(entities)
+        self.months = months
+        self.metrics = list(metrics)
+        self.attrs = dict(attrs or {})
+        self.path = path
+        self.entity_index: Dict[str, int] = {entity: i for i, entity in enumerate(self.entities)}
+        self.metric_index: Dict[str, int] = {metric: i for i, metric in enumerate(self.metrics)}
+
+    def __reduce__(self):
+        # Memory-mapped cubes travel to worker processes as their directory
+        if self.path is not None:
+            return open_cube, (self.path,)
+        return MetricCube, (self.values, self.entities, self.months, self.metrics, self.attrs)
+
+    def series(self, entity: str, metric: str) -> np.ndarray:
+        """One entity's monthly values of one metric (a view; NaN for missing months)."""
+        return self.values[self.entity_index[entity], :, self.metric_index[metric]]
+
+    def entity_frame(self, entity: str) -> pd.DataFrame:
+        """One entity's months with data, in the long layout of aggregate_master()."""
+        block = self.values[self.entity_index[entity]]
+        present = ~np.isnan(block).all(axis=1)
+        frame = pd.DataFrame(np.array(block[present]), columns=self.metrics)
+        frame.insert(0, PERIOD_COLUMN, self.months[present])
+        frame.insert(0, METRO_COLUMN, pd.array([entity] * len(frame), dtype="str"))
+        return frame
+
+    def to_frame(self) -> pd.DataFrame:
+        """Every entity's months with data: the frame aggregate_master() returned."""
+        frames = [self.entity_frame(entity) for entity in self.entities]
+        if not frames:
+            return pd.DataFrame(columns=[METRO_COLUMN, PERIOD_COLUMN] + self.metrics)
+        result = pd.concat(frames, ignore_index=True)
+        result.attrs.update(self.attrs)
+        return result
+
+
+def cube_from_totals(totals: pd.DataFrame) -> MetricCube:
+    """Pivot aggregate_master() output into a dense cube."""
+    metrics = [column for column in totals.columns if column not in (METRO_COLUMN, PERIOD_COLUMN)]
+    entity_codes, entities = pd.factorize(totals[METRO_COLUMN], sort=True)
+    month_codes, months = pd.factorize(totals[PERIOD_COLUMN], sort=True)
+
+    values = np.full((len(entities), len(months), len(metrics)), np.nan)
+    values[entity_codes, month_codes] = totals[metrics].to_numpy(dtype="float64")
+    return MetricCube(values, [str(e) for e in entities], np.asarray(months), metrics, totals.attrs)
+
+
+def save_cube(cube: MetricCube, directory: Path) -> Path:
+    """Write a cube directory, replacing any existing one in a single rename."""
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    temp_dir = Path(tempfile.mkdtemp(prefix=f".{directory.name}.", dir=directory.parent))
+    try:
+        np.save(temp_dir / VALUES_FILE, np.ascontiguousarray(cube.values, dtype="float64"))
+        index = {
+            "version": CUBE_VERSION,
+            "entities": cube.entities,
+            "months": [str(month) for month in cube.months],
+            "month_dtype": str(cube.months.dtype),
+            "metrics": cube.metrics,
+            "attrs": cube.attrs,
+        }
+        (temp_dir / INDEX_FILE).write_text(json.dumps(index), encoding="utf-8")
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(temp_dir, directory)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return directory
+
+
+def open_cube(directory: Path) -> MetricCube:
+    """Open a saved cube with its values memory-mapped read-only."""
+    directory = Path(directory)
+    index = json.loads((directory / INDEX_FILE).read_text(encoding="utf-8"))
+    if index.get("version") != CUBE_VERSION:
+        raise ValueError(f"Unsupported metric cube version: {index.get('version')}")
+    values = np.load(directory / VALUES_FILE, mmap_mode="r", allow_pickle=False)
+    months = np.array(index["months"], dtype=index["month_dtype"])
+    return MetricCube(values, index["entities"], months, index["metrics"], index["attrs"], path=directory)
+
+
+def _code_names(code: types.CodeType) -> Set[str]:
+    """Global names a code object and its nested functions refer to."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _module_dependencies(func: types.FunctionType) -> list:
+    """
+    Sources of the same-module functions `func` calls (recursively) and reprs
+    of the plain constants it reads, sorted by name.
+    """
+    seen: Dict[str, str] = {}
+    pending = [func]
+    while pending:
+        current = pending.pop()
+        for name in sorted(_code_names(current.__code__)):
+            if name in seen or name not in current.__globals__:
+                continue
+            value = current.__globals__[name]
+            if isinstance(value, types.FunctionType) and value.__module__ == func.__module__:
+                try:
+                    seen[name] = inspect.getsource(value)
+                except (OSError, TypeError):
+                    seen[name] = ""
+                pending.append(value)
+            elif isinstance(value, (str, int, float, bool, tuple, list, dict, frozenset)):
+                seen[name] = repr(value)
+    return sorted(seen.items())
+
+
+def _components_identity(components: Callable) -> list:
+    """What a components function computes, as far as the cube key can tell."""
+    if isinstance(components, partial):
+        keywords = sorted((key, repr(value)) for key, value in components.keywords.items())
+        return [_components_identity(components.func), [repr(arg) for arg in components.args], keywords]
+    try:
+        source = inspect.getsource(components)
+    except (OSError, TypeError):
+        source = ""
+    dependencies = _module_dependencies(components) if isinstance(components, types.FunctionType) else []
+    return [getattr(components, "__module__", ""), getattr(components, "__qualname__", repr(components)), source,
+            dependencies]
+
+
+def cube_key(tsv_path: Path, columns: Iterable[str], components: Callable,
+             metro_codes: Optional[Iterable[str]] = None) -> str:
+    """Hash of everything the aggregated values depend on."""
+    tsv_path = Path(tsv_path).resolve()
+    stat = tsv_path.stat()
+    payload = {
+        "version": CUBE_VERSION,
+        "source": [str(tsv_path), stat.st_size, stat.st_mtime_ns],
+        "columns": sorted(columns),
+        "components": _components_identity(components),
+        "metros": None if metro_codes is None else sorted({str(code) for code in metro_codes}),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_or_build_cube(
+    tsv_path: Path,
+    columns: Iterable[str],
+    components: Callable[[pd.DataFrame], pd.DataFrame],
+    cube_dir: Optional[Path],
+    name: str,
+    metro_codes: Optional[Iterable[str]] = None,
+    memory_mb: float = DEFAULT_MEMORY_MB,
+    workers: int = 1,
+) -> MetricCube:
+    """
+    The cube of aggregate_master() sums, reusing a saved one while it is current.
+
+    Cubes live in cube_dir as {name}-{key}; building a new one removes the
+    other cubes with the same name. With cube_dir None the master TSV is
+    aggregated and the cube stays in memory.
+    """
+    columns = list(columns)
+    if cube_dir is None:
+        return cube_from_totals(aggregate_master(tsv_path, columns, components, metro_codes, memory_mb, workers))
+
+    cube_dir = Path(cube_dir)
+    directory = cube_dir / f"{name}-{cube_key(tsv_path, columns, components, metro_codes)[:16]}"
+    if (directory / INDEX_FILE).exists():
+        try:
+            cube = open_cube(directory)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Rebuilding unreadable metric cube {directory}: {e}")
+        else:
+            print(f"[INFO] Using cached metric cube {directory}")
+            return cube
+
+    cube = cube_from_totals(aggregate_master(tsv_path, columns, components, metro_codes, memory_mb, workers))
+    for stale in cube_dir.glob(f"{name}-*"):
+        if stale.is_dir() and stale != directory:
+            shutil.rmtree(stale, ignore_errors=True)
+    save_cube(cube, directory)
+    print(f"[OK] Saved metric cube {directory}")
+    return open_cube(directory)
@@ -9,7 +9,7 @@ import sys
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import pandas as pd
 
@@ -17,32 +17,22 @@ BASE_DIR = Path(__file__).resolve().parents[1]
 if str(BASE_DIR) not in sys.path:
     sys.path.append(str(BASE_DIR))
 
+from market_radar.master_aggregate import DEFAULT_MEMORY_MB, aggregate_master
+from market_radar.metric_cube import load_or_build_cube
+from market_radar.simple_yaml import load_simple_yaml
 
-def load_simple_yaml(path: Path) -> dict:
-    """Load a minimal YAML config (mapping + nested mapping)."""
-    config = {}
-    stack = [(0, config)]
+# Default directory for saved metric cubes (paths.cube_dir in the radar config)
+DEFAULT_CUBE_DIR = "market_radar/.cube"
 
-    for raw_line in path.read_text().splitlines():
-        if not raw_line.strip() or raw_line.strip().startswith("#"):
-            continue
-        line = raw_line.split("#", 1)[0].rstrip()
-        indent = len(line) - len(line.lstrip(" "))
-        key, _, value = line.lstrip().partition(":")
-        key = key.strip()
-        value = value.strip()
-
-        while stack and indent <= stack[-1][0] and len(stack) > 1:
-            stack.pop()
-        parent = stack[-1][1]
-
-        if value == "":
-            parent[key] = {}
-            stack.append((indent, parent[key]))
-        else:
-            parent[key] = _parse_scalar(value)
-
-    return config
+# metro_source in the radar config -> (metric cube name, MarketMetrics.data_source).
+# city_tracker sums the city tracker's rows by metro; metro_tracker reads
+# Redfin's metro tracker, one row per metro and month with true metro medians.
+METRO_SOURCES = {
+    "city_tracker": ("radar", "master_tsv"),
+    "metro_tracker": ("radar_metro", "metro_tracker"),
+}
+DEFAULT_METRO_SOURCE = "city_tracker"
+DEFAULT_METRO_TRACKER_FILE = "redfin_metro_market_tracker.tsv000.gz"
 
 
 @dataclass
@@ -153,14 +143,16 @@ def load_metrics_from_data_json(
     slug: str,
     report_month: Optional[str] = None,
 ) -> Optional[MarketMetrics]:
+    from data_artifact import find_data_file, load_metro_data
+
     period_dir = find_latest_period(metro_dir, report_month)
     if not period_dir:
         return None
-    data_file = period_dir / f"{slug}_data.json"
-    if not data_file.exists():
+    data_file = find_data_file(period_dir, slug)
+    if data_file is None:
         return None
 
-    data = json.loads(data_file.read_text())
+    data = load_metro_data(data_file)
     trends = data.get("full_metro_trends", [])
     if not trends:
         return None
@@ -199,48 +191,57 @@ def calculate_weighted_median_price(df: pd.DataFrame) -> Optional[float]:
     return (df["MEDIAN_SALE_PRICE"] * df["HOMES_SOLD"]).sum() / total_sales
 
 
-def extract_metrics_from_df(
-    df: pd.DataFrame,
+# Master TSV columns the radar aggregates
+MASTER_COLUMNS = ["MEDIAN_SALE_PRICE", "HOMES_SOLD", "INVENTORY", "NEW_LISTINGS", "PENDING_SALES", "MEDIAN_DOM"]
+
+
+def monthly_components(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-row additive components of the radar's monthly metro metrics.
+
+    Summed by month they give the metro totals plus the numerators and weights
+    of the sales-weighted price and DOM.
+    """
+    sold = df["HOMES_SOLD"]
+    valid_dom = df["MEDIAN_DOM"].notna() & (sold > 0)
+    return pd.DataFrame({
+        "rows": 1.0,
+        "inventory": df["INVENTORY"],
+        "new_listings": df["NEW_LISTINGS"],
+        "homes_sold": sold,
+        "pending_sales": df["PENDING_SALES"],
+        "price_numerator": df["MEDIAN_SALE_PRICE"] * sold,
+        "dom_numerator": (df["MEDIAN_DOM"] * sold).where(valid_dom, 0),
+        "dom_weight": sold.where(valid_dom, 0),
+    }, index=df.index)
+
+
+def extract_metrics_from_monthly(
+    monthly: Optional[pd.DataFrame],
     display_name: str,
     metro_code: str,
     report_month: Optional[str] = None,
+    data_source: str = "master_tsv",
 ) -> Optional[MarketMetrics]:
     """
-    Extract market metrics from a pre-filtered DataFrame for a single metro.
+    Extract market metrics from one metro's summed monthly_components.
 
-    This is the core calculation logic, separated from file I/O for performance.
-    The DataFrame should already be filtered to the target metro_code.
+    `monthly` has one row per PERIOD_BEGIN (see load_master_monthly()). For
+    the metro tracker each month is a single row, so the weighted price and
+    DOM are that row's metro medians.
     """
-    if df.empty:
+    if monthly is None or monthly.empty:
         return None
 
-    # Ensure PERIOD_BEGIN is datetime
-    if not pd.api.types.is_datetime64_any_dtype(df["PERIOD_BEGIN"]):
-        df = df.copy()
-        df["PERIOD_BEGIN"] = pd.to_datetime(df["PERIOD_BEGIN"])
-
+    monthly = monthly.sort_values("PERIOD_BEGIN")
     target_period = parse_report_month(report_month)
     if target_period is not None:
-        if not (df["PERIOD_BEGIN"] == target_period).any():
+        if not (monthly["PERIOD_BEGIN"] == target_period).any():
             return None
-        df = df[df["PERIOD_BEGIN"] <= target_period]
-
-    latest_period = df["PERIOD_BEGIN"].max()
-    current_month = latest_period.strftime("%Y-%m")
+        monthly = monthly[monthly["PERIOD_BEGIN"] <= target_period]
 
-    latest_df = df[df["PERIOD_BEGIN"] == latest_period]
-    latest_price = calculate_weighted_median_price(latest_df)
-
-    # Aggregate monthly metrics at metro level
-    monthly = df.groupby("PERIOD_BEGIN").agg(
-        inventory=("INVENTORY", "sum"),
-        new_listings=("NEW_LISTINGS", "sum"),
-        homes_sold=("HOMES_SOLD", "sum"),
-        pending_sales=("PENDING_SALES", "sum"),
-    ).reset_index()
-
-    monthly = monthly.sort_values("PERIOD_BEGIN")
     latest_row = monthly.iloc[-1]
+    current_month = latest_row["PERIOD_BEGIN"].strftime("%Y-%m")
 
     def pct_change(curr: Optional[float], prev: Optional[float]) -> Optional[float]:
         if prev in (None, 0) or curr is None:
@@ -254,40 +255,27 @@ def extract_metrics_from_df(
     inventory_yoy = pct_change(latest_row["inventory"], yoy_row["inventory"] if yoy_row is not None else None)
     pending_sales_yoy = pct_change(latest_row["pending_sales"], yoy_row["pending_sales"] if yoy_row is not None else None)
 
-    # Price YoY calculation
+    # Sales-weighted price per month (None for months without sales)
+    prices = [
+        numerator / sold if sold != 0 else None
+        for numerator, sold in zip(monthly["price_numerator"].tolist(), monthly["homes_sold"].tolist())
+    ]
+    latest_price = prices[-1]
+
     price_yoy = None
-    if len(df) >= 2:
-        monthly_prices = df.groupby("PERIOD_BEGIN").apply(
-            lambda g: calculate_weighted_median_price(g), include_groups=False
-        ).reset_index()
-        monthly_prices.columns = ["PERIOD_BEGIN", "price"]
-        monthly_prices = monthly_prices.sort_values("PERIOD_BEGIN")
-        if len(monthly_prices) >= 13:
-            price_yoy = pct_change(monthly_prices.iloc[-1]["price"], monthly_prices.iloc[-13]["price"])
-
-    # DOM: weighted average by homes sold for latest period
+    if monthly["rows"].sum() >= 2 and len(prices) >= 13:
+        price_yoy = pct_change(prices[-1], prices[-13])
+
+    # DOM: weighted average by homes sold, over months that have any
     median_dom = None
-    if "MEDIAN_DOM" in latest_df.columns and "HOMES_SOLD" in latest_df.columns:
-        valid_dom = latest_df[latest_df["MEDIAN_DOM"].notna() & (latest_df["HOMES_SOLD"] > 0)]
-        if not valid_dom.empty:
-            total_sales = valid_dom["HOMES_SOLD"].sum()
-            if total_sales > 0:
-                median_dom = int((valid_dom["MEDIAN_DOM"] * valid_dom["HOMES_SOLD"]).sum() / total_sales)
+    if latest_row["dom_weight"] > 0:
+        median_dom = int(latest_row["dom_numerator"] / latest_row["dom_weight"])
 
-    # DOM YoY: compare weighted averages
     median_dom_yoy = None
-    if "MEDIAN_DOM" in df.columns:
-        def weighted_dom(g):
-            valid = g[g["MEDIAN_DOM"].notna() & (g["HOMES_SOLD"] > 0)]
-            if valid.empty or valid["HOMES_SOLD"].sum() == 0:
-                return None
-            return (valid["MEDIAN_DOM"] * valid["HOMES_SOLD"]).sum() / valid["HOMES_SOLD"].sum()
-
-        monthly_dom = df.groupby("PERIOD_BEGIN").apply(weighted_dom, include_groups=False).reset_index()
-        monthly_dom.columns = ["PERIOD_BEGIN", "dom"]
-        monthly_dom = monthly_dom.sort_values("PERIOD_BEGIN").dropna()
-        if len(monthly_dom) >= 13:
-            median_dom_yoy = pct_change(monthly_dom.iloc[-1]["dom"], monthly_dom.iloc[-13]["dom"])
+    dom_months = monthly[monthly["dom_weight"] > 0]
+    doms = (dom_months["dom_numerator"] / dom_months["dom_weight"]).tolist()
+    if len(doms) >= 13:
+        median_dom_yoy = pct_change(doms[-1], doms[-13])
 
     # Months of Supply: inventory / homes_sold (metro level)
     months_of_supply = None
@@ -311,35 +299,64 @@ def extract_metrics_from_df(
         months_of_supply=months_of_supply,
         pending_sales=int(latest_row["pending_sales"]) if pd.notna(latest_row["pending_sales"]) else None,
         pending_sales_yoy=pending_sales_yoy,
-        data_source="master_tsv",
+        data_source=data_source,
     )
 
 
-def load_master_tsv(tsv_path: Path) -> Optional[pd.DataFrame]:
+def extract_metrics_from_df(
+    df: pd.DataFrame,
+    display_name: str,
+    metro_code: str,
+    report_month: Optional[str] = None,
+) -> Optional[MarketMetrics]:
     """
-    Load the master TSV file once and prepare it for filtering.
+    Extract market metrics from a pre-filtered DataFrame for a single metro.
 
-    Returns a DataFrame filtered to 'All Residential' with PERIOD_BEGIN as datetime,
-    or None if the file doesn't exist or can't be read.
+    The DataFrame should already be filtered to the target metro_code; it is
+    summed by month and handed to extract_metrics_from_monthly().
+    """
+    if df.empty:
+        return None
+
+    periods = pd.to_datetime(df["PERIOD_BEGIN"])
+    monthly = monthly_components(df).astype("float64").groupby(periods).sum().reset_index()
+    return extract_metrics_from_monthly(monthly, display_name, metro_code, report_month=report_month)
+
+
+def load_master_monthly(
+    tsv_path: Path,
+    metro_codes: List[str],
+    memory_mb: float = DEFAULT_MEMORY_MB,
+    workers: int = 1,
+    cube_dir: Optional[Path] = None,
+    cube_name: str = "radar",
+) -> Optional[Dict[str, pd.DataFrame]]:
+    """
+    Aggregate the master TSV once into monthly_components sums per metro.
+
+    The file is read in chunks under a memory cap (see master_aggregate.py),
+    never as one DataFrame, and parsed across `workers` processes when more
+    than one. With cube_dir, the sums are saved there as a metric cube and
+    reused until the file changes (see metric_cube.py). Returns
+    {metro_code: monthly frame}, or None if the file doesn't exist or can't
+    be read.
     """
     if not tsv_path.exists():
         print(f"[WARN] Master TSV not found: {tsv_path}")
         return None
 
-    print(f"[INFO] Loading master TSV: {tsv_path}")
+    print(f"[INFO] Master TSV: {tsv_path} ({memory_mb:g} MB cap, {workers} worker(s))")
     try:
-        df = pd.read_csv(tsv_path, sep="\t", compression="gzip", low_memory=False)
+        cube = load_or_build_cube(tsv_path, MASTER_COLUMNS, monthly_components, cube_dir, cube_name,
+                                  metro_codes, memory_mb, workers)
     except Exception as e:
         print(f"[ERROR] Failed to load master TSV: {e}")
         return None
 
-    # Pre-filter to All Residential and convert dates once
-    df = df[df["PROPERTY_TYPE"] == "All Residential"].copy()
-    df["PERIOD_BEGIN"] = pd.to_datetime(df["PERIOD_BEGIN"])
-    df["PARENT_METRO_REGION_METRO_CODE"] = df["PARENT_METRO_REGION_METRO_CODE"].astype(str)
-
-    print(f"[INFO] Loaded {len(df):,} rows for All Residential properties")
-    return df
+    monthly_by_metro = {code: cube.entity_frame(code) for code in cube.entities}
+    print(f"[INFO] Aggregated {cube.attrs['rows_read']:,} rows into "
+          f"{sum(map(len, monthly_by_metro.values())):,} monthly totals for {len(monthly_by_metro)} metros")
+    return monthly_by_metro
 
 
 def load_metrics_from_master_tsv(
@@ -347,28 +364,24 @@ def load_metrics_from_master_tsv(
     display_name: str,
     metro_code: str,
     report_month: Optional[str] = None,
+    memory_mb: float = DEFAULT_MEMORY_MB,
 ) -> Optional[MarketMetrics]:
     """
     Load metrics directly from the master TSV file by filtering on metro_code.
 
-    NOTE: This loads the entire TSV each time. For batch processing of multiple
-    markets, use load_master_tsv() once and extract_metrics_from_df() per market.
+    NOTE: This scans the entire TSV each time. For batch processing of multiple
+    markets, use load_master_monthly() once and extract_metrics_from_monthly()
+    per market.
     """
     if not tsv_path.exists():
         return None
 
     try:
-        df = pd.read_csv(tsv_path, sep="\t", compression="gzip", low_memory=False)
+        monthly = aggregate_master(tsv_path, MASTER_COLUMNS, monthly_components, [metro_code], memory_mb)
     except Exception:
         return None
 
-    # Filter by metro code and property type
-    df = df[
-        (df["PARENT_METRO_REGION_METRO_CODE"].astype(str) == str(metro_code)) &
-        (df["PROPERTY_TYPE"] == "All Residential")
-    ]
-
-    return extract_metrics_from_df(df, display_name, metro_code, report_month=report_month)
+    return extract_metrics_from_monthly(monthly, display_name, metro_code, report_month=report_month)
 
 
 def load_metrics_from_tsv(
@@ -377,10 +390,12 @@ def load_metrics_from_tsv(
     metro_code: str,
     report_month: Optional[str] = None,
 ) -> Optional[MarketMetrics]:
-    if not tsv_path.exists():
+    from frame_partition import partition_path, read_extracted
+
+    if not partition_path(tsv_path).exists() and not tsv_path.exists():
         return None
 
-    df = pd.read_csv(tsv_path, sep="\t", low_memory=False)
+    df = read_extracted(tsv_path)
     if df.empty:
         return None
 
@@ -756,6 +771,10 @@ def gather_metrics(
     output_pattern: str,
     master_tsv_path: Optional[Path] = None,
     report_month: Optional[str] = None,
+    memory_mb: float = DEFAULT_MEMORY_MB,
+    workers: int = 1,
+    cube_dir: Optional[Path] = None,
+    metro_source: str = DEFAULT_METRO_SOURCE,
 ) -> List[MarketMetrics]:
     """
     Gather metrics for all markets from available data sources.
@@ -763,10 +782,13 @@ def gather_metrics(
     Tries sources in order of preference:
     1. Pre-generated data.json (from full pipeline)
     2. Per-metro filtered TSV files
-    3. Master TSV (loaded ONCE and filtered per market)
+    3. Master TSV (aggregated ONCE, in chunks under memory_mb across
+       `workers` processes, for all remaining markets; cached as a metric
+       cube in cube_dir when given). master_tsv_path is the city tracker or,
+       with metro_source "metro_tracker", Redfin's metro tracker.
     """
+    cube_name, data_source = METRO_SOURCES[metro_source]
     metrics = []
-    master_df = None  # Lazy-load only if needed
     markets_needing_master = []  # Track markets that need master TSV
 
     # First pass: try fast sources (data.json, filtered TSV)
@@ -794,19 +816,21 @@ def gather_metrics(
         if master_tsv_path and metro_code:
             markets_needing_master.append((display_name, metro_code))
 
-    # Second pass: load master TSV ONCE for all remaining markets
+    # Second pass: aggregate master TSV ONCE for all remaining markets
     if markets_needing_master and master_tsv_path:
-        master_df = load_master_tsv(master_tsv_path)
-        if master_df is not None:
+        monthly_by_metro = load_master_monthly(
+            master_tsv_path, [metro_code for _, metro_code in markets_needing_master], memory_mb, workers,
+            cube_dir, cube_name,
+        )
+        if monthly_by_metro is not None:
             print(f"[INFO] Processing {len(markets_needing_master)} markets from master TSV...")
             for idx, (display_name, metro_code) in enumerate(markets_needing_master, 1):
-                # Filter to this metro from the pre-loaded DataFrame
-                metro_df = master_df[master_df["PARENT_METRO_REGION_METRO_CODE"] == str(metro_code)]
-                master_metrics = extract_metrics_from_df(
-                    metro_df,
+                master_metrics = extract_metrics_from_monthly(
+                    monthly_by_metro.get(str(metro_code)),
                     display_name,
                     metro_code,
                     report_month=report_month,
+                    data_source=data_source,
                 )
                 if master_metrics:
                     metrics.append(master_metrics)
@@ -821,6 +845,10 @@ def run_radar(
     seed_path: Path,
     month: Optional[str] = None,
     limit: Optional[int] = None,
+    memory_mb: Optional[float] = None,
+    workers: Optional[int] = None,
+    use_cube: bool = True,
+    metro_source: Optional[str] = None,
 ) -> None:
     """
     Main entry point for running the market radar.
@@ -830,6 +858,14 @@ def run_radar(
         seed_path: Path to seed CSV with markets
         month: Report month YYYY-MM (defaults to latest in data)
         limit: Limit number of markets for testing
+        memory_mb: Memory cap for aggregating the master TSV
+            (default: config master_memory_mb, else 256)
+        workers: Worker processes for aggregating the master TSV
+            (default: config master_workers, else 1)
+        use_cube: Reuse/save master TSV sums as a metric cube in
+            paths.cube_dir (an empty cube_dir also disables it)
+        metro_source: city_tracker or metro_tracker
+            (default: config metro_source, else city_tracker)
     """
     config = load_simple_yaml(config_path)
     paths = config.get("paths", {})
@@ -839,6 +875,19 @@ def run_radar(
 
     output_dir = Path(paths.get("outputs_dir", "market_radar/outputs"))
     master_tsv_path = BASE_DIR / paths.get("source_file", "city_market_tracker.tsv000.gz")
+    metro_source = metro_source or config.get("metro_source", DEFAULT_METRO_SOURCE)
+    if metro_source not in METRO_SOURCES:
+        raise ValueError(f"Unknown metro_source: {metro_source} (choose from {', '.join(METRO_SOURCES)})")
+    if metro_source == "metro_tracker":
+        metro_tracker_path = BASE_DIR / paths.get("metro_tracker_file", DEFAULT_METRO_TRACKER_FILE)
+        if metro_tracker_path.exists():
+            master_tsv_path = metro_tracker_path
+        else:
+            print(f"[WARN] Metro tracker not found: {metro_tracker_path} "
+                  "(fetch it with: python fetch_redfin_data.py --tracker metro); using the city tracker")
+            metro_source = DEFAULT_METRO_SOURCE
+    cube_dir = paths.get("cube_dir", DEFAULT_CUBE_DIR)
+    cube_dir = BASE_DIR / cube_dir if use_cube and cube_dir else None
 
     # Load markets directly from seed CSV
     markets = load_seed_csv(seed_path, limit)
@@ -854,6 +903,10 @@ def run_radar(
         output_pattern,
         master_tsv_path,
         report_month=month,
+        memory_mb=memory_mb or config.get("master_memory_mb", DEFAULT_MEMORY_MB),
+        workers=workers or config.get("master_workers", 1),
+        cube_dir=cube_dir,
+        metro_source=metro_source,
     )
     if not metrics:
         raise RuntimeError("No market metrics found. Ensure city_market_tracker.tsv000.gz exists.")
@@ -885,6 +938,14 @@ def main() -> None:
     parser.add_argument("--seeds", default="market_radar/seeds_roanoke_4hr.csv")
     parser.add_argument("--month", default=None, help="Report month YYYY-MM (defaults to latest in data).")
     parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--memory-mb", type=float, default=None,
+                        help="Memory cap for aggregating the master TSV (default: config master_memory_mb).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for aggregating the master TSV (default: config master_workers).")
+    parser.add_argument("--no-cube", action="store_true",
+                        help="Aggregate the master TSV without reading or saving the metric cube.")
+    parser.add_argument("--metro-source", choices=sorted(METRO_SOURCES), default=None,
+                        help="Where metro metrics come from (default: config metro_source).")
     args = parser.parse_args()
 
     run_radar(
@@ -892,6 +953,10 @@ def main() -> None:
         seed_path=Path(args.seeds),
         month=args.month,
         limit=args.limit,
+        memory_mb=args.memory_mb,
+        workers=args.workers,
+        use_cube=not args.no_cube,
+        metro_source=args.metro_source,
     )
 
 
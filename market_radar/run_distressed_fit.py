@@ -17,7 +17,7 @@ if str(BASE_DIR) not in sys.path:
 
 from market_radar.distressed_fit.backtest import run_backtest
 from market_radar.distressed_fit.competition import load_optional_proxy_csv
-from market_radar.distressed_fit.config_schema import load_config, resolve_optional_path
+from market_radar.distressed_fit.config_schema import METRO_SOURCES, load_config, resolve_optional_path
 from market_radar.distressed_fit.features import (
     build_feature_rows_for_month,
     load_master_monthly_series,
@@ -187,6 +187,11 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--with-backtest", action="store_true", help="Run six-month rolling backtest")
     parser.add_argument("--competition-csv", default=None, help="Optional override path for competition proxy CSV")
     parser.add_argument("--housing-age-csv", default=None, help="Optional override path for housing age proxy CSV")
+    parser.add_argument("--memory-mb", type=float, default=None, help="Memory cap for aggregating the master TSV")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for aggregating the master TSV")
+    parser.add_argument("--no-cube", action="store_true", help="Aggregate the master TSV without the saved metric cube")
+    parser.add_argument("--metro-source", choices=METRO_SOURCES, default=None,
+                        help="Where metro metrics come from: city_tracker or metro_tracker")
     return parser.parse_args()
 
 
@@ -205,6 +210,12 @@ def main() -> int:
         config.data_paths.competition_csv = args.competition_csv
     if args.housing_age_csv:
         config.data_paths.housing_age_csv = args.housing_age_csv
+    if args.memory_mb:
+        config.master_memory_mb = args.memory_mb
+    if args.workers:
+        config.master_workers = args.workers
+    if args.metro_source:
+        config.metro_source = args.metro_source
 
     seed_path = Path(config.markets_seed)
     if not seed_path.is_absolute():
@@ -235,12 +246,27 @@ def main() -> int:
     if not master_tsv.is_absolute():
         master_tsv = BASE_DIR / master_tsv
 
-    print(f"[INFO] Aggregating master market data from {master_tsv}")
+    metro_tracker = None
+    if config.metro_source == "metro_tracker":
+        metro_tracker = resolve_optional_path(config.data_paths.metro_tracker_tsv, BASE_DIR)
+        if metro_tracker is None or not metro_tracker.exists():
+            print(f"[WARN] Metro tracker not found: {metro_tracker} "
+                  "(fetch it with: python fetch_redfin_data.py --tracker metro); using the city tracker")
+            metro_tracker = None
+        else:
+            print(f"[INFO] Reading metro metrics from {metro_tracker}")
+
+    print(f"[INFO] Aggregating master market data from {master_tsv} "
+          f"({config.master_memory_mb:g} MB cap, {config.master_workers} worker(s))")
     monthly_by_metro, all_periods = load_master_monthly_series(
         master_tsv,
         metro_codes=[seed.metro_code for seed in seeds],
         buy_box_min=config.buy_box.target_price_min,
         buy_box_max=config.buy_box.target_price_max,
+        memory_mb=config.master_memory_mb,
+        workers=config.master_workers,
+        cube_dir=None if args.no_cube else resolve_optional_path(config.data_paths.cube_dir, BASE_DIR),
+        metro_tracker_path=metro_tracker,
     )
 
     if not all_periods:
@@ -3,13 +3,17 @@ Runner for the Roanoke 4-hour Market Radar.
 
 Simple flow:
 1. Read markets from seed CSV
-2. Generate radar summary (reads directly from master TSV)
+2. Generate radar summary (aggregates the master TSV in memory-capped chunks)
 3. Output to market_radar/outputs/
 
 Usage:
     python market_radar/run_roanoke_radar.py
     python market_radar/run_roanoke_radar.py --month 2025-01
     python market_radar/run_roanoke_radar.py --limit 5  # Quick test
+    python market_radar/run_roanoke_radar.py --memory-mb 128  # Tighter memory cap
+    python market_radar/run_roanoke_radar.py --workers 8      # Parse the master TSV on 8 cores
+    python market_radar/run_roanoke_radar.py --no-cube        # Rescan the master TSV, ignoring the saved cube
+    python market_radar/run_roanoke_radar.py --metro-source metro_tracker  # Redfin's metro tracker
 """
 
 import argparse
@@ -21,7 +25,7 @@ BASE_DIR = Path(__file__).resolve().parents[1]
 if str(BASE_DIR) not in sys.path:
     sys.path.insert(0, str(BASE_DIR))
 
-from market_radar.radar_summary import run_radar
+from market_radar.radar_summary import METRO_SOURCES, run_radar
 
 
 def main() -> None:
@@ -34,6 +38,14 @@ def main() -> None:
                         help="Report month YYYY-MM (defaults to latest in data)")
     parser.add_argument("--limit", type=int, default=None,
                         help="Limit number of markets for quick tests")
+    parser.add_argument("--memory-mb", type=float, default=None,
+                        help="Memory cap for aggregating the master TSV (default: config master_memory_mb)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for aggregating the master TSV (default: config master_workers)")
+    parser.add_argument("--no-cube", action="store_true",
+                        help="Aggregate the master TSV without reading or saving the metric cube")
+    parser.add_argument("--metro-source", choices=sorted(METRO_SOURCES), default=None,
+                        help="Where metro metrics come from: city_tracker or metro_tracker (default: config metro_source)")
     args = parser.parse_args()
 
     run_radar(
@@ -41,6 +53,10 @@ def main() -> None:
         seed_path=Path(args.seeds),
         month=args.month,
         limit=args.limit,
+        memory_mb=args.memory_mb,
+        workers=args.workers,
+        use_cube=not args.no_cube,
+        metro_source=args.metro_source,
     )
 
 
@@ -0,0 +1,67 @@
+"""
+Loader for the small YAML config files in this repo (alert_rules.yaml, the
+radar and distressed-fit configs): nested mappings of scalars, with full-line
+and inline `# comments`. No lists, anchors or multi-line values.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict
+
+
+def parse_scalar(raw: str) -> Any:
+    """A YAML scalar as bool, None, int, float or (unquoted) str."""
+    value = raw.strip().strip('"').strip("'")
+    if value.lower() in {"true", "false"}:
+        return value.lower() == "true"
+    if value.lower() in {"none", "null"}:
+        return None
+    try:
+        if "." in value:
+            return float(value)
+        return int(value)
+    except ValueError:
+        return value
+
+
+def strip_comment(line: str) -> str:
+    """Drop a trailing `# comment`: a '#' at the start or after whitespace, outside quotes."""
+    quote = None
+    for i, char in enumerate(line):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "#" and (i == 0 or line[i - 1].isspace()):
+            return line[:i].rstrip()
+    return line.rstrip()
+
+
+def load_simple_yaml(path: Path) -> Dict[str, Any]:
+    """Load a minimal YAML config (nested mappings only)."""
+    config: Dict[str, Any] = {}
+    stack = [(-1, config)]
+
+    for raw_line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = strip_comment(raw_line)
+        if not line.strip():
+            continue
+
+        indent = len(line) - len(line.lstrip(" "))
+        key, _, value = line.lstrip().partition(":")
+        key = key.strip()
+        value = value.strip()
+
+        while indent <= stack[-1][0]:
+            stack.pop()
+
+        parent = stack[-1][1]
+        if value == "":
+            parent[key] = {}
+            stack.append((indent, parent[key]))
+        else:
+            parent[key] = parse_scalar(value)
+
+    return config
@@ -0,0 +1,187 @@
+"""
+Narrative Batch
+Batch-submission mode for the monthly AI narratives.
+
+Monthly narratives aren't latency-sensitive, so instead of one request per
+metro the prompts go out as a single Message Batch. The batch id and what is
+needed to save each result (metro, output folder, prompt) are persisted to
+.pipeline/narrative_batches/{batch_id}.json as soon as the batch is accepted,
+so the submitting process can exit. Any later run (`python ai_narrative.py
+--collect`, or the next scheduled run) polls the pending batches and writes
+{slug}_narrative.txt/json for every finished one.
+
+Metros whose prompt is already in the narrative cache are saved straight away
+and left out of the batch.
+"""
+
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from ai_narrative import (
+    ANTHROPIC_AVAILABLE, apply_response, build_narrative_prompt, client_options, load_cached_narrative,
+    message_request, narrative_cache_key, new_result, save_narrative_result, store_cached_narrative
+)
+from atomic_io import write_json_atomic
+
+if ANTHROPIC_AVAILABLE:
+    import anthropic
+
+DEFAULT_BATCH_DIR = Path('.pipeline') / 'narrative_batches'
+DEFAULT_POLL_INTERVAL = 60.0
+
+# Control-plane calls (create / retrieve / results) use the SDK's own retries
+BATCH_CLIENT_RETRIES = 3
+
+
+def _client(config):
+    return anthropic.Anthropic(**{**client_options(config), 'max_retries': BATCH_CLIENT_RETRIES})
+
+
+def _custom_id(index: int, metro_name: str) -> str:
+    """
+    Batch custom_ids allow 1-64 letters, digits, '-' and '_'. The request's
+    index keeps metros that sanitize alike (e.g. 'a.b' and 'a_b') apart.
+    """
+    return f"{index}-{re.sub(r'[^A-Za-z0-9_-]', '_', metro_name)}"[:64]
+
+
+def pending_batches(base_dir: Path) -> List[Path]:
+    """State files of batches submitted but not yet collected, oldest first."""
+    batch_dir = Path(base_dir) / DEFAULT_BATCH_DIR
+    return sorted(batch_dir.glob('*.json'), key=lambda p: p.stat().st_mtime) if batch_dir.exists() else []
+
+
+def submit_narrative_batch(jobs, config, base_dir: Path) -> Optional[str]:
+    """
+    Submit every job's narrative request as one Message Batch.
+
+    Args:
+        jobs: List of (metro_name, output_folder, summary, metro_trends)
+        config: AI narrative configuration dict
+        base_dir: Repo root; batch state goes under .pipeline/narrative_batches/
+
+    Returns:
+        The batch id, or None when every metro was served from the cache or
+        is already waiting in an earlier batch
+    """
+    # Requests already waiting in an earlier batch aren't submitted twice
+    in_flight: Set[str] = set()
+    for state_file in pending_batches(base_dir):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            in_flight.update(entry['cache_key'] for entry in json.load(f)['requests'].values())
+
+    requests: List[dict] = []
+    entries: Dict[str, dict] = {}
+    for metro_name, output_folder, summary, metro_trends in jobs:
+        prompt = build_narrative_prompt(summary, metro_trends, config)
+        cached = load_cached_narrative(output_folder, metro_name, prompt, config)
+        if cached is not None:
+            print(f"\n[CACHE] {metro_name}")
+            save_narrative_result(metro_name, output_folder, summary, cached)
+            continue
+
+        cache_key = narrative_cache_key(prompt, config)
+        if cache_key in in_flight:
+            print(f"  [SKIP] {metro_name}: already in a submitted batch")
+            continue
+
+        custom_id = _custom_id(len(requests), metro_name)
+        requests.append({'custom_id': custom_id, 'params': message_request(config, prompt)})
+        entries[custom_id] = {
+            'metro_name': metro_name,
+            'output_folder': str(output_folder),
+            'summary': {'metro_name': summary.get('metro_name'), 'report_period': summary.get('report_period')},
+            'prompt': prompt,
+            'cache_key': cache_key,
+        }
+
+    if not requests:
+        return None
+
+    batch = _client(config).messages.batches.create(requests=requests)
+
+    batch_dir = Path(base_dir) / DEFAULT_BATCH_DIR
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(batch_dir / f"{batch.id}.json", {
+        'batch_id': batch.id,
+        'submitted_at': datetime.now().isoformat(),
+        'model': config.get('model'),
+        'max_tokens': config.get('max_tokens', 2000),
+        'requests': entries,
+    })
+    print(f"[BATCH] Submitted {batch.id} ({len(requests)} narrative(s))")
+    return batch.id
+
+
+def _collect(client, state_file: Path, state: dict, config: dict, log: Callable[[str], None]) -> dict:
+    """Save every result of an ended batch, then drop its state file."""
+    # Results are saved with the settings the batch was submitted with
+    batch_config = dict(config, model=state['model'], max_tokens=state['max_tokens'])
+    outcome: Dict[str, Any] = {'saved': 0, 'failed': []}
+
+    for entry in client.messages.batches.results(state['batch_id']):
+        request = state['requests'].get(entry.custom_id)
+        if request is None:
+            continue
+        if entry.result.type != 'succeeded':
+            outcome['failed'].append(f"{request['metro_name']} ({entry.result.type})")
+            continue
+
+        result = new_result(batch_config)
+        apply_response(result, entry.result.message)
+        save_narrative_result(request['metro_name'], request['output_folder'], request['summary'], result)
+        store_cached_narrative(request['output_folder'], request['metro_name'], request['prompt'], batch_config, result)
+        outcome['saved'] += 1
+
+    state_file.unlink()
+    log(f"  [BATCH] {state['batch_id']}: saved {outcome['saved']} narrative(s)"
+        + (f", failed: {', '.join(outcome['failed'])}" if outcome['failed'] else ''))
+    return outcome
+
+
+def collect_narrative_batches(config, base_dir: Path, wait: bool = False,
+                              poll_interval: float = DEFAULT_POLL_INTERVAL, timeout: Optional[float] = None,
+                              log: Callable[[str], None] = print) -> dict:
+    """
+    Poll pending batches and save the narratives of every batch that has ended.
+
+    Args:
+        wait: Keep polling until each batch ends (or `timeout` seconds pass)
+
+    Returns:
+        dict with 'saved' (narratives written), 'failed' (metros whose request
+        errored or expired) and 'pending' (batches still processing)
+    """
+    totals: Dict[str, Any] = {'saved': 0, 'failed': [], 'pending': 0}
+    state_files = pending_batches(base_dir)
+    if not state_files:
+        return totals
+
+    client = _client(config)
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    for state_file in state_files:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        batch = client.messages.batches.retrieve(state['batch_id'])
+        while batch.processing_status != 'ended' and wait and (deadline is None or time.monotonic() < deadline):
+            time.sleep(poll_interval)
+            batch = client.messages.batches.retrieve(state['batch_id'])
+
+        if batch.processing_status != 'ended':
+            counts = batch.request_counts
+            log(f"  [BATCH] {state['batch_id']}: {batch.processing_status} "
+                f"({counts.processing} processing, {counts.succeeded} succeeded)")
+            totals['pending'] += 1
+            continue
+
+        outcome = _collect(client, state_file, state, config, log)
+        totals['saved'] += outcome['saved']
+        totals['failed'].extend(outcome['failed'])
+
+    return totals
@@ -0,0 +1,320 @@
+"""
+Outbox
+Durable on-disk queue for report and notification emails.
+
+Messages are flattened once and written to .pipeline/outbox/pending/ under an
+idempotency key (e.g. report-charlotte-2025-12). A delivery worker drains the
+queue in the background, so pipeline stages only pay for a file write, not for
+SMTP latency. Delivered messages leave a small record in sent/. Enqueueing a
+key that was already sent, or is still pending, is a no-op, so rerunning the
+pipeline never sends a second report for the same metro and period.
+
+Failed deliveries are retried with exponential backoff (`outbox_retry_backoff`
+seconds, doubling) up to `outbox_max_attempts`. Permanent rejections switch
+to the message's fallback (e.g. the report body without attachments) when
+there is one. After that, the message is moved to dead/ for inspection. Messages
+still pending when a run ends stay on disk and go out with the next run (or
+`python outbox.py --drain`).
+
+Usage:
+    python outbox.py                # Show queue status and dead letters
+    python outbox.py --drain        # Deliver everything that is due now
+    python outbox.py --retry-dead   # Move dead letters back to pending
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from atomic_io import write_bytes_atomic, write_json_atomic
+
+DEFAULT_OUTBOX_DIR = Path('.pipeline') / 'outbox'
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_OUTBOX_BACKOFF = 60.0
+DEFAULT_FLUSH_TIMEOUT = 300.0
+
+# A claimed message whose sender died is released after this long
+STALE_CLAIM_SECONDS = 15 * 60
+
+
+def idempotency_key(*parts: str) -> str:
+    """A filename-safe key from its parts, e.g. ('report', 'charlotte', '2025-12')."""
+    return '-'.join(re.sub(r'[^A-Za-z0-9_.-]+', '_', str(p)) for p in parts)
+
+
+class Outbox:
+    """Pending, sent and dead-letter folders for one outbox directory."""
+
+    def __init__(self, root: Path, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retry_backoff: float = DEFAULT_OUTBOX_BACKOFF, clock: Callable[[], float] = time.time):
+        self.root = Path(root)
+        self.pending = self.root / 'pending'
+        self.sent = self.root / 'sent'
+        self.dead = self.root / 'dead'
+        for folder in (self.pending, self.sent, self.dead):
+            folder.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._added = threading.Event()
+
+    @classmethod
+    def from_config(cls, base_dir: Path, config: dict) -> 'Outbox':
+        """Open the repo's outbox with retry settings from an email config dict."""
+        return cls(
+            Path(base_dir) / DEFAULT_OUTBOX_DIR,
+            max_attempts=int(config.get('outbox_max_attempts', DEFAULT_MAX_ATTEMPTS)),
+            retry_backoff=float(config.get('outbox_retry_backoff', DEFAULT_OUTBOX_BACKOFF)),
+        )
+
+    # ---------- queue ----------
+
+    def enqueue(self, key: str, message: bytes, fallback: Optional[bytes] = None, **meta) -> bool:
+        """
+        Queue a flattened message under an idempotency key.
+
+        Returns:
+            False when the key was already sent or is still pending
+        """
+        with self._lock:
+            if self.state(key) in ('sent', 'pending'):
+                return False
+
+            # A dead letter for the same key is superseded by the new message
+            for stale in self.dead.glob(f'{key}.*'):
+                stale.unlink()
+
+            write_bytes_atomic(self.pending / f'{key}.eml', message)
+            if fallback is not None:
+                write_bytes_atomic(self.pending / f'{key}.fallback.eml', fallback)
+            record = {
+                'key': key,
+                'created_at': datetime.now().isoformat(),
+                'attempts': 0,
+                'next_attempt_at': 0,
+                'has_fallback': fallback is not None,
+                'last_error': None,
+                **meta,
+            }
+            # The JSON record is written last; it is what marks the message as queued
+            write_json_atomic(self.pending / f'{key}.json', record)
+
+        self._added.set()
+        return True
+
+    def state(self, key: str) -> Optional[str]:
+        """'sent', 'pending', 'dead', or None for a key the outbox has never seen."""
+        if (self.sent / f'{key}.json').exists():
+            return 'sent'
+        if (self.pending / f'{key}.json').exists() or (self.pending / f'{key}.json.sending').exists():
+            return 'pending'
+        if (self.dead / f'{key}.json').exists():
+            return 'dead'
+        return None
+
+    def pending_records(self) -> List[dict]:
+        """Queued message records, oldest first."""
+        records = []
+        for path in sorted(self.pending.glob('*.json')):
+            try:
+                records.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return sorted(records, key=lambda r: r['created_at'])
+
+    def dead_records(self) -> List[dict]:
+        return [json.loads(p.read_text()) for p in sorted(self.dead.glob('*.json'))]
+
+    def sent_count(self) -> int:
+        return sum(1 for _ in self.sent.glob('*.json'))
+
+    def release_stale_claims(self):
+        """Return messages claimed by a sender that never finished to the queue."""
+        for claim in self.pending.glob('*.json.sending'):
+            if self.clock() - claim.stat().st_mtime > STALE_CLAIM_SECONDS:
+                os.replace(claim, claim.with_suffix(''))
+
+    # ---------- delivery ----------
+
+    def _claim(self, key: str) -> Optional[Path]:
+        """Atomically take a pending message so no other sender delivers it too."""
+        claim = self.pending / f'{key}.json.sending'
+        try:
+            os.replace(self.pending / f'{key}.json', claim)
+        except FileNotFoundError:
+            return None
+        os.utime(claim)
+        return claim
+
+    def deliver(self, record: dict, send: Callable[[bytes], None]) -> str:
+        """
+        Deliver one pending message with `send`, which raises on failure
+        (an exception with a truthy `permanent` attribute skips the retries).
+
+        Returns:
+            'sent', 'retry', 'dead', or 'skipped' (claimed elsewhere)
+        """
+        key = record['key']
+        claim = self._claim(key)
+        if claim is None:
+            return 'skipped'
+
+        use_fallback = record.get('use_fallback', False)
+        message_file = self.pending / (f'{key}.fallback.eml' if use_fallback else f'{key}.eml')
+        try:
+            send(message_file.read_bytes())
+        except Exception as e:
+            return self._failed(record, claim, e)
+
+        record.update(sent_at=datetime.now().isoformat(), attempts=record['attempts'] + 1, last_error=None)
+        write_json_atomic(self.sent / f'{key}.json', record)
+        for path in self.pending.glob(f'{key}.*'):
+            path.unlink()
+        return 'sent'
+
+    def _failed(self, record: dict, claim: Path, error: Exception) -> str:
+        key = record['key']
+        record['attempts'] += 1
+        record['last_error'] = str(error)[:500]
+        permanent = bool(getattr(error, 'permanent', False))
+
+        if permanent and record.get('has_fallback') and not record.get('use_fallback'):
+            # e.g. a policy rejection of the attachments: send the plain report instead
+            record['use_fallback'] = True
+            record['next_attempt_at'] = 0
+            outcome = 'retry'
+        elif permanent or record['attempts'] >= self.max_attempts:
+            for path in self.pending.glob(f'{key}.*'):
+                if path != claim:
+                    os.replace(path, self.dead / path.name)
+            record['dead_at'] = datetime.now().isoformat()
+            write_json_atomic(self.dead / f'{key}.json', record)
+            claim.unlink()
+            return 'dead'
+        else:
+            record['next_attempt_at'] = self.clock() + self.retry_backoff * (2 ** (record['attempts'] - 1))
+            outcome = 'retry'
+
+        write_json_atomic(claim, record)
+        os.replace(claim, self.pending / f'{key}.json')
+        return outcome
+
+    def drain(self, send: Callable[[bytes], None], max_workers: int = 1) -> dict:
+        """Deliver every message that is due now; returns {key: outcome}."""
+        due = [r for r in self.pending_records() if r['next_attempt_at'] <= self.clock()]
+        if not due:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            outcomes = list(executor.map(lambda r: self.deliver(r, send), due))
+        return {r['key']: outcome for r, outcome in zip(due, outcomes)}
+
+    def retry_dead(self) -> int:
+        """Move dead letters back to pending with a fresh attempt count."""
+        moved = 0
+        for record_file in self.dead.glob('*.json'):
+            record = json.loads(record_file.read_text())
+            key = record['key']
+            for path in self.dead.glob(f'{key}.*'):
+                if path != record_file:
+                    os.replace(path, self.pending / path.name)
+            record.update(attempts=0, next_attempt_at=0, use_fallback=False)
+            record.pop('dead_at', None)
+            write_json_atomic(self.pending / f'{key}.json', record)
+            record_file.unlink()
+            moved += 1
+        return moved
+
+
+class OutboxWorker:
+    """Background thread that drains an outbox while the pipeline runs."""
+
+    def __init__(self, outbox: Outbox, send: Callable[[bytes], None], max_workers: int = 1,
+                 poll_interval: float = 1.0, log: Callable[[str], None] = print):
+        self.outbox = outbox
+        self.send = send
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.log = log
+        self.outcomes: dict = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+
+    def start(self) -> 'OutboxWorker':
+        self.outbox.release_stale_claims()
+        self._thread.start()
+        return self
+
+    def _drain_once(self):
+        for key, outcome in self.outbox.drain(self.send, self.max_workers).items():
+            self.outcomes[key] = outcome
+            self.log(f"  [OUTBOX] {key}: {outcome}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._drain_once()
+            except Exception as e:
+                self.log(f"  [OUTBOX] [ERROR] Delivery pass failed: {e}")
+            self.outbox._added.wait(self.poll_interval)
+            self.outbox._added.clear()
+
+    def stop(self, flush_timeout: float = DEFAULT_FLUSH_TIMEOUT) -> int:
+        """
+        Keep delivering until nothing is due or `flush_timeout` passes, then stop.
+
+        Returns:
+            Number of messages left pending (retried by the next run)
+        """
+        deadline = time.monotonic() + flush_timeout
+        while time.monotonic() < deadline:
+            due = [r for r in self.outbox.pending_records() if r['next_attempt_at'] <= self.outbox.clock()]
+            if not due:
+                break
+            self.outbox._added.set()
+            time.sleep(min(self.poll_interval, 0.2))
+        self._stop.set()
+        self.outbox._added.set()
+        self._thread.join()
+        return len(self.outbox.pending_records())
+
+
+def main():
+    """Command-line entry point."""
+    from email_reports import load_config, outbox_sender
+
+    base_dir = Path(__file__).parent
+    config = load_config()
+    outbox = Outbox.from_config(base_dir, config)
+
+    if '--retry-dead' in sys.argv:
+        print(f"[OK] Requeued {outbox.retry_dead()} dead letter(s)")
+
+    if '--drain' in sys.argv:
+        if not config.get('enabled'):
+            print("[SKIP] Email not configured (missing credentials or recipients)")
+            return 1
+        outbox.release_stale_claims()
+        outcomes = outbox.drain(outbox_sender(config), int(config.get('smtp_max_sessions', 1)))
+        for key, outcome in outcomes.items():
+            print(f"  {key}: {outcome}")
+
+    pending = outbox.pending_records()
+    dead = outbox.dead_records()
+    print(f"\nOutbox: {len(pending)} pending, {outbox.sent_count()} sent, {len(dead)} dead")
+    for record in pending:
+        print(f"  [PENDING] {record['key']} (attempts: {record['attempts']})")
+    for record in dead:
+        print(f"  [DEAD] {record['key']}: {record['last_error']}")
+    return 1 if dead else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
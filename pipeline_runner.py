@@ -0,0 +1,898 @@
+"""
+Pipeline Runner
+Runs the analysis stages (extract -> process + summary -> dashboards ->
+narratives -> report emails) as a per-metro task graph.
+
+By default every stage runs in-process and hands its in-memory results to the
+stages that depend on it: extraction passes each metro's filtered DataFrame to
+processing, processing builds the metro's summary from the data dict it just
+computed and passes both to the dashboard, narrative and email stages. Each
+stage still writes its usual artifacts (extraction partition, {slug}_data.npz and
+{slug}_summary.json, dashboard HTML), but downstream stages never parse them
+back.
+
+Per-metro stages expand into one task per metro, so a metro's dashboard,
+narrative and email start as soon as that metro's own data is processed rather
+than waiting for every metro. CPU-bound and network-bound tasks run on
+separate bounded thread pools (pipeline_settings.cpu_workers /
+network_workers in metro_config.json). CPU tasks share the interpreter lock,
+so their pool mainly bounds memory; the gain comes from overlapping them with
+network waits and from delivering each metro as soon as it is ready.
+
+With isolated=True each stage that has a standalone script instead runs that
+script once, in a fresh subprocess, exactly like the original pipeline.
+
+Stages declare their input and output files. Given a FingerprintStore (see
+stage_cache.py), a task whose inputs, code and config are unchanged since its
+last successful run is skipped, make-style. force_stages reruns the named
+stages and everything downstream of them.
+
+Given a RunState (see run_state.py), each task's status is persisted as it
+finishes; when resuming, tasks that completed in the previous run are reused
+once their recorded outputs pass a checksum check.
+
+Given a `metrics` dict, each task's wall time, CPU time, peak RSS, row counts,
+bytes written and (for streamed narratives) time to first byte are collected
+for run_history.py.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from run_history import child_cpu_seconds, peak_rss_mb
+from run_state import RunState
+from stage_cache import DEFAULT_STORE_PATH, FingerprintStore
+
+# Default pool size for network-bound tasks (AI narratives, report emails)
+DEFAULT_NETWORK_WORKERS = 4
+
+# stage_email's output for a report waiting on its batch narrative
+REPORT_HELD = 'Report held for batch narrative'
+
+# Row counts reported by the stage function running on this thread
+_task_rows = threading.local()
+
+
+@dataclass
+class Stage:
+    """A pipeline stage: an in-process function plus its standalone script.
+
+    Per-metro stages take (ctx, metro) in `func`, `inputs` and `outputs` and run
+    as one task per enabled metro; other stages take (ctx) and run once.
+    `inputs` and `outputs` return the files a task reads and writes; stages
+    without `inputs` are never skipped. `code` lists extra source files (beyond
+    `script`) whose changes invalidate the stage, and `params` returns extra
+    settings to fingerprint alongside the metro config. `kind` picks the worker
+    pool: 'cpu' or 'network'. `force_args` are passed to `script` in isolated
+    mode when the stage is forced, for scripts that skip up-to-date work on
+    their own. `child_processes` marks stages whose work may run in worker
+    processes (a process pool); their CPU is counted in the task's metrics.
+    """
+    name: str
+    label: str
+    script: Optional[str]
+    func: Callable[..., str]
+    depends_on: List[str] = field(default_factory=list)
+    required: bool = True
+    inputs: Optional[Callable[..., List[Path]]] = None
+    outputs: Optional[Callable[..., List[Path]]] = None
+    code: List[str] = field(default_factory=list)
+    params: Optional[Callable[['PipelineContext'], dict]] = None
+    per_metro: bool = False
+    kind: str = 'cpu'
+    force_args: List[str] = field(default_factory=list)
+    child_processes: bool = False
+
+
+@dataclass
+class Task:
+    """One unit of scheduled work: a stage, for one metro or for all of them."""
+    stage: Stage
+    metro: Optional[dict] = None
+
+    @property
+    def key(self) -> str:
+        return self.stage.name if self.metro is None else f"{self.stage.name}:{self.metro['name']}"
+
+    @property
+    def label(self) -> str:
+        if self.metro is None:
+            return self.stage.label
+        return f"{self.stage.label} - {self.metro.get('display_name', self.metro['name'])}"
+
+
+@dataclass
+class PipelineContext:
+    """Configuration and in-memory results shared between stages, keyed by metro slug."""
+    base_dir: Path
+    config: dict
+    ai_config: Optional[dict] = None
+    email_config: Optional[dict] = None
+    outbox: Optional[Any] = None                               # outbox.Outbox: queue reports instead of sending
+    extracted: Dict[str, Any] = field(default_factory=dict)    # slug -> filtered DataFrame
+    processed: Dict[str, dict] = field(default_factory=dict)   # slug -> {'metro_data', 'data_file', 'data_hash'}
+    summaries: Dict[str, dict] = field(default_factory=dict)   # slug -> {'summary', 'folder'}
+    narratives: Dict[str, str] = field(default_factory=dict)   # slug -> narrative text
+    forced: set = field(default_factory=set)                   # stage names forced to rerun
+
+    @property
+    def data_settings(self) -> dict:
+        return self.config.get('data_settings', {})
+
+    @property
+    def pipeline_settings(self) -> dict:
+        return self.config.get('pipeline_settings', {})
+
+    @property
+    def metros(self) -> List[dict]:
+        return [m for m in self.config.get('metros', []) if m.get('enabled', True)]
+
+    def metro_output_dir(self, metro: dict) -> Path:
+        return self.base_dir / metro.get('output_directory', metro['name'])
+
+
+class StageError(Exception):
+    """Raised when a required stage fails."""
+
+    def __init__(self, stage: Stage, output: str):
+        super().__init__(f"{stage.label} failed")
+        self.stage = stage
+        self.output = output
+
+
+def parse_force_stages(argv: List[str]) -> List[str]:
+    """Collect `--force-stage NAME` arguments, rejecting unknown stage names."""
+    names = [argv[i + 1] for i, arg in enumerate(argv[:-1]) if arg == '--force-stage']
+    unknown = [n for n in names if n not in STAGE_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(unknown)} (choose from {', '.join(STAGE_NAMES)})")
+    return names
+
+
+def load_fingerprint_store(base_dir: Path) -> FingerprintStore:
+    """Open the fingerprint database kept under the repo's .pipeline/ directory."""
+    return FingerprintStore(Path(base_dir) / DEFAULT_STORE_PATH, base_dir=Path(base_dir))
+
+
+def load_pipeline_context(base_dir: Path) -> PipelineContext:
+    """Load metro_config.json into a fresh context."""
+    config_file = Path(base_dir) / 'metro_config.json'
+    if not config_file.exists():
+        raise FileNotFoundError("metro_config.json not found")
+
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+
+    return PipelineContext(base_dir=Path(base_dir), config=config)
+
+
+def succeeded_metros(stage_result: Optional[dict], metros: List[dict]) -> List[dict]:
+    """Metros whose task for a stage succeeded (all of them for a stage-wide success)."""
+    if not stage_result:
+        return []
+    if 'metros' in stage_result:
+        return [m for m in metros if stage_result['metros'].get(m['name'], {}).get('success')]
+    return list(metros) if stage_result.get('success') else []
+
+
+def record_task_rows(rows_read: Optional[int] = None, rows_kept: Optional[int] = None):
+    """Report row counts for the task running on this thread (stored in run history)."""
+    counts = getattr(_task_rows, 'counts', None)
+    if counts is None:
+        return
+    if rows_read is not None:
+        counts['rows_read'] = int(rows_read)
+    if rows_kept is not None:
+        counts['rows_kept'] = int(rows_kept)
+
+
+def record_task_first_byte(seconds: Optional[float]):
+    """Report a network task's time to first response byte (stored in run history)."""
+    counts = getattr(_task_rows, 'counts', None)
+    if counts is not None and seconds is not None:
+        counts['first_byte_seconds'] = round(float(seconds), 3)
+
+
+# ========== STAGES ==========
+
+def stage_extract(ctx: PipelineContext, metro: dict) -> str:
+    """
+    Extract a metro from the source file and keep its rows in memory.
+
+    With data_settings.extract_memory_mb the metro is streamed to its
+    partition under that cap instead, and processing reads it back from disk.
+    Zip-code and neighborhood metros always stream (see region_granularity.py).
+    """
+    from extract_metros import extract_and_write_metro, stream_and_write_metro
+    from region_granularity import extract_memory_mb, metro_granularity
+
+    source_file = _source_files(ctx, metro)[0]
+    if not source_file.exists():
+        raise FileNotFoundError(f"Source file not found: {source_file}")
+
+    memory_mb = extract_memory_mb(ctx.data_settings, metro_granularity(ctx.data_settings, metro))
+    if memory_mb:
+        stats = stream_and_write_metro(
+            source_file=str(source_file),
+            metro_code=metro['metro_code'],
+            output_file=str(_tsv_file(ctx, metro)),
+            memory_mb=memory_mb,
+            property_type=ctx.data_settings.get('property_type_filter', 'All Residential'),
+            tsv_export=ctx.data_settings.get('tsv_export', False)
+        )
+        if stats is None:
+            raise RuntimeError(f"Extraction failed for {metro.get('display_name', metro['name'])}")
+        ctx.extracted.pop(metro['name'], None)
+        record_task_rows(stats['rows_scanned'], stats['rows'])
+        return f"Extracted {stats['rows']:,} rows (streamed)"
+
+    df = extract_and_write_metro(
+        source_file=str(source_file),
+        metro_code=metro['metro_code'],
+        output_file=str(_tsv_file(ctx, metro)),
+        property_type=ctx.data_settings.get('property_type_filter', 'All Residential'),
+        tsv_export=ctx.data_settings.get('tsv_export', False)
+    )
+    if df is None:
+        raise RuntimeError(f"Extraction failed for {metro.get('display_name', metro['name'])}")
+
+    ctx.extracted[metro['name']] = df
+    record_task_rows(df.attrs.get('rows_scanned'), len(df))
+    return f"Extracted {len(df):,} rows"
+
+
+def stage_process(ctx: PipelineContext, metro: dict) -> str:
+    """Build a metro's data dict and summary from its extracted rows and save both."""
+    from chart_downsample import DEFAULT_POINT_BUDGET
+    from data_artifact import DEFAULT_DATA_FORMAT
+    from extract_summary import write_metro_summary
+    from frame_partition import iter_extracted_blocks, partition_path
+    from process_market_data import process_metro_blocks, save_metro_data
+    from region_granularity import metro_granularity
+
+    metro_slug = metro['name']
+    metro_display = metro.get('display_name', metro_slug)
+
+    df = ctx.extracted.get(metro_slug)
+    if df is None:
+        # Extraction ran elsewhere (e.g. a previous run, or streaming); read
+        # its partition a block at a time (or the TSV)
+        tsv_file = _tsv_file(ctx, metro)
+        if not partition_path(tsv_file).exists() and not tsv_file.exists():
+            raise FileNotFoundError(f"Missing extracted data for {metro_display}: {partition_path(tsv_file)}")
+        blocks = iter_extracted_blocks(tsv_file)
+    else:
+        blocks = iter([df])
+
+    rows_read = 0
+
+    def counted(blocks):
+        nonlocal rows_read
+        for block in blocks:
+            rows_read += len(block)
+            yield block
+
+    print(f"\nProcessing {metro_display} data...")
+    chart_point_budget = ctx.data_settings.get('chart_point_budget', DEFAULT_POINT_BUDGET)
+    granularity = metro_granularity(ctx.data_settings, metro)
+    metro_data = process_metro_blocks(counted(blocks), metro_display, 12, chart_point_budget, granularity.name)
+    record_task_rows(rows_read=rows_read)
+    data_file, data_hash = save_metro_data(
+        metro_data, ctx.metro_output_dir(metro), metro_slug,
+        ctx.data_settings.get('data_format', DEFAULT_DATA_FORMAT), ctx.data_settings.get('data_json_export', False)
+    )
+    print(f"[OK] Saved: {data_file}")
+    summary, summary_file = write_metro_summary(metro_data, data_file.parent, metro_slug)
+    print(f"[OK] {metro_display} summary: {summary_file}")
+
+    ctx.processed[metro_slug] = {
+        'metro_data': metro_data,
+        'data_file': data_file,
+        'data_hash': data_hash,
+    }
+    ctx.summaries[metro_slug] = {'summary': summary, 'folder': data_file.parent}
+    return f"Processed period {metro_data['period']} ({summary['market_status']})"
+
+
+def stage_dashboard(ctx: PipelineContext, metro: dict) -> str:
+    """Render a metro's dashboard from its in-memory data."""
+    from generate_dashboards_v2 import _render_dashboard_job, plan_dashboard_job
+
+    job = plan_dashboard_job(
+        ctx.base_dir, metro,
+        force=DASHBOARD_STAGE.name in ctx.forced,
+        in_memory=ctx.processed.get(metro['name'])
+    )
+    if job['current']:
+        return "Dashboard up to date"
+
+    _render_dashboard_job(job)
+    return f"Rendered {Path(job['output_file']).name}"
+
+
+def _load_processed(ctx: PipelineContext, metro: dict) -> dict:
+    """Return a metro's processed entry, loading the latest data file if this run didn't produce it."""
+    metro_slug = metro['name']
+    if metro_slug not in ctx.processed:
+        from data_artifact import load_metro_data
+        from extract_summary import find_latest_data_file
+
+        data_file, _ = find_latest_data_file(str(ctx.metro_output_dir(metro)), metro_slug)
+        metro_data = load_metro_data(data_file)
+        ctx.processed[metro_slug] = {'metro_data': metro_data, 'data_file': Path(data_file), 'data_hash': None}
+
+    return ctx.processed[metro_slug]
+
+
+def _load_summary(ctx: PipelineContext, metro: dict) -> dict:
+    """Return a metro's summary entry, loading the saved summary if this run didn't produce it."""
+    metro_slug = metro['name']
+    if metro_slug not in ctx.summaries:
+        folder = Path(_load_processed(ctx, metro)['data_file']).parent
+        with open(folder / f'{metro_slug}_summary.json', 'r') as f:
+            ctx.summaries[metro_slug] = {'summary': json.load(f), 'folder': folder}
+
+    return ctx.summaries[metro_slug]
+
+
+def stage_narrative(ctx: PipelineContext, metro: dict) -> str:
+    """Generate a metro's AI narrative from its in-memory summary and trends."""
+    import ai_narrative
+
+    config = ctx.ai_config or ai_narrative.load_config()
+    if not ai_narrative.ANTHROPIC_AVAILABLE:
+        raise RuntimeError("anthropic package not installed")
+    if not config.get('api_key'):
+        raise RuntimeError("No API key configured")
+
+    metro_slug = metro['name']
+    entry = _load_summary(ctx, metro)
+    metro_trends = _load_processed(ctx, metro)['metro_data'].get('metro_trends', [])
+
+    result = ai_narrative.narrate_metro(metro_slug, entry['folder'], entry['summary'], metro_trends, config)
+    if not result or not result['success']:
+        raise RuntimeError((result or {}).get('error') or "Narrative generation failed")
+
+    ctx.narratives[metro_slug] = result['narrative']
+    record_task_first_byte(result.get('first_byte_seconds'))
+    if result.get('cached'):
+        return f"Narrative reused from cache ({result['tokens_saved']} tokens saved)"
+    if result.get('first_byte_seconds') is not None:
+        return f"Narrative saved ({result['tokens_used']} tokens, first byte after {result['first_byte_seconds']:.2f}s)"
+    return f"Narrative saved ({result['tokens_used']} tokens)"
+
+
+def stage_email(ctx: PipelineContext, metro: dict) -> str:
+    """
+    Email a metro's market report as soon as its summary (and narrative) are ready.
+
+    With ai_narrative.batch_mode the narrative arrives in a later run, so a
+    report without one is held (REPORT_HELD) rather than sent at most once
+    without it; the run that collects the batch sends it.
+    """
+    from email_reports import queue_market_report, send_market_report
+
+    metro_slug = metro['name']
+    entry = _load_summary(ctx, metro)
+
+    narrative = ctx.narratives.get(metro_slug)
+    narrative_file = entry['folder'] / f"{metro_slug}_narrative.txt"
+    if narrative is None and narrative_file.exists():
+        with open(narrative_file, 'r', encoding='utf-8') as f:
+            narrative = f.read()
+    if narrative is None and ctx.ai_config is not None and ctx.ai_config.get('batch_mode'):
+        return REPORT_HELD
+
+    report = (
+        metro.get('display_name', metro_slug),
+        entry['summary'],
+        ctx.email_config,
+        narrative,
+        metro.get('output_directory', metro_slug),
+        metro_slug,
+    )
+
+    # With an outbox the report is delivered in the background, at most once per period
+    if ctx.outbox is not None:
+        queued = queue_market_report(ctx.outbox, *report)
+        if queued is None:
+            raise RuntimeError("Market report email could not be queued")
+        return "Report queued" if queued == 'queued' else "Report already sent or queued"
+
+    sent = send_market_report(*report)
+    if not sent:
+        raise RuntimeError("Market report email failed")
+    return "Report sent"
+
+
+# ========== STAGE INPUTS / OUTPUTS ==========
+
+def _source_files(ctx: PipelineContext, metro: dict) -> List[Path]:
+    from region_granularity import granularity_source_file, metro_granularity
+
+    return [ctx.base_dir / granularity_source_file(ctx.data_settings, metro_granularity(ctx.data_settings, metro))]
+
+
+def _tsv_file(ctx: PipelineContext, metro: dict) -> Path:
+    from region_granularity import extracted_file_name, metro_granularity
+
+    return ctx.base_dir / extracted_file_name(ctx.data_settings, metro, metro_granularity(ctx.data_settings, metro))
+
+
+def _extracted_files(ctx: PipelineContext, metro: dict) -> List[Path]:
+    """A metro's extraction partition, plus the TSV when data_settings.tsv_export is on."""
+    from frame_partition import partition_path
+
+    tsv_file = _tsv_file(ctx, metro)
+    return [partition_path(tsv_file)] + ([tsv_file] if ctx.data_settings.get('tsv_export') else [])
+
+
+def _period_files(*patterns: str) -> Callable[[PipelineContext, dict], List[Path]]:
+    """Files in a metro's latest period folder; patterns take {slug} and {period}."""
+    def files(ctx: PipelineContext, metro: dict) -> List[Path]:
+        from extract_summary import find_latest_data_file
+
+        data_file, period = find_latest_data_file(str(ctx.metro_output_dir(metro)), metro['name'])
+        folder = Path(data_file).parent
+        return [folder / p.format(slug=metro['name'], period=period) for p in patterns]
+    return files
+
+
+def _data_files(ctx: PipelineContext, metro: dict) -> List[Path]:
+    """A metro's data artifacts in its latest period folder, primary format first."""
+    from data_artifact import DEFAULT_DATA_FORMAT, data_file_name
+
+    data_format = ctx.data_settings.get('data_format', DEFAULT_DATA_FORMAT)
+    names = [data_file_name(metro['name'], data_format)]
+    if ctx.data_settings.get('data_json_export') and data_format != 'json':
+        names.append(data_file_name(metro['name'], 'json'))
+    return _period_files(*names)(ctx, metro)
+
+
+def _primary_data_file(ctx: PipelineContext, metro: dict) -> List[Path]:
+    return _data_files(ctx, metro)[:1]
+
+
+def _process_inputs(ctx: PipelineContext, metro: dict) -> List[Path]:
+    rules_file = ctx.base_dir / 'alert_rules.yaml'
+    return _extracted_files(ctx, metro)[:1] + ([rules_file] if rules_file.exists() else [])
+
+
+def _process_outputs(ctx: PipelineContext, metro: dict) -> List[Path]:
+    return _data_files(ctx, metro) + _period_files('{slug}_summary.json')(ctx, metro)
+
+
+def _narrative_inputs(ctx: PipelineContext, metro: dict) -> List[Path]:
+    return _primary_data_file(ctx, metro) + _period_files('{slug}_summary.json')(ctx, metro)
+
+
+def _ai_params(ctx: PipelineContext) -> dict:
+    ai_config = ctx.ai_config or {}
+    return {'model': ai_config.get('model'), 'max_tokens': ai_config.get('max_tokens')}
+
+
+EXTRACT_STAGE = Stage(
+    'extract_metros', 'Metro extraction', 'extract_metros.py', stage_extract,
+    inputs=_source_files, outputs=_extracted_files, code=['frame_partition.py', 'region_granularity.py'],
+    per_metro=True
+)
+PROCESS_STAGE = Stage(
+    'process_data', 'Data processing', 'process_market_data.py', stage_process,
+    depends_on=['extract_metros'], inputs=_process_inputs, outputs=_process_outputs,
+    code=['chart_downsample.py', 'data_artifact.py', 'extract_summary.py', 'alert_rules.py', 'frame_partition.py',
+          'region_granularity.py'],
+    per_metro=True
+)
+DASHBOARD_STAGE = Stage(
+    'generate_dashboards', 'Dashboard generation', 'generate_dashboards_v2.py', stage_dashboard,
+    depends_on=['process_data'], inputs=_primary_data_file,
+    outputs=_period_files('dashboard_enhanced_{slug}_{period}.html'),
+    code=['chart_downsample.py', 'data_artifact.py', 'region_granularity.py'], per_metro=True,
+    force_args=['--force'], child_processes=True
+)
+NARRATIVE_STAGE = Stage(
+    'ai_narrative', 'AI narrative generation', 'ai_narrative.py', stage_narrative,
+    depends_on=['process_data'], required=False, inputs=_narrative_inputs,
+    outputs=_period_files('{slug}_narrative.txt', '{slug}_narrative.json'),
+    params=_ai_params, per_metro=True, kind='network'
+)
+# No standalone script: always runs in-process, one task per metro
+EMAIL_STAGE = Stage(
+    'email_report', 'Market report email', None, stage_email,
+    depends_on=['generate_dashboards', 'process_data', 'ai_narrative'], required=False, per_metro=True,
+    kind='network'
+)
+
+ANALYSIS_STAGES = [EXTRACT_STAGE, PROCESS_STAGE, DASHBOARD_STAGE]
+STAGE_NAMES = [s.name for s in ANALYSIS_STAGES + [NARRATIVE_STAGE]]
+
+
+# ========== RUNNER ==========
+
+def order_stages(stages: List[Stage]) -> List[Stage]:
+    """
+    Topologically sort stages, keeping the given order among independent ones.
+
+    Dependencies on stages not in the list are treated as already satisfied, so
+    a subset of the graph (e.g. only narratives) can run on its own.
+    """
+    names = {s.name for s in stages}
+    done = set()
+    ordered = []
+    pending = list(stages)
+
+    while pending:
+        ready = [s for s in pending if all(d in done or d not in names for d in s.depends_on)]
+        if not ready:
+            raise ValueError(f"Stage dependency cycle: {', '.join(s.name for s in pending)}")
+        stage = ready[0]
+        ordered.append(stage)
+        done.add(stage.name)
+        pending.remove(stage)
+
+    return ordered
+
+
+def build_tasks(stages: List[Stage], ctx: PipelineContext, isolated: bool = False) -> tuple:
+    """
+    Expand stages into tasks and wire their dependencies.
+
+    A per-metro task depends on the same metro's task of each upstream stage, or
+    on the single task of a stage that runs once.
+
+    Returns:
+        (tasks in stage order, {task key: [dependency task keys]})
+    """
+    tasks = []
+    by_stage: Dict[str, List[Task]] = {}
+    for stage in order_stages(stages):
+        # Subprocess stages run their script once for all metros
+        if stage.per_metro and not (isolated and stage.script):
+            stage_tasks = [Task(stage, metro) for metro in ctx.metros]
+        else:
+            stage_tasks = [Task(stage)]
+        by_stage[stage.name] = stage_tasks
+        tasks.extend(stage_tasks)
+
+    deps: Dict[str, List[str]] = {}
+    for task in tasks:
+        deps[task.key] = []
+        for dep_name in task.stage.depends_on:
+            for dep in by_stage.get(dep_name, []):
+                if task.metro is None or dep.metro is None or dep.metro['name'] == task.metro['name']:
+                    deps[task.key].append(dep.key)
+
+    return tasks, deps
+
+
+def _task_files(fn: Callable, task: Task, ctx: PipelineContext) -> List[Path]:
+    """Evaluate a stage's inputs/outputs for one task (all metros for a stage-wide task)."""
+    if not task.stage.per_metro:
+        return fn(ctx)
+    metros = [task.metro] if task.metro is not None else ctx.metros
+    return [path for metro in metros for path in fn(ctx, metro)]
+
+
+def task_fingerprint(task: Task, ctx: PipelineContext, store: FingerprintStore) -> Optional[str]:
+    """Fingerprint a task's inputs, code and config; None when it can't be cached."""
+    stage = task.stage
+    if stage.inputs is None:
+        return None
+
+    try:
+        inputs = _task_files(stage.inputs, task, ctx)
+    except FileNotFoundError:
+        return None
+    if not all(Path(p).exists() for p in inputs):
+        return None
+
+    code = [ctx.base_dir / c for c in ([stage.script] if stage.script else []) + stage.code] + [Path(__file__)]
+    if task.metro is not None:
+        config = {'data_settings': ctx.data_settings, 'metro': task.metro}
+    else:
+        config = ctx.config
+    params = {'config': config, 'stage': stage.params(ctx) if stage.params else None}
+    return store.fingerprint(inputs, code, params)
+
+
+def run_stage_script(script_path: str, *args: str) -> tuple:
+    """Run a stage's standalone script in a subprocess, streaming its output."""
+    result = subprocess.run([sys.executable, script_path, *args], text=True)
+    if result.returncode != 0:
+        return False, f"Exit code {result.returncode}"
+    return True, "Completed"
+
+
+def _output_files(task: Task, ctx: PipelineContext) -> List[Path]:
+    """A task's declared outputs, or [] when it has none or they can't be resolved."""
+    if task.stage.outputs is None:
+        return []
+    try:
+        return _task_files(task.stage.outputs, task, ctx)
+    except FileNotFoundError:
+        return []
+
+
+def _task_metrics(task: Task, status: str, output: str = '', **values) -> dict:
+    """A run-history row for one task (see run_history.METRIC_COLUMNS)."""
+    return dict(
+        stage=task.stage.name,
+        metro=task.metro['name'] if task.metro is not None else '',
+        status=status,
+        output=str(output)[:500],
+        **values
+    )
+
+
+def _run_task(task, ctx, isolated, dry_run, log, script_runner, store,
+              run_state=None, resumable=False, metrics=None) -> dict:
+    """Run (or skip) one task and return its result dict; never raises."""
+    try:
+        return _execute_task(task, ctx, isolated, dry_run, log, script_runner, store, run_state, resumable, metrics)
+    except Exception as e:
+        # Hashing inputs or statting outputs failed (e.g. a file deleted or
+        # unreadable mid-run): the task fails, the scheduler carries on
+        output = f"{type(e).__name__}: {e}"
+        try:
+            if store is not None:
+                store.invalidate(task.key)
+            if run_state is not None:
+                run_state.mark(task.key, 'failed', output=output)
+        except Exception as record_error:
+            log(f"  [WARN] Could not record {task.label}'s failure: {record_error}")
+        if metrics is not None:
+            metrics[task.key] = _task_metrics(task, 'failed', output)
+        if task.stage.required:
+            log(f"  [ERROR] {task.label}: {output}")
+        else:
+            log(f"  [WARN] {task.label} failed (optional): {output}")
+        return {'success': False, 'output': output[:500], 'seconds': 0.0}
+
+
+def _execute_task(task, ctx, isolated, dry_run, log, script_runner, store,
+                  run_state, resumable, metrics) -> dict:
+    """_run_task's body; errors outside the stage itself propagate to _run_task."""
+    stage = task.stage
+
+    if resumable and stage.name not in ctx.forced and run_state.can_reuse(task.key):
+        log(f"  [RESUME] {task.label} completed in the previous run")
+        run_state.carry_over(task.key)
+        if metrics is not None:
+            metrics[task.key] = _task_metrics(task, 'skipped', 'Completed in previous run')
+        return {'success': True, 'output': 'Completed in previous run', 'seconds': 0.0,
+                'skipped': True, 'resumed': True}
+
+    fingerprint = None
+    if store is not None and stage.name not in ctx.forced:
+        fingerprint = task_fingerprint(task, ctx, store)
+        if fingerprint and store.is_current(task.key, fingerprint):
+            log(f"  [SKIP] {task.label} is up to date")
+            if run_state is not None:
+                run_state.mark(task.key, 'succeeded', _output_files(task, ctx), 'Up to date')
+            if metrics is not None:
+                metrics[task.key] = _task_metrics(task, 'skipped', 'Up to date')
+            return {'success': True, 'output': 'Up to date', 'seconds': 0.0, 'skipped': True}
+
+    if dry_run:
+        log(f"  [DRY-RUN] Would run: {task.label}")
+        return {'success': True, 'output': 'Dry run', 'seconds': 0.0}
+
+    if store is not None and fingerprint is None:
+        fingerprint = task_fingerprint(task, ctx, store)
+
+    log(f"  [START] {task.label}")
+    if run_state is not None:
+        run_state.mark(task.key, 'running')
+    rows: Dict[str, float] = {}
+    _task_rows.counts = rows
+    start = time.perf_counter()
+    cpu_start, child_cpu_start = time.thread_time(), child_cpu_seconds()
+    runs_script = isolated and stage.script and task.metro is None
+    if runs_script:
+        script_args = stage.force_args if stage.name in ctx.forced else []
+        success, output = script_runner(str(ctx.base_dir / stage.script), *script_args)
+    else:
+        try:
+            output = stage.func(ctx, task.metro) if stage.per_metro else stage.func(ctx)
+            success = True
+        except Exception as e:
+            output = str(e)
+            success = False
+    elapsed = round(time.perf_counter() - start, 2)
+    # Thread CPU covers in-process work; child CPU (counted once a child exits)
+    # covers --isolated subprocesses and the workers of child_processes stages
+    cpu_seconds = time.thread_time() - cpu_start
+    if runs_script or stage.child_processes:
+        cpu_seconds += child_cpu_seconds() - child_cpu_start
+    _task_rows.counts = None
+
+    if store is not None:
+        if success and fingerprint and stage.outputs is not None:
+            try:
+                store.record(task.key, fingerprint, _task_files(stage.outputs, task, ctx))
+            except FileNotFoundError:
+                store.invalidate(task.key)
+        else:
+            store.invalidate(task.key)
+
+    outputs = _output_files(task, ctx) if success else []
+    if run_state is not None:
+        if success:
+            run_state.mark(task.key, 'succeeded', outputs, output)
+        else:
+            run_state.mark(task.key, 'failed', output=output)
+
+    if metrics is not None:
+        metrics[task.key] = _task_metrics(
+            task, 'ok' if success else 'failed', output,
+            wall_seconds=elapsed,
+            cpu_seconds=round(cpu_seconds, 2),
+            peak_rss_mb=peak_rss_mb(),
+            bytes_written=sum(p.stat().st_size for p in outputs if p.exists()) if outputs else None,
+            **rows
+        )
+
+    if success:
+        log(f"  [OK] {task.label} completed in {elapsed:.2f}s")
+    elif stage.required:
+        log(f"  [ERROR] {task.label}: {output}")
+    else:
+        log(f"  [WARN] {task.label} failed (optional): {output}")
+
+    return {'success': success, 'output': str(output)[:500], 'seconds': elapsed}
+
+
+def _stage_result(stage: Stage, tasks: List[Task], task_results: Dict[str, dict]) -> dict:
+    """Roll a stage's task results up into one step result."""
+    outcomes = [task_results[t.key] for t in tasks]
+    if len(tasks) == 1 and tasks[0].metro is None:
+        return dict(outcomes[0])
+
+    metros = [t.metro or {} for t in tasks]
+    failures = [f"{m.get('display_name', m['name'])}: {r['output']}"
+                for m, r in zip(metros, outcomes) if not r['success']]
+    ok_count = len(tasks) - len(failures)
+    result = {
+        'success': not failures,
+        'output': '; '.join([f"{ok_count}/{len(tasks)} metro(s) OK"] + failures)[:500],
+        'seconds': round(sum(r['seconds'] for r in outcomes), 2),
+        'metros': {m['name']: r for m, r in zip(metros, outcomes)},
+    }
+    if outcomes and all(r.get('skipped') for r in outcomes):
+        result['skipped'] = True
+    return result
+
+
+def run_pipeline(
+    stages: List[Stage],
+    ctx: PipelineContext,
+    isolated: bool = False,
+    dry_run: bool = False,
+    log: Callable[[str], None] = print,
+    script_runner: Callable[..., tuple] = run_stage_script,
+    results: Optional[dict] = None,
+    store: Optional[FingerprintStore] = None,
+    force_stages: Iterable[str] = (),
+    cpu_workers: Optional[int] = None,
+    network_workers: Optional[int] = None,
+    run_state: Optional[RunState] = None,
+    metrics: Optional[dict] = None,
+) -> dict:
+    """
+    Run the stages' tasks as soon as their dependencies finish.
+
+    Each stage's outcome is recorded in `results` (created if not given) as
+    {'success', 'output', 'seconds'}, plus 'skipped' when the store showed it
+    was up to date (or run_state reused it from the previous run) and 'metros'
+    with per-metro task results. If `metrics` is given, it is filled with one
+    run-history row per task key. A failed required
+    task blocks only the tasks that depend on it; other metros carry on. Once
+    everything has finished, StageError is raised for the first failed required
+    stage; failed optional tasks are logged only.
+
+    Returns:
+        The results dict keyed by stage name
+    """
+    if results is None:
+        results = {}
+
+    ordered = order_stages(stages)
+    ctx.forced.update(force_stages)
+    for stage in ordered:
+        # Forcing a stage forces everything downstream of it
+        if stage.name in ctx.forced or any(d in ctx.forced for d in stage.depends_on):
+            ctx.forced.add(stage.name)
+
+    tasks, deps = build_tasks(ordered, ctx, isolated)
+    required = {t.key: t.stage.required for t in tasks}
+
+    if cpu_workers is None:
+        cpu_workers = ctx.pipeline_settings.get('cpu_workers') or min(len(ctx.metros) or 1, os.cpu_count() or 1)
+    if network_workers is None:
+        network_workers = ctx.pipeline_settings.get('network_workers') or DEFAULT_NETWORK_WORKERS
+
+    mode = 'subprocess' if isolated else 'in-process'
+    log(f"\n[PIPELINE] {len(tasks)} task(s), {mode}, cpu_workers={cpu_workers}, network_workers={network_workers}")
+
+    task_results: Dict[str, dict] = {}
+    pending = list(tasks)
+    running: Dict[Future, Task] = {}
+    limits = {'cpu': cpu_workers, 'network': network_workers}
+    in_flight = {'cpu': 0, 'network': 0}
+    # Prefer the most downstream ready task so each metro finishes as early as possible
+    rank = {stage.name: i for i, stage in enumerate(ordered)}
+
+    with ThreadPoolExecutor(max_workers=cpu_workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=network_workers) as network_pool:
+        pools = {'cpu': cpu_pool, 'network': network_pool}
+
+        while pending or running:
+            ready: List[Task] = []
+            blocked_any = True
+            while blocked_any:
+                blocked_any = False
+                ready = []
+                for task in list(pending):
+                    if any(k not in task_results for k in deps[task.key]):
+                        continue
+
+                    failed_dep = next(
+                        (k for k in deps[task.key] if required[k] and not task_results[k]['success']), None
+                    )
+                    if failed_dep:
+                        log(f"  [BLOCKED] {task.label} (waiting on failed {failed_dep})")
+                        task_results[task.key] = {
+                            'success': False, 'output': f"Blocked by {failed_dep}", 'seconds': 0.0, 'blocked': True
+                        }
+                        if run_state is not None:
+                            run_state.mark(task.key, 'blocked', output=f"Blocked by {failed_dep}")
+                        if metrics is not None:
+                            metrics[task.key] = _task_metrics(task, 'blocked', f"Blocked by {failed_dep}")
+                        pending.remove(task)
+                        blocked_any = True
+                    else:
+                        ready.append(task)
+
+            ready.sort(key=lambda t: -rank[t.stage.name])
+            for task in ready:
+                kind = task.stage.kind
+                if in_flight[kind] >= limits[kind]:
+                    continue
+                # A task is only reused if everything upstream was reused or up to date
+                resumable = run_state is not None and all(task_results[k].get('skipped') for k in deps[task.key])
+                future = pools[kind].submit(
+                    _run_task, task, ctx, isolated, dry_run, log, script_runner, store,
+                    run_state, resumable, metrics
+                )
+                running[future] = task
+                in_flight[kind] += 1
+                pending.remove(task)
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                in_flight[task.stage.kind] -= 1
+                task_results[task.key] = future.result()
+
+    first_failure = None
+    for stage in ordered:
+        stage_tasks = [t for t in tasks if t.stage is stage]
+        results[stage.name] = _stage_result(stage, stage_tasks, task_results)
+        if stage.required and not results[stage.name]['success'] and first_failure is None:
+            first_failure = stage
+
+    if first_failure is not None:
+        raise StageError(first_failure, results[first_failure.name]['output'])
+
+    return results
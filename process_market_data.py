@@ -1,15 +1,27 @@
 """
 Real Estate Market Data Processor
-Processes Redfin TSV files into structured JSON for dashboard generation and agent analysis
+Processes Redfin TSV files into structured metro data for dashboard generation and agent analysis
 Includes 12-month historical trends for metro and top 5 cities
+Cities are the metro's regions at its region granularity: city, zip code or
+neighborhood (see region_granularity.py); output keys keep the city names
+Writes each metro's strategic summary alongside its data (see extract_summary.py)
 """
 
+import numpy as np
 import pandas as pd
+import hashlib
 import json
 from pathlib import Path
 from datetime import datetime
 import sys
 
+from atomic_io import write_bytes_atomic
+from chart_downsample import DEFAULT_POINT_BUDGET, build_chart_downsample
+from data_artifact import DATA_FORMATS, DEFAULT_DATA_FORMAT, data_file_name, encode_data_file
+from extract_summary import write_metro_summary
+from frame_partition import iter_extracted_blocks, partition_path
+from region_granularity import DEFAULT_GRANULARITY, extracted_file_name, get_granularity, metro_granularity
+
 
 def load_metro_config(config_path: Path) -> dict:
     """Load metro configuration from JSON file."""
@@ -90,6 +102,94 @@ def calculate_health_score(row):
 
     return min(score, 100)
 
+# Per-row columns health_scores reads
+HEALTH_COLUMNS = ['PENDING_SALES_YOY', 'MEDIAN_DOM_YOY', 'MEDIAN_DOM', 'MONTHS_OF_SUPPLY']
+
+
+def health_scores(df):
+    """
+    calculate_health_score for every row at once.
+
+    Mirrors the row-wise version exactly, including its truthiness quirks: a
+    YoY or months-of-supply of exactly 0 scores like missing data, and DOM is
+    truncated to an int before the thresholds.
+    """
+    pending_yoy = pd.to_numeric(df['PENDING_SALES_YOY'], errors='coerce')
+    dom_yoy = pd.to_numeric(df['MEDIAN_DOM_YOY'], errors='coerce')
+    dom_abs = np.trunc(pd.to_numeric(df['MEDIAN_DOM'], errors='coerce'))
+    mos = pd.to_numeric(df['MONTHS_OF_SUPPLY'], errors='coerce')
+
+    pending_pts = np.select([pending_yoy > 0.10, pending_yoy > 0], [34, 20], 7)
+    dom_pts = np.select([dom_yoy < 0, (dom_yoy < 0.10) & (dom_yoy != 0)], [33, 20], 7)
+    dom_pts = np.minimum(dom_pts, np.select([dom_abs > 90, dom_abs > 70, dom_abs > 50], [0, 7, 20], 33))
+    mos_pts = np.select([(mos < 3) & (mos != 0), (mos < 6) & (mos != 0)], [33, 20], 7)
+
+    return pd.Series(np.minimum(pending_pts + dom_pts + mos_pts, 100), index=df.index)
+
+
+# Per-row columns a city trend series is built from
+TREND_COLUMNS = [
+    'INVENTORY', 'NEW_LISTINGS', 'PENDING_SALES', 'HOMES_SOLD', 'PRICE_DROPS', 'MEDIAN_SALE_PRICE', 'MEDIAN_DOM'
+]
+
+# City metrics as aggregated for top_cities, and the names they go by in the output
+CITY_METRIC_AGG = {
+    'HOMES_SOLD': ('sales', 'sum'),
+    'MEDIAN_SALE_PRICE': ('price', 'first'),
+    'MEDIAN_SALE_PRICE_YOY': ('price_yoy', 'first'),
+    'MEDIAN_DOM': ('dom', 'first'),
+    'INVENTORY': ('inventory', 'sum'),
+    'PENDING_SALES': ('pending', 'sum'),
+    'NEW_LISTINGS': ('new_listings', 'sum'),
+    'PRICE_DROPS': ('price_drops', 'sum'),
+    'MONTHS_OF_SUPPLY': ('months_supply', 'first'),
+    'HEALTH_SCORE': ('health', 'first'),
+}
+
+# Source columns city_metric_frame reads (besides its keys and PERIOD_BEGIN)
+CITY_METRIC_COLUMNS = list(dict.fromkeys([c for c in CITY_METRIC_AGG if c != 'HEALTH_SCORE'] + HEALTH_COLUMNS))
+
+
+def city_metric_frame(df, keys=('CITY',)):
+    """
+    One row per city and month, with the metrics top_cities reports.
+
+    Args:
+        df: "All Residential" Redfin rows with PERIOD_BEGIN as datetime (any
+            number of months)
+        keys: Columns identifying a city (add STATE_CODE etc. across metros)
+
+    Returns:
+        DataFrame with `keys`, 'period' (YYYY-MM) and the CITY_METRIC_AGG names
+    """
+    df = df.assign(HEALTH_SCORE=health_scores(df))
+    frame = df.groupby([*keys, 'PERIOD_BEGIN'], sort=False).agg(
+        **{name: (column, how) for column, (name, how) in CITY_METRIC_AGG.items()}
+    ).reset_index()
+    frame['period'] = frame['PERIOD_BEGIN'].dt.strftime('%Y-%m')
+    return frame.drop(columns='PERIOD_BEGIN')
+
+
+def city_metric_records(frame, name_column='CITY'):
+    """A city_metric_frame as top_cities-style dicts, busiest city first."""
+    records = []
+    for row in frame.sort_values('sales', ascending=False).to_dict('records'):
+        records.append({
+            'name': row[name_column],
+            'sales': safe_int(row['sales']),
+            'price': safe_int(row['price']),
+            'price_yoy': safe_float(row['price_yoy']),
+            'dom': safe_int(row['dom']),
+            'inventory': safe_int(row['inventory']),
+            'pending': safe_int(row['pending']),
+            'new_listings': safe_int(row['new_listings']),
+            'price_drops': safe_int(row['price_drops']),
+            'months_supply': safe_float(row['months_supply']),
+            'health': int(row['health']) if pd.notna(row['health']) else 50
+        })
+    return records
+
+
 def pct_change(curr, prev):
     """Safe percent change (curr/prev - 1). Returns None when not computable."""
     try:
@@ -128,89 +228,169 @@ def add_series_derived(trend_rows, fields_for_change):
             row[f'{field}_yoy'] = pct_change(curr_val, prev12_val)
 
 
-def process_metro_data(tsv_file: str, metro_name: str, output_dir: Path, lookback_months: int = 12) -> dict:
-    """Process TSV file and extract metro-level + city-level historical trends"""
+def period_frames(blocks):
+    """
+    Each month's "All Residential" rows as one frame, with PERIOD_BEGIN as datetime.
+
+    `blocks` are extracted rows as one or more DataFrames in which a month's
+    rows are contiguous, as extraction writes them (most recent month first).
+    Only one month is gathered at a time. Rows keep their order within a month.
+
+    Yields (PERIOD_BEGIN, rows) pairs in the order the months appear.
+    """
+    finished = set()
+    current, pending = None, []
+    for block in blocks:
+        block = block[block['PROPERTY_TYPE'] == 'All Residential']
+        block = block.assign(PERIOD_BEGIN=pd.to_datetime(block['PERIOD_BEGIN']))
+        for period, rows in block.groupby('PERIOD_BEGIN', sort=False):
+            if period == current:
+                pending.append(rows)
+                continue
+            if pending:
+                yield current, pd.concat(pending)
+                finished.add(current)
+            if period in finished:
+                raise ValueError(f"Rows for {period:%Y-%m} are not contiguous in the extracted data")
+            current, pending = period, [rows]
+    if pending:
+        yield current, pd.concat(pending)
+
+
+def metro_period_trend(period, period_data):
+    """One month of the metro series from that month's rows (None when nothing sold)."""
+    # Sum totals
+    total_sales = safe_float(period_data['HOMES_SOLD'].sum())
+    total_inventory = safe_float(period_data['INVENTORY'].sum())
+
+    if not (total_sales and total_sales > 0):
+        return None
+
+    # Weighted averages by sales volume
+    weighted_price = (period_data['MEDIAN_SALE_PRICE'] * period_data['HOMES_SOLD']).sum() / total_sales
+    weighted_dom = (period_data['MEDIAN_DOM'] * period_data['HOMES_SOLD']).sum() / total_sales
+
+    return {
+        'period': period.strftime('%Y-%m'),
+        'inventory': safe_int(total_inventory),
+        'new_listings': safe_int(period_data['NEW_LISTINGS'].sum()),
+        'pending_sales': safe_int(period_data['PENDING_SALES'].sum()),
+        'homes_sold': safe_int(total_sales),
+        'price_drops': safe_int(period_data['PRICE_DROPS'].sum()),
+        'median_sale_price': safe_int(weighted_price),
+        'median_dom': safe_int(weighted_dom),
+        'pending_ratio': safe_float(period_data['PENDING_SALES'].sum() / total_inventory) if total_inventory > 0 else None
+    }
+
+
+def process_metro_data(
+    tsv_file: str,
+    metro_name: str,
+    output_dir: Path,
+    lookback_months: int = 12,
+    chart_point_budget: int = DEFAULT_POINT_BUDGET,
+    granularity: str = DEFAULT_GRANULARITY,
+) -> dict:
+    """Process a metro's extracted rows and extract metro-level + city-level historical trends
+
+    Reads the partition next to tsv_file a block at a time when there is one
+    (see frame_partition.py).
+    """
 
     print(f"\nProcessing {metro_name} data from {tsv_file}...")
 
-    # Read TSV file
-    df = pd.read_csv(tsv_file, sep='\t', low_memory=False)
+    # Read extracted rows (binary partition in blocks, else the TSV)
+    blocks = iter_extracted_blocks(Path(tsv_file))
 
-    # Filter to "All Residential" property type only
-    df = df[df['PROPERTY_TYPE'] == 'All Residential'].copy()
+    return process_metro_blocks(blocks, metro_name, lookback_months, chart_point_budget, granularity)
 
-    # Convert PERIOD_BEGIN to datetime
-    df['PERIOD_BEGIN'] = pd.to_datetime(df['PERIOD_BEGIN'])
+
+def process_metro_frame(
+    df: pd.DataFrame,
+    metro_name: str,
+    lookback_months: int = 12,
+    chart_point_budget: int = DEFAULT_POINT_BUDGET,
+    granularity: str = DEFAULT_GRANULARITY,
+) -> dict:
+    """Extract metro-level + city-level historical trends from extracted metro rows (see process_metro_blocks)"""
+    return process_metro_blocks([df], metro_name, lookback_months, chart_point_budget, granularity)
+
+
+def process_metro_blocks(
+    blocks,
+    metro_name: str,
+    lookback_months: int = 12,
+    chart_point_budget: int = DEFAULT_POINT_BUDGET,
+    granularity: str = DEFAULT_GRANULARITY,
+) -> dict:
+    """Extract metro-level + city-level historical trends from extracted metro rows
+
+    `blocks` are the rows as one or more DataFrames, read a month at a time
+    (see period_frames). Besides the output, only the current month's rows
+    and each region's first row per month (the trend columns) are kept.
+
+    `granularity` names the rows' region level (see region_granularity.py);
+    its region_column identifies the "cities" below.
+    """
+    region_column = get_granularity(granularity).region_column
+
+    # One pass over the months: metro totals, each city's row per month and
+    # the current month's rows (filtered to "All Residential" by period_frames)
+    metro_rows = {}
+    city_rows = []
+    latest_period, df_current = None, None
+    for period, period_data in period_frames(blocks):
+        metro_rows[period] = metro_period_trend(period, period_data)
+        city_rows.append(period_data[[region_column, 'PERIOD_BEGIN', *TREND_COLUMNS]].drop_duplicates(region_column))
+        if latest_period is None or period > latest_period:
+            latest_period, df_current = period, period_data.copy()
+    if latest_period is None or df_current is None:
+        raise ValueError(f"No All Residential rows for {metro_name}")
+
+    # Each city's first row per period, oldest first (a zip-level metro has
+    # hundreds of regions to look up)
+    first_rows = pd.concat(city_rows).sort_values('PERIOD_BEGIN', kind='stable')
+    del city_rows
+    periods = sorted(metro_rows)
 
     # Get latest period (current month)
-    latest_period = df['PERIOD_BEGIN'].max()
     current_month = latest_period.strftime('%Y-%m')
 
     # Get earliest period for full history
-    earliest_period = df['PERIOD_BEGIN'].min()
-    total_months = len(df['PERIOD_BEGIN'].unique())
+    earliest_period = periods[0]
+    total_months = len(periods)
 
     print(f"  Latest period: {current_month}")
     print(f"  Full history: {earliest_period.strftime('%Y-%m')} to {current_month} ({total_months} months)")
 
     # Filter to last 12 months for summary
     cutoff_date_12m = latest_period - pd.DateOffset(months=lookback_months-1)
-    df_recent_12m = df[df['PERIOD_BEGIN'] >= cutoff_date_12m].copy()
+    periods_12m = [period for period in periods if period >= cutoff_date_12m]
 
     print(f"  12-month summary: {cutoff_date_12m.strftime('%Y-%m')} to {current_month}")
 
-    # Get current month data only
-    df_current = df[df['PERIOD_BEGIN'] == latest_period].copy()
-
     # ========== HELPER FUNCTION FOR METRO TRENDS ==========
-    def calculate_metro_trends(dataframe):
-        """Calculate metro trends from a dataframe"""
-        trends = []
-        for period in sorted(dataframe['PERIOD_BEGIN'].unique()):
-            period_data = dataframe[dataframe['PERIOD_BEGIN'] == period]
-
-            # Sum totals
-            total_sales = safe_float(period_data['HOMES_SOLD'].sum())
-            total_inventory = safe_float(period_data['INVENTORY'].sum())
-
-            if total_sales and total_sales > 0:
-                # Weighted averages by sales volume
-                weighted_price = (period_data['MEDIAN_SALE_PRICE'] * period_data['HOMES_SOLD']).sum() / total_sales
-                weighted_dom = (period_data['MEDIAN_DOM'] * period_data['HOMES_SOLD']).sum() / total_sales
-
-                trends.append({
-                    'period': period.strftime('%Y-%m'),
-                    'inventory': safe_int(total_inventory),
-                    'new_listings': safe_int(period_data['NEW_LISTINGS'].sum()),
-                    'pending_sales': safe_int(period_data['PENDING_SALES'].sum()),
-                    'homes_sold': safe_int(total_sales),
-                    'price_drops': safe_int(period_data['PRICE_DROPS'].sum()),
-                    'median_sale_price': safe_int(weighted_price),
-                    'median_dom': safe_int(weighted_dom),
-                    'pending_ratio': safe_float(period_data['PENDING_SALES'].sum() / total_inventory) if total_inventory > 0 else None
-                })
+    def calculate_metro_trends(period_list):
+        """The metro series over these periods (months without sales are left out)"""
+        trends = [dict(metro_rows[period]) for period in period_list if metro_rows[period] is not None]
+        add_series_derived(trends, [
+            'inventory', 'new_listings', 'pending_sales', 'homes_sold',
+            'price_drops', 'median_sale_price', 'median_dom', 'pending_ratio'
+        ])
         return trends
 
     # ========== METRO-LEVEL TRENDS (12 months for default view) ==========
-    metro_trends_12m = calculate_metro_trends(df_recent_12m)
-    add_series_derived(metro_trends_12m, [
-        'inventory', 'new_listings', 'pending_sales', 'homes_sold',
-        'price_drops', 'median_sale_price', 'median_dom', 'pending_ratio'
-    ])
+    metro_trends_12m = calculate_metro_trends(periods_12m)
     print(f"  Metro trends (12m): {len(metro_trends_12m)} months")
 
     # ========== METRO-LEVEL TRENDS (FULL HISTORY) ==========
-    full_metro_trends = calculate_metro_trends(df)
-    add_series_derived(full_metro_trends, [
-        'inventory', 'new_listings', 'pending_sales', 'homes_sold',
-        'price_drops', 'median_sale_price', 'median_dom', 'pending_ratio'
-    ])
+    full_metro_trends = calculate_metro_trends(periods)
     print(f"  Metro trends (full): {len(full_metro_trends)} months")
 
     # ========== TOP 10 CITIES (Current Month) ==========
     df_current['HEALTH_SCORE'] = df_current.apply(calculate_health_score, axis=1)
 
-    city_data = df_current.groupby('CITY').agg({
+    city_data = df_current.groupby(region_column).agg({
         'HOMES_SOLD': 'sum',
         'MEDIAN_SALE_PRICE': 'first',
         'MEDIAN_SALE_PRICE_YOY': 'first',
@@ -228,7 +408,7 @@ def process_metro_data(tsv_file: str, metro_name: str, output_dir: Path, lookbac
     top_cities = []
     for _, row in city_data.iterrows():
         top_cities.append({
-            'name': row['CITY'],
+            'name': row[region_column],
             'sales': safe_int(row['HOMES_SOLD']),
             'price': safe_int(row['MEDIAN_SALE_PRICE']),
             'price_yoy': safe_float(row['MEDIAN_SALE_PRICE_YOY']),
@@ -243,22 +423,25 @@ def process_metro_data(tsv_file: str, metro_name: str, output_dir: Path, lookbac
 
     print(f"  Top cities: {len(top_cities)}")
 
+    # ========== ALL CITIES (Current Month) - screened by the alert rules ==========
+    city_metrics = city_metric_records(city_metric_frame(df_current, (region_column,)), region_column)
+
     # ========== HELPER FUNCTION FOR CITY TRENDS ==========
-    def calculate_city_trends(dataframe, city_list):
-        """Calculate historical trends for a list of cities"""
+    def calculate_city_trends(city_first_rows, city_list):
+        """Calculate historical trends for a list of cities from their first rows per period"""
+        rows_by_city = {name: rows for name, rows in city_first_rows.groupby(region_column, sort=False)}
+
         trends = {}
         for city_name in city_list:
-            city_df = dataframe[dataframe['CITY'] == city_name]
+            city_rows = rows_by_city.get(city_name)
             city_history = []
 
-            for period in sorted(city_df['PERIOD_BEGIN'].unique()):
-                period_row = city_df[city_df['PERIOD_BEGIN'] == period].iloc[0]
-
+            for period_row in ([] if city_rows is None else city_rows.to_dict('records')):
                 inventory_val = safe_int(period_row['INVENTORY'])
                 pending_val = safe_int(period_row['PENDING_SALES'])
 
                 city_history.append({
-                    'period': period.strftime('%Y-%m'),
+                    'period': period_row['PERIOD_BEGIN'].strftime('%Y-%m'),
                     'inventory': inventory_val,
                     'new_listings': safe_int(period_row['NEW_LISTINGS']),
                     'pending_sales': pending_val,
@@ -279,21 +462,20 @@ def process_metro_data(tsv_file: str, metro_name: str, output_dir: Path, lookbac
 
     # ========== TOP 5 CITIES - 12 MONTH TRENDS (for default dashboard view) ==========
     top_5_cities = [city['name'] for city in top_cities[:5]]
-    city_trends_12m = calculate_city_trends(df_recent_12m, top_5_cities)
+    city_trends_12m = calculate_city_trends(first_rows[first_rows['PERIOD_BEGIN'] >= cutoff_date_12m], top_5_cities)
     print(f"  Top 5 cities (12m): {len(top_5_cities)} cities")
 
     # ========== ALL CITIES - FULL HISTORICAL TRENDS ==========
-    all_cities = sorted(df['CITY'].unique())
-    full_city_trends = calculate_city_trends(df, all_cities)
+    all_cities = sorted(first_rows[region_column].unique())
+    full_city_trends = calculate_city_trends(first_rows, all_cities)
     print(f"  All cities (full): {len(all_cities)} cities, {len(full_metro_trends)} months each")
 
     # ========== PERIOD INDICES ==========
-    all_periods_sorted = sorted({d.strftime('%Y-%m') for d in df['PERIOD_BEGIN'].unique()})
-    periods_12m_sorted = sorted({d.strftime('%Y-%m') for d in df_recent_12m['PERIOD_BEGIN'].unique()})
-    period_index_by_city = {}
-    for c in all_cities:
-        city_periods = sorted({d.strftime('%Y-%m') for d in df[df['CITY'] == c]['PERIOD_BEGIN'].unique()})
-        period_index_by_city[c] = city_periods
+    all_periods_sorted = [d.strftime('%Y-%m') for d in periods]
+    periods_12m_sorted = [d.strftime('%Y-%m') for d in periods_12m]
+    period_index_by_city = {
+        c: sorted({row['period'] for row in full_city_trends[c]}) for c in all_cities
+    }
 
     # ========== CURRENT MONTH METRO STATS ==========
     current_metro_stats = {
@@ -302,12 +484,14 @@ def process_metro_data(tsv_file: str, metro_name: str, output_dir: Path, lookbac
         'total_cities': len(df_current)
     }
 
-    return {
+    metro_data = {
         'metro': metro_name,
         'period': current_month,
+        'region_granularity': get_granularity(granularity).name,
         'current_stats': current_metro_stats,
         'metro_trends': metro_trends_12m,  # 12-month default view
         'top_cities': top_cities,
+        'city_metrics': city_metrics,  # All cities, current month
         'city_trends': city_trends_12m,  # Top 5 cities, 12 months
         'full_metro_trends': full_metro_trends,  # All available history
         'full_city_trends': full_city_trends,  # All cities, all history
@@ -317,6 +501,47 @@ def process_metro_data(tsv_file: str, metro_name: str, output_dir: Path, lookbac
         'period_index_by_city': period_index_by_city
     }
 
+    # ========== DOWNSAMPLED CHART SERIES (full-history views) ==========
+    metro_data['chart_downsample'] = build_chart_downsample(metro_data, chart_point_budget)
+
+    return metro_data
+
+
+def save_metro_data(
+    metro_data: dict,
+    output_dir: Path,
+    metro_slug: str,
+    data_format: str = DEFAULT_DATA_FORMAT,
+    json_export: bool = False,
+) -> tuple:
+    """
+    Write metro data to {output_dir}/{period}/{slug}_data.npz (or .json; see data_artifact.py).
+
+    With json_export, a minified {slug}_data.json is written next to the
+    binary artifact. A data file in a format that wasn't written is removed,
+    so readers never pick up a stale copy.
+
+    Returns (output_file, sha256 of the written bytes) for the primary artifact
+    so callers can fingerprint it without reading it back.
+    """
+    period_dir = Path(output_dir) / metro_data['period']
+    period_dir.mkdir(parents=True, exist_ok=True)
+    formats = [data_format] + (['json'] if json_export and data_format != 'json' else [])
+
+    written = []
+    for fmt in formats:
+        payload = encode_data_file(metro_data, fmt)
+        output_file = period_dir / data_file_name(metro_slug, fmt)
+        write_bytes_atomic(output_file, payload)
+        written.append((output_file, hashlib.sha256(payload).hexdigest()))
+
+    for fmt in DATA_FORMATS:
+        if fmt not in formats:
+            (period_dir / data_file_name(metro_slug, fmt)).unlink(missing_ok=True)
+
+    return written[0]
+
+
 def main():
     """Process enabled metros from metro_config.json."""
 
@@ -328,7 +553,9 @@ def main():
 
     config = load_metro_config(config_file)
     data_settings = config.get('data_settings', {})
-    input_pattern = data_settings.get('output_file_pattern', '{name}_cities_filtered.tsv')
+    chart_point_budget = data_settings.get('chart_point_budget', DEFAULT_POINT_BUDGET)
+    data_format = data_settings.get('data_format', DEFAULT_DATA_FORMAT)
+    json_export = data_settings.get('data_json_export', False)
     enabled_metros = [m for m in config.get('metros', []) if m.get('enabled', True)]
 
     if not enabled_metros:
@@ -347,10 +574,11 @@ def main():
             print("[ERROR] Metro config missing required field: name")
             continue
 
-        tsv_file = base_dir / input_pattern.format(name=metro_slug)
-        if not tsv_file.exists():
+        granularity = metro_granularity(data_settings, metro)
+        tsv_file = base_dir / extracted_file_name(data_settings, metro, granularity)
+        if not partition_path(tsv_file).exists() and not tsv_file.exists():
             failed_metros.append(metro_display)
-            print(f"[ERROR] Missing extracted TSV for {metro_display}: {tsv_file}")
+            print(f"[ERROR] Missing extracted data for {metro_display}: {partition_path(tsv_file)}")
             continue
 
         output_dir = base_dir / metro.get('output_directory', metro_slug)
@@ -359,16 +587,16 @@ def main():
             tsv_file=str(tsv_file),
             metro_name=metro_display,
             output_dir=output_dir,
-            lookback_months=12
+            lookback_months=12,
+            chart_point_budget=chart_point_budget,
+            granularity=granularity.name
         )
 
-        period = metro_data['period']
-        output_file = output_dir / period / f"{metro_slug}_data.json"
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_file, 'w') as f:
-            json.dump(metro_data, f, indent=2)
+        output_file, _ = save_metro_data(metro_data, output_dir, metro_slug, data_format, json_export)
+        _, summary_file = write_metro_summary(metro_data, output_file.parent, metro_slug)
 
         print(f"\n[OK] Saved: {output_file}")
+        print(f"[OK] Saved: {summary_file}")
         processed_results.append((metro_display, metro_data))
 
     if failed_metros:
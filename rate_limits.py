@@ -0,0 +1,133 @@
+"""
+Rate Limits
+Client-side request and token budgets for the AI narrative API.
+
+The API enforces requests-per-minute and tokens-per-minute limits per account.
+Instead of firing every metro's request at once and collecting 429s, callers
+reserve a slot from a RateBudget first. A reservation counts the prompt's
+estimated input tokens plus max_tokens against a sliding 60-second window;
+once the response arrives, the reservation is settled to the tokens actually
+used. The budget never blocks by itself: reserve() returns how long to wait,
+so the same budget serves worker threads (time.sleep) and asyncio tasks
+(asyncio.sleep).
+
+Failures worth retrying (429, 5xx/529 overloaded, connection errors) back off
+with full jitter, so concurrent requests that failed together don't retry in
+lockstep. A server-sent Retry-After takes precedence.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+try:
+    import anthropic
+    ANTHROPIC_AVAILABLE = True
+except ImportError:
+    ANTHROPIC_AVAILABLE = False
+
+DEFAULT_REQUESTS_PER_MINUTE = 50
+DEFAULT_TOKENS_PER_MINUTE = 40000
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_BASE_DELAY = 1.0
+DEFAULT_RETRY_MAX_DELAY = 60.0
+
+WINDOW_SECONDS = 60.0
+
+# Jitter source when the caller doesn't pass a seeded Random
+_rng = random.Random()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English prose and tables (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class RateBudget:
+    """Sliding-window requests-per-minute and tokens-per-minute budget."""
+
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests_per_minute = max(1, int(requests_per_minute))
+        self.tokens_per_minute = max(1, int(tokens_per_minute))
+        self.clock = clock
+        self._window: deque = deque()   # [granted at, tokens] per request
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int):
+        """
+        Try to reserve one request of `tokens` tokens.
+
+        Returns:
+            (reservation, 0.0) when granted, or (None, seconds to wait before
+            trying again)
+        """
+        with self._lock:
+            now = self.clock()
+            while self._window and now - self._window[0][0] >= WINDOW_SECONDS:
+                self._window.popleft()
+
+            used = sum(entry[1] for entry in self._window)
+            # A request larger than the whole budget still goes out, alone
+            fits = used + tokens <= self.tokens_per_minute or not self._window
+            if len(self._window) < self.requests_per_minute and fits:
+                reservation = [now, tokens]
+                self._window.append(reservation)
+                return reservation, 0.0
+
+            return None, max(0.01, WINDOW_SECONDS - (now - self._window[0][0]))
+
+    def settle(self, reservation: list, tokens: int):
+        """Replace a reservation's estimate with the tokens the request actually used."""
+        with self._lock:
+            reservation[1] = tokens
+
+
+_budgets: Dict[tuple, RateBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def get_budget(config: dict) -> RateBudget:
+    """Return the process-wide budget for the config's API key and limits."""
+    rpm = int(config.get('requests_per_minute', DEFAULT_REQUESTS_PER_MINUTE))
+    tpm = int(config.get('tokens_per_minute', DEFAULT_TOKENS_PER_MINUTE))
+    key = (config.get('api_key', ''), rpm, tpm)
+    with _budgets_lock:
+        if key not in _budgets:
+            _budgets[key] = RateBudget(rpm, tpm)
+        return _budgets[key]
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate limits, server errors (incl. 529 overloaded) and connection failures."""
+    if not ANTHROPIC_AVAILABLE:
+        return False
+    if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError)):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """The server's Retry-After delay in seconds, if the error carries one."""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def retry_delay(attempt: int, config: dict, error: Optional[Exception] = None,
+                rng: Optional[random.Random] = None) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (0-based), honoring Retry-After."""
+    rng = rng or _rng
+    server_delay = retry_after(error) if error is not None else None
+    if server_delay is not None:
+        return server_delay + rng.uniform(0, 1)
+
+    base = float(config.get('retry_base_delay', DEFAULT_RETRY_BASE_DELAY))
+    cap = float(config.get('retry_max_delay', DEFAULT_RETRY_MAX_DELAY))
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,79 @@
+"""
+Region Granularity
+Which Redfin tracker the pipeline reads and which column names a region in it.
+
+The pipeline was written against the city tracker, where a metro's rows are
+keyed by CITY. Redfin publishes the same columns at zip-code and neighborhood
+level; those rows are keyed by REGION ("Zip Code: 28202", "Charlotte, NC -
+Dilworth"), and CITY is blank or names the enclosing city. Extraction,
+processing and trend building take a Granularity and group by its
+region_column, so a zip-level run produces the same data file (top_cities,
+city_trends, full_city_trends, ...) with one series per zip code.
+
+data_settings.region_granularity picks the level for every metro; a metro's
+own region_granularity overrides it. The source file is data_settings.source_file
+for city granularity and data_settings.tracker_files.<granularity> (default:
+the tracker's file name from fetch_redfin_data.py) otherwise.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from fetch_redfin_data import TRACKER_FILES
+
+DEFAULT_GRANULARITY = 'city'
+
+
+@dataclass(frozen=True)
+class Granularity:
+    """A region level: its tracker, the column naming its regions and display labels.
+
+    `extract_memory_mb` is the streaming extraction cap used when
+    data_settings.extract_memory_mb is unset (None: extract in memory).
+    """
+    name: str
+    region_column: str
+    label: str
+    plural: str
+    extract_memory_mb: Optional[float] = None
+
+
+GRANULARITIES = {
+    'city': Granularity('city', 'CITY', 'City', 'Cities'),
+    # Submarket trackers are several times the size of the city tracker and a
+    # metro has many more regions, so they always stream to disk
+    'zip': Granularity('zip', 'REGION', 'Zip Code', 'Zip Codes', extract_memory_mb=512),
+    'neighborhood': Granularity('neighborhood', 'REGION', 'Neighborhood', 'Neighborhoods', extract_memory_mb=512),
+}
+
+
+def get_granularity(name: Optional[str] = None) -> Granularity:
+    """The Granularity called `name` (default: city)."""
+    name = name or DEFAULT_GRANULARITY
+    if name not in GRANULARITIES:
+        raise ValueError(f"Unknown region_granularity: {name} (choose from {', '.join(GRANULARITIES)})")
+    return GRANULARITIES[name]
+
+
+def metro_granularity(data_settings: dict, metro: Optional[dict] = None) -> Granularity:
+    """A metro's granularity: its own region_granularity, else data_settings'."""
+    name = (metro or {}).get('region_granularity') or data_settings.get('region_granularity')
+    return get_granularity(name)
+
+
+def granularity_source_file(data_settings: dict, granularity: Granularity) -> str:
+    """The tracker file a granularity's rows are extracted from."""
+    if granularity.name == 'city':
+        return data_settings.get('source_file', TRACKER_FILES['city'])
+    return data_settings.get('tracker_files', {}).get(granularity.name, TRACKER_FILES[granularity.name])
+
+
+def extract_memory_mb(data_settings: dict, granularity: Granularity) -> Optional[float]:
+    """Streaming extraction cap: data_settings.extract_memory_mb, else the granularity's default."""
+    return data_settings.get('extract_memory_mb') or granularity.extract_memory_mb
+
+
+def extracted_file_name(data_settings: dict, metro: dict, granularity: Granularity) -> str:
+    """A metro's extraction TSV path from data_settings.output_file_pattern ({name}, {granularity})."""
+    pattern = data_settings.get('output_file_pattern', '{name}_cities_filtered.tsv')
+    return pattern.format(name=metro['name'], granularity=granularity.name)
@@ -0,0 +1,218 @@
+"""
+Report Attachments
+Size-aware planning of market report emails.
+
+Mail servers cap the size of a whole message after encoding, and base64
+inflates attachments by about a third, so an 11 MB dashboard becomes a 15 MB
+part. Instead of sending and retrying when the server rejects the message,
+the planner encodes each attachment once, checks each candidate message
+against the limit, and sends the first one that fits:
+
+1. full      - dashboard HTML (plus the summary JSON, if enabled) as-is
+2. archive   - the same files in one .zip (dashboards compress ~10x)
+3. truncated - a dashboard rendered from the last `email_dashboard_months`
+               months of history, zipped
+4. link      - no dashboard; the body links to a hosted copy under
+               `dashboard_base_url` (only when configured)
+5. no_dashboard, then body_only - without the dashboard, then without any
+               attachment
+
+The limit is `smtp_max_message_bytes` when configured. Otherwise it is the
+SIZE the server advertises in its EHLO reply, capped at 25 MB. The server is
+asked at most once per pool, and a failed probe is not retried.
+"""
+
+import io
+import os
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from data_artifact import load_metro_data
+
+DEFAULT_MAX_MESSAGE_BYTES = 25 * 1024 * 1024
+DEFAULT_DASHBOARD_MONTHS = 36
+
+# Allowance for headers and MIME boundaries when estimating before flattening
+ENVELOPE_ALLOWANCE = 16 * 1024
+
+
+@dataclass
+class ReportVariant:
+    """One candidate shape of a report email."""
+    name: str
+    parts: List[MIMEBase] = field(default_factory=list)
+    dashboard_attached: bool = False
+    dashboard_note: str = ''
+    dashboard_link: Optional[str] = None
+
+
+@dataclass
+class MessagePlan:
+    """The message chosen by plan_report_message, flattened and ready to send."""
+    variant: str
+    message: bytes
+    size: int
+    limit: int
+    dashboard_attached: bool = False
+
+
+def message_size_limit(config: dict, pool=None) -> int:
+    """The configured size limit, or the server's advertised SIZE (at most the default) when none is set."""
+    if config.get('smtp_max_message_bytes'):
+        return int(config['smtp_max_message_bytes'])
+
+    limit = DEFAULT_MAX_MESSAGE_BYTES
+    if pool is not None:
+        try:
+            advertised = pool.advertised_size()
+        except Exception as e:
+            print(f"    [WARN] Could not read server size limit ({e}); using {limit:,} bytes")
+            advertised = None
+        if advertised:
+            limit = min(limit, advertised)
+    return limit
+
+
+def encode_attachment(filename: str, data: bytes) -> MIMEBase:
+    """Base64-encode an attachment once; the part can be shared between messages."""
+    part = MIMEBase('application', 'octet-stream')
+    part.set_payload(data)
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', f'attachment; filename="{filename}"')
+    return part
+
+
+def build_message(config: dict, subject: str, html_body: str, text_body: str,
+                  parts: Optional[List[MIMEBase]] = None) -> MIMEMultipart:
+    """Assemble a report email from its bodies and already-encoded attachment parts."""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = config['from_address'] or config['smtp_user']
+    msg['To'] = ', '.join(config['recipients'])
+
+    msg.attach(MIMEText(text_body, 'plain'))
+    msg.attach(MIMEText(html_body, 'html'))
+    for part in parts or []:
+        msg.attach(part)
+    return msg
+
+
+def zip_files(files: Dict[str, bytes]) -> bytes:
+    """Deflate named file contents into an in-memory zip archive."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def render_truncated_dashboard(data_file: Path, months: int) -> bytes:
+    """Render a metro's dashboard from only the last `months` months of history."""
+    from generate_dashboards_v2 import generate_enhanced_dashboard, truncate_history
+
+    data = load_metro_data(data_file)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_file = Path(tmp) / 'dashboard.html'
+        generate_enhanced_dashboard(str(data_file), str(output_file), data=truncate_history(data, months))
+        return output_file.read_bytes()
+
+
+def _variants(config: dict, dashboard_file: Optional[Path], data_file: Optional[Path],
+              extra_files: List[Path], dashboard_url: Optional[str]):
+    """Yield candidate variants, largest first, building each only when it's needed."""
+    extras = {Path(p).name: Path(p).read_bytes() for p in extra_files}
+    extra_parts = [encode_attachment(name, data) for name, data in extras.items()]
+
+    if dashboard_file is not None:
+        dashboard = dashboard_file.read_bytes()
+        yield ReportVariant('full', [encode_attachment(dashboard_file.name, dashboard)] + extra_parts, True)
+
+        archive_name = f"{dashboard_file.stem}.zip"
+        yield ReportVariant(
+            'archive', [encode_attachment(archive_name, zip_files({dashboard_file.name: dashboard, **extras}))], True,
+            dashboard_note="The dashboard is zipped to fit the email size limit; unzip it before opening."
+        )
+
+        if data_file is not None and data_file.exists():
+            months = int(config.get('email_dashboard_months', DEFAULT_DASHBOARD_MONTHS))
+            truncated = render_truncated_dashboard(data_file, months)
+            yield ReportVariant(
+                'truncated', [encode_attachment(archive_name, zip_files({dashboard_file.name: truncated, **extras}))],
+                True,
+                dashboard_note=(f"To fit the email size limit, this copy covers the last {months} months "
+                                f"of history; unzip it before opening.")
+            )
+
+        if dashboard_url:
+            yield ReportVariant('link', extra_parts, dashboard_link=dashboard_url)
+
+    if extra_parts:
+        yield ReportVariant('no_dashboard', extra_parts)
+    yield ReportVariant('body_only', [])
+
+
+def plan_report_message(
+    config: dict,
+    subject: str,
+    render_bodies: Callable[[ReportVariant], tuple],
+    dashboard_file: Optional[Path] = None,
+    data_file: Optional[Path] = None,
+    extra_files: Optional[List[Path]] = None,
+    dashboard_url: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> MessagePlan:
+    """
+    Pick the largest report variant whose encoded message fits the size limit.
+
+    Args:
+        render_bodies: Returns (html_body, text_body) for a variant, so the
+            body can describe how the dashboard is delivered
+        dashboard_file: Dashboard HTML to attach, if any
+        data_file: The metro's data file (see data_artifact.py), used to render a shorter dashboard
+        extra_files: Other attachments (e.g. the summary JSON)
+        dashboard_url: Link to a hosted copy of the dashboard
+        limit: Size limit in bytes (default: message_size_limit(config))
+
+    Returns:
+        The chosen MessagePlan; the smallest variant if nothing fits
+    """
+    if limit is None:
+        limit = message_size_limit(config)
+
+    plan = None
+    for variant in _variants(config, dashboard_file, data_file, extra_files or [], dashboard_url):
+        # Encoded parts already know their size; only flatten candidates that could fit
+        estimate = sum(len(part.get_payload()) for part in variant.parts) + ENVELOPE_ALLOWANCE
+        if estimate > limit and variant.parts:
+            print(f"    [SKIP] {variant.name}: ~{estimate / 1024 / 1024:.1f} MB exceeds {limit / 1024 / 1024:.1f} MB")
+            continue
+
+        html_body, text_body = render_bodies(variant)
+        message = build_message(config, subject, html_body, text_body, variant.parts).as_bytes()
+        plan = MessagePlan(variant.name, message, len(message), limit, variant.dashboard_attached)
+        if plan.size <= limit:
+            return plan
+        print(f"    [SKIP] {variant.name}: {plan.size / 1024 / 1024:.1f} MB exceeds {limit / 1024 / 1024:.1f} MB")
+
+    assert plan is not None  # body_only is always built
+    return plan
+
+
+def dashboard_link(config: dict, base_dir: Path, dashboard_file: Path) -> Optional[str]:
+    """URL of a dashboard under `dashboard_base_url`, mirroring its path below base_dir."""
+    base_url = config.get('dashboard_base_url', '')
+    if not base_url:
+        return None
+    try:
+        relative = Path(dashboard_file).resolve().relative_to(Path(base_dir).resolve())
+    except ValueError:
+        relative = Path(os.path.basename(dashboard_file))
+    return f"{base_url.rstrip('/')}/{relative.as_posix()}"
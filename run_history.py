@@ -0,0 +1,321 @@
+"""
+Run History
+SQLite record of pipeline runs, used to spot performance regressions as the
+Redfin source file grows.
+
+Every run of run_market_analysis.py / run_scheduled.py adds one row to `runs`
+and one row per task to `task_metrics`, holding the task's wall time, CPU time,
+peak RSS, rows read, rows kept, bytes written and, for streamed AI narratives,
+time to first byte. The database lives at .pipeline/run_history.db.
+
+Peak RSS is the process high-water mark when the task finished (the largest
+child process for --isolated runs), so with several workers it bounds rather
+than isolates one task's memory. It is not recorded on Windows, where the
+`resource` module is unavailable.
+
+Usage:
+    python run_history.py                    # Trends over the last 10 runs
+    python run_history.py --runs 20          # Widen the window
+    python run_history.py --threshold 0.5    # Flag tasks 50%+ worse than baseline
+"""
+
+import json
+import sqlite3
+import statistics
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+DEFAULT_DB_PATH = Path('.pipeline') / 'run_history.db'
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPORT_RUNS = 10
+
+METRIC_COLUMNS = ['wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows_read', 'rows_kept', 'bytes_written',
+                  'first_byte_seconds']
+
+# Metrics checked for regressions, with the baseline below which changes are noise
+REGRESSION_FLOORS = {'wall_seconds': 0.5, 'cpu_seconds': 0.5, 'peak_rss_mb': 50.0, 'bytes_written': 1024}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    runner TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    success INTEGER NOT NULL,
+    wall_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS task_metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    stage TEXT NOT NULL,
+    metro TEXT NOT NULL,
+    status TEXT NOT NULL,
+    wall_seconds REAL,
+    cpu_seconds REAL,
+    peak_rss_mb REAL,
+    rows_read INTEGER,
+    rows_kept INTEGER,
+    bytes_written INTEGER,
+    first_byte_seconds REAL,
+    output TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_task_metrics_stage ON task_metrics(stage, metro, run_id);
+"""
+
+
+# ========== RESOURCE USAGE ==========
+
+def _rss_mb(maxrss: int) -> float:
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    return round(maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process or its largest child, in MB."""
+    if not RESOURCE_AVAILABLE:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return _rss_mb(max(own, children))
+
+
+def child_cpu_seconds() -> float:
+    """User + system CPU time of finished child processes (0 where unavailable)."""
+    if not RESOURCE_AVAILABLE:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+# ========== DATABASE ==========
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """Open the history database, creating it if needed."""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    # Databases created before a metric column existed get it added
+    existing = {row['name'] for row in conn.execute("PRAGMA table_info(task_metrics)")}
+    for column in METRIC_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE task_metrics ADD COLUMN {column} REAL")
+    return conn
+
+
+def record_run(db_path: Path, runner: str, started_at: str, finished_at: str, success: bool,
+               task_metrics: Dict[str, dict], wall_seconds: Optional[float] = None) -> int:
+    """
+    Store one run and its task metrics.
+
+    Args:
+        task_metrics: {task key: {'stage', 'metro', 'status', <METRIC_COLUMNS>, 'output'}}
+            as filled in by pipeline_runner.run_pipeline(metrics=...)
+
+    Returns:
+        The new run id
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (runner, started_at, finished_at, success, wall_seconds) VALUES (?, ?, ?, ?, ?)",
+                (runner, started_at, finished_at, int(bool(success)), wall_seconds)
+            )
+            run_id = cursor.lastrowid
+            assert run_id is not None  # always set after an INSERT
+            conn.executemany(
+                f"INSERT INTO task_metrics (run_id, stage, metro, status, {', '.join(METRIC_COLUMNS)}, output) "
+                f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in METRIC_COLUMNS)}, ?)",
+                [
+                    (run_id, m['stage'], m.get('metro') or '', m['status'],
+                     *[m.get(col) for col in METRIC_COLUMNS], m.get('output'))
+                    for m in task_metrics.values()
+                ]
+            )
+        return run_id
+    finally:
+        conn.close()
+
+
+def recent_runs(conn: sqlite3.Connection, limit: int) -> List[sqlite3.Row]:
+    """The last `limit` runs, oldest first."""
+    rows = conn.execute("SELECT * FROM runs ORDER BY run_id DESC LIMIT ?", (limit,)).fetchall()
+    return list(reversed(rows))
+
+
+def find_regressions(db_path: Path, threshold: float = DEFAULT_THRESHOLD,
+                     runs: int = DEFAULT_REPORT_RUNS) -> List[dict]:
+    """
+    Compare each task's latest completed run with the median of its earlier runs.
+
+    Only tasks that actually ran (status 'ok') count; skipped and failed tasks
+    are ignored. A metric regresses when it exceeds the baseline by more than
+    `threshold` (0.25 = 25%) and the baseline is above its noise floor.
+
+    Returns:
+        [{'stage', 'metro', 'metric', 'baseline', 'latest', 'change'}]
+    """
+    conn = connect(db_path)
+    try:
+        run_ids = [r['run_id'] for r in recent_runs(conn, runs)]
+        if len(run_ids) < 2:
+            return []
+
+        placeholders = ', '.join('?' for _ in run_ids)
+        rows = conn.execute(
+            f"SELECT * FROM task_metrics WHERE status = 'ok' AND run_id IN ({placeholders}) ORDER BY run_id",
+            run_ids
+        ).fetchall()
+    finally:
+        conn.close()
+
+    history: Dict[tuple, List[sqlite3.Row]] = {}
+    for row in rows:
+        history.setdefault((row['stage'], row['metro']), []).append(row)
+
+    regressions = []
+    for (stage, metro), task_rows in sorted(history.items()):
+        latest, earlier = task_rows[-1], task_rows[:-1]
+        if not earlier:
+            continue
+        for metric, floor in REGRESSION_FLOORS.items():
+            values = [r[metric] for r in earlier if r[metric] is not None]
+            if not values or latest[metric] is None:
+                continue
+            baseline = statistics.median(values)
+            if baseline < floor:
+                continue
+            change = latest[metric] / baseline - 1
+            if change > threshold:
+                regressions.append({
+                    'stage': stage, 'metro': metro, 'metric': metric,
+                    'baseline': baseline, 'latest': latest[metric], 'change': change,
+                })
+    return regressions
+
+
+def format_regression(r: dict) -> str:
+    """One-line description of a regression."""
+    task = f"{r['stage']}:{r['metro']}" if r['metro'] else r['stage']
+    return (f"{task} {r['metric']} {r['baseline']:.2f} -> {r['latest']:.2f} "
+            f"(+{r['change']:.0%})")
+
+
+# ========== REPORT ==========
+
+def print_report(db_path: Path, runs: int = DEFAULT_REPORT_RUNS, threshold: float = DEFAULT_THRESHOLD):
+    """Print recent runs, per-stage trends and any regressions."""
+    conn = connect(db_path)
+    try:
+        run_rows = recent_runs(conn, runs)
+        if not run_rows:
+            print("[INFO] No runs recorded yet")
+            return
+
+        print("=" * 70)
+        print(f"RUN HISTORY (last {len(run_rows)} run(s))")
+        print("=" * 70)
+        for run in run_rows:
+            status = 'OK' if run['success'] else 'FAILED'
+            wall = f"{run['wall_seconds']:.1f}s" if run['wall_seconds'] is not None else '-'
+            print(f"  #{run['run_id']:<5} {run['started_at'][:19]}  {run['runner']:<20} {status:<7} {wall}")
+
+        run_ids = [r['run_id'] for r in run_rows]
+        placeholders = ', '.join('?' for _ in run_ids)
+        stage_rows = conn.execute(
+            f"""SELECT run_id, stage,
+                       SUM(wall_seconds) AS wall, SUM(cpu_seconds) AS cpu, MAX(peak_rss_mb) AS rss,
+                       SUM(rows_read) AS rows_read, SUM(bytes_written) AS bytes_written,
+                       MAX(first_byte_seconds) AS first_byte
+                FROM task_metrics WHERE status = 'ok' AND run_id IN ({placeholders})
+                GROUP BY run_id, stage ORDER BY stage, run_id""",
+            run_ids
+        ).fetchall()
+    finally:
+        conn.close()
+
+    print("\nSTAGE TRENDS (tasks that ran; oldest -> newest)")
+    trends: Dict[str, List[sqlite3.Row]] = {}
+    for row in stage_rows:
+        trends.setdefault(row['stage'], []).append(row)
+    for stage, rows in trends.items():
+        walls = ' '.join(f"{r['wall']:.1f}" for r in rows)
+        latest = rows[-1]
+        extra = []
+        if latest['cpu'] is not None:
+            extra.append(f"cpu {latest['cpu']:.1f}s")
+        if latest['rss'] is not None:
+            extra.append(f"rss {latest['rss']:.0f}MB")
+        if latest['rows_read'] is not None:
+            extra.append(f"rows {latest['rows_read']:,}")
+        if latest['bytes_written'] is not None:
+            extra.append(f"{latest['bytes_written'] / 1024:,.0f}KB written")
+        if latest['first_byte'] is not None:
+            extra.append(f"first byte {latest['first_byte']:.2f}s")
+        print(f"  {stage:<22} wall(s): {walls}")
+        if extra:
+            print(f"  {'':<22} latest: {', '.join(extra)}")
+
+    regressions = find_regressions(db_path, threshold, runs)
+    print(f"\nREGRESSIONS (>{threshold:.0%} over median of earlier runs)")
+    if regressions:
+        for r in regressions:
+            print(f"  [WARN] {format_regression(r)}")
+    else:
+        print("  None")
+
+
+def load_threshold(base_dir: Path) -> float:
+    """pipeline_settings.regression_threshold from metro_config.json, or the default."""
+    config_file = Path(base_dir) / 'metro_config.json'
+    if config_file.exists():
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+        return config.get('pipeline_settings', {}).get('regression_threshold', DEFAULT_THRESHOLD)
+    return DEFAULT_THRESHOLD
+
+
+def record_pipeline_run(base_dir: Path, runner: str, started_at: str, finished_at: str, success: bool,
+                        task_metrics: Dict[str, dict], wall_seconds: float) -> List[dict]:
+    """
+    Record a finished run in the repo's history database and check it for regressions.
+
+    Returns:
+        Regressions involving tasks that ran in this run (see find_regressions)
+    """
+    db_path = Path(base_dir) / DEFAULT_DB_PATH
+    record_run(db_path, runner, started_at, finished_at, success, task_metrics, wall_seconds)
+
+    ran = {(m['stage'], m.get('metro') or '') for m in task_metrics.values() if m['status'] == 'ok'}
+    return [r for r in find_regressions(db_path, load_threshold(base_dir)) if (r['stage'], r['metro']) in ran]
+
+
+def main():
+    """Command-line entry point."""
+    base_dir = Path(__file__).parent
+    runs = DEFAULT_REPORT_RUNS
+    threshold = load_threshold(base_dir)
+
+    try:
+        if '--runs' in sys.argv:
+            runs = int(sys.argv[sys.argv.index('--runs') + 1])
+        if '--threshold' in sys.argv:
+            threshold = float(sys.argv[sys.argv.index('--threshold') + 1])
+    except (IndexError, ValueError):
+        print("[ERROR] Usage: python run_history.py [--runs N] [--threshold FRACTION]")
+        return 1
+
+    print_report(base_dir / DEFAULT_DB_PATH, runs, threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,61 +2,93 @@
 Master Automation Script for Real Estate Market Analysis
 Runs the complete pipeline: Metro Extraction -> Data Processing -> Dashboard Generation
 
+Stages run in-process by default and pass their results to each other in memory
+(see pipeline_runner.py).
+
+Stages whose inputs, code and config are unchanged since their last successful
+run are skipped (fingerprints live in .pipeline/fingerprints.json).
+
+Each run's per-stage timings, memory and row counts are stored in
+.pipeline/run_history.db; `python run_history.py` reports trends and
+regressions.
+
+Usage:
+    python run_market_analysis.py                       # In-process run
+    python run_market_analysis.py --isolated            # Run each stage script in its own subprocess
+    python run_market_analysis.py --force-stage NAME    # Rerun NAME and everything downstream
+
 For automated/scheduled runs with notifications, use run_scheduled.py instead.
 """
 
-import subprocess
+import sqlite3
 import sys
+import time
+from datetime import datetime
 from pathlib import Path
 
-def run_script(script_name):
-    """Run a Python script and check for errors"""
-    print(f"\n{'='*60}")
-    print(f"RUNNING: {script_name}")
-    print('='*60)
+from pipeline_runner import (
+    ANALYSIS_STAGES, StageError, load_fingerprint_store, load_pipeline_context, parse_force_stages, run_pipeline
+)
+from run_history import format_regression, record_pipeline_run
 
-    result = subprocess.run(
-        [sys.executable, script_name],
-        capture_output=False,
-        text=True
-    )
 
-    if result.returncode != 0:
-        print(f"\n[ERROR] {script_name} failed with return code {result.returncode}")
-        sys.exit(1)
+def save_run_history(base_dir, started_at, start, success, metrics):
+    """Store this run's task metrics and print any regressions."""
+    try:
+        regressions = record_pipeline_run(
+            base_dir, 'run_market_analysis', started_at, datetime.now().isoformat(), success,
+            metrics, round(time.perf_counter() - start, 2)
+        )
+    except (sqlite3.Error, OSError) as e:
+        print(f"[WARN] Could not record run history: {e}")
+        return
+    for regression in regressions:
+        print(f"[WARN] Regression: {format_regression(regression)}")
 
-    print(f"\n[OK] {script_name} completed successfully")
-    return result.returncode
 
 def main():
     """Run the complete market analysis pipeline"""
 
     base_dir = Path(__file__).parent
+    isolated = '--isolated' in sys.argv
 
     print("\n" + "="*60)
     print("REAL ESTATE MARKET ANALYSIS PIPELINE")
     print("="*60)
 
-    # Step 1: Extract metros from raw TSV file
-    run_script(str(base_dir / 'extract_metros.py'))
-
-    # Step 2: Process market data
-    run_script(str(base_dir / 'process_market_data.py'))
-
-    # Step 3: Generate enhanced dashboards
-    run_script(str(base_dir / 'generate_dashboards_v2.py'))
+    # Extract -> process + summaries -> dashboards
+    started_at = datetime.now().isoformat()
+    start = time.perf_counter()
+    metrics = {}
+    try:
+        force_stages = parse_force_stages(sys.argv)
+        ctx = load_pipeline_context(base_dir)
+        results = run_pipeline(
+            ANALYSIS_STAGES, ctx,
+            isolated=isolated,
+            store=load_fingerprint_store(base_dir),
+            force_stages=force_stages,
+            metrics=metrics
+        )
+    except (StageError, FileNotFoundError, ValueError) as e:
+        print(f"\n[ERROR] {e}")
+        if metrics:
+            save_run_history(base_dir, started_at, start, False, metrics)
+        sys.exit(1)
 
-    # Step 4: Extract summaries with strategic analysis
-    run_script(str(base_dir / 'extract_summary.py'))
+    save_run_history(base_dir, started_at, start, True, metrics)
 
     print("\n" + "="*60)
     print("[OK] PIPELINE COMPLETE!")
     print("="*60)
+    for stage_name, stage_result in results.items():
+        status = 'up to date' if stage_result.get('skipped') else f"{stage_result['seconds']:.2f}s"
+        print(f"  {stage_name}: {status}")
     print("\nExtracted Files:")
-    print("  - charlotte_cities_filtered.tsv")
-    print("  - roanoke_cities_filtered.tsv")
+    print("  - charlotte_cities_filtered.npz")
+    print("  - roanoke_cities_filtered.npz")
     print("\nGenerated Files (in {metro}/{period}/ folders):")
-    print("  - {metro}_data.json          (full data with 12-month trends)")
+    print("  - {metro}_data.npz           (full data with 12-month trends; see data_artifact.py)")
     print("  - dashboard_enhanced_{metro}_{period}.html (interactive dashboard)")
     print("  - {metro}_summary.json       (strategic analysis + recommendations)")
     print("\nAdditional Commands:")
@@ -64,6 +96,7 @@ def main():
     print("  python ai_narrative.py       - Generate AI market narratives")
     print("  python email_reports.py      - Send market reports via email")
     print("  python run_scheduled.py      - Full automated run with notifications")
+    print("  python run_history.py        - Stage timing trends and regressions")
     print("\nTo add new metros:")
     print("  1. Edit metro_config.json to add new metro definitions")
     print("  2. Re-run this pipeline")
@@ -14,6 +14,32 @@ Usage:
     python run_scheduled.py --no-notify  # Skip notifications
     python run_scheduled.py --no-ai      # Skip AI narrative generation
     python run_scheduled.py --dry-run    # Simulate without executing
+    python run_scheduled.py --isolated   # Run each analysis stage in its own subprocess
+    python run_scheduled.py --force-stage process_data   # Rerun a stage and everything downstream
+    python run_scheduled.py --resume     # Continue the last incomplete run
+
+Analysis stages whose inputs, code and config are unchanged since their last
+successful run are skipped (see stage_cache.py).
+
+Each task's status is saved to .pipeline/run_state.json as the run goes. With
+--resume, tasks that completed in the last (failed or interrupted) run are
+reused once their outputs pass a checksum check, including the data fetch and
+any report emails already sent (see run_state.py).
+
+Report emails and the status notification are queued in .pipeline/outbox/ and
+delivered by a background worker, so the pipeline never waits on SMTP. Each
+report is sent at most once per metro and period, even across reruns; failed
+deliveries are retried and then dead-lettered (see outbox.py).
+
+With ai_narrative.batch_mode, narratives are submitted as one batch job after
+the analysis stages instead of one request per metro, and the run doesn't wait
+for it; the next run saves the finished batch (see narrative_batch.py). Each
+report email is held until its metro's narrative is saved, so it goes out
+from the run that collects the batch, with the narrative.
+
+Per-stage timings, CPU, memory and row counts for every run go to
+.pipeline/run_history.db; regressions are logged at the end of the run and
+`python run_history.py` reports trends.
 
 Windows Task Scheduler Setup:
     schtasks /create /tn "RedfinMarketAnalysis" /tr "python C:\\path\\to\\run_scheduled.py" /sc monthly /d SAT /mo THIRD
@@ -25,11 +51,21 @@ Linux/Mac Cron (third Saturday at 9 AM):
 import os
 import sys
 import json
+import sqlite3
 import subprocess
+import time
 from datetime import datetime
 from pathlib import Path
 import traceback
 
+from pipeline_runner import (
+    ANALYSIS_STAGES, EMAIL_STAGE, NARRATIVE_STAGE, REPORT_HELD, load_fingerprint_store, load_pipeline_context,
+    parse_force_stages, run_pipeline, stage_email, succeeded_metros
+)
+from outbox import DEFAULT_FLUSH_TIMEOUT, Outbox, OutboxWorker
+from run_history import format_regression, record_pipeline_run
+from run_state import DEFAULT_STATE_PATH, RunState
+
 
 def log_message(message, log_file=None):
     """Log message to console and optionally to file."""
@@ -42,9 +78,9 @@ def log_message(message, log_file=None):
             f.write(formatted + '\n')
 
 
-def load_schedule_config():
+def load_schedule_config(base_dir=None):
     """Load schedule configuration."""
-    base_dir = Path(__file__).parent
+    base_dir = base_dir or Path(__file__).parent
     config_file = base_dir / 'notifications_config.json'
 
     config = {
@@ -63,17 +99,18 @@ def load_schedule_config():
     return config
 
 
-def run_script(script_name, log_file=None, dry_run=False):
-    """Run a Python script and capture results."""
-    log_message(f"Running: {script_name}", log_file)
+def run_script(script_name, *args, log_file=None, dry_run=False):
+    """Run a Python script (with any extra command-line args) and capture results."""
+    command = ' '.join([script_name, *args])
+    log_message(f"Running: {command}", log_file)
 
     if dry_run:
-        log_message(f"  [DRY-RUN] Would execute: python {script_name}", log_file)
+        log_message(f"  [DRY-RUN] Would execute: python {command}", log_file)
         return True, "Dry run - skipped"
 
     try:
         result = subprocess.run(
-            [sys.executable, script_name],
+            [sys.executable, script_name, *args],
             capture_output=True,
             text=True,
             timeout=1800  # 30 minute timeout
@@ -134,6 +171,24 @@ def get_processed_metros(base_dir):
     return [m['display_name'] for m in metro_config.get('metros', []) if m.get('enabled', True)]
 
 
+def submarket_trackers(base_dir):
+    """Zip-code / neighborhood trackers the enabled metros read (see region_granularity.py)."""
+    from region_granularity import metro_granularity
+
+    metro_config_file = base_dir / 'metro_config.json'
+    if not metro_config_file.exists():
+        return []
+
+    with open(metro_config_file, 'r') as f:
+        metro_config = json.load(f)
+
+    data_settings = metro_config.get('data_settings', {})
+    names = {
+        metro_granularity(data_settings, m).name for m in metro_config.get('metros', []) if m.get('enabled', True)
+    }
+    return sorted(names - {'city'})
+
+
 def get_enabled_metro_configs(base_dir):
     """Get enabled metro configs with normalized fields for downstream steps."""
     metro_config_file = base_dir / 'metro_config.json'
@@ -161,7 +216,97 @@ def get_enabled_metro_configs(base_dir):
     return normalized
 
 
-def run_scheduled_pipeline(skip_fetch=False, skip_notify=False, skip_ai=False, dry_run=False):
+def collect_batches(base_dir, ai_config, log_file=None):
+    """Save narratives from batches that finished after an earlier run exited."""
+    from narrative_batch import collect_narrative_batches, pending_batches
+
+    if not pending_batches(base_dir):
+        return
+    log_message("\n[OPTIONAL] Checking submitted narrative batches...", log_file)
+    try:
+        totals = collect_narrative_batches(ai_config, base_dir, log=lambda msg: log_message(msg, log_file))
+        for failure in totals['failed']:
+            log_message(f"  [WARN] Batch narrative failed: {failure}", log_file)
+    except Exception as e:
+        log_message(f"  [WARN] Could not check narrative batches: {str(e)}", log_file)
+
+
+def submit_batch(base_dir, ctx, log_file=None):
+    """Submit narratives for every metro with a summary as one batch; returns the step result."""
+    from ai_narrative import load_metro_inputs
+    from narrative_batch import submit_narrative_batch
+
+    log_message("\n[OPTIONAL] Submitting AI narrative batch...", log_file)
+    jobs = []
+    for metro in ctx.metros:
+        inputs = load_metro_inputs(metro['name'], base_dir / metro.get('output_directory', metro['name']))
+        if inputs is not None:
+            jobs.append((metro['name'], *inputs))
+
+    try:
+        batch_id = submit_narrative_batch(jobs, ctx.ai_config, base_dir)
+    except Exception as e:
+        log_message(f"  [ERROR] Batch submission failed: {str(e)}", log_file)
+        return {'success': False, 'output': str(e)[:500]}
+
+    if batch_id is None:
+        return {'success': True, 'output': 'Nothing to submit (cached or already in a pending batch)'}
+    log_message(f"  [OK] Batch {batch_id} submitted; narratives are saved by the next run", log_file)
+    return {'success': True, 'output': f"Batch {batch_id} submitted ({len(jobs)} metros)"}
+
+
+def send_held_reports(ctx, steps, log_file=None):
+    """Queue the batch-mode reports held this run whose narrative has since been saved (e.g. from the cache)."""
+    report_tasks = steps.get('email_report', {}).get('metros', {})
+    for metro in ctx.metros:
+        result = report_tasks.get(metro['name'])
+        if result is None or result['output'] != REPORT_HELD:
+            continue
+        try:
+            output = stage_email(ctx, metro)
+        except Exception as e:
+            log_message(f"  [WARN] Market report email - {metro.get('display_name', metro['name'])} failed: {e}", log_file)
+            result.update(success=False, output=str(e)[:500])
+            continue
+        result['output'] = output
+        if output != REPORT_HELD:
+            log_message(f"  [OK] Market report email - {metro.get('display_name', metro['name'])}: {output}", log_file)
+
+
+def start_outbox(base_dir, email_config, log_file=None):
+    """Open the email outbox and start its background delivery worker."""
+    from email_reports import outbox_sender
+
+    outbox = Outbox.from_config(base_dir, email_config)
+    worker = OutboxWorker(
+        outbox, outbox_sender(email_config),
+        max_workers=int(email_config.get('smtp_max_sessions', 1)),
+        log=lambda msg: log_message(msg, log_file)
+    ).start()
+    return outbox, worker
+
+
+def stop_outbox(worker, email_config, log_file=None):
+    """Let the worker flush what is due (bounded by outbox_flush_timeout), then log delivery totals."""
+    timeout = float(email_config.get('outbox_flush_timeout', DEFAULT_FLUSH_TIMEOUT))
+    left = worker.stop(timeout)
+
+    outcomes = list(worker.outcomes.values())
+    dead = len(worker.outbox.dead_records())
+    log_message(
+        f"  Outbox: delivered={outcomes.count('sent')}, pending={left}, dead={dead}",
+        log_file
+    )
+    if left:
+        log_message("  [WARN] Undelivered messages stay queued for the next run (python outbox.py --drain)", log_file)
+    if dead:
+        log_message("  [WARN] Dead letters need attention (python outbox.py; --retry-dead to requeue)", log_file)
+    if not left and not dead:
+        log_message("  [OK] Notifications sent", log_file)
+
+
+def run_scheduled_pipeline(skip_fetch=False, skip_notify=False, skip_ai=False, dry_run=False, isolated=False,
+                           force_stages=(), resume=False, base_dir=None):
     """
     Run the complete scheduled pipeline.
 
@@ -170,14 +315,22 @@ def run_scheduled_pipeline(skip_fetch=False, skip_notify=False, skip_ai=False, d
         skip_notify: Skip email notifications
         skip_ai: Skip AI narrative generation
         dry_run: Simulate without executing
+        isolated: Run each analysis stage script in its own subprocess
+        force_stages: Stage names to rerun (with everything downstream) even if up to date
+        resume: Reuse tasks that completed in the last incomplete run
+        base_dir: Repo folder with metro_config.json and the stage scripts (default: this script's folder)
 
     Returns:
         dict with execution results
     """
-    base_dir = Path(__file__).parent
-    config = load_schedule_config()
+    base_dir = Path(base_dir) if base_dir else Path(__file__).parent
+    config = load_schedule_config(base_dir)
     log_file = str(base_dir / config['log_file'])
-    metro_configs = get_enabled_metro_configs(base_dir)
+    email_config = None
+    outbox = None
+    outbox_worker = None
+    metrics = {}
+    start = time.perf_counter()
 
     results = {
         'success': False,
@@ -196,100 +349,135 @@ def run_scheduled_pipeline(skip_fetch=False, skip_notify=False, skip_ai=False, d
     if dry_run:
         log_message("[MODE] Dry run - no actual execution", log_file)
 
+    # One store for the run: run state checksums and stage fingerprints share its hash cache
+    store = load_fingerprint_store(base_dir)
+
+    # Dry runs leave the last run's state alone so it can still be resumed
+    run_state = None
+    if not dry_run:
+        run_state = RunState.start(
+            base_dir / DEFAULT_STATE_PATH, base_dir, resume=resume,
+            options={'skip_fetch': skip_fetch, 'skip_notify': skip_notify, 'skip_ai': skip_ai, 'isolated': isolated},
+            store=store
+        )
+        if run_state.previous:
+            log_message(f"[MODE] Resuming last run ({len(run_state.previous)} task(s) recorded)", log_file)
+        elif resume:
+            log_message("[MODE] No incomplete run to resume, starting fresh", log_file)
+
     try:
         # Step 1: Fetch Redfin Data
-        if not skip_fetch:
-            log_message("\n[STEP 1/5] Fetching Redfin data...", log_file)
+        data_file = base_dir / 'city_market_tracker.tsv000.gz'
+        if not skip_fetch and run_state is not None and run_state.can_reuse('fetch_data'):
+            log_message("\n[STEP 1/4] Data fetch completed in the previous run", log_file)
+            run_state.carry_over('fetch_data')
+            results['steps']['fetch_data'] = {'success': True, 'output': 'Completed in previous run', 'skipped': True}
+        elif not skip_fetch:
+            log_message("\n[STEP 1/4] Fetching Redfin data...", log_file)
+            fetch_start = time.perf_counter()
             success, output = run_module_function(
                 'fetch_redfin_data', 'fetch_redfin_data',
                 log_file=log_file, dry_run=dry_run
             )
             results['steps']['fetch_data'] = {'success': success, 'output': str(output)[:500]}
+            metrics['fetch_data'] = {
+                'stage': 'fetch_data', 'status': 'ok' if success else 'failed', 'output': str(output)[:500],
+                'wall_seconds': round(time.perf_counter() - fetch_start, 2),
+                'bytes_written': data_file.stat().st_size if success and data_file.exists() else None,
+            }
+            if run_state is not None:
+                if success:
+                    run_state.mark('fetch_data', 'succeeded', [data_file], output)
+                else:
+                    run_state.mark('fetch_data', 'failed', output=output)
 
             if not success and not dry_run:
                 # Check if we can continue with existing data
-                data_file = base_dir / 'city_market_tracker.tsv000.gz'
                 if data_file.exists():
                     log_message("  [WARN] Fetch failed but existing data found, continuing...", log_file)
                 else:
                     results['errors'].append("Data fetch failed and no existing data")
                     raise Exception("Cannot continue without data file")
+
+            # Submarket trackers; a metro whose tracker is missing fails at extraction
+            for tracker in submarket_trackers(base_dir):
+                tracker_ok, tracker_output = run_module_function(
+                    'fetch_redfin_data', 'fetch_redfin_data', tracker=tracker,
+                    log_file=log_file, dry_run=dry_run
+                )
+                if not tracker_ok:
+                    log_message(f"  [WARN] {tracker} tracker fetch failed: {str(tracker_output)[:200]}", log_file)
         else:
-            log_message("\n[STEP 1/5] Skipping data fetch (--no-fetch)", log_file)
+            log_message("\n[STEP 1/4] Skipping data fetch (--no-fetch)", log_file)
             results['steps']['fetch_data'] = {'success': True, 'output': 'Skipped'}
 
-        # Step 2: Extract Metros
-        log_message("\n[STEP 2/5] Extracting metro data...", log_file)
-        success, output = run_script(
-            str(base_dir / 'extract_metros.py'),
-            log_file=log_file, dry_run=dry_run
-        )
-        results['steps']['extract_metros'] = {'success': success, 'output': str(output)[:500]}
-        if not success and not dry_run:
-            results['errors'].append("Metro extraction failed")
-            raise Exception("Metro extraction failed")
-
-        # Step 3: Process Market Data
-        log_message("\n[STEP 3/5] Processing market data...", log_file)
-        success, output = run_script(
-            str(base_dir / 'process_market_data.py'),
-            log_file=log_file, dry_run=dry_run
-        )
-        results['steps']['process_data'] = {'success': success, 'output': str(output)[:500]}
-        if not success and not dry_run:
-            results['errors'].append("Data processing failed")
-            raise Exception("Data processing failed")
-
-        # Step 4: Generate Dashboards
-        log_message("\n[STEP 4/5] Generating dashboards...", log_file)
-        success, output = run_script(
-            str(base_dir / 'generate_dashboards_v2.py'),
-            log_file=log_file, dry_run=dry_run
-        )
-        results['steps']['generate_dashboards'] = {'success': success, 'output': str(output)[:500]}
-        if not success and not dry_run:
-            results['errors'].append("Dashboard generation failed")
-            raise Exception("Dashboard generation failed")
-
-        # Step 5: Extract Summaries
-        log_message("\n[STEP 5/5] Extracting summaries...", log_file)
-        success, output = run_script(
-            str(base_dir / 'extract_summary.py'),
-            log_file=log_file, dry_run=dry_run
-        )
-        results['steps']['extract_summary'] = {'success': success, 'output': str(output)[:500]}
-        if not success and not dry_run:
-            results['errors'].append("Summary extraction failed")
-            raise Exception("Summary extraction failed")
-
-        # Get list of processed metros
-        results['metros_processed'] = [m['display_name'] for m in metro_configs]
+        # Steps 2-5 (+ optional narratives and report emails) run as one per-metro task graph
+        ctx = load_pipeline_context(base_dir)
+        stages = list(ANALYSIS_STAGES)
 
         # Optional: AI Narrative Generation
         if not skip_ai:
-            log_message("\n[OPTIONAL] Generating AI narratives...", log_file)
-
             # Check if AI is configured
             try:
                 from ai_narrative import load_config as load_ai_config
                 ai_config = load_ai_config()
 
                 if ai_config.get('enabled') or ai_config.get('api_key'):
-                    success, output = run_script(
-                        str(base_dir / 'ai_narrative.py'),
-                        log_file=log_file, dry_run=dry_run
-                    )
-                    results['steps']['ai_narrative'] = {'success': success, 'output': str(output)[:500]}
+                    ctx.ai_config = ai_config
+                    if not dry_run:
+                        collect_batches(base_dir, ai_config, log_file)
+                    if ai_config.get('batch_mode'):
+                        log_message("\n[OPTIONAL] AI narratives will be submitted as a batch after the analysis stages", log_file)
+                    else:
+                        stages.append(NARRATIVE_STAGE)
                 else:
-                    log_message("  [SKIP] AI narrative not configured (no API key)", log_file)
+                    log_message("\n[OPTIONAL] AI narrative not configured (no API key)", log_file)
                     results['steps']['ai_narrative'] = {'success': True, 'output': 'Not configured'}
             except ImportError:
-                log_message("  [SKIP] ai_narrative module not available", log_file)
+                log_message("\n[OPTIONAL] ai_narrative module not available", log_file)
                 results['steps']['ai_narrative'] = {'success': True, 'output': 'Module not available'}
         else:
             log_message("\n[OPTIONAL] Skipping AI narratives (--no-ai)", log_file)
             results['steps']['ai_narrative'] = {'success': True, 'output': 'Skipped'}
 
+        # Market reports are queued per metro as soon as that metro is ready
+        # and delivered in the background while the rest of the pipeline runs
+        if not skip_notify and not dry_run:
+            try:
+                from email_reports import load_config as load_email_config
+                email_config = load_email_config()
+                if email_config.get('enabled'):
+                    outbox, outbox_worker = start_outbox(base_dir, email_config, log_file)
+                    ctx.email_config = email_config
+                    ctx.outbox = outbox
+                    stages.append(EMAIL_STAGE)
+            except Exception as e:
+                log_message(f"\n[NOTIFY] [ERROR] Could not load email config: {str(e)}", log_file)
+
+        log_message(f"\n[STEP 2-4/4] Running analysis stages ({'subprocess' if isolated else 'in-process'})...", log_file)
+        try:
+            run_pipeline(
+                stages, ctx,
+                isolated=isolated, dry_run=dry_run,
+                log=lambda msg: log_message(msg, log_file),
+                script_runner=lambda path, *args: run_script(path, *args, log_file=log_file),
+                results=results['steps'],
+                store=store, force_stages=force_stages, run_state=run_state, metrics=metrics
+            )
+        finally:
+            # Metros whose summary is ready, even if another metro failed
+            results['metros_processed'] = [
+                m.get('display_name', m['name'])
+                for m in succeeded_metros(results['steps'].get('process_data'), ctx.metros)
+            ]
+
+        # Batch mode: submit every processed metro's narrative and move on.
+        # Reports without a narrative were held; the run that collects the
+        # batch sends them, apart from narratives the cache served just now
+        if ctx.ai_config is not None and ctx.ai_config.get('batch_mode') and not dry_run:
+            results['steps']['ai_narrative'] = submit_batch(base_dir, ctx, log_file)
+            send_held_reports(ctx, results['steps'], log_file)
+
         # Pipeline completed successfully
         results['success'] = True
         log_message("\n[OK] PIPELINE COMPLETED SUCCESSFULLY", log_file)
@@ -302,104 +490,67 @@ def run_scheduled_pipeline(skip_fetch=False, skip_notify=False, skip_ai=False, d
     finally:
         results['end_time'] = datetime.now().isoformat()
 
-        # Send notifications
+        if run_state is not None:
+            # Failed optional steps (narratives, report emails) leave the run resumable too
+            complete = results['success'] and all(step['success'] for step in results['steps'].values())
+            run_state.finish(complete, results['steps'], results['errors'])
+
+        if not dry_run:
+            try:
+                regressions = record_pipeline_run(
+                    base_dir, 'run_scheduled', results['start_time'], results['end_time'], results['success'],
+                    metrics, round(time.perf_counter() - start, 2)
+                )
+                for regression in regressions:
+                    log_message(f"[WARN] Regression: {format_regression(regression)}", log_file)
+            except (sqlite3.Error, OSError) as e:
+                log_message(f"[WARN] Could not record run history: {e}", log_file)
+
+        # Queue the status notification, then give the outbox a bounded time to deliver
         if not skip_notify and not dry_run:
             log_message("\n[NOTIFY] Sending notifications...", log_file)
             try:
-                from email_reports import send_pipeline_notification, send_market_report, load_config
+                from email_reports import load_config, queue_pipeline_notification
 
-                email_config = load_config()
+                if email_config is None:
+                    # The run failed before the task graph loaded it
+                    email_config = load_config()
 
                 if email_config.get('enabled'):
-                    # Send pipeline status notification
+                    if outbox is None:
+                        outbox, outbox_worker = start_outbox(base_dir, email_config, log_file)
+
                     status_msg = "All steps completed successfully" if results['success'] else f"Failed: {', '.join(results['errors'])}"
-                    send_pipeline_notification(
+                    queue_pipeline_notification(
+                        outbox,
+                        results['start_time'],
                         results['success'],
                         status_msg,
                         metros_processed=results['metros_processed'],
                         config=email_config
                     )
 
-                    # Send individual market reports if pipeline succeeded
-                    if results['success']:
-                        log_message("  Sending market reports...", log_file)
-                        import re
-                        period_pattern = re.compile(r'^\d{4}-\d{2}$')
-                        sent_reports = 0
-                        failed_reports = 0
-                        skipped_reports = 0
-
-                        for metro in metro_configs:
-                            metro_slug = metro['name']
-                            metro_display_name = metro['display_name']
-                            output_directory = metro['output_directory']
-                            metro_dir = base_dir / output_directory
-
-                            if not metro_dir.exists():
-                                log_message(f"  [SKIP] Metro output directory not found for {metro_display_name}: {metro_dir}", log_file)
-                                skipped_reports += 1
-                                continue
-
-                            period_folders = sorted([
-                                d for d in metro_dir.iterdir()
-                                if d.is_dir() and period_pattern.match(d.name)
-                            ], reverse=True)
-
-                            if not period_folders:
-                                log_message(f"  [SKIP] No period folders found for {metro_display_name} in {metro_dir}", log_file)
-                                skipped_reports += 1
-                                continue
-
-                            latest_folder = period_folders[0]
-                            summary_file = latest_folder / f"{metro_slug}_summary.json"
-                            narrative_file = latest_folder / f"{metro_slug}_narrative.txt"
-
-                            if not summary_file.exists():
-                                log_message(f"  [SKIP] Summary file not found for {metro_display_name}: {summary_file}", log_file)
-                                skipped_reports += 1
-                                continue
-
-                            try:
-                                with open(summary_file, 'r') as f:
-                                    summary = json.load(f)
-
-                                # Load AI narrative if available
-                                ai_narrative = None
-                                if narrative_file.exists():
-                                    with open(narrative_file, 'r', encoding='utf-8') as f:
-                                        ai_narrative = f.read()
-
-                                report_sent = send_market_report(
-                                    metro_display_name,
-                                    summary,
-                                    email_config,
-                                    ai_narrative,
-                                    output_directory=output_directory,
-                                    metro_slug=metro_slug,
-                                )
-                            except Exception as metro_error:
-                                log_message(f"  [FAILED] Report send errored for {metro_display_name}: {metro_error}", log_file)
-                                failed_reports += 1
-                                continue
-
-                            if report_sent:
-                                log_message(f"  [OK] Market report sent for {metro_display_name}", log_file)
-                                sent_reports += 1
-                            else:
-                                log_message(f"  [FAILED] Market report email failed for {metro_display_name}", log_file)
-                                failed_reports += 1
-
+                    # Market reports were queued per metro by the email_report tasks
+                    report_tasks = results['steps'].get('email_report', {}).get('metros', {})
+                    if report_tasks:
+                        queued_reports = sum(1 for r in report_tasks.values() if r['success'] and r['output'] == 'Report queued')
+                        held_reports = sum(1 for r in report_tasks.values() if r['success'] and r['output'] == REPORT_HELD)
+                        duplicate_reports = sum(1 for r in report_tasks.values() if r['success']) - queued_reports - held_reports
+                        skipped_reports = sum(1 for r in report_tasks.values() if r.get('blocked'))
+                        failed_reports = len(report_tasks) - queued_reports - held_reports - duplicate_reports - skipped_reports
                         log_message(
-                            f"  Market report summary: sent={sent_reports}, failed={failed_reports}, skipped={skipped_reports}",
+                            f"  Market report summary: queued={queued_reports}, already sent={duplicate_reports}, "
+                            f"held for narrative={held_reports}, failed={failed_reports}, skipped={skipped_reports}",
                             log_file
                         )
-
-                    log_message("  [OK] Notifications sent", log_file)
                 else:
                     log_message("  [SKIP] Email not configured", log_file)
 
             except Exception as e:
                 log_message(f"  [ERROR] Notification failed: {str(e)}", log_file)
+
+            if outbox_worker is not None:
+                stop_outbox(outbox_worker, email_config, log_file)
         elif skip_notify:
             log_message("\n[NOTIFY] Skipping notifications (--no-notify)", log_file)
 
@@ -429,12 +580,23 @@ def main():
     skip_notify = '--no-notify' in sys.argv
     skip_ai = '--no-ai' in sys.argv
     dry_run = '--dry-run' in sys.argv
+    isolated = '--isolated' in sys.argv
+    resume = '--resume' in sys.argv
+
+    try:
+        force_stages = parse_force_stages(sys.argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
 
     results = run_scheduled_pipeline(
         skip_fetch=skip_fetch,
         skip_notify=skip_notify,
         skip_ai=skip_ai,
-        dry_run=dry_run
+        dry_run=dry_run,
+        isolated=isolated,
+        force_stages=force_stages,
+        resume=resume
     )
 
     return 0 if results['success'] else 1
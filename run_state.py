@@ -0,0 +1,131 @@
+"""
+Run State
+Persistent record of the current scheduled run, used to resume a failed run.
+
+The state file (.pipeline/run_state.json) is rewritten as each task starts and
+finishes. It records every task's status and the SHA-256 of the files it wrote,
+plus the run's step results and errors once it ends.
+
+Resuming loads the previous run's state. A task that succeeded last time is
+reused instead of rerun, but only if each recorded output still has its
+recorded checksum. Tasks without outputs (such as report emails) are reused
+as-is, so a resumed run does not resend reports that already went out.
+
+Checksums go through FingerprintStore.file_hash (see stage_cache.py), so an
+output whose size and mtime are unchanged, such as the multi-GB source
+tracker, is not re-read.
+"""
+
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from atomic_io import write_json_atomic
+from stage_cache import DEFAULT_STORE_PATH, FingerprintStore
+
+DEFAULT_STATE_PATH = Path('.pipeline') / 'run_state.json'
+
+
+class RunState:
+    """Task status for the current run, plus the previous run's tasks when resuming.
+
+    Pass the runner's `store` to share its file hash cache; by default the
+    repo's fingerprint store is opened read-only for its cached hashes.
+    """
+
+    def __init__(self, path: Path, base_dir: Path, previous: Optional[dict] = None, options: Optional[dict] = None,
+                 store: Optional[FingerprintStore] = None):
+        self.path = Path(path)
+        self.base_dir = Path(base_dir)
+        self.previous = previous or {}
+        self.store = store or FingerprintStore(self.base_dir / DEFAULT_STORE_PATH, base_dir=self.base_dir)
+        self._lock = threading.RLock()
+        self.data: Dict[str, Any] = {
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'status': 'running',
+            'resumed': bool(self.previous),
+            'options': options or {},
+            'tasks': {},
+            'steps': {},
+            'errors': [],
+        }
+
+    @classmethod
+    def start(cls, path: Path, base_dir: Path, resume: bool = False, options: Optional[dict] = None,
+              store: Optional[FingerprintStore] = None) -> 'RunState':
+        """
+        Begin a new run state, carrying over the last run's tasks when resuming.
+
+        Only an interrupted or incomplete previous run is resumed; after a
+        completed run, --resume starts fresh.
+        """
+        previous = {}
+        path = Path(path)
+        if resume and path.exists():
+            try:
+                with open(path, 'r') as f:
+                    last = json.load(f)
+                if last.get('status') != 'completed':
+                    previous = last.get('tasks', {})
+            except (OSError, ValueError):
+                previous = {}
+
+        state = cls(path, base_dir, previous, options, store)
+        state.save()
+        return state
+
+    def _key(self, path: Path) -> str:
+        try:
+            return Path(path).resolve().relative_to(self.base_dir.resolve()).as_posix()
+        except ValueError:
+            return str(Path(path).resolve())
+
+    def can_reuse(self, task_key: str) -> bool:
+        """True when the task succeeded in the resumed run and its outputs still match their checksums."""
+        entry = self.previous.get(task_key)
+        if not entry or entry.get('status') != 'succeeded':
+            return False
+
+        for key, digest in entry.get('outputs', {}).items():
+            path = self.base_dir / key
+            if not path.exists() or self.store.file_hash(path) != digest:
+                return False
+        return True
+
+    def carry_over(self, task_key: str):
+        """Copy a reused task's entry from the previous run into this one."""
+        entry = dict(self.previous[task_key])
+        entry['resumed'] = True
+        with self._lock:
+            self.data['tasks'][task_key] = entry
+            self.save()
+
+    def mark(self, task_key: str, status: str, outputs: Iterable[Path] = (), output: str = ''):
+        """Record a task's status ('running', 'succeeded', 'failed', 'blocked') and output checksums."""
+        entry = {
+            'status': status,
+            'output': str(output)[:500],
+            'outputs': {self._key(p): self.store.file_hash(p) for p in outputs if Path(p).exists()},
+            'updated_at': datetime.now().isoformat(),
+        }
+        with self._lock:
+            self.data['tasks'][task_key] = entry
+            self.save()
+
+    def finish(self, complete: bool, steps: dict, errors: list):
+        """Record the run's outcome; an incomplete run can be resumed."""
+        with self._lock:
+            self.data['status'] = 'completed' if complete else 'incomplete'
+            self.data['finished_at'] = datetime.now().isoformat()
+            self.data['steps'] = steps
+            self.data['errors'] = list(errors)
+            self.save()
+
+    def save(self):
+        """Write the state file atomically."""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.path, self.data, default=str)
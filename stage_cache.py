@@ -0,0 +1,121 @@
+"""
+Stage Cache
+Fingerprint database used by pipeline_runner.py to skip up-to-date stages.
+
+A stage's fingerprint covers the content of its input files, the source of the
+code that implements it, and the configuration it reads. After a stage
+succeeds, its fingerprint and the hashes of the files it produced are stored;
+the next run skips the stage when the fingerprint is unchanged and every
+recorded output is still on disk with the same content.
+
+File hashes are cached by (size, mtime) so unchanged multi-GB inputs are not
+re-read on every run. The store is safe to share between the runner's worker
+threads.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from atomic_io import write_json_atomic
+
+DEFAULT_STORE_PATH = Path('.pipeline') / 'fingerprints.json'
+
+
+def hash_file(path: Path, block_size: int = 1024 * 1024) -> str:
+    """Calculate SHA-256 hash of a file."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class FingerprintStore:
+    """JSON-backed store of stage fingerprints, recorded outputs and file hashes."""
+
+    def __init__(self, path: Path, base_dir: Optional[Path] = None):
+        self.path = Path(path)
+        self.base_dir = Path(base_dir) if base_dir else self.path.parent
+        self.data: Dict[str, dict] = {'stages': {}, 'files': {}}
+        self._lock = threading.RLock()
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    loaded = json.load(f)
+                self.data['stages'] = loaded.get('stages', {})
+                self.data['files'] = loaded.get('files', {})
+            except (OSError, ValueError):
+                # A corrupt store only costs a full rerun
+                pass
+
+    def _key(self, path: Path) -> str:
+        path = Path(path)
+        try:
+            return path.resolve().relative_to(self.base_dir.resolve()).as_posix()
+        except ValueError:
+            return str(path.resolve())
+
+    def file_hash(self, path: Path) -> str:
+        """Return the file's SHA-256, reusing the cached hash when size and mtime match."""
+        stat = os.stat(path)
+        key = self._key(path)
+        with self._lock:
+            cached = self.data['files'].get(key)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+
+        digest = hash_file(path)
+        with self._lock:
+            self.data['files'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    def fingerprint(self, inputs: Iterable[Path], code: Iterable[Path], params) -> str:
+        """Fingerprint input file contents, code sources and JSON-serializable params."""
+        hasher = hashlib.sha256()
+        for label, paths in (('input', inputs), ('code', code)):
+            for path in sorted(Path(p) for p in paths):
+                hasher.update(f"{label}:{self._key(path)}:{self.file_hash(path)}\n".encode())
+        hasher.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return hasher.hexdigest()
+
+    def is_current(self, stage_name: str, fingerprint: str) -> bool:
+        """True when the stage last succeeded with this fingerprint and its outputs are intact."""
+        with self._lock:
+            entry = self.data['stages'].get(stage_name)
+        if not entry or entry.get('fingerprint') != fingerprint:
+            return False
+
+        for key, digest in entry.get('outputs', {}).items():
+            path = self.base_dir / key
+            if not path.exists() or self.file_hash(path) != digest:
+                return False
+        return True
+
+    def record(self, stage_name: str, fingerprint: str, outputs: Iterable[Path]):
+        """Record a successful stage run."""
+        entry = {
+            'fingerprint': fingerprint,
+            'outputs': {self._key(p): self.file_hash(p) for p in outputs if Path(p).exists()},
+            'completed_at': datetime.now().isoformat(),
+        }
+        with self._lock:
+            self.data['stages'][stage_name] = entry
+            self.save()
+
+    def invalidate(self, stage_name: str):
+        """Forget a stage so it runs next time."""
+        with self._lock:
+            if self.data['stages'].pop(stage_name, None) is not None:
+                self.save()
+
+    def save(self):
+        """Write the store atomically."""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.path, self.data)
@@ -0,0 +1,383 @@
+import asyncio
+import json
+import re
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import ai_narrative
+import narrative_batch
+from rate_limits import RateBudget
+
+
+class _APIHandler(BaseHTTPRequestHandler):
+    """Just enough of the Messages API to answer create() calls."""
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def _text(request):
+        """The reply's text; after an assistant prefill, only what continues it."""
+        prompt = request["messages"][0]["content"]
+        text = f"Narrative for {prompt.split('MARKET: ', 1)[1].split(' |')[0]}."
+        if request["messages"][-1]["role"] == "assistant":
+            text = text[len(request["messages"][-1]["content"]):]
+        return text
+
+    @classmethod
+    def _message(cls, request, n):
+        return {
+            "id": f"msg_{n}", "type": "message", "role": "assistant", "model": request["model"],
+            "content": [{"type": "text", "text": cls._text(request)}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 100, "output_tokens": 50},
+        }
+
+    def _stream(self, request, n):
+        """
+        Server-sent events for a streamed reply, cut off after `cut_after` deltas if set;
+        with `drop` also set, the connection is lost mid-body rather than ended cleanly.
+        """
+        message = self._message(request, n)
+        chunks = re.findall(r"\s*\S+", message["content"][0]["text"])
+        cut_after, self.server.cut_after = self.server.cut_after, None
+        drop, self.server.drop = self.server.drop and cut_after is not None, False
+        events = [("message_start", {"message": dict(message, content=[], stop_reason=None,
+                                                     usage={"input_tokens": 100, "output_tokens": 0})}),
+                  ("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})]
+        events += [("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": chunk}})
+                   for chunk in chunks[:cut_after]]
+        if cut_after is None:
+            events += [("content_block_stop", {"index": 0}),
+                       ("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                          "usage": {"output_tokens": 50}}),
+                       ("message_stop", {})]
+
+        body = "".join(f"event: {name}\ndata: {json.dumps(dict(data, type=name))}\n\n" for name, data in events)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        if drop:
+            # Promise more than is sent, so the client sees the body cut short
+            self.send_header("Content-Length", str(len(body.encode()) + 1000))
+        self.end_headers()
+        self.wfile.write(body.encode())
+        self.wfile.flush()
+
+    def _batch(self, batch_id):
+        batch = self.server.batches[batch_id]
+        count = len(batch["requests"])
+        ended = self.server.batches_ready
+        return {
+            "id": batch_id, "type": "message_batch", "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else count, "succeeded": count if ended else 0,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2026-01-01T00:00:00Z", "expires_at": "2026-01-02T00:00:00Z",
+            "ended_at": "2026-01-01T01:00:00Z" if ended else None,
+            "results_url": f"http://127.0.0.1:{self.server.server_address[1]}/v1/messages/batches/{batch_id}/results"
+            if ended else None,
+        }
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")   # v1 messages batches {id} [results]
+        if parts[-1] == "results":
+            lines = [json.dumps({"custom_id": r["custom_id"],
+                                 "result": {"type": "succeeded", "message": self._message(r["params"], n)}})
+                     for n, r in enumerate(self.server.batches[parts[3]]["requests"])]
+            data = "\n".join(lines).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/binary")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._reply(200, self._batch(parts[3]))
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.rstrip("/").endswith("/batches"):
+            batch_id = f"msgbatch_{len(server.batches) + 1}"
+            server.batches[batch_id] = {"requests": request["requests"]}
+            self._reply(200, self._batch(batch_id))
+            return
+
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            status = server.statuses.pop(0) if server.statuses else 200
+        try:
+            time.sleep(server.delay)
+            if status != 200:
+                error_type = "rate_limit_error" if status == 429 else "overloaded_error"
+                self._reply(status, {"type": "error", "error": {"type": error_type, "message": "slow down"}},
+                            {"retry-after": "0"} if status == 429 else None)
+                return
+            server.last_request = request
+            if request.get("stream"):
+                self._stream(request, server.requests)
+            else:
+                self._reply(200, self._message(request, server.requests))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+class _APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _APIHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.statuses = []
+        self.delay = 0.0
+        self.batches = {}
+        self.batches_ready = False
+        self.cut_after = None
+        self.drop = False
+        self.last_request = None
+
+
+class _APITestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = _APIServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = {
+            "api_key": "test-key", "model": "test-model", "max_tokens": 200,
+            "base_url": f"http://127.0.0.1:{self.server.server_address[1]}",
+            "max_concurrency": 8, "requests_per_minute": 1000, "tokens_per_minute": 10 ** 7,
+            "max_retries": 3, "retry_base_delay": 0.01, "retry_max_delay": 0.05,
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def _jobs(self, count):
+        jobs = []
+        for n in range(count):
+            folder = Path(self.tmp.name) / f"metro{n}"
+            folder.mkdir()
+            jobs.append((f"metro{n}", folder, {"metro_name": f"Metro {n}", "report_period": "2025-12"}, []))
+        return jobs
+
+
+@unittest.skipUnless(ai_narrative.ANTHROPIC_AVAILABLE, "anthropic package not installed")
+class ConcurrentNarrativeTests(_APITestCase):
+    def test_metros_are_narrated_concurrently_and_saved(self):
+        self.server.delay = 0.3
+        jobs = self._jobs(6)
+
+        started = time.perf_counter()
+        results = asyncio.run(ai_narrative.narrate_metros_async(jobs, self.config))
+
+        self.assertLess(time.perf_counter() - started, 1.5)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertTrue(all(result["success"] for _, result in results))
+        saved = json.loads((jobs[3][1] / "metro3_narrative.json").read_text())
+        self.assertEqual(saved["narrative"], "Narrative for Metro 3.")
+        self.assertEqual(saved["tokens_used"], 150)
+
+    def test_rate_limit_and_overload_are_retried(self):
+        self.server.statuses = [429, 529]
+        [(_, result)] = asyncio.run(ai_narrative.narrate_metros_async(self._jobs(1), self.config))
+
+        self.assertTrue(result["success"])
+        self.assertEqual(self.server.requests, 3)
+
+    def test_unchanged_prompt_is_served_from_cache(self):
+        jobs = self._jobs(2)
+        asyncio.run(ai_narrative.narrate_metros_async(jobs, self.config))
+        results = asyncio.run(ai_narrative.narrate_metros_async(jobs, self.config))
+
+        self.assertEqual(self.server.requests, 2)
+        self.assertTrue(all(result["cached"] for _, result in results))
+        self.assertEqual(results[0][1]["tokens_used"], 0)
+        self.assertEqual(results[0][1]["tokens_saved"], 150)
+
+        # A different max_tokens is a different request
+        ai_narrative.narrate_metro(*jobs[0], dict(self.config, max_tokens=300))
+        self.assertEqual(self.server.requests, 3)
+
+
+@unittest.skipUnless(ai_narrative.ANTHROPIC_AVAILABLE, "anthropic package not installed")
+class StreamingNarrativeTests(_APITestCase):
+    def test_cut_off_stream_is_continued_from_the_partial_text(self):
+        self.server.cut_after = 2
+        [(_, result)] = asyncio.run(ai_narrative.narrate_metros_async(self._jobs(1), self.config))
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["narrative"], "Narrative for Metro 0.")
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(self.server.last_request["messages"][-1],
+                         {"role": "assistant", "content": "Narrative for"})
+        self.assertIsNotNone(result["first_byte_seconds"])
+
+        folder = Path(self.tmp.name) / "metro0"
+        saved = json.loads((folder / "metro0_narrative.json").read_text())
+        self.assertEqual(saved["resumed_chars"], len("Narrative for"))
+        self.assertEqual(list(folder.glob("*.partial")), [])
+        # Both attempts are counted: the cut-off one's input plus the full continuation
+        self.assertEqual(result["tokens_used"], 100 + 150)
+        cache = json.loads((folder / "metro0_narrative_cache.json").read_text())
+        self.assertEqual([entry["tokens_used"] for entry in cache.values()], [250])
+
+    def test_dropped_connection_is_continued(self):
+        self.server.cut_after, self.server.drop = 2, True
+        result = ai_narrative.narrate_metro(*self._jobs(1)[0], self.config)
+
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(result["narrative"], "Narrative for Metro 0.")
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(result["tokens_used"], 100 + 150)
+
+    def test_error_after_text_arrived_is_not_retried(self):
+        def broken_chunk(result, partial, chunk, started):
+            partial.append(chunk)
+            raise KeyError("first_byte_seconds")
+
+        with mock.patch.object(ai_narrative, "_stream_chunk", broken_chunk):
+            result = ai_narrative.narrate_metro(*self._jobs(1)[0], self.config)
+
+        self.assertFalse(result["success"])
+        self.assertTrue(result["error"].startswith("Unexpected error"))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_partial_left_by_an_earlier_run_is_resumed(self):
+        [job] = self._jobs(1)
+        prompt = ai_narrative.build_narrative_prompt(job[2], job[3], self.config)
+        ai_narrative.partial_path(job[1], job[0], prompt, self.config).write_text("Narrative for Metro ")
+
+        result = ai_narrative.narrate_metro(*job, self.config)
+
+        self.assertEqual(result["narrative"], "Narrative for Metro 0.")
+        self.assertEqual(self.server.last_request["messages"][-1]["content"], "Narrative for Metro")
+        self.assertEqual((job[1] / "metro0_narrative.txt").read_text(), "Narrative for Metro 0.")
+
+
+@unittest.skipUnless(ai_narrative.ANTHROPIC_AVAILABLE, "anthropic package not installed")
+class NarrativeBatchTests(_APITestCase):
+    def test_batch_is_collected_by_a_later_run(self):
+        jobs = self._jobs(3)
+        batch_id = narrative_batch.submit_narrative_batch(jobs, self.config, self.tmp.name)
+
+        # Still processing: nothing saved, state kept for the next run
+        totals = narrative_batch.collect_narrative_batches(self.config, self.tmp.name)
+        self.assertEqual(totals["pending"], 1)
+        self.assertFalse((jobs[0][1] / "metro0_narrative.txt").exists())
+
+        # Resubmitting the same prompts doesn't create a second batch
+        self.assertIsNone(narrative_batch.submit_narrative_batch(jobs, self.config, self.tmp.name))
+
+        self.server.batches_ready = True
+        totals = narrative_batch.collect_narrative_batches(self.config, self.tmp.name)
+
+        self.assertEqual(totals["saved"], 3)
+        self.assertEqual(list(self.server.batches), [batch_id])
+        self.assertEqual((jobs[2][1] / "metro2_narrative.txt").read_text(), "Narrative for Metro 2.")
+        self.assertEqual(narrative_batch.pending_batches(self.tmp.name), [])
+        self.assertEqual(self.server.requests, 0)
+
+    def test_metros_that_sanitize_alike_get_distinct_ids(self):
+        jobs = []
+        for n, name in enumerate(["a.b", "a_b"]):
+            folder = Path(self.tmp.name) / f"metro{n}"
+            folder.mkdir()
+            jobs.append((name, folder, {"metro_name": f"Metro {n}", "report_period": "2025-12"}, []))
+
+        batch_id = narrative_batch.submit_narrative_batch(jobs, self.config, self.tmp.name)
+        custom_ids = [r["custom_id"] for r in self.server.batches[batch_id]["requests"]]
+        self.server.batches_ready = True
+        totals = narrative_batch.collect_narrative_batches(self.config, self.tmp.name)
+
+        self.assertEqual(len(set(custom_ids)), 2)
+        self.assertEqual(totals["saved"], 2)
+        self.assertEqual((jobs[0][1] / "a.b_narrative.txt").read_text(), "Narrative for Metro 0.")
+        self.assertEqual((jobs[1][1] / "a_b_narrative.txt").read_text(), "Narrative for Metro 1.")
+
+
+class PromptBudgetTests(unittest.TestCase):
+    def setUp(self):
+        self.summary = {
+            "metro_name": "Metro 1", "report_period": "2025-12", "metro_health_score": 61,
+            "market_status": "BALANCED", "market_description": "Neither side has the edge",
+            "key_metrics": {"total_sales": 4210, "total_inventory": 9876,
+                            "weighted_avg_price": 412345.6, "weighted_avg_dom": 38.2},
+            "top_cities": [{"name": f"City {n}", "price": 350000 + n * 10000, "dom": 30 + n,
+                            "health": 60 + n, "price_yoy": 0.021} for n in range(5)],
+            "city_tiers": {"hot_markets": ["City 0", "City 1"], "buyer_markets": ["City 4"]},
+            "alert_cities": [{"name": f"Town {n}", "severity": "HIGH",
+                              "alerts": ["Price drop over 10%", "Inventory spike"]} for n in range(3)],
+        }
+        self.trends = [{"period": f"2025-{m:02d}", "median_sale_price": 400000 + m * 1000,
+                        "median_dom": 30 + m, "inventory": 9000 + m * 10} for m in range(1, 13)]
+
+    def test_full_prompt_is_compact(self):
+        prompt = ai_narrative.build_narrative_prompt(self.summary, self.trends)
+
+        self.assertIn("2025-12|$412k|42|9,120", prompt)
+        self.assertIn("City 4|$390k|34|64|+2.1%", prompt)
+        self.assertIn("HOT MARKETS", prompt)
+        self.assertIn("Town 2|HIGH|", prompt)
+        self.assertNotIn("2025-06|", prompt)
+
+    def test_low_priority_sections_are_dropped_to_fit(self):
+        full = ai_narrative.build_narrative_prompt(self.summary, self.trends)
+        instructions = ai_narrative.estimate_tokens(ai_narrative.NARRATIVE_INSTRUCTIONS)
+        budget = instructions + ai_narrative.estimate_tokens(full) - 1
+
+        prompt = ai_narrative.build_narrative_prompt(self.summary, self.trends, {"prompt_token_budget": budget})
+
+        self.assertLessEqual(instructions + ai_narrative.estimate_tokens(prompt), budget)
+        self.assertNotIn("HOT MARKETS", prompt)
+        self.assertIn("City 4|", prompt)
+        self.assertIn("2025-07|", prompt)
+
+
+class RateBudgetTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.budget = RateBudget(requests_per_minute=2, tokens_per_minute=1000, clock=lambda: self.now)
+
+    def test_requests_per_minute(self):
+        self.assertIsNotNone(self.budget.reserve(10)[0])
+        self.now = 15.0
+        self.assertIsNotNone(self.budget.reserve(10)[0])
+
+        reservation, wait = self.budget.reserve(10)
+        self.assertIsNone(reservation)
+        self.assertEqual(wait, 45.0)
+
+        self.now = 60.0
+        self.assertIsNotNone(self.budget.reserve(10)[0])
+
+    def test_settled_tokens_free_the_budget(self):
+        reservation, _ = self.budget.reserve(900)
+        self.assertIsNone(self.budget.reserve(200)[0])
+
+        self.budget.settle(reservation, 300)
+        self.assertIsNotNone(self.budget.reserve(200)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+import alert_rules
+from alert_rules import alert_city_records, evaluate_alerts, load_alert_rules, load_city_frame
+from extract_summary import build_metro_summary
+from frame_partition import write_partition
+from process_market_data import calculate_health_score, city_metric_frame, health_scores
+
+
+def _city(name, sales, price_yoy=0.02, dom=30, months_supply=2.5, health=70):
+    return {"name": name, "sales": sales, "price": 300000, "price_yoy": price_yoy, "dom": dom,
+            "inventory": 50, "months_supply": months_supply, "health": health}
+
+
+class AlertRuleTests(unittest.TestCase):
+    def setUp(self):
+        self.rules = load_alert_rules()
+
+    def test_every_city_is_screened_and_ranked(self):
+        cities = [
+            _city("Busy", 500),
+            _city("Slow", 400, dom=85),
+            _city("Glut", 300, price_yoy=-0.08, months_supply=7.25, health=34),
+            _city("Quiet", 20, dom=71),
+        ]
+        summary = build_metro_summary({"top_cities": cities[:2], "city_metrics": cities})
+
+        alerts = summary["alert_cities"]
+        self.assertEqual([a["name"] for a in alerts], ["Glut", "Slow", "Quiet"])
+        self.assertEqual(alerts[0]["severity"], "HIGH")
+        self.assertEqual(alerts[0]["alerts"], ["Price down 8.0% YoY", "Excess inventory: 7.2 months supply",
+                                               "Low health score: 34/100"])
+        self.assertEqual(alerts[1]["alerts"], ["High days on market: 85 days"])
+        self.assertEqual(summary["alert_count"], {"high": 1, "medium": 2, "low": 0})
+        self.assertEqual(summary["key_metrics"]["cities_screened"], 4)
+
+    def test_history_ranks_latest_period_first(self):
+        frame = pd.DataFrame([dict(_city("A", 10, dom=80), period="2025-11"),
+                              dict(_city("B", 5, dom=80), period="2025-12"),
+                              dict(_city("C", 1, months_supply=None), period="2025-12")])
+        table = evaluate_alerts(frame, self.rules)
+
+        self.assertEqual(list(table["name"]), ["B", "A"])
+        self.assertEqual(alert_city_records(table, self.rules)[0]["recommendation"],
+                         self.rules.recommendation("MEDIUM"))
+
+    def test_rules_file_is_validated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rules_file = Path(tmp) / "rules.yaml"
+            rules_file.write_text("rules:\n  odd:\n    metric: rainfall\n    above: 3\n")
+            with self.assertRaises(ValueError):
+                load_alert_rules(rules_file)
+
+    def test_rules_file_allows_inline_comments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rules_file = Path(tmp) / "rules.yaml"
+            rules_file.write_text(
+                "rules:\n"
+                "  slow:  # days on market\n"
+                "    metric: dom\n"
+                "    above: 80   # was 70\n"
+                "    severity: HIGH\n"
+                "    message: \"Slow #1: {value:.0f} days\"\n"
+            )
+            rules = load_alert_rules(rules_file)
+
+        table = evaluate_alerts(pd.DataFrame([_city("A", 10, dom=85), _city("B", 10, dom=75)]), rules)
+        self.assertEqual(alert_city_records(table, rules)[0]["alerts"], ["Slow #1: 85 days"])
+        self.assertEqual(list(table["name"]), ["A"])
+
+    def test_vectorized_health_matches_row_scores(self):
+        rows = pd.DataFrame({
+            "PENDING_SALES_YOY": [0, 0.1, 0.11, None, "N/A", -1, 0.05],
+            "MEDIAN_DOM_YOY": [0, -0.1, 0.05, 0.1, None, 0.09, 0.2],
+            "MEDIAN_DOM": [90.9, 91, 70.5, 71, None, 50, 51],
+            "MONTHS_OF_SUPPLY": [0, 3, 2.9, 5.99, 6, None, 1],
+        })
+        self.assertEqual(list(health_scores(rows)), list(rows.apply(calculate_health_score, axis=1)))
+
+
+class LoadCityFrameTests(unittest.TestCase):
+    def test_metros_are_read_from_partitions_without_a_tsv(self):
+        rows = pd.DataFrame({
+            "PERIOD_BEGIN": pd.to_datetime(["2025-12-01", "2025-12-01", "2025-11-01"]),
+            "CITY": ["Alpha", "Beta", "Alpha"],
+            "PROPERTY_TYPE": "All Residential",
+        })
+        for column in ["HOMES_SOLD", "MEDIAN_SALE_PRICE", "MEDIAN_SALE_PRICE_YOY", "MEDIAN_DOM", "INVENTORY",
+                       "PENDING_SALES", "NEW_LISTINGS", "PRICE_DROPS", "MONTHS_OF_SUPPLY", "PENDING_SALES_YOY",
+                       "MEDIAN_DOM_YOY"]:
+            rows[column] = [10.0, 20.0, 30.0]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            base_dir = Path(tmp)
+            (base_dir / "metro_config.json").write_text(json.dumps({
+                "metros": [{"name": "alpha", "display_name": "Alpha Metro"}, {"name": "missing"}]
+            }))
+            write_partition(rows, base_dir / "alpha_cities_filtered.npz")
+
+            frame = load_city_frame(base_dir)
+
+        self.assertEqual(sorted(frame["CITY"]), ["Alpha", "Beta"])
+        self.assertEqual(set(frame["METRO"]), {"Alpha Metro"})
+        self.assertEqual(set(frame["period"]), {"2025-12"})
+
+    def test_national_file_is_read_in_chunks(self):
+        rows = pd.DataFrame({
+            "PERIOD_BEGIN": ["2025-11-01", "2025-12-01", "2025-10-01", "2025-12-01", "2025-12-01", "2025-11-01", "2025-12-01"],
+            "STATE_CODE": ["NC", "NC", "VA", "VA", "VA", "NC", "SC"],
+            "CITY": ["Alpha", "Alpha", "Beta", "Beta", "Beta", "Gamma", "Delta"],
+            "PROPERTY_TYPE": ["All Residential"] * 4 + ["Condo/Co-op", "All Residential", "All Residential"],
+            "REGION_NOTES": ["unused"] * 7,
+        })
+        for i, column in enumerate(["HOMES_SOLD", "MEDIAN_SALE_PRICE", "MEDIAN_SALE_PRICE_YOY", "MEDIAN_DOM", "INVENTORY",
+                                    "PENDING_SALES", "NEW_LISTINGS", "PRICE_DROPS", "MONTHS_OF_SUPPLY",
+                                    "PENDING_SALES_YOY", "MEDIAN_DOM_YOY"]):
+            rows[column] = [float(i + n) for n in range(7)]
+
+        def whole_file(history):
+            df = rows[rows["PROPERTY_TYPE"] == "All Residential"]
+            df = df.assign(PERIOD_BEGIN=pd.to_datetime(df["PERIOD_BEGIN"]))
+            if not history:
+                df = df[df["PERIOD_BEGIN"] == df["PERIOD_BEGIN"].max()]
+            return city_metric_frame(df, ("STATE_CODE", "CITY")).reset_index(drop=True)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            base_dir = Path(tmp)
+            (base_dir / "metro_config.json").write_text(json.dumps({"data_settings": {"source_file": "cities.tsv000.gz"}}))
+            rows.to_csv(base_dir / "cities.tsv000.gz", sep="\t", index=False, compression="gzip")
+
+            with mock.patch.object(alert_rules, "NATIONAL_CHUNK_ROWS", 2):
+                latest = load_city_frame(base_dir, national=True)
+                history = load_city_frame(base_dir, national=True, history=True)
+
+        pd.testing.assert_frame_equal(latest.reset_index(drop=True), whole_file(False))
+        pd.testing.assert_frame_equal(history.reset_index(drop=True), whole_file(True))
+        self.assertEqual(sorted(latest["CITY"]), ["Alpha", "Beta", "Delta"])
+
+    def test_zip_metros_are_screened_by_region(self):
+        rows = pd.DataFrame({
+            "PERIOD_BEGIN": pd.to_datetime(["2025-12-01", "2025-12-01"]),
+            "REGION": ["Zip Code: 28202", "Zip Code: 28203"],
+            "CITY": ["Charlotte", "Charlotte"],
+            "PROPERTY_TYPE": "All Residential",
+        })
+        for column in ["HOMES_SOLD", "MEDIAN_SALE_PRICE", "MEDIAN_SALE_PRICE_YOY", "MEDIAN_DOM", "INVENTORY",
+                       "PENDING_SALES", "NEW_LISTINGS", "PRICE_DROPS", "MONTHS_OF_SUPPLY", "PENDING_SALES_YOY",
+                       "MEDIAN_DOM_YOY"]:
+            rows[column] = [10.0, 20.0]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            base_dir = Path(tmp)
+            (base_dir / "metro_config.json").write_text(json.dumps({
+                "metros": [{"name": "charlotte", "region_granularity": "zip"}],
+                "data_settings": {"output_file_pattern": "{name}_{granularity}_filtered.tsv"},
+            }))
+            write_partition(rows, base_dir / "charlotte_zip_filtered.npz")
+
+            frame = load_city_frame(base_dir)
+
+        self.assertEqual(sorted(frame["CITY"]), ["Zip Code: 28202", "Zip Code: 28203"])
+        self.assertEqual(set(frame["GRANULARITY"]), {"zip"})
+        self.assertEqual(list(frame.sort_values("CITY")["sales"]), [10.0, 20.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
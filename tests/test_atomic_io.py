@@ -0,0 +1,50 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from atomic_io import atomic_write, temp_path, write_bytes_atomic, write_json_atomic, write_text_atomic
+
+
+class AtomicWriteTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "state.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_writes_replace_the_target(self):
+        write_text_atomic(self.path, "old")
+        write_json_atomic(self.path, {"b": 1})
+        self.assertEqual(json.loads(self.path.read_text()), {"b": 1})
+
+        write_bytes_atomic(self.path, b"\x00raw")
+        self.assertEqual(self.path.read_bytes(), b"\x00raw")
+        self.assertFalse(temp_path(self.path).exists())
+
+    def test_failed_write_keeps_the_previous_file(self):
+        write_text_atomic(self.path, "previous")
+
+        with self.assertRaises(TypeError):
+            write_json_atomic(self.path, {"not json": object()})
+        with self.assertRaises(KeyboardInterrupt):
+            with atomic_write(self.path) as f:
+                f.write("half of it")
+                raise KeyboardInterrupt
+
+        self.assertEqual(self.path.read_text(), "previous")
+        self.assertFalse(temp_path(self.path).exists())
+
+    def test_failed_rename_removes_the_temp_file(self):
+        with mock.patch("atomic_io.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                write_bytes_atomic(self.path, b"data")
+
+        self.assertFalse(self.path.exists())
+        self.assertFalse(temp_path(self.path).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from chart_downsample import build_chart_downsample, downsample_periods, lttb_indices
+
+
+def _series(months: int) -> list:
+    rows = []
+    for i in range(months):
+        year, month = divmod(i, 12)
+        rows.append({
+            "period": f"{2000 + year:04d}-{month + 1:02d}",
+            "inventory": 100 + (i % 7) * 10,
+            "homes_sold": 50 + (i % 5),
+            "median_sale_price": 200000 + i * 100,
+        })
+    return rows
+
+
+class LttbTests(unittest.TestCase):
+    def test_keeps_all_points_under_threshold(self):
+        self.assertEqual(lttb_indices([1, 2, 3], 10), [0, 1, 2])
+
+    def test_keeps_endpoints_and_respects_threshold(self):
+        values = [float(i % 13) for i in range(500)]
+        indices = lttb_indices(values, 50)
+
+        self.assertEqual(len(indices), 50)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 499)
+        self.assertEqual(indices, sorted(indices))
+
+    def test_keeps_spike(self):
+        values = [1.0] * 300
+        values[150] = 1000.0
+
+        self.assertIn(150, lttb_indices(values, 20))
+
+    def test_skips_missing_values(self):
+        values = [None, 1.0, None, 2.0, float("nan"), 3.0]
+
+        self.assertEqual(lttb_indices(values, 10), [1, 3, 5])
+
+
+class DownsamplePeriodsTests(unittest.TestCase):
+    def test_short_series_is_not_downsampled(self):
+        rows = _series(12)
+
+        self.assertEqual(downsample_periods(rows, ["inventory"], budget=120), [r["period"] for r in rows])
+
+    def test_long_series_fits_budget(self):
+        rows = _series(400)
+        periods = downsample_periods(rows, ["inventory", "homes_sold", "median_sale_price"], budget=60)
+
+        self.assertLessEqual(len(periods), 62)
+        self.assertEqual(periods[0], rows[0]["period"])
+        self.assertEqual(periods[-1], rows[-1]["period"])
+
+    def test_build_chart_downsample_covers_every_city(self):
+        data = {
+            "full_metro_trends": _series(200),
+            "full_city_trends": {"A": _series(200), "B": _series(10)},
+        }
+        result = build_chart_downsample(data, budget=50)
+
+        self.assertEqual(result["budget"], 50)
+        self.assertEqual(set(result["cities"]), {"A", "B"})
+        self.assertEqual(len(result["cities"]["B"]), 10)
+        self.assertLessEqual(len(result["cities"]["A"]), 52)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from data_artifact import LazyTables, decode_metro_data, encode_metro_data, find_data_file, load_metro_data
+from process_market_data import save_metro_data
+
+
+def _series(months: int, city: str = "") -> list:
+    rows = []
+    for i in range(months):
+        year, month = divmod(i, 12)
+        rows.append({
+            "period": f"{2000 + year:04d}-{month + 1:02d}",
+            "inventory": 100 + i if i % 9 else None,
+            "median_sale_price": 200000 + i * 100,
+            "pending_ratio": 0.25 + i / 1000 if i else None,
+            "label": city or None,
+            "mixed": i if i % 2 else i / 2,
+        })
+    return rows
+
+
+def _metro_data() -> dict:
+    return {
+        "metro": "Test Metro",
+        "period": "2001-12",
+        "current_stats": {"total_sales": 10, "total_cities": 2},
+        "metro_trends": _series(12),
+        "top_cities": [{"name": "A", "sales": 5, "health": 70, "flag": True},
+                       {"name": "B", "sales": 3, "health": 50, "flag": False}],
+        "full_metro_trends": _series(24),
+        "full_city_trends": {"A": _series(24, "A"), "B": _series(3, "B"), "C": []},
+        "period_index_full": [row["period"] for row in _series(24)],
+        "period_index_by_city": {"A": ["2000-01"], "B": []},
+        "ratios": [0.5, float("nan"), 1.5] * 4,
+    }
+
+
+class DataArtifactTests(unittest.TestCase):
+    def test_round_trip_is_exact(self):
+        data = _metro_data()
+        decoded = decode_metro_data(encode_metro_data(data))
+
+        self.assertIsInstance(decoded["full_city_trends"], LazyTables)
+        self.assertEqual(
+            json.dumps({**decoded, "full_city_trends": dict(decoded["full_city_trends"])}),
+            json.dumps(data)
+        )
+
+    def test_city_trends_decode_on_access(self):
+        decoded = decode_metro_data(encode_metro_data(_metro_data()))
+        trends = decoded["full_city_trends"]
+
+        self.assertEqual(list(trends), ["A", "B", "C"])
+        self.assertEqual(trends["B"], _series(3, "B"))
+        self.assertIn("1 decoded", repr(trends))
+        self.assertIs(trends["B"], trends["B"])
+
+    def test_save_writes_selected_format_and_drops_stale_copy(self):
+        data = _metro_data()
+        with tempfile.TemporaryDirectory() as tmp:
+            json_file, _ = save_metro_data(data, Path(tmp), "test", "json")
+            self.assertEqual(json.loads(json_file.read_text()), json.loads(json.dumps(data)))
+
+            binary_file, _ = save_metro_data(data, Path(tmp), "test")
+            self.assertEqual(binary_file.suffix, ".npz")
+            self.assertFalse(json_file.exists())
+            self.assertEqual(find_data_file(binary_file.parent, "test"), binary_file)
+            self.assertEqual(load_metro_data(binary_file)["full_city_trends"]["A"], data["full_city_trends"]["A"])
+
+            save_metro_data(data, Path(tmp), "test", json_export=True)
+            self.assertTrue(json_file.exists() and binary_file.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
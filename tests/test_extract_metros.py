@@ -0,0 +1,88 @@
+import gzip
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import extract_metros
+from frame_partition import read_partition
+
+
+def _write_source(path: Path):
+    rows = []
+    for i in range(60):
+        rows.append({
+            "PERIOD_BEGIN": f"2025-{i % 6 + 1:02d}-01",
+            "PERIOD_END": f"2025-{i % 6 + 1:02d}-28",
+            "REGION": f"City {i % 4}",
+            "PARENT_METRO_REGION_METRO_CODE": 16740 if i % 3 else 40220,
+            "PROPERTY_TYPE": "All Residential" if i % 5 else "Condo/Co-op",
+            "HOMES_SOLD": i,
+            "MEDIAN_DOM": i / 2 if i % 7 else None,
+        })
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        pd.DataFrame(rows).to_csv(f, sep="\t", index=False)
+
+
+class StreamingExtractionTests(unittest.TestCase):
+    def test_streaming_matches_in_memory_extraction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_file = Path(tmp) / "source.tsv.gz"
+            output_file = Path(tmp) / "metro_cities_filtered.tsv"
+            _write_source(source_file)
+            expected = extract_metros.extract_metro_frame(str(source_file), "16740").reset_index(drop=True)
+
+            # Tiny chunks and cap: every chunk's matches become their own spool run
+            with mock.patch.object(extract_metros, "PROBE_ROWS", 7):
+                stats = extract_metros.stream_and_write_metro(
+                    str(source_file), "16740", str(output_file), memory_mb=0.001, tsv_export=True
+                )
+
+            self.assertEqual(stats["rows"], len(expected))
+            self.assertEqual(stats["rows_scanned"], 60)
+            pd.testing.assert_frame_equal(read_partition(output_file.with_suffix(".npz")), expected)
+            self.assertEqual(pd.read_csv(output_file, sep="\t")["HOMES_SOLD"].tolist(), expected["HOMES_SOLD"].tolist())
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()),
+                             ["metro_cities_filtered.npz", "metro_cities_filtered.tsv", "source.tsv.gz"])
+
+    def test_peak_memory_stays_under_the_cap(self):
+        rows = 40000
+        rng = np.random.default_rng(0)
+        periods = pd.date_range("2015-01-01", periods=120, freq="MS").strftime("%Y-%m-%d")
+        source = pd.DataFrame({
+            "PERIOD_BEGIN": rng.choice(periods, rows),
+            "REGION": [f"Zip Code: {z}" for z in rng.integers(28000, 28400, rows)],
+            "PARENT_METRO_REGION_METRO_CODE": 16740,
+            "PROPERTY_TYPE": "All Residential",
+        })
+        source["PERIOD_END"] = source["PERIOD_BEGIN"]
+        for n in range(12):
+            source[f"METRIC_{n}"] = rng.random(rows)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source_file = Path(tmp) / "source.tsv.gz"
+            output_file = Path(tmp) / "metro_cities_filtered.tsv"
+            with gzip.open(source_file, "wt", encoding="utf-8") as f:
+                source.to_csv(f, sep="\t", index=False)
+            del source
+
+            memory_mb = 2
+            tracemalloc.start()
+            try:
+                stats = extract_metros.stream_and_write_metro(str(source_file), "16740", str(output_file), memory_mb)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            extracted = read_partition(output_file.with_suffix(".npz"))
+            self.assertEqual(stats["rows"], rows)
+            self.assertGreater(extracted.memory_usage(deep=True).sum(), 2 * memory_mb * 2 ** 20)
+            self.assertLess(peak, memory_mb * 2 ** 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
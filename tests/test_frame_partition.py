@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from frame_partition import partition_path, read_extracted, read_partition, write_partition
+
+
+def _frame() -> pd.DataFrame:
+    df = pd.DataFrame({
+        "PERIOD_BEGIN": pd.to_datetime(["2025-12-01", "2025-11-01", "2025-11-01"]),
+        "CITY": ["Alpha", None, "Alpha"],
+        "HOMES_SOLD": [12, 0, 70000],
+        "INVENTORY": [-1, 5, 2 ** 40],
+        "MEDIAN_DOM": [31.5, np.nan, 12.0],
+        "IS_NEW": [True, False, True],
+    })
+    df.attrs["rows_scanned"] = 99
+    return df
+
+
+class FramePartitionTests(unittest.TestCase):
+    def test_round_trip_keeps_dtypes_and_attrs(self):
+        df = _frame()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "metro_cities_filtered.npz"
+            write_partition(df, path)
+            restored = read_partition(path)
+
+            pd.testing.assert_frame_equal(restored, df)
+            self.assertEqual(restored.attrs, {"rows_scanned": 99})
+            self.assertEqual(list(read_partition(path, columns=["CITY"]).columns), ["CITY"])
+
+    def test_object_column_keeps_none_and_nan(self):
+        df = pd.DataFrame({"REGION": pd.Series(["Zip Code: 28202", None, np.nan], dtype=object),
+                           "EMPTY": pd.Series([np.nan, None, np.nan], dtype=object)})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "metro_cities_filtered.npz"
+            write_partition(df, path)
+            restored = read_partition(path)
+
+            pd.testing.assert_frame_equal(restored, df)
+            self.assertIsNone(restored["REGION"][1])
+            self.assertIsNone(restored["EMPTY"][1])
+
+            with self.assertRaises(TypeError):
+                write_partition(pd.DataFrame({"MIXED": pd.Series(["a", 1], dtype=object)}), path)
+            self.assertEqual(list(read_partition(path).columns), ["REGION", "EMPTY"])
+
+    def test_partition_is_preferred_over_tsv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_file = Path(tmp) / "metro_cities_filtered.tsv"
+            pd.DataFrame({"CITY": ["Stale"]}).to_csv(tsv_file, sep="\t", index=False)
+            self.assertEqual(list(read_extracted(tsv_file)["CITY"]), ["Stale"])
+
+            write_partition(_frame(), partition_path(tsv_file))
+            self.assertEqual(read_extracted(tsv_file)["PERIOD_BEGIN"].dtype.kind, "M")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import generate_dashboards_v2
+from process_market_data import process_metro_frame, save_metro_data
+
+METROS = [
+    {"name": "alpha", "display_name": "Alpha, NC", "output_directory": "core_markets/alpha"},
+    {"name": "beta", "display_name": "Beta, VA", "output_directory": "core_markets/beta"},
+]
+
+
+def _metro_rows(seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    periods = pd.date_range("2024-01-01", periods=14, freq="MS")[::-1]
+    frame = pd.DataFrame([(p, c) for p in periods for c in ("One", "Two")], columns=["PERIOD_BEGIN", "CITY"])
+    rows = len(frame)
+    frame["PROPERTY_TYPE"] = "All Residential"
+    for column in ["HOMES_SOLD", "INVENTORY", "PENDING_SALES", "NEW_LISTINGS", "PRICE_DROPS"]:
+        frame[column] = rng.integers(1, 200, rows).astype(float)
+    frame["MEDIAN_SALE_PRICE"] = rng.integers(200, 500, rows) * 1000.0
+    frame["MEDIAN_DOM"] = rng.integers(10, 90, rows).astype(float)
+    for column in ["MEDIAN_SALE_PRICE_YOY", "PENDING_SALES_YOY", "MEDIAN_DOM_YOY", "INVENTORY_YOY"]:
+        frame[column] = rng.uniform(-0.2, 0.2, rows)
+    frame["MONTHS_OF_SUPPLY"] = rng.uniform(1, 6, rows)
+    return frame
+
+
+class DashboardMainTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        self.metros = [dict(metro) for metro in METROS]
+        self._write_config()
+        for seed, metro in enumerate(self.metros):
+            self._write_data(metro, seed)
+        self.argv = mock.patch("sys.argv", ["generate_dashboards_v2.py", "--workers", "1"])
+        self.argv.start()
+
+    def tearDown(self):
+        self.argv.stop()
+        self.tmp.cleanup()
+
+    def _write_config(self):
+        (self.base / "metro_config.json").write_text(json.dumps({"metros": self.metros}))
+
+    def _write_data(self, metro, seed):
+        data = process_metro_frame(_metro_rows(seed), metro["display_name"])
+        save_metro_data(data, self.base / metro["output_directory"], metro["name"])
+
+    def _dashboard(self, metro) -> Path:
+        return self.base / metro["output_directory"] / "2025-02" / f"dashboard_enhanced_{metro['name']}_2025-02.html"
+
+    def _stamps(self):
+        return {m["name"]: (os.stat(self._dashboard(m)).st_ino, os.stat(self._dashboard(m)).st_mtime_ns)
+                for m in self.metros}
+
+    def test_unchanged_inputs_are_not_rewritten(self):
+        generate_dashboards_v2.main(self.base)
+        before = self._stamps()
+
+        generate_dashboards_v2.main(self.base)
+
+        self.assertEqual(self._stamps(), before)
+
+    def test_changed_data_or_config_rerenders_only_that_metro(self):
+        generate_dashboards_v2.main(self.base)
+        before = self._stamps()
+
+        self._write_data(self.metros[0], seed=7)
+        generate_dashboards_v2.main(self.base)
+        after_data = self._stamps()
+        self.assertNotEqual(after_data["alpha"], before["alpha"])
+        self.assertEqual(after_data["beta"], before["beta"])
+
+        self.metros[1]["display_name"] = "Beta, Virginia"
+        self._write_config()
+        generate_dashboards_v2.main(self.base)
+        after_config = self._stamps()
+        self.assertEqual(after_config["alpha"], after_data["alpha"])
+        self.assertNotEqual(after_config["beta"], after_data["beta"])
+
+    def test_changed_rendering_module_rerenders(self):
+        generate_dashboards_v2.main(self.base)
+        before = self._stamps()
+
+        def hash_file(path):
+            return "changed" if Path(path).name == "region_granularity.py" else real_hash_file(path)
+
+        real_hash_file = generate_dashboards_v2.hash_file
+        with mock.patch.object(generate_dashboards_v2, "hash_file", side_effect=hash_file):
+            generate_dashboards_v2.main(self.base)
+
+        after = self._stamps()
+        self.assertTrue(all(after[name] != before[name] for name in before))
+
+    def test_interrupted_write_leaves_no_partial_file(self):
+        generate_dashboards_v2.main(self.base)
+        dashboard = self._dashboard(self.metros[0])
+        previous = dashboard.read_bytes()
+        self._write_data(self.metros[0], seed=7)
+
+        with mock.patch.object(generate_dashboards_v2.os, "replace", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                generate_dashboards_v2.main(self.base)
+
+        self.assertEqual(dashboard.read_bytes(), previous)
+        self.assertEqual([p.name for p in dashboard.parent.glob("*.tmp")], [])
+
+        # The old dashboard's fingerprint no longer matches, so the next run renders it
+        generate_dashboards_v2.main(self.base)
+        self.assertNotEqual(dashboard.read_bytes(), previous)
+
+
+if __name__ == "__main__":
+    unittest.main()
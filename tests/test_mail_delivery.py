@@ -0,0 +1,161 @@
+import smtplib
+import socketserver
+import ssl
+import threading
+import unittest
+from email.mime.text import MIMEText
+
+from mail_delivery import DeliveryError, SMTPPool, is_transient
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of an SMTP server to accept messages (no TLS, no auth)."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 localhost ready")
+
+        for raw in self.rfile:
+            command = raw.decode().strip().upper()
+            if command.startswith("EHLO") and server.size_limit:
+                self.reply("250-localhost")
+                self.reply(f"250 SIZE {server.size_limit}")
+            elif command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                for line in self.rfile:
+                    if line in (b".\r\n", b".\n"):
+                        break
+                with server.lock:
+                    code = server.data_replies.pop(0) if server.data_replies else 250
+                    if code == 250:
+                        server.messages += 1
+                self.reply(f"{code} {'OK' if code == 250 else 'Rejected'}")
+                if code == 421:
+                    return
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.data_replies = []
+        self.size_limit = 0
+
+
+def _message(n=0):
+    msg = MIMEText(f"body {n}")
+    msg["Subject"] = f"Report {n}"
+    msg["From"] = "pipeline@example.com"
+    msg["To"] = "team@example.com"
+    return msg
+
+
+class SMTPPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.server = _SMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.delays = []
+        self.pool = SMTPPool(
+            "127.0.0.1", self.server.server_address[1], starttls=False,
+            max_sessions=2, max_retries=2, retry_backoff=0.5, sleep=self.delays.append
+        )
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sessions_are_reused_across_messages(self):
+        for n in range(10):
+            self.pool.send(_message(n))
+
+        self.assertEqual(self.server.messages, 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_parallel_batches_stay_within_session_limit(self):
+        batches = [[f"user{i}@example.com"] for i in range(6)]
+        self.pool.send_batches(_message(), batches)
+
+        self.assertEqual(self.server.messages, 6)
+        self.assertLessEqual(self.pool.connections_opened, 2)
+
+    def test_transient_failure_is_retried_with_backoff(self):
+        self.server.data_replies = [451, 421]
+        self.pool.send(_message())
+
+        self.assertEqual(self.server.messages, 1)
+        self.assertEqual(self.delays, [0.5, 1.0])
+
+    def test_advertised_size_is_read_from_ehlo(self):
+        self.server.size_limit = 1000000
+
+        self.assertEqual(self.pool.advertised_size(), 1000000)
+
+    def test_failed_size_probe_is_not_retried(self):
+        attempts = []
+
+        def refuse():
+            attempts.append(1)
+            raise ConnectionRefusedError("refused")
+
+        self.pool._connect = refuse
+        with self.assertRaises(ConnectionRefusedError):
+            self.pool.advertised_size()
+
+        self.assertIsNone(self.pool.advertised_size())
+        self.assertEqual(len(attempts), 1)
+
+    def test_permanent_rejection_is_not_retried(self):
+        self.server.data_replies = [552]
+        with self.assertRaises(DeliveryError) as raised:
+            self.pool.send(_message())
+
+        self.assertTrue(raised.exception.permanent)
+        self.assertEqual(self.delays, [])
+
+    def test_unsupported_extension_is_not_retried(self):
+        def no_starttls():
+            raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+
+        self.pool._connect = no_starttls
+        with self.assertRaises(DeliveryError) as raised:
+            self.pool.send(_message())
+
+        self.assertTrue(raised.exception.permanent)
+        self.assertEqual(self.delays, [])
+
+
+class IsTransientTests(unittest.TestCase):
+    def test_connection_failures_and_4xx_are_transient(self):
+        for error in [smtplib.SMTPServerDisconnected("gone"), ConnectionResetError("reset"), TimeoutError("slow"),
+                      smtplib.SMTPDataError(451, b"try later"), ssl.SSLEOFError("eof")]:
+            self.assertTrue(is_transient(error), repr(error))
+
+    def test_other_smtp_and_certificate_errors_are_permanent(self):
+        for error in [smtplib.SMTPNotSupportedError("no AUTH"), smtplib.SMTPException("odd reply"),
+                      smtplib.SMTPDataError(552, b"too big"), smtplib.SMTPAuthenticationError(535, b"bad login"),
+                      ssl.SSLCertVerificationError("certificate verify failed")]:
+            self.assertFalse(is_transient(error), repr(error))
+
+
+if __name__ == "__main__":
+    unittest.main()
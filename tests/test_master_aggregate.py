@@ -0,0 +1,89 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from market_radar import master_aggregate
+from market_radar.master_aggregate import aggregate_master
+
+
+def _master_frame() -> pd.DataFrame:
+    rng = np.random.default_rng(5)
+    rows = 400
+    frame = pd.DataFrame({
+        "PERIOD_BEGIN": [f"2025-{month:02d}-01" for month in rng.integers(1, 13, rows)],
+        "PARENT_METRO_REGION_METRO_CODE": rng.choice(["16740", "40220", "19260"], rows),
+        "PROPERTY_TYPE": rng.choice(["All Residential", "Condo/Co-op"], rows),
+        "HOMES_SOLD": rng.integers(0, 90, rows).astype(float),
+        "MEDIAN_SALE_PRICE": rng.integers(100, 400, rows) * 1000.0,
+    })
+    frame.loc[rng.random(rows) < 0.1, "HOMES_SOLD"] = np.nan
+    return frame
+
+
+def _components(frame: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({
+        "homes_sold": frame["HOMES_SOLD"],
+        "price_numerator": frame["MEDIAN_SALE_PRICE"] * frame["HOMES_SOLD"],
+    }, index=frame.index)
+
+
+class MasterAggregateTests(unittest.TestCase):
+    def test_chunked_sums_match_a_full_read(self):
+        frame = _master_frame()
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_path = Path(tmp) / "master.tsv000.gz"
+            frame.to_csv(tsv_path, sep="\t", index=False, compression="gzip")
+
+            # Tiny chunks: dozens of partials folded into the running totals
+            with mock.patch.object(master_aggregate, "PROBE_ROWS", 9):
+                result = aggregate_master(tsv_path, ["HOMES_SOLD", "MEDIAN_SALE_PRICE"], _components,
+                                          metro_codes=["16740", "40220"], memory_mb=0.001)
+
+        expected = frame[(frame["PROPERTY_TYPE"] == "All Residential")
+                         & frame["PARENT_METRO_REGION_METRO_CODE"].isin(["16740", "40220"])].copy()
+        expected["PERIOD_BEGIN"] = pd.to_datetime(expected["PERIOD_BEGIN"])
+        expected = pd.concat([expected[["PARENT_METRO_REGION_METRO_CODE", "PERIOD_BEGIN"]], _components(expected)], axis=1)
+        expected = expected.groupby(["PARENT_METRO_REGION_METRO_CODE", "PERIOD_BEGIN"]).sum().reset_index()
+
+        self.assertEqual(result.attrs["rows_read"], 400)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_worker_pool_matches_serial_bit_for_bit(self):
+        frame = _master_frame()
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_path = Path(tmp) / "master.tsv000.gz"
+            frame.to_csv(tsv_path, sep="\t", index=False, compression="gzip")
+
+            results = [
+                aggregate_master(tsv_path, ["HOMES_SOLD", "MEDIAN_SALE_PRICE"], _components,
+                                 memory_mb=0.001, workers=workers)
+                for workers in (1, 2)
+            ]
+
+        self.assertEqual(results[1].attrs["rows_read"], 400)
+        pd.testing.assert_frame_equal(results[1], results[0], check_exact=True)
+
+    def test_metro_tracker_skips_seasonally_adjusted_rows(self):
+        frame = pd.DataFrame({
+            "PERIOD_BEGIN": ["2025-01-01", "2025-01-01", "2025-02-01", "2025-02-01"],
+            "PARENT_METRO_REGION_METRO_CODE": ["40220"] * 4,
+            "PROPERTY_TYPE": "All Residential",
+            "IS_SEASONALLY_ADJUSTED": ["false", "true", "f", "t"],
+            "HOMES_SOLD": [300.0, 310.0, 280.0, 295.0],
+            "MEDIAN_SALE_PRICE": [241000.0, 250000.0, 238500.0, 244000.0],
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_path = Path(tmp) / "redfin_metro_market_tracker.tsv000.gz"
+            frame.to_csv(tsv_path, sep="\t", index=False, compression="gzip")
+            result = aggregate_master(tsv_path, ["HOMES_SOLD", "MEDIAN_SALE_PRICE"], _components)
+
+        self.assertEqual(result["homes_sold"].tolist(), [300.0, 280.0])
+        self.assertEqual((result["price_numerator"] / result["homes_sold"]).tolist(), [241000.0, 238500.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import importlib
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from market_radar import metric_cube
+from market_radar.master_aggregate import aggregate_master
+from market_radar.metric_cube import load_or_build_cube
+
+
+def _write_master(path: Path):
+    rng = np.random.default_rng(8)
+    rows = 300
+    frame = pd.DataFrame({
+        "PERIOD_BEGIN": [f"2025-{month:02d}-01" for month in rng.integers(1, 13, rows)],
+        "PARENT_METRO_REGION_METRO_CODE": rng.choice(["16740", "40220", "19260"], rows),
+        "PROPERTY_TYPE": "All Residential",
+        "HOMES_SOLD": rng.integers(0, 90, rows).astype(float),
+    })
+    frame.to_csv(path, sep="\t", index=False, compression="gzip")
+
+
+def _components(frame: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({"homes_sold": frame["HOMES_SOLD"]}, index=frame.index)
+
+
+class MetricCubeTests(unittest.TestCase):
+    def test_cube_round_trips_and_is_reused_until_the_source_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_path = Path(tmp) / "master.tsv000.gz"
+            cube_dir = Path(tmp) / "cube"
+            _write_master(tsv_path)
+            expected = aggregate_master(tsv_path, ["HOMES_SOLD"], _components, metro_codes=["16740", "40220"])
+
+            cube = load_or_build_cube(tsv_path, ["HOMES_SOLD"], _components, cube_dir, "test", ["16740", "40220"])
+            self.assertIsInstance(cube.values, np.memmap)
+            self.assertEqual(cube.entities, ["16740", "40220"])
+            pd.testing.assert_frame_equal(cube.to_frame(), expected, check_exact=True)
+            self.assertEqual(cube.to_frame().attrs["rows_read"], 300)
+
+            # Workers receive the directory and map the same file
+            attached = pickle.loads(pickle.dumps(cube))
+            self.assertLess(len(pickle.dumps(cube)), 1000)
+            np.testing.assert_array_equal(attached.series("40220", "homes_sold"), cube.series("40220", "homes_sold"))
+
+            with mock.patch.object(metric_cube, "aggregate_master") as aggregate:
+                warm = load_or_build_cube(tsv_path, ["HOMES_SOLD"], _components, cube_dir, "test", ["40220", "16740"])
+            aggregate.assert_not_called()
+            pd.testing.assert_frame_equal(warm.to_frame(), expected, check_exact=True)
+
+            stat = tsv_path.stat()
+            os.utime(tsv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            rebuilt = load_or_build_cube(tsv_path, ["HOMES_SOLD"], _components, cube_dir, "test", ["16740", "40220"])
+            self.assertNotEqual(rebuilt.path, cube.path)
+            self.assertEqual([p.name for p in cube_dir.iterdir()], [rebuilt.path.name])
+
+    def test_key_changes_with_same_module_helpers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_path = Path(tmp) / "master.tsv000.gz"
+            _write_master(tsv_path)
+            module_file = Path(tmp) / "cube_components.py"
+            source = (
+                "SCALE = {scale}\n\n"
+                "def _helper(frame):\n    return frame['HOMES_SOLD'] * SCALE{extra}\n\n"
+                "def components(frame):\n    return frame.assign(homes_sold=_helper(frame))[['homes_sold']]\n"
+            )
+            module_file.write_text(source.format(scale=1, extra=""))
+            sys.path.insert(0, tmp)
+            self.addCleanup(sys.path.remove, tmp)
+            self.addCleanup(sys.modules.pop, "cube_components", None)
+            module = importlib.import_module("cube_components")
+            keys = {metric_cube.cube_key(tsv_path, ["HOMES_SOLD"], module.components)}
+
+            for scale, extra in ((1, " + 0"), (2, " + 0")):
+                module_file.write_text(source.format(scale=scale, extra=extra))
+                module = importlib.reload(module)
+                keys.add(metric_cube.cube_key(tsv_path, ["HOMES_SOLD"], module.components))
+
+            self.assertEqual(len(keys), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
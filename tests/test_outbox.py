@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from mail_delivery import DeliveryError
+from outbox import Outbox, OutboxWorker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class OutboxTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.clock = _Clock()
+        self.outbox = Outbox(Path(self.tmp.name), max_attempts=3, retry_backoff=10, clock=self.clock)
+        self.sent = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_is_delivered_once_across_reruns(self):
+        self.assertTrue(self.outbox.enqueue("report-charlotte-2025-12", b"report"))
+        self.assertFalse(self.outbox.enqueue("report-charlotte-2025-12", b"report"))
+
+        self.outbox.drain(self.sent.append)
+        self.assertFalse(self.outbox.enqueue("report-charlotte-2025-12", b"report"))
+        self.outbox.drain(self.sent.append)
+
+        self.assertEqual(self.sent, [b"report"])
+        self.assertEqual(self.outbox.state("report-charlotte-2025-12"), "sent")
+
+    def test_transient_failures_back_off_then_dead_letter(self):
+        def fail(message):
+            raise DeliveryError("451 try later")
+
+        self.outbox.enqueue("report-roanoke-2025-12", b"report")
+        self.assertEqual(self.outbox.drain(fail), {"report-roanoke-2025-12": "retry"})
+
+        # Not due again until the backoff has passed
+        self.assertEqual(self.outbox.drain(fail), {})
+        self.clock.now += 10
+        self.assertEqual(self.outbox.drain(fail), {"report-roanoke-2025-12": "retry"})
+        self.clock.now += 20
+        self.assertEqual(self.outbox.drain(fail), {"report-roanoke-2025-12": "dead"})
+
+        self.assertEqual(self.outbox.pending_records(), [])
+        self.assertEqual(self.outbox.dead_records()[0]["attempts"], 3)
+
+        self.assertEqual(self.outbox.retry_dead(), 1)
+        self.outbox.drain(self.sent.append)
+        self.assertEqual(self.sent, [b"report"])
+
+    def test_permanent_rejection_switches_to_fallback(self):
+        def reject_large(message):
+            if message == b"with attachments":
+                raise DeliveryError("552 message too large", permanent=True)
+            self.sent.append(message)
+
+        self.outbox.enqueue("report-charlotte-2025-12", b"with attachments", fallback=b"body only")
+        self.outbox.drain(reject_large)
+        self.outbox.drain(reject_large)
+
+        self.assertEqual(self.sent, [b"body only"])
+        self.assertEqual(self.outbox.state("report-charlotte-2025-12"), "sent")
+
+    def test_worker_delivers_in_background_and_flushes_on_stop(self):
+        worker = OutboxWorker(self.outbox, self.sent.append, poll_interval=0.05, log=lambda msg: None).start()
+        for n in range(5):
+            self.outbox.enqueue(f"report-metro{n}-2025-12", f"report {n}".encode())
+
+        self.assertEqual(worker.stop(flush_timeout=5), 0)
+        self.assertEqual(sorted(self.sent), [f"report {n}".encode() for n in range(5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,305 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pipeline_runner import PipelineContext, Stage, StageError, order_stages, run_pipeline
+from run_state import RunState
+from stage_cache import FingerprintStore
+
+
+def _stage(name, func=None, depends_on=None, required=True):
+    return Stage(name, name.title(), f"{name}.py", func or (lambda ctx: "ok"), depends_on or [], required)
+
+
+def _context() -> PipelineContext:
+    return PipelineContext(base_dir=Path("."), config={"metros": []})
+
+
+class OrderStagesTests(unittest.TestCase):
+    def test_dependencies_run_first(self):
+        stages = [_stage("summary", depends_on=["process"]), _stage("process", depends_on=["extract"]), _stage("extract")]
+
+        self.assertEqual([s.name for s in order_stages(stages)], ["extract", "process", "summary"])
+
+    def test_missing_dependency_is_treated_as_satisfied(self):
+        self.assertEqual([s.name for s in order_stages([_stage("narrative", depends_on=["summary"])])], ["narrative"])
+
+    def test_cycle_is_rejected(self):
+        with self.assertRaises(ValueError):
+            order_stages([_stage("a", depends_on=["b"]), _stage("b", depends_on=["a"])])
+
+
+class RunPipelineTests(unittest.TestCase):
+    def test_stages_share_context(self):
+        def produce(ctx):
+            ctx.processed["metro"] = {"metro_data": {"period": "2025-01"}}
+            return "produced"
+
+        def consume(ctx):
+            return ctx.processed["metro"]["metro_data"]["period"]
+
+        results = run_pipeline(
+            [_stage("produce", produce), _stage("consume", consume, ["produce"])],
+            _context(), log=lambda msg: None
+        )
+
+        self.assertEqual(results["consume"]["output"], "2025-01")
+
+    def test_required_failure_stops_the_run(self):
+        def fail(ctx):
+            raise RuntimeError("boom")
+
+        results = {}
+        with self.assertRaises(StageError) as raised:
+            run_pipeline(
+                [_stage("first", fail), _stage("second", depends_on=["first"])],
+                _context(), log=lambda msg: None, results=results
+            )
+
+        self.assertEqual(str(raised.exception), "First failed")
+        self.assertFalse(results["first"]["success"])
+        self.assertTrue(results["second"]["blocked"])
+
+    def test_optional_failure_is_recorded(self):
+        def fail(ctx):
+            raise RuntimeError("boom")
+
+        results = run_pipeline([_stage("optional", fail, required=False)], _context(), log=lambda msg: None)
+
+        self.assertEqual(results["optional"], {"success": False, "output": "boom", "seconds": results["optional"]["seconds"]})
+
+    def test_isolated_runs_stage_scripts(self):
+        scripts = []
+
+        def script_runner(path):
+            scripts.append(Path(path).name)
+            return True, "done"
+
+        run_pipeline([_stage("extract")], _context(), isolated=True, log=lambda msg: None, script_runner=script_runner)
+
+        self.assertEqual(scripts, ["extract.py"])
+
+    def test_isolated_forced_stage_passes_its_force_args(self):
+        calls = []
+
+        def script_runner(path, *args):
+            calls.append((Path(path).name, args))
+            return True, "done"
+
+        extract = _stage("extract")
+        dashboard = Stage("dashboard", "Dashboard", "dashboard.py", lambda ctx: "ok", ["extract"], force_args=["--force"])
+        run_pipeline([extract, dashboard], _context(), isolated=True, log=lambda msg: None,
+                     script_runner=script_runner)
+        run_pipeline([extract, dashboard], _context(), isolated=True, force_stages=["extract"],
+                     log=lambda msg: None, script_runner=script_runner)
+
+        self.assertEqual(calls, [("extract.py", ()), ("dashboard.py", ()),
+                                 ("extract.py", ()), ("dashboard.py", ("--force",))])
+
+
+class PerMetroTests(unittest.TestCase):
+    def setUp(self):
+        self.ctx = PipelineContext(
+            base_dir=Path("."),
+            config={"metros": [{"name": "a", "display_name": "A"}, {"name": "b", "display_name": "B"}]}
+        )
+        self.calls = []
+
+    def _stage(self, name, depends_on=None, fail_for=None):
+        def func(ctx, metro):
+            if metro["name"] == fail_for:
+                raise RuntimeError("boom")
+            self.calls.append(f"{name}:{metro['name']}")
+            return "ok"
+
+        return Stage(name, name.title(), None, func, depends_on or [], per_metro=True)
+
+    def test_each_metro_finishes_before_the_next_starts_on_one_worker(self):
+        stages = [self._stage("extract"), self._stage("process", ["extract"]), self._stage("summary", ["process"])]
+
+        run_pipeline(stages, self.ctx, log=lambda msg: None, cpu_workers=1)
+
+        self.assertEqual(self.calls, [
+            "extract:a", "process:a", "summary:a", "extract:b", "process:b", "summary:b"
+        ])
+
+    def test_failed_metro_blocks_only_its_own_tasks(self):
+        stages = [self._stage("extract", fail_for="a"), self._stage("process", ["extract"])]
+
+        results = {}
+        with self.assertRaises(StageError):
+            run_pipeline(stages, self.ctx, log=lambda msg: None, results=results)
+
+        self.assertEqual(self.calls, ["extract:b", "process:b"])
+        self.assertTrue(results["process"]["metros"]["a"]["blocked"])
+        self.assertTrue(results["process"]["metros"]["b"]["success"])
+
+
+class StageCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        for script in ("extract.py", "process.py"):
+            (self.base / script).write_text("# stage\n")
+        (self.base / "source.tsv").write_text("a\n1\n")
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _stages(self):
+        def extract(ctx):
+            self.calls.append("extract")
+            (ctx.base_dir / "extracted.tsv").write_text((ctx.base_dir / "source.tsv").read_text())
+            return "ok"
+
+        def process(ctx):
+            self.calls.append("process")
+            (ctx.base_dir / "data.json").write_text("{}")
+            return "ok"
+
+        return [
+            Stage("extract", "Extract", "extract.py", extract,
+                  inputs=lambda ctx: [ctx.base_dir / "source.tsv"],
+                  outputs=lambda ctx: [ctx.base_dir / "extracted.tsv"]),
+            Stage("process", "Process", "process.py", process, depends_on=["extract"],
+                  inputs=lambda ctx: [ctx.base_dir / "extracted.tsv"],
+                  outputs=lambda ctx: [ctx.base_dir / "data.json"]),
+        ]
+
+    def _run(self, **kwargs):
+        ctx = PipelineContext(base_dir=self.base, config={"metros": []})
+        store = FingerprintStore(self.base / ".pipeline" / "fingerprints.json", base_dir=self.base)
+        return run_pipeline(self._stages(), ctx, log=lambda msg: None, store=store, **kwargs)
+
+    def test_unchanged_inputs_are_skipped(self):
+        self._run()
+        results = self._run()
+
+        self.assertEqual(self.calls, ["extract", "process"])
+        self.assertTrue(results["extract"]["skipped"])
+        self.assertTrue(results["process"]["skipped"])
+
+    def test_changed_input_reruns_stage_and_dependents(self):
+        self._run()
+        (self.base / "source.tsv").write_text("a\n22\n")
+        self._run()
+
+        self.assertEqual(self.calls, ["extract", "process", "extract", "process"])
+
+    def test_missing_output_reruns_stage(self):
+        self._run()
+        (self.base / "data.json").unlink()
+        self._run()
+
+        self.assertEqual(self.calls, ["extract", "process", "process"])
+
+    def test_unreadable_input_fails_only_its_task(self):
+        self._run()
+        (self.base / "source.tsv").unlink()
+        (self.base / "source.tsv").mkdir()   # exists, but can't be read as a file
+
+        results = {}
+        with self.assertRaises(StageError):
+            self._run(results=results)
+
+        self.assertFalse(results["extract"]["success"])
+        self.assertIn("IsADirectoryError", results["extract"]["output"])
+        self.assertTrue(results["process"]["blocked"])
+
+    def test_force_stage_reruns_downstream(self):
+        self._run()
+        self._run(force_stages=["extract"])
+
+        self.assertEqual(self.calls, ["extract", "process", "extract", "process"])
+
+
+class ResumeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        self.state_path = self.base / ".pipeline" / "run_state.json"
+        self.calls = []
+        self.fail_process = True
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _stages(self):
+        def extract(ctx):
+            self.calls.append("extract")
+            (ctx.base_dir / "extracted.tsv").write_text("a\n1\n")
+            return "ok"
+
+        def process(ctx):
+            self.calls.append("process")
+            if self.fail_process:
+                raise RuntimeError("boom")
+            return "ok"
+
+        return [
+            Stage("extract", "Extract", None, extract, outputs=lambda ctx: [ctx.base_dir / "extracted.tsv"]),
+            Stage("process", "Process", None, process, depends_on=["extract"]),
+        ]
+
+    def _run(self, resume=False):
+        ctx = PipelineContext(base_dir=self.base, config={"metros": []})
+        state = RunState.start(self.state_path, self.base, resume=resume)
+        results = {}
+        try:
+            run_pipeline(self._stages(), ctx, log=lambda msg: None, results=results, run_state=state)
+        except StageError:
+            pass
+        state.finish(all(r["success"] for r in results.values()), results, [])
+        return results
+
+    def test_resume_reuses_completed_tasks(self):
+        self._run()
+        self.fail_process = False
+        results = self._run(resume=True)
+
+        self.assertEqual(self.calls, ["extract", "process", "process"])
+        self.assertTrue(results["extract"]["resumed"])
+        self.assertTrue(results["process"]["success"])
+
+    def test_changed_output_is_not_reused(self):
+        self._run()
+        (self.base / "extracted.tsv").write_text("a\n2\n")
+        self.fail_process = False
+        self._run(resume=True)
+
+        self.assertEqual(self.calls, ["extract", "process", "extract", "process"])
+
+    def test_unchanged_output_is_not_rehashed_on_resume(self):
+        self._run()
+        self.fail_process = False
+        store = FingerprintStore(self.base / ".pipeline" / "fingerprints.json", base_dir=self.base)
+        store.file_hash(self.base / "extracted.tsv")
+        state = RunState.start(self.state_path, self.base, resume=True, store=store)
+
+        with mock.patch("stage_cache.hash_file", side_effect=AssertionError("re-hashed")):
+            self.assertTrue(state.can_reuse("extract"))
+
+    def test_task_after_a_rerun_is_not_reused(self):
+        self.fail_process = False
+        self._run()
+        state = json.loads(self.state_path.read_text())
+        state["status"] = "running"
+        state["tasks"]["extract"]["status"] = "failed"
+        self.state_path.write_text(json.dumps(state))
+        self._run(resume=True)
+
+        self.assertEqual(self.calls, ["extract", "process", "extract", "process"])
+
+    def test_completed_run_is_not_resumed(self):
+        self.fail_process = False
+        self._run()
+        self._run(resume=True)
+
+        self.assertEqual(self.calls, ["extract", "process", "extract", "process"])
+
+
+if __name__ == "__main__":
+    unittest.main()
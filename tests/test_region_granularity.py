@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from extract_summary import build_metro_summary
+from frame_partition import iter_partition_blocks, write_partition
+from process_market_data import process_metro_blocks, process_metro_frame
+from region_granularity import extract_memory_mb, granularity_source_file, metro_granularity
+
+
+def _city_rows() -> pd.DataFrame:
+    rng = np.random.default_rng(11)
+    periods = pd.date_range("2024-01-01", periods=18, freq="MS")
+    cities = ["Charlotte", "Concord", "Gastonia"]
+    frame = pd.DataFrame(
+        [(period, city) for period in periods[::-1] for city in cities], columns=["PERIOD_BEGIN", "CITY"]
+    )
+    rows = len(frame)
+    frame["PROPERTY_TYPE"] = "All Residential"
+    for column in ["HOMES_SOLD", "INVENTORY", "PENDING_SALES", "NEW_LISTINGS", "PRICE_DROPS"]:
+        frame[column] = rng.integers(1, 200, rows).astype(float)
+    frame["MEDIAN_SALE_PRICE"] = rng.integers(200, 500, rows) * 1000.0
+    frame["MEDIAN_SALE_PRICE_YOY"] = rng.uniform(-0.1, 0.1, rows)
+    frame["MEDIAN_DOM"] = rng.integers(10, 90, rows).astype(float)
+    frame["MONTHS_OF_SUPPLY"] = rng.uniform(1, 6, rows)
+    frame["PENDING_SALES_YOY"] = rng.uniform(-0.2, 0.2, rows)
+    frame["MEDIAN_DOM_YOY"] = rng.uniform(-20, 20, rows)
+    frame["INVENTORY_YOY"] = rng.uniform(-0.2, 0.2, rows)
+    return frame
+
+
+class RegionGranularityTests(unittest.TestCase):
+    def test_zip_series_match_city_series_for_the_same_rows(self):
+        cities = _city_rows()
+        zip_codes = {"Charlotte": "Zip Code: 28202", "Concord": "Zip Code: 28025", "Gastonia": "Zip Code: 28052"}
+        zips = cities.assign(REGION=cities["CITY"].map(zip_codes), CITY=np.nan)
+
+        by_city = process_metro_frame(cities, "Charlotte, NC")
+        by_zip = process_metro_frame(zips, "Charlotte, NC", granularity="zip")
+
+        self.assertEqual(by_zip["region_granularity"], "zip")
+        self.assertEqual(sorted(by_zip["available_cities"]), sorted(zip_codes.values()))
+        for city, zip_code in zip_codes.items():
+            self.assertEqual(by_zip["full_city_trends"][zip_code], by_city["full_city_trends"][city])
+            self.assertEqual(by_zip["period_index_by_city"][zip_code], by_city["period_index_by_city"][city])
+        self.assertEqual([c["name"] for c in by_zip["top_cities"]],
+                         [zip_codes[c["name"]] for c in by_city["top_cities"]])
+        self.assertEqual(by_zip["full_metro_trends"], by_city["full_metro_trends"])
+
+        # Alerts screen the metro's zip codes, as its city_metrics list them
+        summary = build_metro_summary(by_zip)
+        self.assertEqual(summary["region_granularity"], "zip")
+        self.assertEqual(summary["key_metrics"]["cities_screened"], 3)
+        self.assertTrue(set(a["name"] for a in summary["alert_cities"]) <= set(zip_codes.values()))
+
+    def test_partition_blocks_give_the_same_data_as_the_whole_frame(self):
+        zips = _city_rows().rename(columns={"CITY": "REGION"})
+        expected = process_metro_frame(zips, "Charlotte, NC", granularity="zip")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            partition_file = Path(tmp) / "charlotte_cities_filtered.npz"
+            write_partition(zips, partition_file)
+            # Blocks of 7 rows split months (3 regions each) across blocks
+            by_block = process_metro_blocks(iter_partition_blocks(partition_file, 7), "Charlotte, NC",
+                                            granularity="zip")
+
+        self.assertEqual(by_block, expected)
+        with self.assertRaises(ValueError):
+            process_metro_blocks([zips.iloc[:3], zips.iloc[3:], zips.iloc[:3]], "Charlotte, NC", granularity="zip")
+
+    def test_metro_setting_overrides_the_default_tracker(self):
+        data_settings = {"source_file": "city.tsv.gz", "tracker_files": {"neighborhood": "hoods.tsv.gz"}}
+
+        city = metro_granularity(data_settings, {"name": "roanoke"})
+        zip_level = metro_granularity(data_settings, {"name": "charlotte", "region_granularity": "zip"})
+        hoods = metro_granularity({**data_settings, "region_granularity": "neighborhood"}, {"name": "charlotte"})
+
+        self.assertEqual((city.region_column, granularity_source_file(data_settings, city)), ("CITY", "city.tsv.gz"))
+        self.assertEqual(granularity_source_file(data_settings, zip_level), "zip_code_market_tracker.tsv000.gz")
+        self.assertEqual(granularity_source_file(data_settings, hoods), "hoods.tsv.gz")
+        self.assertIsNone(extract_memory_mb(data_settings, city))
+        self.assertEqual(extract_memory_mb({"extract_memory_mb": 64}, zip_level), 64)
+        with self.assertRaises(ValueError):
+            metro_granularity({"region_granularity": "county"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from report_attachments import DEFAULT_MAX_MESSAGE_BYTES, message_size_limit, plan_report_message
+
+CONFIG = {"from_address": "pipeline@example.com", "smtp_user": "", "recipients": ["team@example.com"]}
+
+
+def _bodies(variant):
+    return f"<p>{variant.name}</p>", variant.name
+
+
+class PlanReportMessageTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dashboard = Path(self.tmp.name) / "dashboard.html"
+        # Repetitive HTML: ~400 KB raw, a few KB zipped
+        self.dashboard.write_text("<tr><td>row</td></tr>\n" * 20000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _plan(self, limit, **kwargs):
+        return plan_report_message(CONFIG, "Report", _bodies, dashboard_file=self.dashboard, limit=limit, **kwargs)
+
+    def test_full_dashboard_when_it_fits(self):
+        plan = self._plan(10 * 1024 * 1024)
+
+        self.assertEqual(plan.variant, "full")
+        self.assertLessEqual(plan.size, plan.limit)
+
+    def test_archive_when_only_the_compressed_copy_fits(self):
+        plan = self._plan(200 * 1024)
+
+        self.assertEqual(plan.variant, "archive")
+        self.assertIn(b'filename="dashboard.zip"', plan.message)
+
+    def test_link_when_no_attachment_fits(self):
+        plan = self._plan(1024, dashboard_url="https://reports.example.com/dashboard.html")
+
+        self.assertEqual(plan.variant, "link")
+        self.assertFalse(plan.dashboard_attached)
+
+    def test_body_only_without_a_link(self):
+        self.assertEqual(self._plan(1024).variant, "body_only")
+
+
+class _Pool:
+    def __init__(self, size=None, error=None):
+        self.size = size
+        self.error = error
+        self.probes = 0
+
+    def advertised_size(self):
+        self.probes += 1
+        if self.error:
+            raise self.error
+        return self.size
+
+
+class MessageSizeLimitTests(unittest.TestCase):
+    def test_configured_limit_skips_the_probe(self):
+        pool = _Pool(size=1000)
+
+        self.assertEqual(message_size_limit({"smtp_max_message_bytes": 5000}, pool), 5000)
+        self.assertEqual(pool.probes, 0)
+
+    def test_advertised_size_is_used_when_no_limit_is_configured(self):
+        self.assertEqual(message_size_limit({"smtp_max_message_bytes": None}, _Pool(size=1000)), 1000)
+
+    def test_failed_probe_falls_back_to_the_default(self):
+        pool = _Pool(error=OSError("unreachable"))
+
+        self.assertEqual(message_size_limit({}, pool), DEFAULT_MAX_MESSAGE_BYTES)
+
+
+if __name__ == "__main__":
+    unittest.main()
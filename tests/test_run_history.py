@@ -0,0 +1,81 @@
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import run_history
+from pipeline_runner import PipelineContext, Stage, record_task_rows, run_pipeline
+from run_history import find_regressions, record_run
+
+
+def _burn_cpu(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def _task(stage, wall, status="ok", metro="charlotte"):
+    return {"stage": stage, "metro": metro, "status": status, "wall_seconds": wall}
+
+
+class RunHistoryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Path(self.tmp.name) / "history.db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _record(self, *tasks):
+        record_run(self.db, "test", "2026-01-01T00:00:00", "2026-01-01T00:01:00", True,
+                   {f"{t['stage']}:{t['metro']}": t for t in tasks})
+
+    def test_slower_stage_is_flagged(self):
+        for wall in (10.0, 11.0, 9.0):
+            self._record(_task("process_data", wall), _task("extract_metros", 20.0))
+        self._record(_task("process_data", 15.0), _task("extract_metros", 21.0))
+
+        regressions = find_regressions(self.db, threshold=0.25)
+
+        self.assertEqual([(r["stage"], r["metric"]) for r in regressions], [("process_data", "wall_seconds")])
+        self.assertAlmostEqual(regressions[0]["change"], 0.5)
+
+    def test_skipped_runs_do_not_count(self):
+        self._record(_task("process_data", 10.0))
+        self._record(_task("process_data", None, status="skipped"))
+
+        self.assertEqual(find_regressions(self.db, threshold=0.25), [])
+
+    def test_run_pipeline_collects_task_metrics(self):
+        def extract(ctx, metro):
+            record_task_rows(rows_read=100, rows_kept=7)
+            return "ok"
+
+        ctx = PipelineContext(base_dir=Path("."), config={"metros": [{"name": "a"}]})
+        metrics = {}
+        run_pipeline([Stage("extract", "Extract", None, extract, per_metro=True)], ctx,
+                     log=lambda msg: None, metrics=metrics)
+
+        row = metrics["extract:a"]
+        self.assertEqual((row["stage"], row["metro"], row["status"]), ("extract", "a", "ok"))
+        self.assertEqual((row["rows_read"], row["rows_kept"]), (100, 7))
+        self.assertIsNotNone(row["cpu_seconds"])
+
+    @unittest.skipUnless(run_history.RESOURCE_AVAILABLE, "resource module not available")
+    def test_worker_process_cpu_counts_for_child_process_stages(self):
+        def render(ctx, metro):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                pool.submit(_burn_cpu, 0.5).result()
+            return "ok"
+
+        ctx = PipelineContext(base_dir=Path("."), config={"metros": [{"name": "a"}]})
+        metrics = {}
+        run_pipeline([Stage("render", "Render", None, render, per_metro=True, child_processes=True)], ctx,
+                     log=lambda msg: None, metrics=metrics)
+
+        self.assertGreaterEqual(metrics["render:a"]["cpu_seconds"], 0.4)
+
+
+if __name__ == "__main__":
+    unittest.main()
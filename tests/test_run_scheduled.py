@@ -0,0 +1,118 @@
+import io
+import email
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import run_scheduled
+from email_reports import report_key
+from extract_summary import build_metro_summary
+from outbox import Outbox
+from pipeline_runner import EMAIL_STAGE, REPORT_HELD, PipelineContext, run_pipeline
+
+# Stands in for a stage script: records the arguments it was run with
+RECORD_ARGS = (
+    "import json, sys\n"
+    "from pathlib import Path\n"
+    "with open(Path(__file__).with_suffix('.args'), 'a') as f:\n"
+    "    f.write(json.dumps(sys.argv[1:]) + '\\n')\n"
+)
+SCRIPTS = ["extract_metros.py", "process_market_data.py", "generate_dashboards_v2.py"]
+
+
+class IsolatedRunTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        config = {"metros": [{"name": "alpha", "display_name": "Alpha", "metro_code": "1", "output_directory": "alpha"}]}
+        (self.base / "metro_config.json").write_text(json.dumps(config))
+        for script in SCRIPTS:
+            (self.base / script).write_text(RECORD_ARGS)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _run(self, force_stages=()):
+        with redirect_stdout(io.StringIO()):
+            return run_scheduled.run_scheduled_pipeline(
+                skip_fetch=True, skip_notify=True, skip_ai=True, isolated=True,
+                force_stages=force_stages, base_dir=self.base
+            )
+
+    def _calls(self, script):
+        args_file = (self.base / script).with_suffix(".args")
+        return [json.loads(line) for line in args_file.read_text().splitlines()]
+
+    def test_forced_stage_scripts_get_their_force_args(self):
+        results = self._run(force_stages=["generate_dashboards"])
+
+        self.assertTrue(results["success"], results["errors"])
+        self.assertEqual(self._calls("generate_dashboards_v2.py"), [["--force"]])
+        self.assertEqual(self._calls("extract_metros.py"), [[]])
+
+    def test_forcing_an_upstream_stage_forces_the_dashboard_script(self):
+        results = self._run(force_stages=["extract_metros"])
+
+        self.assertTrue(results["success"], results["errors"])
+        self.assertEqual([self._calls(s) for s in SCRIPTS], [[[]], [[]], [["--force"]]])
+
+
+class BatchModeReportTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name)
+        self.folder = base / "alpha" / "2025-01"
+        self.folder.mkdir(parents=True)
+        summary = build_metro_summary({"metro": "Alpha", "period": "2025-01", "top_cities": []})
+        email_config = {
+            "enabled": True, "recipients": ["team@example.com"], "from_address": "radar@example.com",
+            "smtp_host": "localhost", "smtp_port": 2525, "smtp_max_message_bytes": 10 * 1024 * 1024,
+        }
+        self.outbox = Outbox(base / "outbox")
+        self.ctx = PipelineContext(
+            base_dir=base,
+            config={"metros": [{"name": "alpha", "display_name": "Alpha", "output_directory": "alpha"}]},
+            ai_config={"batch_mode": True}, email_config=email_config, outbox=self.outbox,
+            summaries={"alpha": {"summary": summary, "folder": self.folder}},
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _queued_text(self) -> str:
+        message = email.message_from_bytes((self.outbox.pending / f"{report_key('alpha', '2025-01')}.eml").read_bytes())
+        payloads = [part.get_payload(decode=True) for part in message.walk() if not part.is_multipart()]
+        return "".join(payload.decode() for payload in payloads if isinstance(payload, bytes))
+
+    def test_report_waits_for_the_batch_narrative(self):
+        with redirect_stdout(io.StringIO()):
+            steps = run_pipeline([EMAIL_STAGE], self.ctx, log=lambda msg: None)
+        self.assertEqual(steps["email_report"]["metros"]["alpha"]["output"], REPORT_HELD)
+        self.assertIsNone(self.outbox.state(report_key("alpha", "2025-01")))
+
+        # The batch (or the narrative cache) saves the narrative; the held report goes out with it
+        (self.folder / "alpha_narrative.txt").write_text("Inventory is tightening across Alpha.", encoding="utf-8")
+        with redirect_stdout(io.StringIO()):
+            run_scheduled.send_held_reports(self.ctx, steps)
+
+        self.assertEqual(steps["email_report"]["metros"]["alpha"]["output"], "Report queued")
+        self.assertIn("Inventory is tightening across Alpha.", self._queued_text())
+
+
+class RunScriptTests(unittest.TestCase):
+    def test_extra_args_reach_the_script(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            script = Path(tmp) / "echo_args.py"
+            script.write_text("import sys\nprint(' '.join(sys.argv[1:]))\n")
+
+            with redirect_stdout(io.StringIO()):
+                success, output = run_scheduled.run_script(str(script), "--force", "--workers", "2")
+
+        self.assertTrue(success)
+        self.assertEqual(output.strip(), "--force --workers 2")
+
+
+if __name__ == "__main__":
+    unittest.main()